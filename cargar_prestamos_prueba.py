@@ -203,6 +203,7 @@ def crear_prestamo_con_pagos(cliente, config):
                 cuota.save()
                 print(f"     ✅ Cuota {cuota.numero_cuota}: PAGADA ${float(cuota.monto_cuota):,.0f} ({cuota.get_metodo_pago_display()})")
         
+        prestamo.actualizar_saldos()
         cuotas_pend = prestamo.cuotas.filter(estado__in=['PE', 'PC']).count()
         print(f"     📊 Progreso: {prestamo.cuotas_pagadas}/{prestamo.cuotas_pactadas} | Pendientes: {cuotas_pend}")
     else:
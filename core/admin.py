@@ -4,12 +4,15 @@ Configuración del Admin para el Sistema de Gestión de Préstamos
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib.auth import get_user_model
+from django.utils import timezone
 from .models import (
     Cliente, Prestamo, Cuota, PerfilUsuario, RutaCobro,
     TipoNegocio, ConfiguracionCredito, ColumnaPlanilla, ConfiguracionPlanilla,
     RegistroAuditoria, Notificacion, ConfiguracionRespaldo,
-    ConfiguracionMora, InteresMora, HistorialModificacionPago
+    ConfiguracionMora, InteresMora, HistorialModificacionPago, ResumenCobroDiario,
+    ClaveIdempotencia, TareaProgramada, DestinatarioNotificacion, TrabajoExportacion, CierreDiario
 )
+from .notificaciones import avisar_cambio_notificaciones
 
 User = get_user_model()
 
@@ -241,6 +244,26 @@ class CuotaAdmin(admin.ModelAdmin):
         if not request.user.is_superuser:
             qs = qs.filter(prestamo__cliente__usuario=request.user)
         return qs
+    
+    def save_model(self, request, obj, form, change):
+        anterior = Cuota.objects.filter(pk=obj.pk).select_related('prestamo').first() if change else None
+        super().save_model(request, obj, form, change)
+        # Las cuotas editadas a mano también afectan los saldos del préstamo y los cobros del día
+        ResumenCobroDiario.aplicar_cambio(
+            anterior.aporte_cobro_diario() if anterior else None,
+            obj.aporte_cobro_diario()
+        )
+        for fecha in {anterior and anterior.fecha_pago_real, obj.fecha_pago_real} - {None}:
+            CierreDiario.invalidar(fecha)
+        obj.prestamo.actualizar_saldos()
+    
+    def delete_model(self, request, obj):
+        prestamo = obj.prestamo
+        ResumenCobroDiario.aplicar_cambio(obj.aporte_cobro_diario(), None)
+        if obj.fecha_pago_real:
+            CierreDiario.invalidar(obj.fecha_pago_real)
+        super().delete_model(request, obj)
+        prestamo.actualizar_saldos()
 
 
 # ==================== AUDITORÍA Y NOTIFICACIONES ====================
@@ -270,22 +293,28 @@ class RegistroAuditoriaAdmin(admin.ModelAdmin):
 
 @admin.register(Notificacion)
 class NotificacionAdmin(admin.ModelAdmin):
-    list_display = ['titulo', 'tipo', 'prioridad', 'usuario', 'leida', 'fecha_creacion']
-    list_filter = ['tipo', 'prioridad', 'leida', 'fecha_creacion']
+    list_display = ['titulo', 'tipo', 'prioridad', 'usuario', 'fecha_creacion']
+    list_filter = ['tipo', 'prioridad', 'fecha_creacion']
     search_fields = ['titulo', 'mensaje', 'usuario__username']
-    readonly_fields = ['fecha_creacion', 'fecha_lectura']
-    list_editable = ['leida']
+    readonly_fields = ['fecha_creacion', 'fecha_referencia']
+    raw_id_fields = ['cuota']
     date_hierarchy = 'fecha_creacion'
     
     actions = ['marcar_leidas', 'marcar_no_leidas']
     
     def marcar_leidas(self, request, queryset):
-        queryset.update(leida=True)
-    marcar_leidas.short_description = 'Marcar como leídas'
+        DestinatarioNotificacion.objects.filter(notificacion__in=queryset, leida=False).update(
+            leida=True, fecha_lectura=timezone.now()
+        )
+        avisar_cambio_notificaciones()
+    marcar_leidas.short_description = 'Marcar como leídas (para todos sus destinatarios)'
     
     def marcar_no_leidas(self, request, queryset):
-        queryset.update(leida=False)
-    marcar_no_leidas.short_description = 'Marcar como no leídas'
+        DestinatarioNotificacion.objects.filter(notificacion__in=queryset, leida=True).update(
+            leida=False, fecha_lectura=None
+        )
+        avisar_cambio_notificaciones()
+    marcar_no_leidas.short_description = 'Marcar como no leídas (para todos sus destinatarios)'
 
 
 @admin.register(ConfiguracionRespaldo)
@@ -338,3 +367,64 @@ class HistorialModificacionPagoAdmin(admin.ModelAdmin):
     readonly_fields = ['fecha_modificacion']
     raw_id_fields = ['cuota', 'cuota_relacionada']
     date_hierarchy = 'fecha_modificacion'
+
+
+@admin.register(ResumenCobroDiario)
+class ResumenCobroDiarioAdmin(admin.ModelAdmin):
+    list_display = ['fecha', 'cobrador', 'total_cobrado', 'cantidad_cobros']
+    list_filter = ['cobrador']
+    date_hierarchy = 'fecha'
+    readonly_fields = ['cobrador', 'fecha', 'total_cobrado', 'cantidad_cobros']
+    
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(ClaveIdempotencia)
+class ClaveIdempotenciaAdmin(admin.ModelAdmin):
+    list_display = ['fecha_creacion', 'usuario', 'operacion', 'clave', 'codigo_estado']
+    list_filter = ['operacion']
+    search_fields = ['clave', 'usuario__username']
+    date_hierarchy = 'fecha_creacion'
+    readonly_fields = ['usuario', 'clave', 'operacion', 'respuesta', 'codigo_estado', 'fecha_creacion']
+    
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(TareaProgramada)
+class TareaProgramadaAdmin(admin.ModelAdmin):
+    list_display = ['nombre', 'proxima_ejecucion', 'ultima_ejecucion', 'ultima_duracion',
+                    'ejecuciones', 'fallos', 'bloqueada_por']
+    readonly_fields = ['nombre', 'bloqueada_hasta', 'bloqueada_por', 'ultima_ejecucion', 'ultima_duracion',
+                       'duracion_total', 'ultimo_resultado', 'ultimo_error', 'ejecuciones', 'fallos']
+    
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(CierreDiario)
+class CierreDiarioAdmin(admin.ModelAdmin):
+    list_display = ['fecha', 'cobrador', 'cantidad_pagos', 'total_cobrado', 'total_efectivo',
+                    'total_transferencia', 'fecha_cierre']
+    list_filter = ['cobrador']
+    date_hierarchy = 'fecha'
+    readonly_fields = ['fecha', 'cobrador', 'cantidad_pagos', 'total_cobrado', 'total_efectivo',
+                       'total_transferencia', 'filas', 'fecha_cierre']
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(TrabajoExportacion)
+class TrabajoExportacionAdmin(admin.ModelAdmin):
+    list_display = ['tipo', 'usuario', 'estado', 'fecha_creacion', 'fecha_fin']
+    list_filter = ['tipo', 'estado']
+    readonly_fields = ['usuario', 'tipo', 'parametros', 'clave', 'archivo', 'error',
+                       'fecha_creacion', 'fecha_inicio', 'fecha_fin']
+    
+    def has_add_permission(self, request):
+        return False
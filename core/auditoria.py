@@ -0,0 +1,198 @@
+"""
+Escritura diferida de la auditoría.
+
+RegistroAuditoria.registrar no escribe en la base: deja el registro en un
+buffer del request y la escritura se hace con un bulk_create
+- al terminar el request (señal request_finished, cuando la respuesta ya se
+  envió al cliente),
+- cuando el buffer llega a AUDITORIA_LOTE registros,
+- después de cada tarea del programador y al terminar el proceso.
+
+Si la base no acepta el lote, los registros se agregan a un archivo JSON
+Lines local (AUDITORIA_SPOOL) y se vuelven a intentar en la próxima
+escritura que funcione. El spool se lee con el archivo bloqueado y se borra
+solo después de que el lote se guardó: si la escritura falla o el proceso
+muere en el medio, el archivo queda como estaba (en el peor caso, un registro
+se guarda dos veces).
+
+Lo que todavía está en el buffer se pierde si el proceso muere sin terminar
+el request (SIGKILL, falta de memoria): a lo sumo los registros del request o
+de la tarea en curso, que de todos modos no llegó a responder. Para no
+aceptar esa ventana, AUDITORIA_DIFERIDA = False los escribe en el momento,
+como antes.
+
+Dentro de un atomic el registro entra al buffer recién cuando la transacción
+se confirma (transaction.on_commit): si la operación se revierte no queda
+auditoría, igual que cuando se escribía con create. El buffer es un
+asgiref Local, así que es del hilo por WSGI y del request por ASGI: cada
+request escribe solo sus registros.
+"""
+import atexit
+import json
+import logging
+import os
+from datetime import datetime
+
+from asgiref.local import Local
+from django.conf import settings
+from django.core.signals import request_finished
+from django.db import transaction
+from django.dispatch import receiver
+
+try:
+    import fcntl
+except ImportError:  # Windows (desarrollo): un solo proceso, sin bloqueo
+    fcntl = None
+
+
+logger = logging.getLogger(__name__)
+
+AUDITORIA_LOTE_DEFAULT = 200
+
+CAMPOS = (
+    'usuario_id', 'tipo_accion', 'tipo_modelo', 'modelo_id', 'descripcion',
+    'datos_anteriores', 'datos_nuevos', 'ip_address', 'fecha_hora'
+)
+
+_local = Local()
+
+
+def ruta_spool():
+    return getattr(
+        settings, 'AUDITORIA_SPOOL',
+        os.path.join(settings.BASE_DIR, 'archivo', 'auditoria_pendiente.jsonl')
+    )
+
+
+def _buffer():
+    if getattr(_local, 'pid', None) != os.getpid():
+        # Buffer nuevo por hilo o request, y en el proceso hijo (fork de
+        # gunicorn), donde lo que había era del padre
+        _local.pendientes, _local.pid = [], os.getpid()
+    return _local.pendientes
+
+
+def agregar(registro):
+    """Deja el registro para la próxima escritura (o lo escribe ya si no es diferida)"""
+    if not getattr(settings, 'AUDITORIA_DIFERIDA', True):
+        registro.save()
+        return registro
+
+    transaction.on_commit(lambda: _encolar(registro), robust=True)
+    return registro
+
+
+def _encolar(registro):
+    buffer = _buffer()
+    buffer.append(registro)
+    if len(buffer) >= getattr(settings, 'AUDITORIA_LOTE', AUDITORIA_LOTE_DEFAULT):
+        vaciar()
+
+
+def pendientes():
+    return len(_buffer())
+
+
+def vaciar():
+    """Escribe lo pendiente (y lo que haya quedado en el spool); devuelve cuántos escribió"""
+    registros, _local.pendientes = _buffer(), []
+    # Si otro proceso está vaciando el spool, se deja para él
+    spool = _abrir_spool(esperar=False) if os.path.exists(ruta_spool()) else None
+    if not registros and spool is None:
+        return 0
+
+    from .models import RegistroAuditoria
+
+    try:
+        todos = (_leer_spool(spool) if spool else []) + registros
+        try:
+            if todos:
+                RegistroAuditoria.objects.bulk_create(todos)
+        except Exception:
+            # Base caída, conexión cerrada al salir, etc.: lo leído del spool
+            # sigue ahí y se le agrega lo del buffer
+            logger.exception('No se pudo escribir la auditoría; %s registros al spool', len(registros))
+            _escribir_spool(registros, spool)
+            return 0
+        if spool:
+            os.remove(ruta_spool())
+        return len(todos)
+    finally:
+        if spool:
+            spool.close()
+
+
+def _abrir_spool(esperar=True):
+    """
+    Abre el spool (para leer y agregar) con el bloqueo exclusivo tomado. Si
+    mientras esperaba otro proceso lo vació y lo borró, abre el nuevo. Con
+    esperar=False devuelve None si otro proceso lo tiene.
+    """
+    ruta = ruta_spool()
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    while True:
+        archivo = open(ruta, 'a+', encoding='utf-8')
+        if fcntl:
+            try:
+                fcntl.flock(archivo.fileno(), fcntl.LOCK_EX | (0 if esperar else fcntl.LOCK_NB))
+            except BlockingIOError:
+                archivo.close()
+                return None
+        try:
+            if os.path.samestat(os.fstat(archivo.fileno()), os.stat(ruta)):
+                return archivo
+        except FileNotFoundError:
+            pass
+        archivo.close()
+
+
+def _escribir_spool(registros, archivo=None):
+    if not registros:
+        return
+    propio = archivo is None
+    if propio:
+        archivo = _abrir_spool()
+    try:
+        for registro in registros:
+            fila = {campo: getattr(registro, campo) for campo in CAMPOS}
+            fila['fecha_hora'] = registro.fecha_hora.isoformat()
+            archivo.write(json.dumps(fila, ensure_ascii=False, default=str) + '\n')
+        archivo.flush()
+        os.fsync(archivo.fileno())
+    finally:
+        if propio:
+            archivo.close()
+
+
+def _leer_spool(archivo):
+    """Registros del spool (una línea cortada por un proceso que murió escribiendo se descarta)"""
+    from .models import RegistroAuditoria
+
+    archivo.seek(0)
+    registros = []
+    for linea in archivo:
+        if not linea.strip():
+            continue
+        try:
+            fila = json.loads(linea)
+        except ValueError:
+            logger.warning('Línea incompleta en el spool de auditoría: %r', linea[:200])
+            continue
+        fila['fecha_hora'] = datetime.fromisoformat(fila['fecha_hora'])
+        registros.append(RegistroAuditoria(**fila))
+    return registros
+
+
+@receiver(request_finished)
+def vaciar_al_terminar_request(sender, **kwargs):
+    if pendientes():
+        try:
+            vaciar()
+        except Exception:
+            logger.exception('Error escribiendo la auditoría al terminar el request')
+
+
+@atexit.register
+def vaciar_al_salir():
+    if pendientes():
+        vaciar()
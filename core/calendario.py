@@ -0,0 +1,110 @@
+"""
+Calendario de días hábiles para el cálculo de vencimientos.
+
+Permite configurar qué días de la semana no se cobra (por defecto domingo)
+y una lista de feriados. El N-ésimo día hábil se calcula de forma aritmética
+(semanas completas + resto) en vez de avanzar día por día.
+
+Configuración opcional en settings:
+    COBRO_DIAS_NO_HABILES = [6]              # 0=lunes ... 6=domingo
+    COBRO_FERIADOS = ['2025-12-25', ...]     # fechas ISO o date
+"""
+from bisect import bisect_left, bisect_right
+from datetime import date, timedelta
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+
+DOMINGO = 6
+DIAS_NO_HABILES_DEFAULT = (DOMINGO,)
+
+
+class CalendarioCobro:
+    """Calendario con días de la semana no hábiles y feriados"""
+
+    def __init__(self, dias_no_habiles=DIAS_NO_HABILES_DEFAULT, feriados=()):
+        self.dias_no_habiles = frozenset(dias_no_habiles)
+        self.dias_habiles = [d for d in range(7) if d not in self.dias_no_habiles]
+        if not self.dias_habiles:
+            raise ValueError('El calendario debe tener al menos un día hábil por semana.')
+        # Solo interesan los feriados que caen en días hábiles de la semana
+        self.feriados = sorted({
+            f for f in (_parsear_fecha(f) for f in feriados)
+            if f.weekday() not in self.dias_no_habiles
+        })
+        self._feriados_set = frozenset(self.feriados)
+
+    def es_habil(self, fecha):
+        """Verifica si se cobra en la fecha indicada"""
+        return fecha.weekday() not in self.dias_no_habiles and fecha not in self._feriados_set
+
+    def siguiente_habil(self, fecha):
+        """Devuelve la misma fecha si es hábil, o el próximo día hábil"""
+        while not self.es_habil(fecha):
+            fecha += timedelta(days=1)
+        return fecha
+
+    def enesimo_habil(self, fecha_inicio, n):
+        """
+        N-ésimo día hábil contando fecha_inicio como el primero (si es hábil).
+        Con n=1 equivale a siguiente_habil(fecha_inicio).
+        """
+        if n < 1:
+            raise ValueError('n debe ser mayor o igual a 1.')
+
+        desde = self.siguiente_habil(fecha_inicio)
+        fecha = self._avanzar_semanal(desde, n - 1)
+        # Cada feriado del tramo recorrido obliga a avanzar un día hábil más
+        pendientes = self._contar_feriados(desde, fecha)
+        while pendientes:
+            desde = fecha
+            fecha = self._avanzar_semanal(desde, pendientes)
+            pendientes = self._contar_feriados(desde, fecha, incluir_desde=False)
+        return fecha
+
+    def _avanzar_semanal(self, fecha, dias):
+        """Avanza `dias` días hábiles de la semana (sin considerar feriados)"""
+        semanas, resto = divmod(dias, len(self.dias_habiles))
+        fecha += timedelta(weeks=semanas)
+        for _ in range(resto):
+            fecha += timedelta(days=1)
+            while fecha.weekday() in self.dias_no_habiles:
+                fecha += timedelta(days=1)
+        return fecha
+
+    def _contar_feriados(self, desde, hasta, incluir_desde=True):
+        """Cantidad de feriados hábiles entre desde y hasta (inclusive)"""
+        if not self.feriados:
+            return 0
+        if incluir_desde:
+            inicio = bisect_left(self.feriados, desde)
+        else:
+            inicio = bisect_right(self.feriados, desde)
+        return bisect_right(self.feriados, hasta) - inicio
+
+
+def _parsear_fecha(valor):
+    if isinstance(valor, date):
+        return valor
+    return date.fromisoformat(str(valor))
+
+
+@lru_cache(maxsize=1)
+def obtener_calendario():
+    """Calendario configurado en settings (se construye una sola vez)"""
+    return CalendarioCobro(
+        dias_no_habiles=getattr(settings, 'COBRO_DIAS_NO_HABILES', DIAS_NO_HABILES_DEFAULT),
+        feriados=getattr(settings, 'COBRO_FERIADOS', ()),
+    )
+
+
+@receiver(setting_changed)
+def _limpiar_calendario(sender, setting, **kwargs):
+    """Reconstruir el calendario si cambian los settings (tests)"""
+    if setting in ('COBRO_DIAS_NO_HABILES', 'COBRO_FERIADOS'):
+        obtener_calendario.cache_clear()
+        from .cronograma import calcular_fecha_fin
+        calcular_fecha_fin.cache_clear()
@@ -0,0 +1,128 @@
+"""
+Sincronización incremental de las cuotas del día.
+
+Cada escritura que toca cuotas registra un CambioPrestamo (una fila por
+préstamo y cobrador al confirmarse la transacción). La app guarda el token de
+la última respuesta ("AAAAMMDD-id") y en la siguiente pide solo lo que
+cambió: recibe los préstamos modificados y, de ellos, las cuotas que hoy
+siguen pendientes. Con eso reemplaza las cuotas que tenía de esos préstamos.
+
+Los ids se asignan al insertar pero se ven al confirmar, así que un id más
+chico puede aparecer después de uno más grande. Por eso el token no es el
+último id sino el último anterior a CAMBIOS_MARGEN_SEGUNDOS: los cambios más
+nuevos se vuelven a enviar en la consulta siguiente (reemplazar las cuotas de
+un préstamo dos veces no hace daño) y ninguno queda atrás.
+
+Si el token es de otro día, no se puede leer o es anterior a los cambios
+que se conservan (ver prune_change_log), se responde la lista completa.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Max, Min, Q
+from django.utils import timezone
+
+from .models import CambioPrestamo, Cuota, fecha_local_hoy
+
+
+CAMBIOS_MARGEN_SEGUNDOS_DEFAULT = 120
+
+
+CAMPOS_CUOTA = (
+    'id', 'numero_cuota', 'monto_cuota', 'monto_pagado', 'estado',
+    'prestamo__id', 'prestamo__cuotas_pactadas',
+    'prestamo__cliente__nombre', 'prestamo__cliente__apellido',
+    'prestamo__cobrador__username', 'prestamo__cobrador__first_name',
+    'prestamo__cobrador__last_name'
+)
+
+
+def generar_token(hoy, secuencia):
+    return f'{hoy:%Y%m%d}-{secuencia}'
+
+
+def estado_registro(ahora=None):
+    """
+    Primer y último id del registro, y el id hasta el que ya no pueden
+    aparecer cambios sin confirmar (el último anterior al margen), en una consulta.
+    """
+    margen = getattr(settings, 'CAMBIOS_MARGEN_SEGUNDOS', CAMBIOS_MARGEN_SEGUNDOS_DEFAULT)
+    limite = (ahora or timezone.now()) - timedelta(seconds=margen)
+    return CambioPrestamo.objects.aggregate(
+        primero=Min('id'),
+        ultimo=Max('id'),
+        confirmado=Max('id', filter=Q(fecha__lt=limite)),
+    )
+
+
+def token_actual(hoy=None):
+    """Token desde el que hay que pedir los próximos cambios"""
+    return generar_token(hoy or fecha_local_hoy(), estado_registro()['confirmado'] or 0)
+
+
+def leer_token(token, hoy):
+    """Secuencia del token si es de hoy, o None"""
+    try:
+        fecha, secuencia = token.split('-')
+        secuencia = int(secuencia)
+    except (AttributeError, ValueError):
+        return None
+    if fecha != f'{hoy:%Y%m%d}' or secuencia < 0:
+        return None
+    return secuencia
+
+
+def cuotas_del_dia(cobrador=None, hoy=None):
+    """Cuotas pendientes de hoy (de un cobrador, o todas para admin)"""
+    cuotas = Cuota.objects.filter(
+        fecha_vencimiento=hoy or fecha_local_hoy(),
+        estado__in=['PE', 'PC'],
+        prestamo__estado='AC'
+    )
+    if cobrador is not None:
+        cuotas = cuotas.filter(prestamo__cobrador=cobrador)
+    return cuotas
+
+
+def cambios_desde(secuencia, registro, cobrador=None):
+    """
+    Ids de los préstamos que cambiaron después del id `secuencia`, o None si
+    ya no se conservan todos los cambios desde ahí.
+    """
+    if secuencia > (registro['ultimo'] or 0):
+        return None
+    if secuencia == registro['ultimo']:
+        return []
+    if registro['primero'] is None or registro['primero'] > secuencia + 1:
+        return None
+    cambios = CambioPrestamo.objects.filter(id__gt=secuencia)
+    if cobrador is not None:
+        cambios = cambios.filter(cobrador_id=cobrador.pk)
+    return list(cambios.order_by().values_list('prestamo_id', flat=True).distinct())
+
+
+def cuotas_hoy_desde(token=None, cobrador=None, hoy=None):
+    """
+    Respuesta de /api/cuotas-hoy/. Sin token (o con uno inválido) devuelve
+    todas las cuotas con 'completo': True; con token devuelve solo las de
+    los préstamos listados en 'prestamos'.
+    """
+    hoy = hoy or fecha_local_hoy()
+    # El registro se lee antes que las cuotas: lo que se confirme en el medio
+    # vuelve a llegar en la próxima consulta, nunca se pierde
+    registro = estado_registro()
+    cuotas = cuotas_del_dia(cobrador, hoy)
+
+    secuencia = leer_token(token, hoy) if token else None
+    prestamos = cambios_desde(secuencia, registro, cobrador) if secuencia is not None else None
+
+    confirmado = registro['confirmado'] or 0
+    if prestamos is not None:
+        # El token nunca retrocede respecto del que mandó la app
+        confirmado = max(confirmado, secuencia)
+    respuesta = {'token': generar_token(hoy, confirmado), 'completo': prestamos is None}
+    if prestamos is not None:
+        respuesta['prestamos'] = prestamos
+        cuotas = cuotas.filter(prestamo_id__in=prestamos) if prestamos else cuotas.none()
+    respuesta['cuotas'] = list(cuotas.values(*CAMPOS_CUOTA))
+    return respuesta
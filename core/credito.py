@@ -0,0 +1,155 @@
+"""
+Evaluador de límites de crédito de clientes.
+
+Calcula máximo prestable, deuda actual, renovación y el resto de los límites
+para uno o muchos clientes con una cantidad fija de consultas: clientes (con
+tipo de negocio), préstamos activos y configuraciones de crédito. Las
+configuraciones se leen una sola vez por evaluador, por eso conviene crear
+un evaluador por request y reutilizarlo.
+
+La información de crédito no se cachea: con varios procesos, una caché local
+no se entera de los pagos o préstamos registrados en otro y podría mostrar un
+máximo prestable viejo justo cuando se está por otorgar otro préstamo.
+"""
+from decimal import Decimal
+
+from .models import ConfiguracionCredito, Prestamo, fecha_local_hoy
+
+
+_SIN_CARGAR = object()
+
+
+class EvaluadorCredito:
+    """Calcula la información de crédito de clientes en lote"""
+
+    def __init__(self, hoy=None):
+        self.hoy = hoy or fecha_local_hoy()
+        self._configs = None
+
+    @property
+    def configs(self):
+        """Configuraciones de crédito activas por categoría (una consulta por evaluador)"""
+        if self._configs is None:
+            self._configs = {
+                config.categoria: config
+                for config in ConfiguracionCredito.objects.filter(activo=True)
+            }
+        return self._configs
+
+    def evaluar(self, cliente, prestamo=_SIN_CARGAR):
+        """
+        Información de crédito de un cliente (mismas claves que
+        Cliente.info_limite_credito). Si no se pasa el préstamo activo, se consulta.
+        """
+        if prestamo is _SIN_CARGAR:
+            prestamo = cliente.prestamos.filter(estado='AC').first()
+        config = self.configs.get(cliente.categoria)
+        deuda = prestamo.monto_pendiente if prestamo else Decimal('0.00')
+
+        limite_individual = cliente.limite_credito if cliente.limite_credito > 0 else None
+
+        limite_categoria = None
+        if config and config.limite_maximo > 0:
+            limite_categoria = config.limite_maximo
+
+        limite_sobre_deuda = None
+        if config and config.porcentaje_sobre_deuda > 0:
+            limite_sobre_deuda = deuda * (config.porcentaje_sobre_deuda / 100)
+
+        limite_tipo_negocio = None
+        if cliente.tipo_negocio and cliente.tipo_negocio.limite_credito_sugerido > 0:
+            limite_tipo_negocio = cliente.tipo_negocio.limite_credito_sugerido
+
+        # Máximo prestable: el menor de todos los límites que apliquen
+        limites = [
+            limite - deuda
+            for limite in (limite_individual, limite_categoria, limite_tipo_negocio)
+            if limite
+        ]
+        if limite_sobre_deuda and deuda > 0:
+            limites.append(limite_sobre_deuda)
+        maximo_prestable = max(Decimal('0.00'), min(limites)) if limites else None
+
+        # Renovación
+        puede_renovar = True
+        dias_para_renovar = 0
+        if prestamo and config:
+            if not config.puede_renovar_con_deuda and deuda > 0:
+                puede_renovar = False
+            if config.dias_minimos_para_renovar > 0:
+                dias_pagando = (self.hoy - prestamo.fecha_inicio).days
+                dias_para_renovar = max(0, config.dias_minimos_para_renovar - dias_pagando)
+                if dias_pagando < config.dias_minimos_para_renovar:
+                    puede_renovar = False
+
+        return {
+            'limite_individual': limite_individual,
+            'limite_categoria': limite_categoria,
+            'limite_tipo_negocio': limite_tipo_negocio,
+            'limite_sobre_deuda': limite_sobre_deuda,
+            'maximo_prestable': maximo_prestable,
+            'deuda_actual': deuda,
+            'puede_renovar': puede_renovar,
+            'dias_para_renovar': dias_para_renovar,
+            'fecha_fin_actual': prestamo.fecha_finalizacion if prestamo else None,
+        }
+
+    def evaluar_clientes(self, clientes):
+        """
+        Evalúa una lista o queryset de clientes y devuelve {cliente_id: info}.
+        Además deja la información en cada cliente para que sus propiedades
+        (maximo_prestable, puede_renovar, ...) no vuelvan a consultar.
+        """
+        if hasattr(clientes, 'select_related'):
+            clientes = clientes.select_related('tipo_negocio')
+        clientes = list(clientes)
+
+        # Préstamo activo más reciente de cada cliente (mismo criterio que Cliente.prestamo_activo)
+        activos = {}
+        prestamos = Prestamo.objects.filter(
+            cliente_id__in=[c.pk for c in clientes],
+            estado='AC'
+        ).only(
+            'cliente_id', 'monto_total_a_pagar', 'total_pagado',
+            'fecha_inicio', 'fecha_finalizacion', 'fecha_creacion'
+        ).order_by('-fecha_creacion')
+        for prestamo in prestamos:
+            activos.setdefault(prestamo.cliente_id, prestamo)
+
+        resultado = {}
+        for cliente in clientes:
+            info = self.evaluar(cliente, activos.get(cliente.pk))
+            cliente._info_credito = info
+            resultado[cliente.pk] = info
+        return resultado
+
+
+def evaluar_clientes(clientes, hoy=None):
+    """Atajo: evalúa los clientes con un evaluador nuevo"""
+    return EvaluadorCredito(hoy=hoy).evaluar_clientes(clientes)
+
+
+def _decimal_a_float(valor):
+    return float(valor) if valor is not None else None
+
+
+def datos_credito_cliente(cliente, evaluador=None):
+    """Datos de crédito de un cliente listos para JSON (formulario de préstamo)"""
+    info = (evaluador or EvaluadorCredito()).evaluar(cliente)
+    return {
+        'id': cliente.pk,
+        'nombre': cliente.nombre_completo,
+        'categoria': cliente.categoria,
+        'categoria_display': cliente.get_categoria_display(),
+        'tipo_negocio': cliente.tipo_negocio.nombre if cliente.tipo_negocio else '-',
+        'comercio': cliente.tipo_comercio or '-',
+        'maximo_prestable': _decimal_a_float(info['maximo_prestable']),
+        'deuda_total': float(info['deuda_actual']),
+        'puede_renovar': info['puede_renovar'],
+        'dias_para_renovar': info['dias_para_renovar'],
+        'fecha_fin': info['fecha_fin_actual'].strftime('%d/%m/%Y') if info['fecha_fin_actual'] else '',
+        'limite_individual': float(cliente.limite_credito),
+        'limite_categoria': _decimal_a_float(info['limite_categoria']),
+        'limite_tipo_negocio': _decimal_a_float(info['limite_tipo_negocio']),
+        'limite_sobre_deuda': _decimal_a_float(info['limite_sobre_deuda']),
+    }
@@ -0,0 +1,94 @@
+"""
+Planificador de cronogramas de cuotas.
+
+Calcula en memoria todas las fechas de vencimiento y montos de un préstamo,
+sin tocar la base de datos, para que las cuotas se inserten con un único
+bulk_create. La fecha de finalización usa el mismo calendario de días
+hábiles (core/calendario.py), así ambos cálculos siempre coinciden.
+"""
+from collections import namedtuple
+from datetime import timedelta
+from functools import lru_cache
+
+from .calendario import obtener_calendario
+
+
+# Días entre cuotas para las frecuencias no diarias
+DIAS_POR_FRECUENCIA = {
+    'SE': 7,
+    'QU': 15,
+    'ME': 30,
+}
+
+CuotaPlanificada = namedtuple('CuotaPlanificada', ['numero', 'fecha_vencimiento', 'monto'])
+
+
+def fechas_por_frecuencia(fecha_inicio, cuotas, frecuencia):
+    """
+    Fechas de vencimiento según la frecuencia.
+    - Diario: la primera cuota es el día de inicio y se saltan los días
+      no hábiles (domingos y feriados configurados).
+    - Resto: cada cuota vence N días después de la anterior.
+    """
+    fechas = []
+    if frecuencia == 'DI':
+        calendario = obtener_calendario()
+        fecha = calendario.siguiente_habil(fecha_inicio)
+        for _ in range(cuotas):
+            fechas.append(fecha)
+            fecha = calendario.siguiente_habil(fecha + timedelta(days=1))
+    else:
+        paso = timedelta(days=DIAS_POR_FRECUENCIA.get(frecuencia, 0))
+        for numero in range(1, cuotas + 1):
+            fechas.append(fecha_inicio + paso * numero)
+    return fechas
+
+
+def fechas_hasta_fecha_fin(fecha_inicio, fecha_fin, cuotas, frecuencia):
+    """Distribuye las cuotas uniformemente entre fecha_inicio y fecha_fin"""
+    total_dias = (fecha_fin - fecha_inicio).days
+    if total_dias <= 0:
+        total_dias = 1
+
+    calendario = obtener_calendario()
+    fechas = []
+    for numero in range(1, cuotas + 1):
+        dias_offset = int(round(total_dias * numero / cuotas))
+        fecha = fecha_inicio + timedelta(days=dias_offset)
+        # Si es frecuencia diaria, saltar días no hábiles
+        if frecuencia == 'DI':
+            fecha = calendario.siguiente_habil(fecha)
+        fechas.append(fecha)
+    return fechas
+
+
+def planificar_cuotas(monto_total, cuotas, frecuencia, fecha_inicio, fecha_fin=None):
+    """
+    Devuelve la lista de CuotaPlanificada de un préstamo.
+    Si se indica fecha_fin (fecha manual), las cuotas se reparten hasta esa fecha.
+    """
+    if fecha_fin:
+        fechas = fechas_hasta_fecha_fin(fecha_inicio, fecha_fin, cuotas, frecuencia)
+    else:
+        fechas = fechas_por_frecuencia(fecha_inicio, cuotas, frecuencia)
+
+    monto_cuota = round(monto_total / cuotas, 2)
+    return [
+        CuotaPlanificada(numero, fecha, monto_cuota)
+        for numero, fecha in enumerate(fechas, 1)
+    ]
+
+
+@lru_cache(maxsize=4096)
+def calcular_fecha_fin(fecha_inicio, cuotas, frecuencia):
+    """
+    Fecha de vencimiento de la última cuota del cronograma.
+    Se calcula en forma cerrada (sin recorrer día por día) y se cachea por
+    (fecha_inicio, cuotas, frecuencia), ya que Prestamo.save() la recalcula
+    en cada guardado.
+    """
+    if cuotas < 1:
+        return fecha_inicio
+    if frecuencia == 'DI':
+        return obtener_calendario().enesimo_habil(fecha_inicio, cuotas)
+    return fecha_inicio + timedelta(days=DIAS_POR_FRECUENCIA.get(frecuencia, 0) * cuotas)
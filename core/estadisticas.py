@@ -0,0 +1,56 @@
+"""
+Estadísticas del dashboard.
+
+Todas las cifras de cuotas del dashboard salen de una sola consulta con
+agregaciones condicionales (Sum/Count con filter=Q(...)), limitada a las
+cuotas pendientes y a los cobros del día: usa los índices parciales de Cuota
+en vez de recorrer todo el historial.
+
+No se cachea: con varios procesos, una caché local seguiría mostrando cifras
+viejas en los demás después de cada pago.
+"""
+from decimal import Decimal
+
+from django.db.models import Count, Q, Sum
+
+from .models import Cliente, Cuota, Prestamo, fecha_local_hoy
+
+
+def calcular_resumen_dashboard(cobrador=None, hoy=None):
+    """
+    Cifras del dashboard. Con cobrador=None se calculan para toda la cartera (admin).
+    Las de cuotas salen de una única consulta; préstamos y clientes activos son
+    dos COUNT sobre índices.
+    """
+    hoy = hoy or fecha_local_hoy()
+    cuotas = Cuota.objects.filter(Q(estado__in=['PE', 'PC']) | Q(fecha_pago_real=hoy))
+    prestamos = Prestamo.objects.filter(estado='AC')
+    clientes = Cliente.objects.filter(estado='AC')
+    if cobrador is not None:
+        cuotas = cuotas.filter(prestamo__cobrador=cobrador)
+        prestamos = prestamos.filter(cobrador=cobrador)
+        clientes = clientes.filter(usuario=cobrador)
+
+    cobrada_hoy = Q(fecha_pago_real=hoy, estado__in=['PA', 'PC'])
+    pendiente = Q(estado__in=['PE', 'PC'], prestamo__estado='AC')
+
+    totales = cuotas.aggregate(
+        total_cobrado_hoy=Sum('monto_pagado', filter=cobrada_hoy),
+        cantidad_cobros_hoy=Count('id', filter=cobrada_hoy),
+        cuotas_pendientes_hoy=Count('id', filter=pendiente & Q(fecha_vencimiento=hoy)),
+        cuotas_vencidas=Count('id', filter=pendiente & Q(fecha_vencimiento__lt=hoy)),
+        total_por_cobrar=Sum('monto_cuota', filter=pendiente & Q(fecha_vencimiento=hoy)),
+        total_cartera=Sum('monto_cuota', filter=pendiente),
+    )
+
+    return {
+        'total_cobrado_hoy': totales['total_cobrado_hoy'] or Decimal('0.00'),
+        'cantidad_cobros_hoy': totales['cantidad_cobros_hoy'] or 0,
+        'cuotas_pendientes_hoy': totales['cuotas_pendientes_hoy'],
+        'cuotas_vencidas': totales['cuotas_vencidas'],
+        'total_por_cobrar': totales['total_por_cobrar'] or Decimal('0.00'),
+        'prestamos_activos': prestamos.count(),
+        'clientes_activos': clientes.count(),
+        'total_cartera': totales['total_cartera'] or Decimal('0.00'),
+    }
+
@@ -0,0 +1,870 @@
+"""
+Exportaciones a Excel (y a CSV, JSON Lines y Parquet).
+
+Cada exportación se arma como una Planilla: columnas, filas de título y de
+totales, y un iterable de filas que recorre la consulta en lotes
+(.iterator(chunk_size=...)), así que nunca se cargan todas las filas juntas.
+
+escribir_xlsx usa openpyxl en modo write-only: cada fila se escribe al
+archivo temporal de la hoja apenas se genera, y todas las celdas comparten
+unos pocos estilos con nombre (ESTILOS) en vez de crear un Border o un Font
+por celda. respuesta_xlsx escribe el archivo completo en un temporal en
+disco (un xlsx es un zip: no se puede enviar antes de terminarlo) y lo envía
+desde ahí con respuesta_archivo, con memoria constante sin importar la
+cantidad de filas: por WSGI con FileResponse y por ASGI leyéndolo en partes
+desde un iterador async (a un iterador sync Django lo junta entero en
+memoria antes de enviarlo).
+
+Los mismos datos se pueden exportar con format=csv|jsonl|parquet para
+procesos de contabilidad y BI: CSV y JSON Lines se envían fila por fila a
+medida que se leen (con los montos en formato ARS si se pide; por ASGI, en
+lotes desde un iterador async, ver partes_async), y Parquet se
+escribe por columnas, en grupos de LOTE_DEFAULT filas, si pyarrow está
+instalado. Estos formatos solo llevan encabezado y datos (sin títulos,
+totales ni estilos).
+
+Los armadores de planillas reciben el usuario para filtrar lo que le
+corresponde; con usuario=None se exporta todo (administradores).
+
+Las exportaciones de más de EXPORTACIONES_FILAS_DIRECTAS filas no se generan
+en el request: se encola un TrabajoExportacion, la tarea 'exportaciones' del
+programador escribe el archivo en MEDIA_ROOT y se avisa al usuario con una
+notificación con el enlace de descarga. Si se vuelve a pedir lo mismo dentro
+de EXPORTACIONES_REUTILIZAR_MINUTOS se devuelve el mismo trabajo (y archivo).
+"""
+import csv
+import heapq
+import json
+import logging
+import os
+import tempfile
+import traceback
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.files import File
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Q, Sum, Value
+from django.db.models.functions import Coalesce
+from django.http import FileResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import CierreDiario, Cliente, Cuota, HistorialModificacionPago, Notificacion, Prestamo, TrabajoExportacion
+from .templatetags.currency_filters import formato_ars
+
+
+logger = logging.getLogger(__name__)
+
+
+TIPO_XLSX = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+# format=: nombre para mensajes y tipo de contenido
+FORMATOS = {
+    'xlsx': ('Excel', TIPO_XLSX),
+    'csv': ('CSV', 'text/csv; charset=utf-8'),
+    'jsonl': ('JSON Lines', 'application/x-ndjson; charset=utf-8'),
+    'parquet': ('Parquet', 'application/vnd.apache.parquet'),
+}
+ESTILOS_NUMERICOS = ('numero', 'cobrado')
+LOTE_DEFAULT = 2000
+PARTE_RESPUESTA = 64 * 1024
+EXPORTACIONES_FILAS_DIRECTAS_DEFAULT = 5000
+EXPORTACIONES_REUTILIZAR_MINUTOS_DEFAULT = 10
+EXPORTACIONES_RETENCION_HORAS_DEFAULT = 24
+EXPORTACIONES_ABANDONO_DEFAULT = 2 * 3600
+
+# estilo: nombre de ESTILOS para las celdas de la columna
+Columna = namedtuple('Columna', ['titulo', 'ancho', 'estilo'], defaults=['celda'])
+# resaltado: None, 'modificada' o 'recibida' (color de fondo de toda la fila)
+Fila = namedtuple('Fila', ['valores', 'resaltado'], defaults=[None])
+# Fila de totales: etiqueta en las columnas 1..unir (combinadas) y {columna: valor}
+Total = namedtuple('Total', ['etiqueta', 'valores', 'unir'])
+# cantidad: filas de datos (decide si se exporta en el request o en segundo plano)
+Planilla = namedtuple(
+    'Planilla', ['hoja', 'archivo', 'color', 'columnas', 'filas', 'cantidad', 'encabezado', 'pie'],
+    defaults=[(), ()]
+)
+
+BORDE = 'borde'
+# Estilos con nombre: se registran una vez por libro y las celdas solo los referencian.
+# 'marca' se usa en las filas resaltadas; en las demás esa columna va 'centrado'.
+ESTILOS = {
+    'titulo': {'font': {'bold': True, 'size': 14}, 'alignment': {'horizontal': 'center'}},
+    'info': {'alignment': {'horizontal': 'center'}},
+    'leyenda': {'font': {'italic': True, 'size': 9}, 'alignment': {'horizontal': 'center'}},
+    'celda': {BORDE: True},
+    'numero': {BORDE: True, 'number_format': '#,##0'},
+    'cobrado': {BORDE: True, 'number_format': '#,##0', 'font': {'bold': True, 'color': '198754'}},
+    'centrado': {BORDE: True, 'alignment': {'horizontal': 'center'}},
+    'marca': {BORDE: True, 'alignment': {'horizontal': 'center'}, 'font': {'bold': True, 'color': '856404'}},
+    'ajustado': {BORDE: True, 'alignment': {'wrap_text': True}},
+    'total_etiqueta': {'font': {'bold': True, 'size': 12}},
+    'total': {'font': {'bold': True, 'size': 12}, 'number_format': '#,##0'},
+}
+RESALTADOS = {
+    'modificada': 'FFF3CD',  # Amarillo claro
+    'recibida': 'D1ECF1',    # Celeste claro
+}
+
+
+def openpyxl_disponible():
+    try:
+        import openpyxl  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def pyarrow_disponible():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def en_lotes(queryset, tamaño=LOTE_DEFAULT):
+    """Recorre la consulta con iterator() y devuelve listas de hasta `tamaño` objetos"""
+    lote = []
+    for objeto in queryset.iterator(chunk_size=tamaño):
+        lote.append(objeto)
+        if len(lote) >= tamaño:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+
+# ==================== ESCRITURA XLSX ====================
+
+class _Estilos:
+    """Registra en el libro los estilos con nombre a medida que se usan"""
+
+    def __init__(self, libro):
+        self.libro = libro
+        self.registrados = set()
+
+    def __call__(self, nombre, resaltado=None, color=None):
+        from openpyxl.styles import Alignment, Border, Font, NamedStyle, PatternFill, Side
+
+        clave = '_'.join(parte for parte in (nombre, resaltado, color) if parte)
+        if clave in self.registrados:
+            return clave
+
+        if nombre == 'encabezado':
+            definicion = {
+                BORDE: True, 'font': {'bold': True, 'color': 'FFFFFF'},
+                'alignment': {'horizontal': 'center', 'vertical': 'center', 'wrap_text': True},
+            }
+        else:
+            definicion = ESTILOS[nombre]
+        estilo = NamedStyle(name=clave)
+        if 'font' in definicion:
+            estilo.font = Font(**definicion['font'])
+        if 'alignment' in definicion:
+            estilo.alignment = Alignment(**definicion['alignment'])
+        if 'number_format' in definicion:
+            estilo.number_format = definicion['number_format']
+        if definicion.get(BORDE):
+            lado = Side(style='thin')
+            estilo.border = Border(left=lado, right=lado, top=lado, bottom=lado)
+        relleno = color or RESALTADOS.get(resaltado)
+        if relleno:
+            estilo.fill = PatternFill(start_color=relleno, end_color=relleno, fill_type='solid')
+        self.libro.add_named_style(estilo)
+        self.registrados.add(clave)
+        return clave
+
+
+def _valor(valor):
+    return float(valor) if isinstance(valor, Decimal) else valor
+
+
+def escribir_xlsx(planilla, destino):
+    """Escribe la planilla en `destino` (ruta o archivo abierto en modo binario)"""
+    import openpyxl
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.utils import get_column_letter
+
+    libro = openpyxl.Workbook(write_only=True)
+    estilo = _Estilos(libro)
+    hoja = libro.create_sheet(planilla.hoja)
+    ultima = get_column_letter(len(planilla.columnas))
+
+    def celda(valor, nombre_estilo):
+        resultado = WriteOnlyCell(hoja, value=_valor(valor))
+        resultado.style = nombre_estilo
+        return resultado
+
+    # En write-only los anchos y las celdas combinadas se definen antes de escribir
+    for numero, columna in enumerate(planilla.columnas, 1):
+        hoja.column_dimensions[get_column_letter(numero)].width = columna.ancho
+
+    fila = 0
+    for texto, nombre_estilo in planilla.encabezado:
+        fila += 1
+        hoja.merged_cells.add(f'A{fila}:{ultima}{fila}')
+        hoja.append([celda(texto, estilo(nombre_estilo))])
+    if planilla.encabezado:
+        fila += 1
+        hoja.append([])
+
+    encabezado = estilo('encabezado', color=planilla.color)
+    hoja.append([celda(columna.titulo, encabezado) for columna in planilla.columnas])
+    fila += 1
+
+    for datos in planilla.filas:
+        valores, resaltado = (datos.valores, datos.resaltado) if isinstance(datos, Fila) else (datos, None)
+        celdas = []
+        for columna, valor in zip(planilla.columnas, valores):
+            nombre_estilo = columna.estilo
+            if nombre_estilo == 'marca' and not resaltado:
+                nombre_estilo = 'centrado'
+            celdas.append(celda(valor, estilo(nombre_estilo, resaltado)))
+        hoja.append(celdas)
+        fila += 1
+
+    for total in planilla.pie:
+        fila += 1
+        hoja.merged_cells.add(f'A{fila}:{get_column_letter(total.unir)}{fila}')
+        celdas = [None] * max(total.valores, default=1)
+        celdas[0] = celda(total.etiqueta, estilo('total_etiqueta'))
+        for numero, valor in total.valores.items():
+            celdas[numero - 1] = celda(valor, estilo('total'))
+        hoja.append(celdas)
+
+    libro.save(destino)
+
+
+async def partes_async(partes, tamaño=LOTE_DEFAULT):
+    """
+    Las partes de una respuesta como iterador async, para servirlas por ASGI
+    (a un iterador sync Django lo junta entero con sync_to_async(list) antes
+    de enviarlo). Se piden de a `tamaño` en el hilo del request, que es el que
+    tiene abierta la consulta que las va generando.
+    """
+    siguientes = sync_to_async(lambda: list(islice(partes, tamaño)))
+    try:
+        while True:
+            lote = await siguientes()
+            if not lote:
+                break
+            for parte in lote:
+                yield parte
+    finally:
+        await sync_to_async(partes.close)()
+
+
+def _respuesta(planilla, formato, partes, asincrono=False):
+    if asincrono:
+        partes = partes_async(partes)
+    response = StreamingHttpResponse(partes, content_type=FORMATOS[formato][1])
+    response['Content-Disposition'] = f'attachment; filename={planilla.archivo}.{formato}'
+    return response
+
+
+def respuesta_archivo(archivo, nombre, content_type, asincrono=False):
+    """
+    Descarga de un archivo ya escrito, abierto en binario. Por WSGI es un
+    FileResponse; por ASGI (asincrono=True) se lee de a PARTE_RESPUESTA bytes
+    desde un iterador async, para que Django no lo junte entero en memoria.
+    """
+    if not asincrono:
+        return FileResponse(archivo, as_attachment=True, filename=nombre, content_type=content_type)
+
+    archivo.seek(0, os.SEEK_END)
+    tamaño = archivo.tell()
+    archivo.seek(0)
+    leer = sync_to_async(archivo.read, thread_sensitive=False)
+
+    async def partes():
+        try:
+            while True:
+                parte = await leer(PARTE_RESPUESTA)
+                if not parte:
+                    break
+                yield parte
+        finally:
+            archivo.close()
+
+    response = StreamingHttpResponse(partes(), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename={nombre}'
+    response['Content-Length'] = str(tamaño)
+    return response
+
+
+def _respuesta_archivo(planilla, formato, escribir, asincrono=False):
+    """
+    Respuesta con un archivo que hay que terminar antes de enviarlo (xlsx,
+    parquet): se escribe completo en un temporal en disco y se envía desde ahí.
+    """
+    archivo = tempfile.TemporaryFile()
+    try:
+        escribir(planilla, archivo)
+    except BaseException:
+        archivo.close()
+        raise
+    archivo.seek(0)
+    return respuesta_archivo(archivo, f'{planilla.archivo}.{formato}', FORMATOS[formato][1], asincrono)
+
+
+def respuesta_xlsx(planilla, asincrono=False):
+    """Descarga de la planilla en Excel (asincrono=True si el request llegó por ASGI)"""
+    return _respuesta_archivo(planilla, 'xlsx', escribir_xlsx, asincrono)
+
+
+# ==================== CSV, JSON LINES Y PARQUET ====================
+
+def filas_datos(planilla, formateado=False):
+    """Valores de cada fila; con formateado=True los montos van como texto en formato ARS"""
+    numericas = [columna.estilo in ESTILOS_NUMERICOS for columna in planilla.columnas]
+    for datos in planilla.filas:
+        valores = datos.valores if isinstance(datos, Fila) else datos
+        if formateado:
+            valores = [
+                formato_ars(valor) if numerica and isinstance(valor, (int, float, Decimal)) else valor
+                for valor, numerica in zip(valores, numericas)
+            ]
+        yield valores
+
+
+class _Eco:
+    """Archivo falso para csv.writer: devuelve la línea en vez de guardarla"""
+
+    def write(self, valor):
+        return valor
+
+
+def respuesta_csv(planilla, formateado=False, asincrono=False):
+    escritor = csv.writer(_Eco())
+
+    def lineas():
+        yield escritor.writerow([columna.titulo for columna in planilla.columnas])
+        for valores in filas_datos(planilla, formateado):
+            yield escritor.writerow(valores)
+
+    return _respuesta(planilla, 'csv', lineas(), asincrono)
+
+
+def respuesta_jsonl(planilla, formateado=False, asincrono=False):
+    titulos = [columna.titulo for columna in planilla.columnas]
+
+    def lineas():
+        for valores in filas_datos(planilla, formateado):
+            fila = dict(zip(titulos, map(_valor, valores)))
+            yield json.dumps(fila, ensure_ascii=False, default=str) + '\n'
+
+    return _respuesta(planilla, 'jsonl', lineas(), asincrono)
+
+
+def escribir_parquet(planilla, destino):
+    """
+    Escribe la planilla en Parquet: las columnas de montos como float64 y el
+    resto como texto ('-' y vacíos quedan nulos en las numéricas). Cada lote de
+    filas se convierte a columnas y se escribe como un grupo de filas.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    numericas = [columna.estilo in ESTILOS_NUMERICOS for columna in planilla.columnas]
+    esquema = pa.schema([
+        (columna.titulo, pa.float64() if numerica else pa.string())
+        for columna, numerica in zip(planilla.columnas, numericas)
+    ])
+
+    def columna_arrow(valores, numerica):
+        if numerica:
+            return [float(v) if isinstance(v, (int, float, Decimal)) else None for v in valores]
+        return [None if v is None else str(v) for v in valores]
+
+    def escribir_lote(escritor, lote):
+        columnas = zip(*lote)
+        escritor.write_table(pa.Table.from_arrays(
+            [
+                pa.array(columna_arrow(valores, numerica), type=campo.type)
+                for valores, numerica, campo in zip(columnas, numericas, esquema)
+            ],
+            schema=esquema
+        ))
+
+    with pq.ParquetWriter(destino, esquema) as escritor:
+        lote = []
+        for valores in filas_datos(planilla):
+            lote.append(valores)
+            if len(lote) >= LOTE_DEFAULT:
+                escribir_lote(escritor, lote)
+                lote = []
+        if lote:
+            escribir_lote(escritor, lote)
+
+
+def respuesta_parquet(planilla, asincrono=False):
+    return _respuesta_archivo(planilla, 'parquet', escribir_parquet, asincrono)
+
+
+def respuesta_datos(planilla, formato, formateado=False, asincrono=False):
+    """Respuesta en un formato de datos (csv, jsonl o parquet; asincrono=True si el request llegó por ASGI)"""
+    if formato == 'parquet':
+        return respuesta_parquet(planilla, asincrono)
+    if formato == 'jsonl':
+        return respuesta_jsonl(planilla, formateado, asincrono)
+    return respuesta_csv(planilla, formateado, asincrono)
+
+
+# ==================== PLANILLAS ====================
+
+def _generado():
+    return f'Generado: {datetime.now().strftime("%d/%m/%Y %H:%M")}'
+
+
+def planilla_cobros(usuario, fecha, ruta_id=None, incluir_vencidas=True):
+    """Cuotas pendientes a cobrar en la fecha (y las vencidas, si se piden)"""
+    cuotas = Cuota.objects.filter(prestamo__estado='AC', estado__in=['PE', 'PC'])
+    if usuario is not None:
+        cuotas = cuotas.filter(prestamo__cobrador=usuario)
+    if incluir_vencidas:
+        cuotas = cuotas.filter(fecha_vencimiento__lte=fecha)
+    else:
+        cuotas = cuotas.filter(fecha_vencimiento=fecha)
+    if ruta_id:
+        cuotas = cuotas.filter(prestamo__cliente__ruta_id=ruta_id)
+
+    totales = cuotas.aggregate(cantidad=Count('id'), total=Sum('monto_cuota'))
+    cuotas = cuotas.select_related(
+        'prestamo', 'prestamo__cliente', 'prestamo__cliente__ruta'
+    ).order_by('prestamo__cliente__ruta__orden', 'prestamo__cliente__apellido')
+
+    def filas():
+        numero = 0
+        for lote in en_lotes(cuotas):
+            # Cuotas del lote que recibieron monto de otra (pago parcial previo)
+            recibidos = {
+                h.cuota_id: h for h in HistorialModificacionPago.objects.filter(
+                    cuota_id__in=[cuota.pk for cuota in lote], tipo_modificacion='MR'
+                ).select_related('cuota_relacionada')
+            }
+            for cuota in lote:
+                numero += 1
+                prestamo = cuota.prestamo
+                cliente = prestamo.cliente
+                recibido = recibidos.get(cuota.pk)
+                observaciones = '-'
+                if recibido:
+                    origen = f' de cuota #{recibido.cuota_relacionada.numero_cuota}' if recibido.cuota_relacionada else ''
+                    observaciones = f'Recibió ${recibido.monto_restante_transferido:,.0f}{origen}'
+                    if recibido.interes_mora > 0:
+                        observaciones += f' (mora: ${recibido.interes_mora:,.0f})'
+                yield Fila([
+                    numero,
+                    f'#{prestamo.pk}',
+                    cliente.nombre_completo,
+                    cliente.telefono,
+                    cliente.ruta.nombre if cliente.ruta else 'Sin Ruta',
+                    f'{cuota.numero_cuota}/{prestamo.cuotas_pactadas}',
+                    cuota.monto_cuota,
+                    recibido.monto_cuota_anterior if recibido else '-',
+                    cuota.fecha_vencimiento.strftime('%d/%m'),
+                    prestamo.fecha_finalizacion.strftime('%d/%m/%Y') if prestamo.fecha_finalizacion else '-',
+                    '',
+                    'SÍ' if recibido else '-',
+                    observaciones,
+                ], 'recibida' if recibido else None)
+
+    return Planilla(
+        hoja=f"Planilla {fecha.strftime('%d-%m-%Y')}",
+        archivo=f'planilla_cobros_{fecha.strftime("%Y%m%d")}',
+        color='333333',
+        columnas=[
+            Columna('#', 5), Columna('Préstamo', 12), Columna('Cliente', 25),
+            Columna('Teléfono', 15), Columna('Ruta', 15), Columna('Cuota', 10),
+            Columna('Monto', 15, 'numero'), Columna('Monto Original', 16, 'numero'),
+            Columna('Venc.', 12), Columna('Fecha Fin', 14), Columna('Cobrado', 15),
+            Columna('Modificada', 14, 'marca'), Columna('Observaciones', 40, 'ajustado'),
+        ],
+        filas=filas(),
+        cantidad=totales['cantidad'],
+        encabezado=[
+            (f'PLANILLA DE COBROS - {fecha.strftime("%d/%m/%Y")}', 'titulo'),
+            (f'Total cobros: {totales["cantidad"]} | {_generado()}', 'info'),
+            ('■ Celeste = Cuota modificada (recibió monto de otra cuota por pago parcial)', 'leyenda'),
+        ],
+        pie=[Total('TOTAL ESPERADO:', {8: totales['total'] or Decimal('0.00')}, unir=7)],
+    )
+
+
+def _observaciones_cierre(historial, recibido):
+    """Resaltado de la fila, monto original y observaciones de un pago del cierre"""
+    resaltado = None
+    partes = []
+    for h in historial:
+        if h.tipo_modificacion == 'PP':
+            resaltado = 'modificada'
+            texto = f'Pago parcial: cobrado ${h.monto_pagado:,.0f} de ${h.monto_cuota_anterior:,.0f}'
+            if h.monto_restante_transferido > 0:
+                texto += f'. Restante ${h.monto_restante_transferido:,.0f} transferido'
+            partes.append(texto)
+        elif h.tipo_modificacion == 'TR':
+            destino = f' a cuota #{h.cuota_relacionada.numero_cuota}' if h.cuota_relacionada else ''
+            partes.append(f'Transferido ${h.monto_restante_transferido:,.0f}{destino}')
+            if h.interes_mora > 0:
+                partes.append(f'(incluye mora: ${h.interes_mora:,.0f})')
+        elif h.tipo_modificacion == 'CE':
+            destino = f' (cuota #{h.cuota_relacionada.numero_cuota})' if h.cuota_relacionada else ''
+            partes.append(f'Cuota especial creada por ${h.monto_restante_transferido:,.0f}{destino}')
+
+    monto_original = '-'
+    if recibido:
+        resaltado = resaltado or 'recibida'
+        monto_original = recibido.monto_cuota_anterior
+        origen = f' de cuota #{recibido.cuota_relacionada.numero_cuota}' if recibido.cuota_relacionada else ''
+        recibio = [f'Recibió ${recibido.monto_restante_transferido:,.0f}{origen}']
+        if recibido.interes_mora > 0:
+            recibio.append(f'(incluye mora: ${recibido.interes_mora:,.0f})')
+        partes = recibio + partes
+    return resaltado, monto_original, ' | '.join(partes) if partes else '-'
+
+
+def filas_cierre(pagos):
+    """
+    (pago, valores, resaltado) de cada pago del cierre, por apellido del
+    cliente; valores son las columnas de la planilla sin el número de fila.
+    """
+    pagos = pagos.select_related(
+        'prestamo', 'prestamo__cliente', 'prestamo__cliente__ruta', 'cobrado_por'
+    ).order_by('prestamo__cliente__apellido')
+    for lote in en_lotes(pagos):
+        historial_por_cuota = {}
+        recibidos = {}
+        for h in HistorialModificacionPago.objects.filter(
+            cuota_id__in=[pago.pk for pago in lote]
+        ).select_related('cuota_relacionada').order_by('fecha_modificacion'):
+            historial_por_cuota.setdefault(h.cuota_id, []).append(h)
+            if h.tipo_modificacion == 'MR':
+                recibidos[h.cuota_id] = h
+        for pago in lote:
+            prestamo = pago.prestamo
+            cliente = prestamo.cliente
+            resaltado, monto_original, observaciones = _observaciones_cierre(
+                historial_por_cuota.get(pago.pk, []), recibidos.get(pago.pk)
+            )
+            cobrador = pago.cobrado_por
+            yield pago, [
+                f'#{prestamo.pk}',
+                cliente.nombre_completo,
+                cliente.direccion or '-',
+                cliente.telefono,
+                f'{pago.numero_cuota}/{prestamo.cuotas_pactadas}',
+                pago.monto_cuota,
+                pago.monto_pagado,
+                pago.get_metodo_pago_display(),
+                pago.monto_efectivo or 0,
+                pago.monto_transferencia or 0,
+                pago.get_estado_display(),
+                prestamo.fecha_inicio.strftime('%d/%m/%Y'),
+                f'{prestamo.tasa_interes_porcentaje}%',
+                prestamo.fecha_finalizacion.strftime('%d/%m/%Y') if prestamo.fecha_finalizacion else '-',
+                (cobrador.get_full_name() or cobrador.username) if cobrador else '-',
+                'SÍ' if resaltado else '-',
+                monto_original,
+                observaciones,
+            ], resaltado
+
+
+# Columnas de montos de filas_cierre (sin el número de fila): en CierreDiario
+# quedan guardadas como texto
+COLUMNAS_MONTOS_CIERRE = (5, 6, 8, 9, 16)
+
+
+def filas_guardadas(cierres):
+    """Filas de los cierres guardados, intercaladas por apellido como en la consulta"""
+    filas = heapq.merge(*(cierre.filas for cierre in cierres), key=lambda fila: fila[0])
+    for _, valores, resaltado in filas:
+        for columna in COLUMNAS_MONTOS_CIERRE:
+            if valores[columna] != '-':
+                valores[columna] = Decimal(str(valores[columna]))
+        yield valores, resaltado
+
+
+def planilla_cierre(usuario, fecha):
+    """
+    Cobros realizados en la fecha (completos y parciales). Los días terminados
+    salen de CierreDiario; el día en curso se calcula.
+    """
+    cierres = CierreDiario.obtener(fecha, usuario)
+    if cierres is None:
+        pagos = Cuota.objects.filter(fecha_pago_real=fecha, estado__in=['PA', 'PC'])
+        if usuario is not None:
+            pagos = pagos.filter(prestamo__cobrador=usuario)
+        totales = pagos.aggregate(
+            cantidad=Count('id'),
+            cobrado=Sum('monto_pagado'),
+            efectivo=Sum('monto_efectivo'),
+            transferencia=Sum('monto_transferencia'),
+        )
+        cantidad = totales['cantidad']
+        total_cobrado = totales['cobrado'] or Decimal('0.00')
+        total_efectivo = totales['efectivo'] or Decimal('0.00')
+        total_transferencia = totales['transferencia'] or Decimal('0.00')
+        detalle = ((valores, resaltado) for _, valores, resaltado in filas_cierre(pagos))
+    else:
+        cantidad = sum(cierre.cantidad_pagos for cierre in cierres)
+        total_cobrado = sum((cierre.total_cobrado for cierre in cierres), Decimal('0.00'))
+        total_efectivo = sum((cierre.total_efectivo for cierre in cierres), Decimal('0.00'))
+        total_transferencia = sum((cierre.total_transferencia for cierre in cierres), Decimal('0.00'))
+        detalle = filas_guardadas(cierres)
+
+    def filas():
+        for numero, (valores, resaltado) in enumerate(detalle, start=1):
+            yield Fila([numero, *valores], resaltado)
+
+    return Planilla(
+        hoja=f"Cierre {fecha.strftime('%d-%m-%Y')}",
+        archivo=f'cierre_caja_{fecha.strftime("%Y%m%d")}',
+        color='198754',
+        columnas=[
+            Columna('#', 5), Columna('Préstamo', 12), Columna('Cliente', 25),
+            Columna('Dirección', 30), Columna('Teléfono', 15), Columna('Cuota', 10),
+            Columna('Monto Cuota', 15, 'numero'), Columna('Cobrado', 15, 'cobrado'),
+            Columna('Método Pago', 16), Columna('Efectivo', 15, 'numero'),
+            Columna('Transferencia', 15, 'numero'), Columna('Estado', 12),
+            Columna('Fecha Inicio', 16), Columna('% Interés', 12),
+            Columna('Fecha Fin Préstamo', 16), Columna('Cobrador', 20),
+            Columna('Modificada', 14, 'marca'), Columna('Monto Original', 16, 'numero'),
+            Columna('Observaciones', 45, 'ajustado'),
+        ],
+        filas=filas(),
+        cantidad=cantidad,
+        encabezado=[
+            (f'CIERRE DE CAJA - {fecha.strftime("%d/%m/%Y")}', 'titulo'),
+            (
+                f'Total cobrado: ${total_cobrado:,.0f} (Efectivo: ${total_efectivo:,.0f} | '
+                f'Transferencia: ${total_transferencia:,.0f}) | Pagos: {cantidad} | {_generado()}',
+                'info'
+            ),
+            (
+                '■ Amarillo = Pago parcial (se transfirió monto a otra cuota)  |  '
+                '■ Celeste = Cuota que recibió monto de otra cuota',
+                'leyenda'
+            ),
+        ],
+        pie=[Total(
+            'TOTAL COBRADO:', {8: total_cobrado, 10: total_efectivo, 11: total_transferencia}, unir=7
+        )],
+    )
+
+
+def planilla_clientes(usuario):
+    """Clientes activos"""
+    clientes = Cliente.objects.filter(estado='AC')
+    if usuario is not None:
+        clientes = clientes.filter(usuario=usuario)
+    clientes = clientes.select_related('ruta', 'tipo_negocio')
+
+    def filas():
+        for numero, cliente in enumerate(clientes.iterator(chunk_size=LOTE_DEFAULT), 1):
+            yield [
+                numero,
+                cliente.nombre,
+                cliente.apellido,
+                cliente.telefono,
+                cliente.direccion[:50],
+                cliente.get_categoria_display(),
+                cliente.ruta.nombre if cliente.ruta else '-',
+                cliente.tipo_negocio.nombre if cliente.tipo_negocio else '-',
+                cliente.limite_credito,
+            ]
+
+    return Planilla(
+        hoja='Clientes',
+        archivo=f'clientes_{datetime.now().strftime("%Y%m%d")}',
+        color='198754',
+        columnas=[
+            Columna('#', 15), Columna('Nombre', 20), Columna('Apellido', 20),
+            Columna('Teléfono', 15), Columna('Dirección', 30), Columna('Categoría', 15),
+            Columna('Ruta', 15), Columna('Tipo Negocio', 15), Columna('Límite Crédito', 15, 'numero'),
+        ],
+        filas=filas(),
+        cantidad=clientes.count(),
+    )
+
+
+def planilla_prestamos(usuario, estado=''):
+    """
+    Préstamos, opcionalmente de un solo estado. Todo sale de una consulta:
+    lo pagado y las cuotas pagadas se agregan sobre el JOIN con cuotas y las
+    filas se leen como tuplas (values_list), sin instanciar modelos.
+    """
+    prestamos = Prestamo.objects.all()
+    if usuario is not None:
+        prestamos = prestamos.filter(cliente__usuario=usuario)
+    if estado:
+        prestamos = prestamos.filter(estado=estado)
+    cantidad = prestamos.count()
+
+    decimal = DecimalField(max_digits=12, decimal_places=2)
+    pagado = Coalesce(
+        Sum('cuotas__monto_pagado', filter=Q(cuotas__estado__in=['PA', 'PC'])),
+        Value(Decimal('0.00')),
+        output_field=decimal
+    )
+    filas_prestamos = prestamos.annotate(
+        pagado=pagado,
+        pendiente=ExpressionWrapper(F('monto_total_a_pagar') - pagado, output_field=decimal),
+        pagadas=Count('cuotas', filter=Q(cuotas__estado='PA')),
+    ).order_by('-fecha_creacion').values_list(
+        'cliente__nombre', 'cliente__apellido', 'cliente__direccion',
+        'monto_solicitado', 'monto_total_a_pagar', 'pagado', 'pendiente', 'pagadas',
+        'cuotas_pactadas', 'frecuencia', 'estado', 'fecha_inicio', 'fecha_finalizacion',
+    )
+    frecuencias = dict(Prestamo.Frecuencia.choices)
+    estados = dict(Prestamo.Estado.choices)
+
+    def filas():
+        for numero, fila in enumerate(filas_prestamos.iterator(chunk_size=LOTE_DEFAULT), 1):
+            (nombre, apellido, direccion, monto, total, pagado, pendiente, pagadas, pactadas,
+             frecuencia, estado, inicio, finalizacion) = fila
+            yield [
+                numero,
+                f'{nombre} {apellido}',
+                direccion or '-',
+                monto,
+                total,
+                pagado,
+                pendiente,
+                f'{pagadas}/{pactadas}',
+                frecuencias.get(frecuencia, frecuencia),
+                estados.get(estado, estado),
+                inicio.strftime('%d/%m/%Y'),
+                finalizacion.strftime('%d/%m/%Y') if finalizacion else '-',
+            ]
+
+    return Planilla(
+        hoja='Préstamos',
+        archivo=f'prestamos_{datetime.now().strftime("%Y%m%d")}',
+        color='0d6efd',
+        columnas=[
+            Columna('#', 15), Columna('Cliente', 25), Columna('Dirección', 30),
+            Columna('Monto', 15, 'numero'), Columna('Total', 15, 'numero'),
+            Columna('Pagado', 15, 'numero'), Columna('Pendiente', 15, 'numero'),
+            Columna('Cuotas', 15), Columna('Frecuencia', 15), Columna('Estado', 15),
+            Columna('Fecha Inicio', 15), Columna('Fecha Finalización', 15),
+        ],
+        filas=filas(),
+        cantidad=cantidad,
+    )
+
+
+# ==================== EXPORTACIONES EN SEGUNDO PLANO ====================
+
+# tipo de TrabajoExportacion: armador de la planilla a partir de (usuario, parámetros)
+ARMADORES = {
+    TrabajoExportacion.Tipo.PLANILLA: lambda usuario, p: planilla_cobros(
+        usuario, date.fromisoformat(p['fecha']), p.get('ruta'), p.get('incluir_vencidas', True)
+    ),
+    TrabajoExportacion.Tipo.CIERRE: lambda usuario, p: planilla_cierre(usuario, date.fromisoformat(p['fecha'])),
+    TrabajoExportacion.Tipo.CLIENTES: lambda usuario, p: planilla_clientes(usuario),
+    TrabajoExportacion.Tipo.PRESTAMOS: lambda usuario, p: planilla_prestamos(usuario, p.get('estado', '')),
+}
+
+
+def exportar_en_segundo_plano(planilla, pedido=False):
+    """Si la exportación se encola en vez de generarse en el request"""
+    limite = getattr(settings, 'EXPORTACIONES_FILAS_DIRECTAS', EXPORTACIONES_FILAS_DIRECTAS_DEFAULT)
+    return pedido or planilla.cantidad >= limite
+
+
+def solicitar_exportacion(usuario, tipo, parametros, todos):
+    """
+    Encola la exportación (todos=True: sin filtrar por usuario, como la ve un
+    administrador) o reutiliza la misma pedida hace poco. Devuelve (trabajo, reutilizado).
+    """
+    minutos = getattr(settings, 'EXPORTACIONES_REUTILIZAR_MINUTOS', EXPORTACIONES_REUTILIZAR_MINUTOS_DEFAULT)
+    return TrabajoExportacion.solicitar(
+        usuario, tipo, {**parametros, 'todos': todos}, timedelta(minutes=minutos)
+    )
+
+
+def generar_exportacion(trabajo):
+    """Genera el archivo de un trabajo ya tomado y avisa al usuario; devuelve si salió bien"""
+    try:
+        planilla = ARMADORES[trabajo.tipo](
+            None if trabajo.parametros.get('todos') else trabajo.usuario, trabajo.parametros
+        )
+        with tempfile.TemporaryFile() as archivo:
+            escribir_xlsx(planilla, archivo)
+            archivo.seek(0)
+            trabajo.archivo.save(f'{planilla.archivo}.xlsx', File(archivo), save=False)
+    except Exception:
+        logger.exception('Falló la exportación %s', trabajo.pk)
+        trabajo.estado = TrabajoExportacion.Estado.ERROR
+        trabajo.error = traceback.format_exc()
+        trabajo.fecha_fin = timezone.now()
+        trabajo.save(update_fields=['estado', 'error', 'fecha_fin'])
+        Notificacion.crear_notificacion(
+            tipo=Notificacion.TipoNotificacion.ALERTA_SISTEMA,
+            titulo=f'No se pudo generar la exportación: {trabajo.get_tipo_display()}',
+            mensaje='Ocurrió un error al generar el archivo. Intente exportar nuevamente.',
+            usuario=trabajo.usuario,
+            prioridad=Notificacion.Prioridad.ALTA
+        )
+        return False
+
+    trabajo.estado = TrabajoExportacion.Estado.LISTO
+    trabajo.fecha_fin = timezone.now()
+    trabajo.save(update_fields=['archivo', 'estado', 'fecha_fin'])
+    Notificacion.crear_notificacion(
+        tipo=Notificacion.TipoNotificacion.INFO,
+        titulo=f'Exportación lista: {trabajo.get_tipo_display()}',
+        mensaje=f'El archivo ({planilla.cantidad} filas) está listo para descargar.',
+        usuario=trabajo.usuario,
+        enlace=reverse('core:descargar_exportacion', args=[trabajo.pk])
+    )
+    return True
+
+
+def purgar_exportaciones(ahora=None):
+    """Borra los trabajos terminados fuera de retención, con sus archivos"""
+    ahora = ahora or timezone.now()
+    horas = getattr(settings, 'EXPORTACIONES_RETENCION_HORAS', EXPORTACIONES_RETENCION_HORAS_DEFAULT)
+    vencidos = TrabajoExportacion.objects.filter(
+        estado__in=[TrabajoExportacion.Estado.LISTO, TrabajoExportacion.Estado.ERROR],
+        fecha_creacion__lt=ahora - timedelta(hours=horas)
+    )
+    borrados = 0
+    for trabajo in vencidos:
+        if trabajo.archivo:
+            trabajo.archivo.delete(save=False)
+        trabajo.delete()
+        borrados += 1
+    return borrados
+
+
+def procesar_exportaciones(ahora=None):
+    """Tarea del programador: genera las exportaciones pendientes y borra las vencidas"""
+    ahora = ahora or timezone.now()
+    # Las que quedaron en proceso de un programador que murió vuelven a la cola
+    abandono = getattr(settings, 'TAREAS_BLOQUEO', EXPORTACIONES_ABANDONO_DEFAULT)
+    TrabajoExportacion.objects.filter(
+        estado=TrabajoExportacion.Estado.PROCESANDO,
+        fecha_inicio__lt=ahora - timedelta(seconds=abandono)
+    ).update(estado=TrabajoExportacion.Estado.PENDIENTE)
+
+    generadas = fallidas = 0
+    pendientes = TrabajoExportacion.objects.filter(estado=TrabajoExportacion.Estado.PENDIENTE)
+    while True:
+        trabajo = pendientes.order_by('fecha_creacion').first()
+        if trabajo is None:
+            break
+        if not trabajo.tomar():
+            # La tomó otro proceso
+            continue
+        if generar_exportacion(trabajo):
+            generadas += 1
+        else:
+            fallidas += 1
+
+    borradas = purgar_exportaciones(ahora)
+    return f'{generadas} exportaciones generadas, {fallidas} con error, {borradas} vencidas borradas'
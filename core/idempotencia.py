@@ -0,0 +1,80 @@
+"""
+Claves de idempotencia para las APIs de cobro.
+
+Si el cliente manda el header Idempotency-Key, la respuesta JSON de la
+operación se guarda en ClaveIdempotencia y un reintento con la misma clave
+devuelve esa respuesta sin volver a ejecutar la vista (reintentar un pago
+parcial después de un timeout lo sumaría dos veces). Las respuestas con
+error no se guardan: la clave queda libre para reintentar.
+"""
+import json
+from functools import wraps
+
+from django.db import transaction
+from django.http import JsonResponse
+
+from .models import ClaveIdempotencia
+
+
+HEADER_IDEMPOTENCIA = 'Idempotency-Key'
+HEADER_REPETIDA = 'Idempotent-Replayed'
+LARGO_MAXIMO_CLAVE = ClaveIdempotencia._meta.get_field('clave').max_length
+
+
+class _RespuestaSinGuardar(Exception):
+    """Corta la transacción de la clave sin perder la respuesta de la vista"""
+
+    def __init__(self, response):
+        super().__init__()
+        self.response = response
+
+
+def _operacion(nombre, kwargs):
+    """Identifica la operación y su objeto (ej. 'cobrar:15'), para no reusar una clave en otra cuota"""
+    return ':'.join([nombre, *(str(valor) for valor in kwargs.values())])
+
+
+def _respuesta_guardada(registro, operacion):
+    if registro.operacion != operacion:
+        return JsonResponse({
+            'success': False,
+            'message': 'La clave de idempotencia ya se usó en otra operación.'
+        }, status=422)
+    response = JsonResponse(registro.respuesta, status=registro.codigo_estado)
+    response[HEADER_REPETIDA] = 'true'
+    return response
+
+
+def idempotente(nombre):
+    """
+    Decorador para vistas POST que devuelven JsonResponse. Sin el header
+    Idempotency-Key la vista se ejecuta como siempre.
+    """
+    def decorador(vista):
+        @wraps(vista)
+        def envoltura(request, *args, **kwargs):
+            clave = request.headers.get(HEADER_IDEMPOTENCIA)
+            if request.method != 'POST' or not clave or not request.user.is_authenticated:
+                return vista(request, *args, **kwargs)
+            if len(clave) > LARGO_MAXIMO_CLAVE:
+                return JsonResponse({
+                    'success': False,
+                    'message': f'La clave de idempotencia admite hasta {LARGO_MAXIMO_CLAVE} caracteres.'
+                }, status=400)
+            
+            operacion = _operacion(nombre, kwargs)
+            try:
+                # Una request repetida en paralelo espera en el índice único hasta que esta termine
+                with transaction.atomic():
+                    registro, creada = ClaveIdempotencia.reservar(request.user, clave, operacion)
+                    if not creada:
+                        return _respuesta_guardada(registro, operacion)
+                    response = vista(request, *args, **kwargs)
+                    if response.status_code >= 400:
+                        raise _RespuestaSinGuardar(response)
+                    registro.guardar_respuesta(json.loads(response.content), response.status_code)
+            except _RespuestaSinGuardar as e:
+                return e.response
+            return response
+        return envoltura
+    return decorador
@@ -0,0 +1,60 @@
+"""
+Comando para aplicar la política de retención: borra las notificaciones
+vencidas según su tipo y archiva la auditoría vieja en archivos mensuales
+comprimidos (ver core/retencion.py).
+
+Uso:
+    python manage.py apply_retention
+    python manage.py apply_retention --verificar       # solo informar
+    python manage.py apply_retention --lote 500 --pausa 0.2
+"""
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = 'Borra notificaciones vencidas y archiva la auditoría vieja'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--lote',
+            type=int,
+            default=1000,
+            help='Cantidad de filas por lote (default: 1000)'
+        )
+        parser.add_argument(
+            '--pausa',
+            type=float,
+            default=0,
+            help='Segundos de espera entre lotes (default: 0)'
+        )
+        parser.add_argument(
+            '--verificar',
+            action='store_true',
+            help='Solo informar cuántas filas están fuera de retención, sin borrarlas'
+        )
+
+    def handle(self, *args, **options):
+        from core import retencion
+
+        lote = max(options['lote'], 1)
+        pausa = max(options['pausa'], 0)
+
+        if options['verificar']:
+            vencidas = {tipo: n for tipo, n in retencion.notificaciones_vencidas().items() if n}
+            for tipo, cantidad in vencidas.items():
+                self.stdout.write(f'  Notificaciones {tipo}: {cantidad}')
+            self.stdout.write(
+                f'{sum(vencidas.values())} notificaciones para borrar, '
+                f'{retencion.auditoria_vencida()} registros de auditoría para archivar.'
+            )
+            return
+
+        borradas = retencion.purgar_notificaciones(lote=lote, pausa=pausa)
+        archivados = retencion.archivar_auditoria(lote=lote, pausa=pausa)
+
+        for mes, cantidad in sorted(archivados.items()):
+            self.stdout.write(f'  auditoria_{mes}.jsonl.gz: {cantidad} registros')
+        self.stdout.write(self.style.SUCCESS(
+            f'{sum(borradas.values())} notificaciones borradas, '
+            f'{sum(archivados.values())} registros de auditoría archivados.'
+        ))
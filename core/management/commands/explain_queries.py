@@ -0,0 +1,142 @@
+"""
+Comando para revisar los planes de ejecución de las consultas de cuotas
+que usan las vistas (dashboard, cobros, planilla, cierre de caja, stats
+de cobro y notificaciones) y marcar las que recorren tablas completas.
+
+Uso:
+    python manage.py explain_queries
+    python manage.py explain_queries --generar 400
+    python manage.py explain_queries --verbose-plan --estricto
+"""
+import re
+from datetime import timedelta
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count, Sum
+
+
+# Tablas grandes en las que un recorrido completo es un problema
+TABLAS_CRITICAS = ('core_cuota', 'core_prestamo')
+
+# PostgreSQL: "Seq Scan on core_cuota"  /  SQLite: "SCAN core_cuota" (sin USING INDEX)
+PATRON_SEQ_SCAN_PG = re.compile(r'Seq Scan on (\w+)')
+PATRON_SEQ_SCAN_SQLITE = re.compile(r'\bSCAN (\w+)(?!.*USING (?:COVERING )?INDEX)')
+
+
+def consultas_de_vistas(hoy, cobrador):
+    """
+    Consultas representativas de cada vista (mismos filtros que core/views.py).
+    Devuelve una lista de (nombre, queryset) para el cobrador indicado.
+    """
+    from core.models import Cuota, Prestamo
+
+    pendientes = Cuota.objects.filter(
+        estado__in=['PE', 'PC'],
+        prestamo__estado='AC',
+        prestamo__cobrador=cobrador
+    )
+    cobradas = Cuota.objects.filter(
+        estado__in=['PA', 'PC'],
+        prestamo__cobrador=cobrador
+    )
+    relaciones = ('prestamo', 'prestamo__cliente', 'prestamo__cliente__ruta')
+
+    return [
+        ('dashboard: cobros de hoy', cobradas.filter(fecha_pago_real=hoy).values('prestamo__cobrador').annotate(
+            total=Sum('monto_pagado'), cantidad=Count('id'))),
+        ('dashboard: pendientes hoy', pendientes.filter(fecha_vencimiento=hoy)),
+        ('dashboard: vencidas', pendientes.filter(fecha_vencimiento__lt=hoy)),
+        ('dashboard: cartera', pendientes.values('prestamo__estado').annotate(total=Sum('monto_cuota'))),
+        ('cobros: cuotas de hoy', pendientes.filter(fecha_vencimiento=hoy).select_related(*relaciones).order_by(
+            'prestamo__cliente__ruta__orden', 'prestamo__cliente__apellido')),
+        ('cobros: próximas 30 días', pendientes.filter(
+            fecha_vencimiento__gt=hoy,
+            fecha_vencimiento__lte=hoy + timedelta(days=30)
+        ).select_related(*relaciones).order_by('fecha_vencimiento')),
+        ('planilla: pendientes hasta la fecha', pendientes.filter(
+            fecha_vencimiento__lte=hoy).select_related(*relaciones)),
+        ('cierre de caja: pagos del día', cobradas.filter(fecha_pago_real=hoy).select_related(
+            'prestamo', 'prestamo__cliente', 'cobrado_por').order_by('prestamo__cliente__apellido')),
+        ('cobrar_cuota: stats del cobrador', cobradas.filter(fecha_pago_real=hoy).values('estado').annotate(
+            total=Sum('monto_pagado'))),
+        ('notificaciones: vencidas', Cuota.objects.filter(
+            fecha_vencimiento__lt=hoy, estado__in=['PE', 'PC'], prestamo__estado='AC')),
+        ('notificaciones: por vencer', Cuota.objects.filter(
+            fecha_vencimiento=hoy + timedelta(days=1), estado='PE', prestamo__estado='AC')),
+        ('préstamos: activos del cobrador', Prestamo.objects.filter(estado='AC', cobrador=cobrador)),
+    ]
+
+
+def tablas_recorridas(plan):
+    """Tablas críticas que el plan recorre completas (seq scan)"""
+    patron = PATRON_SEQ_SCAN_PG if connection.vendor == 'postgresql' else PATRON_SEQ_SCAN_SQLITE
+    tablas = set()
+    for linea in plan.splitlines():
+        for tabla in patron.findall(linea):
+            if tabla in TABLAS_CRITICAS:
+                tablas.add(tabla)
+    return sorted(tablas)
+
+
+class Command(BaseCommand):
+    help = 'Ejecuta EXPLAIN sobre las consultas de cuotas de las vistas y marca los recorridos secuenciales'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--generar',
+            type=int,
+            default=0,
+            metavar='CLIENTES',
+            help='Generar antes un set de datos con generate_test_volume (cantidad de clientes)'
+        )
+        parser.add_argument(
+            '--verbose-plan',
+            action='store_true',
+            help='Mostrar el plan completo de cada consulta'
+        )
+        parser.add_argument(
+            '--estricto',
+            action='store_true',
+            help='Terminar con error si alguna consulta recorre una tabla completa'
+        )
+
+    def handle(self, *args, **options):
+        from core.models import Prestamo, fecha_local_hoy
+
+        if options['generar']:
+            call_command('generate_test_volume', clientes=options['generar'], stdout=self.stdout)
+
+        prestamo = Prestamo.objects.filter(estado='AC', cobrador__isnull=False).select_related('cobrador').first()
+        if not prestamo:
+            raise CommandError('No hay préstamos activos con cobrador. Use --generar para crear datos.')
+        cobrador = prestamo.cobrador
+
+        # Actualizar estadísticas para que el planificador use datos reales
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+        self.stdout.write(f'=== EXPLAIN DE CONSULTAS ({connection.vendor}, cobrador: {cobrador.username}) ===\n')
+
+        marcadas = []
+        for nombre, queryset in consultas_de_vistas(fecha_local_hoy(), cobrador):
+            plan = queryset.explain()
+            tablas = tablas_recorridas(plan)
+            if tablas:
+                marcadas.append(nombre)
+                self.stdout.write(self.style.WARNING(f'  SEQ SCAN  {nombre}: {", ".join(tablas)}'))
+            else:
+                self.stdout.write(self.style.SUCCESS(f'  OK        {nombre}'))
+            if options['verbose_plan'] or tablas:
+                for linea in plan.splitlines():
+                    self.stdout.write(f'              {linea}')
+
+        self.stdout.write('')
+        if marcadas:
+            mensaje = f'{len(marcadas)} consultas recorren tablas completas.'
+            if options['estricto']:
+                raise CommandError(mensaje)
+            self.stdout.write(self.style.WARNING(mensaje))
+        else:
+            self.stdout.write(self.style.SUCCESS('Todas las consultas usan índices.'))
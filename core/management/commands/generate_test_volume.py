@@ -11,6 +11,7 @@ from django.core.management.base import BaseCommand
 from django.contrib.auth import get_user_model
 from decimal import Decimal
 from datetime import date, timedelta
+from io import StringIO
 import random
 
 User = get_user_model()
@@ -211,6 +212,10 @@ class Command(BaseCommand):
             if (i + 1) % 50 == 0:
                 self.stdout.write(f'   Progreso: {i + 1}/{cantidad_clientes} clientes...')
 
+        # Los préstamos finalizados se pagan en bloque: reconstruir los totales diarios
+        from django.core.management import call_command
+        call_command('reconcile_daily_totals', todo=True, stdout=StringIO())
+
         # ==================== RESUMEN ====================
         self.stdout.write(self.style.SUCCESS(f'\n{"="*50}'))
         self.stdout.write(self.style.SUCCESS(f'  DATOS DE VOLUMEN GENERADOS'))
@@ -267,11 +272,12 @@ class Command(BaseCommand):
             cuotas_pactadas=cuotas,
             frecuencia=frecuencia,
             fecha_inicio=fecha_inicio,
+            cobrador=cliente.usuario,
         )
 
     def _crear_prestamo_finalizado(self, cliente, hoy):
         """Crea un préstamo ya completamente pagado"""
-        from core.models import Prestamo
+        from core.models import Prestamo, Cuota
 
         dias_atras = random.randint(60, 180)
         fecha_inicio = hoy - timedelta(days=dias_atras)
@@ -285,10 +291,12 @@ class Command(BaseCommand):
             cuotas_pactadas=random.choice([10, 15, 20]),
             frecuencia='DI',
             fecha_inicio=fecha_inicio,
+            cobrador=cliente.usuario,
         )
 
-        # Pagar todas las cuotas
-        for cuota in prestamo.cuotas.all():
+        # Pagar todas las cuotas (una sola actualización en bloque)
+        cuotas = list(prestamo.cuotas.all())
+        for cuota in cuotas:
             cuota.estado = 'PA'
             cuota.monto_pagado = cuota.monto_cuota
             cuota.fecha_pago_real = cuota.fecha_vencimiento
@@ -301,7 +309,11 @@ class Command(BaseCommand):
                 mitad = cuota.monto_cuota / 2
                 cuota.monto_efectivo = mitad
                 cuota.monto_transferencia = cuota.monto_cuota - mitad
-            cuota.save()
+        Cuota.objects.bulk_update(cuotas, [
+            'estado', 'monto_pagado', 'fecha_pago_real', 'metodo_pago',
+            'monto_efectivo', 'monto_transferencia',
+        ])
+        prestamo.actualizar_saldos()
 
         prestamo.estado = 'FI'
         prestamo.save(update_fields=['estado'])
@@ -0,0 +1,47 @@
+"""
+Comando para borrar los cambios de préstamos viejos (registro de la
+sincronización incremental de cuotas). Una app con un token anterior a los
+cambios que quedan recibe la lista completa en su próxima consulta.
+
+Uso:
+    python manage.py prune_change_log            # conserva 2 días
+    python manage.py prune_change_log --dias 7
+"""
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+
+class Command(BaseCommand):
+    help = 'Borra el registro de cambios de préstamos anterior a N días'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dias',
+            type=int,
+            default=2,
+            help='Días de cambios a conservar (default: 2; los tokens vencen al cambiar el día)'
+        )
+        parser.add_argument(
+            '--lote',
+            type=int,
+            default=5000,
+            help='Cantidad de filas a borrar por consulta (default: 5000)'
+        )
+
+    def handle(self, *args, **options):
+        from core.models import CambioPrestamo
+
+        limite = timezone.now() - timedelta(days=max(options['dias'], 1))
+        lote = max(options['lote'], 1)
+        borrados = 0
+        while True:
+            ids = list(
+                CambioPrestamo.objects.filter(fecha__lt=limite).values_list('pk', flat=True)[:lote]
+            )
+            if not ids:
+                break
+            borrados += CambioPrestamo.objects.filter(pk__in=ids).delete()[0]
+
+        self.stdout.write(self.style.SUCCESS(f'{borrados} cambios de préstamos borrados.'))
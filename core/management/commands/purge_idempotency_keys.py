@@ -0,0 +1,31 @@
+"""
+Comando para borrar las claves de idempotencia vencidas (más viejas que
+IDEMPOTENCIA_TTL_HORAS). Las vencidas ya no se usan aunque sigan en la
+tabla; este comando solo libera espacio.
+
+Uso:
+    python manage.py purge_idempotency_keys
+    python manage.py purge_idempotency_keys --lote 5000
+"""
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = 'Borra las claves de idempotencia de cobros vencidas'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--lote',
+            type=int,
+            default=1000,
+            help='Cantidad de filas a borrar por consulta (default: 1000)'
+        )
+
+    def handle(self, *args, **options):
+        from core.models import ClaveIdempotencia
+
+        borradas = ClaveIdempotencia.purgar_vencidas(lote=max(options['lote'], 1))
+        if borradas:
+            self.stdout.write(self.style.SUCCESS(f'{borradas} claves de idempotencia vencidas borradas.'))
+        else:
+            self.stdout.write('No hay claves de idempotencia vencidas.')
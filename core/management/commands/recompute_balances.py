@@ -0,0 +1,92 @@
+"""
+Comando para recalcular y verificar los saldos desnormalizados de préstamos.
+Compara total_pagado, saldo_pendiente, cantidad_cuotas_pagadas y
+fecha_proximo_vencimiento contra las cuotas y corrige las diferencias.
+"""
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+
+class Command(BaseCommand):
+    help = 'Recalcula y verifica los saldos almacenados de los préstamos a partir de sus cuotas'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verificar',
+            action='store_true',
+            help='Solo informar diferencias, sin corregirlas (termina con error si hay diferencias)'
+        )
+        parser.add_argument(
+            '--lote',
+            type=int,
+            default=1000,
+            help='Cantidad de préstamos por lote de actualización (default: 1000)'
+        )
+        parser.add_argument(
+            '--prestamo',
+            type=int,
+            action='append',
+            dest='prestamos',
+            help='ID de préstamo a procesar (se puede repetir)'
+        )
+
+    def handle(self, *args, **options):
+        from core.models import Prestamo
+        
+        verificar = options['verificar']
+        lote_size = options['lote']
+        campos = Prestamo.CAMPOS_SALDO
+        
+        self.stdout.write('=== RECALCULANDO SALDOS DE PRÉSTAMOS ===\n')
+        
+        queryset = Prestamo.objects.all()
+        if options['prestamos']:
+            queryset = queryset.filter(pk__in=options['prestamos'])
+        
+        revisados = 0
+        diferencias = 0
+        lote = []
+        
+        for prestamo in queryset.with_balances().iterator(chunk_size=lote_size):
+            revisados += 1
+            esperado = {
+                'total_pagado': prestamo.monto_pagado_anotado,
+                'saldo_pendiente': prestamo.monto_total_a_pagar - prestamo.monto_pagado_anotado,
+                'cantidad_cuotas_pagadas': prestamo.cuotas_pagadas_anotadas,
+                'fecha_proximo_vencimiento': prestamo.proximo_vencimiento_anotado,
+            }
+            distintos = [c for c in campos if getattr(prestamo, c) != esperado[c]]
+            if not distintos:
+                continue
+            
+            diferencias += 1
+            if verificar or options['verbosity'] > 1:
+                detalle = ', '.join(
+                    f'{c}: {getattr(prestamo, c)} -> {esperado[c]}' for c in distintos
+                )
+                self.stdout.write(f'  Préstamo #{prestamo.pk}: {detalle}')
+            
+            for campo, valor in esperado.items():
+                setattr(prestamo, campo, valor)
+            lote.append(prestamo)
+            
+            if not verificar and len(lote) >= lote_size:
+                self._guardar(Prestamo, lote, campos)
+                lote = []
+        
+        if not verificar and lote:
+            self._guardar(Prestamo, lote, campos)
+        
+        self.stdout.write(f'\nPréstamos revisados: {revisados}')
+        if verificar:
+            if diferencias:
+                raise CommandError(f'{diferencias} préstamos tienen saldos desactualizados.')
+            self.stdout.write(self.style.SUCCESS('Todos los saldos están al día.'))
+        elif diferencias:
+            self.stdout.write(self.style.SUCCESS(f'Se corrigieron {diferencias} préstamos.'))
+        else:
+            self.stdout.write(self.style.SUCCESS('No había saldos para corregir.'))
+
+    def _guardar(self, modelo, lote, campos):
+        with transaction.atomic():
+            modelo.objects.bulk_update(lote, campos)
@@ -0,0 +1,90 @@
+"""
+Comando para reconciliar los resúmenes de cobro diario con las cuotas.
+Recalcula total cobrado y cantidad de cobros por cobrador y fecha desde
+las cuotas pagadas y corrige los resúmenes que no coinciden.
+
+Uso:
+    python manage.py reconcile_daily_totals             # hoy
+    python manage.py reconcile_daily_totals --dias 30   # últimos 30 días
+    python manage.py reconcile_daily_totals --todo --verificar
+"""
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye los totales de cobro por cobrador y día desde las cuotas'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dias',
+            type=int,
+            default=1,
+            help='Cantidad de días hacia atrás a revisar, incluyendo hoy (default: 1)'
+        )
+        parser.add_argument(
+            '--todo',
+            action='store_true',
+            help='Revisar todas las fechas'
+        )
+        parser.add_argument(
+            '--verificar',
+            action='store_true',
+            help='Solo informar diferencias, sin corregirlas (termina con error si hay diferencias)'
+        )
+
+    def handle(self, *args, **options):
+        from core.models import ResumenCobroDiario, fecha_local_hoy
+        
+        hoy = fecha_local_hoy()
+        desde = None if options['todo'] else hoy - timedelta(days=max(options['dias'], 1) - 1)
+        
+        self.stdout.write('=== RECONCILIANDO TOTALES DE COBRO DIARIO ===\n')
+        
+        esperados = ResumenCobroDiario.calcular_desde_cuotas(desde=desde)
+        actuales = ResumenCobroDiario.objects.all()
+        if desde:
+            actuales = actuales.filter(fecha__gte=desde)
+        actuales = {
+            (r.cobrador_id, r.fecha): (r.total_cobrado, r.cantidad_cobros)
+            for r in actuales
+        }
+        
+        diferencias = []
+        for clave in sorted(set(esperados) | set(actuales), key=lambda c: (c[1], c[0] or 0)):
+            esperado = esperados.get(clave, (0, 0))
+            actual = actuales.get(clave, (0, 0))
+            if esperado[0] != actual[0] or esperado[1] != actual[1]:
+                diferencias.append(clave)
+                cobrador_id, fecha = clave
+                self.stdout.write(
+                    f'  {fecha} cobrador #{cobrador_id or "-"}: '
+                    f'${actual[0]:,.0f} ({actual[1]}) -> ${esperado[0]:,.0f} ({esperado[1]})'
+                )
+        
+        if options['verificar']:
+            if diferencias:
+                raise CommandError(f'{len(diferencias)} resúmenes no coinciden con las cuotas.')
+            self.stdout.write(self.style.SUCCESS('Todos los resúmenes coinciden con las cuotas.'))
+            return
+        
+        if not diferencias:
+            self.stdout.write(self.style.SUCCESS('No había resúmenes para corregir.'))
+            return
+        
+        with transaction.atomic():
+            for cobrador_id, fecha in diferencias:
+                ResumenCobroDiario.objects.filter(cobrador_id=cobrador_id, fecha=fecha).delete()
+            ResumenCobroDiario.objects.bulk_create([
+                ResumenCobroDiario(
+                    cobrador_id=cobrador_id,
+                    fecha=fecha,
+                    total_cobrado=esperados[(cobrador_id, fecha)][0],
+                    cantidad_cobros=esperados[(cobrador_id, fecha)][1],
+                )
+                for cobrador_id, fecha in diferencias
+                if (cobrador_id, fecha) in esperados
+            ])
+        self.stdout.write(self.style.SUCCESS(f'Se corrigieron {len(diferencias)} resúmenes.'))
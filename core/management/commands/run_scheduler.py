@@ -0,0 +1,116 @@
+"""
+Programador de tareas en segundo plano (notificaciones, mora, respaldos y
+limpiezas). Ver core/tareas.py.
+
+Uso:
+    python manage.py run_scheduler                  # queda corriendo
+    python manage.py run_scheduler --una-vez        # ejecuta lo vencido y termina (cron)
+    python manage.py run_scheduler --tarea respaldo # ejecuta una tarea ya mismo
+    python manage.py run_scheduler --listar
+"""
+import signal
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+
+class Command(BaseCommand):
+    help = 'Ejecuta las tareas programadas fuera de los requests web'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--intervalo',
+            type=int,
+            default=30,
+            help='Segundos entre revisiones de tareas vencidas (default: 30)'
+        )
+        parser.add_argument(
+            '--una-vez',
+            action='store_true',
+            help='Ejecutar las tareas vencidas una vez y terminar'
+        )
+        parser.add_argument(
+            '--tarea',
+            help='Ejecutar solo esta tarea, aunque no esté vencida'
+        )
+        parser.add_argument(
+            '--listar',
+            action='store_true',
+            help='Mostrar el estado de las tareas y terminar'
+        )
+
+    def handle(self, *args, **options):
+        from core import tareas
+
+        tareas.registrar_tareas()
+
+        if options['listar']:
+            self.listar()
+            return
+
+        if options['tarea']:
+            if options['tarea'] not in tareas.TAREAS:
+                raise CommandError(
+                    f'Tarea desconocida: {options["tarea"]}. '
+                    f'Disponibles: {", ".join(tareas.TAREAS)}'
+                )
+            tarea = tareas.ejecutar_tarea(options['tarea'], forzar=True)
+            if tarea is None:
+                raise CommandError(f'La tarea {options["tarea"]} está en ejecución en otro proceso.')
+            self.informar(tarea)
+            return
+
+        if options['una_vez']:
+            for tarea in tareas.ejecutar_pendientes():
+                self.informar(tarea)
+            return
+
+        self.detener = False
+        signal.signal(signal.SIGTERM, self.pedir_detencion)
+        signal.signal(signal.SIGINT, self.pedir_detencion)
+
+        trabajador = tareas.nombre_trabajador()
+        intervalo = max(options['intervalo'], 1)
+        self.stdout.write(f'Programador iniciado ({trabajador}), revisando cada {intervalo}s')
+        while not self.detener:
+            close_old_connections()
+            try:
+                for tarea in tareas.ejecutar_pendientes(trabajador):
+                    self.informar(tarea)
+            except Exception as e:
+                # Base caída o similar: se reintenta en la próxima vuelta
+                self.stderr.write(f'Error revisando tareas: {e}')
+            for _ in range(intervalo):
+                if self.detener:
+                    break
+                time.sleep(1)
+        close_old_connections()
+        self.stdout.write('Programador detenido')
+
+    def pedir_detencion(self, signum, frame):
+        self.detener = True
+
+    def informar(self, tarea):
+        if tarea.ultimo_error:
+            self.stderr.write(self.style.ERROR(
+                f'[{tarea.nombre}] falló en {tarea.ultima_duracion:.1f}s: '
+                f'{tarea.ultimo_error.strip().splitlines()[-1]}'
+            ))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f'[{tarea.nombre}] {tarea.ultima_duracion:.1f}s - {tarea.ultimo_resultado}'
+            ))
+
+    def listar(self):
+        from core.models import TareaProgramada
+
+        self.stdout.write('=== TAREAS PROGRAMADAS ===\n')
+        for tarea in TareaProgramada.objects.all():
+            promedio = tarea.duracion_promedio
+            self.stdout.write(
+                f'  {tarea.nombre:<20} próxima: {str(tarea.proxima_ejecucion or "ya"):<32} '
+                f'ejecuciones: {tarea.ejecuciones} (fallos: {tarea.fallos}) '
+                f'promedio: {f"{promedio:.1f}s" if promedio is not None else "-"}'
+                f'{f"  [tomada por {tarea.bloqueada_por}]" if tarea.bloqueada_por else ""}'
+            )
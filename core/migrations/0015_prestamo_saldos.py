@@ -0,0 +1,47 @@
+# Generated by Django 4.2.30 on 2026-10-17 00:59
+
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_add_fecha_finalizacion_manual'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='prestamo',
+            name='cantidad_cuotas_pagadas',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Cuotas Pagadas'),
+        ),
+        migrations.AddField(
+            model_name='prestamo',
+            name='fecha_proximo_vencimiento',
+            field=models.DateField(blank=True, editable=False, null=True, verbose_name='Próximo Vencimiento'),
+        ),
+        migrations.AddField(
+            model_name='prestamo',
+            name='saldo_pendiente',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), editable=False, max_digits=12, verbose_name='Saldo Pendiente'),
+        ),
+        migrations.AddField(
+            model_name='prestamo',
+            name='total_pagado',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), editable=False, max_digits=12, verbose_name='Total Pagado'),
+        ),
+        migrations.AlterField(
+            model_name='historialmodificacionpago',
+            name='tipo_modificacion',
+            field=models.CharField(choices=[('PP', 'Pago Parcial'), ('PA', 'Pago Completo'), ('TR', 'Restante a Próxima Cuota'), ('CE', 'Cuota Especial Creada'), ('MR', 'Monto Recibido de Otra Cuota'), ('AN', 'Pago Anulado')], max_length=2, verbose_name='Tipo de Modificación'),
+        ),
+        migrations.AddIndex(
+            model_name='prestamo',
+            index=models.Index(fields=['estado', 'saldo_pendiente'], name='core_presta_estado_9ba1b2_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='prestamo',
+            index=models.Index(fields=['estado', 'fecha_proximo_vencimiento'], name='core_presta_estado_b20116_idx'),
+        ),
+    ]
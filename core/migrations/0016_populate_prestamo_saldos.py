@@ -0,0 +1,42 @@
+"""
+Data migration: Calcular los saldos desnormalizados de préstamos existentes.
+Completa total_pagado, saldo_pendiente, cantidad_cuotas_pagadas y
+fecha_proximo_vencimiento a partir de las cuotas de cada préstamo.
+"""
+from decimal import Decimal
+
+from django.db import migrations
+from django.db.models import Count, Min, Q, Sum
+
+
+def populate_saldos(apps, schema_editor):
+    """Recalcular saldos de todos los préstamos en una sola consulta agregada"""
+    Prestamo = apps.get_model('core', 'Prestamo')
+    prestamos = Prestamo.objects.order_by().annotate(
+        _total_pagado=Sum('cuotas__monto_pagado', filter=Q(cuotas__estado__in=['PA', 'PC'])),
+        _cuotas_pagadas=Count('cuotas', filter=Q(cuotas__estado='PA')),
+        _proximo_vencimiento=Min('cuotas__fecha_vencimiento', filter=Q(cuotas__estado='PE')),
+    )
+    lote = []
+    for prestamo in prestamos.iterator(chunk_size=1000):
+        prestamo.total_pagado = prestamo._total_pagado or Decimal('0.00')
+        prestamo.saldo_pendiente = prestamo.monto_total_a_pagar - prestamo.total_pagado
+        prestamo.cantidad_cuotas_pagadas = prestamo._cuotas_pagadas
+        prestamo.fecha_proximo_vencimiento = prestamo._proximo_vencimiento
+        lote.append(prestamo)
+        if len(lote) >= 1000:
+            Prestamo.objects.bulk_update(lote, ['total_pagado', 'saldo_pendiente', 'cantidad_cuotas_pagadas', 'fecha_proximo_vencimiento'])
+            lote = []
+    if lote:
+        Prestamo.objects.bulk_update(lote, ['total_pagado', 'saldo_pendiente', 'cantidad_cuotas_pagadas', 'fecha_proximo_vencimiento'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_prestamo_saldos'),
+    ]
+
+    operations = [
+        migrations.RunPython(populate_saldos, migrations.RunPython.noop),
+    ]
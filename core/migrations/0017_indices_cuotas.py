@@ -0,0 +1,33 @@
+# Generated by Django 4.2.30 on 2026-10-17 01:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_populate_prestamo_saldos'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cuota',
+            index=models.Index(condition=models.Q(('estado__in', ['PE', 'PC'])), fields=['fecha_vencimiento', 'prestamo'], name='cuota_pendiente_venc_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='cuota',
+            index=models.Index(condition=models.Q(('fecha_pago_real__isnull', False)), fields=['fecha_pago_real', 'estado'], name='cuota_pago_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='cuota',
+            index=models.Index(fields=['estado', 'fecha_vencimiento'], name='cuota_estado_venc_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='cuota',
+            index=models.Index(fields=['prestamo', 'estado', 'numero_cuota'], name='cuota_prestamo_estado_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='prestamo',
+            index=models.Index(fields=['cobrador', 'estado'], name='prestamo_cobrador_estado_idx'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 4.2.30 on 2026-10-17 01:10
+
+from decimal import Decimal
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('core', '0017_indices_cuotas'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumenCobroDiario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField(verbose_name='Fecha')),
+                ('total_cobrado', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14, verbose_name='Total Cobrado')),
+                ('cantidad_cobros', models.IntegerField(default=0, verbose_name='Cantidad de Cobros')),
+                ('cobrador', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='resumenes_cobro', to=settings.AUTH_USER_MODEL, verbose_name='Cobrador')),
+            ],
+            options={
+                'verbose_name': 'Resumen de Cobro Diario',
+                'verbose_name_plural': 'Resúmenes de Cobro Diario',
+                'ordering': ['-fecha'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='resumencobrodiario',
+            constraint=models.UniqueConstraint(fields=('cobrador', 'fecha'), name='resumen_cobro_cobrador_fecha_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='resumencobrodiario',
+            constraint=models.UniqueConstraint(condition=models.Q(('cobrador__isnull', True)), fields=('fecha',), name='resumen_cobro_sin_cobrador_uniq'),
+        ),
+    ]
@@ -0,0 +1,48 @@
+"""
+Data migration: Calcular los resúmenes de cobro diario existentes.
+Agrupa las cuotas pagadas o con pago parcial por cobrador del préstamo
+y fecha de pago.
+"""
+from decimal import Decimal
+
+from django.db import migrations
+from django.db.models import Count, Sum
+
+
+def populate_resumenes(apps, schema_editor):
+    """Crear un resumen por (cobrador, fecha) a partir de las cuotas cobradas"""
+    Cuota = apps.get_model('core', 'Cuota')
+    ResumenCobroDiario = apps.get_model('core', 'ResumenCobroDiario')
+    filas = Cuota.objects.filter(
+        estado__in=['PA', 'PC'],
+        fecha_pago_real__isnull=False
+    ).order_by().values('prestamo__cobrador', 'fecha_pago_real').annotate(
+        total=Sum('monto_pagado'),
+        cantidad=Count('id')
+    )
+    ResumenCobroDiario.objects.bulk_create([
+        ResumenCobroDiario(
+            cobrador_id=fila['prestamo__cobrador'],
+            fecha=fila['fecha_pago_real'],
+            total_cobrado=fila['total'] or Decimal('0.00'),
+            cantidad_cobros=fila['cantidad'],
+        )
+        for fila in filas
+    ], batch_size=1000)
+
+
+def reverse_populate(apps, schema_editor):
+    """Reversa: borrar los resúmenes"""
+    ResumenCobroDiario = apps.get_model('core', 'ResumenCobroDiario')
+    ResumenCobroDiario.objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_resumen_cobro_diario'),
+    ]
+
+    operations = [
+        migrations.RunPython(populate_resumenes, reverse_populate),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.30 on 2026-10-17 01:18
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('core', '0019_populate_resumen_cobro_diario'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClaveIdempotencia',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('clave', models.CharField(max_length=64, verbose_name='Clave')),
+                ('operacion', models.CharField(max_length=30, verbose_name='Operación')),
+                ('respuesta', models.JSONField(blank=True, null=True, verbose_name='Respuesta')),
+                ('codigo_estado', models.PositiveSmallIntegerField(default=200, verbose_name='Código de Estado')),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Fecha')),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='claves_idempotencia', to=settings.AUTH_USER_MODEL, verbose_name='Usuario')),
+            ],
+            options={
+                'verbose_name': 'Clave de Idempotencia',
+                'verbose_name_plural': 'Claves de Idempotencia',
+                'ordering': ['-fecha_creacion'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='claveidempotencia',
+            constraint=models.UniqueConstraint(fields=('usuario', 'clave'), name='idempotencia_usuario_clave_uniq'),
+        ),
+    ]
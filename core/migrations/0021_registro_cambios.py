@@ -0,0 +1,41 @@
+# Generated by Django 4.2.30 on 2026-10-17 01:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0020_clave_idempotencia'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SecuenciaCambios',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre', models.CharField(max_length=30, unique=True, verbose_name='Nombre')),
+                ('valor', models.BigIntegerField(default=0, verbose_name='Valor')),
+            ],
+            options={
+                'verbose_name': 'Secuencia de Cambios',
+                'verbose_name_plural': 'Secuencias de Cambios',
+            },
+        ),
+        migrations.CreateModel(
+            name='CambioPrestamo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('secuencia', models.BigIntegerField(db_index=True, verbose_name='Secuencia')),
+                ('prestamo_id', models.PositiveIntegerField(verbose_name='Préstamo')),
+                ('cobrador_id', models.PositiveIntegerField(blank=True, null=True, verbose_name='Cobrador')),
+                ('fecha', models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Fecha')),
+            ],
+            options={
+                'verbose_name': 'Cambio de Préstamo',
+                'verbose_name_plural': 'Cambios de Préstamos',
+                'ordering': ['secuencia'],
+                'indexes': [models.Index(fields=['cobrador_id', 'secuencia'], name='cambio_cobrador_seq_idx')],
+            },
+        ),
+    ]
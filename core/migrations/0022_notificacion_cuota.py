@@ -0,0 +1,28 @@
+# Generated by Django 4.2.30 on 2026-10-17 01:31
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0021_registro_cambios'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notificacion',
+            name='cuota',
+            field=models.ForeignKey(blank=True, help_text='Cuota que originó la notificación automática', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='notificaciones', to='core.cuota', verbose_name='Cuota'),
+        ),
+        migrations.AddField(
+            model_name='notificacion',
+            name='fecha_referencia',
+            field=models.DateField(blank=True, help_text='Día de generación: hay una sola notificación por cuota, tipo y día', null=True, verbose_name='Fecha de Referencia'),
+        ),
+        migrations.AddConstraint(
+            model_name='notificacion',
+            constraint=models.UniqueConstraint(fields=('cuota', 'tipo', 'fecha_referencia'), name='notificacion_cuota_tipo_fecha_uniq'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 4.2.30 on 2026-10-17 01:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0022_notificacion_cuota'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TareaProgramada',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre', models.CharField(max_length=50, unique=True, verbose_name='Nombre')),
+                ('proxima_ejecucion', models.DateTimeField(blank=True, help_text='Vacío: se ejecuta en la próxima vuelta del programador', null=True, verbose_name='Próxima Ejecución')),
+                ('bloqueada_hasta', models.DateTimeField(blank=True, help_text='Mientras no pase esta hora, ningún otro proceso la ejecuta', null=True, verbose_name='Bloqueada Hasta')),
+                ('bloqueada_por', models.CharField(blank=True, default='', max_length=100, verbose_name='Bloqueada Por')),
+                ('ultima_ejecucion', models.DateTimeField(blank=True, null=True, verbose_name='Última Ejecución')),
+                ('ultima_duracion', models.FloatField(blank=True, null=True, verbose_name='Última Duración (s)')),
+                ('duracion_total', models.FloatField(default=0, verbose_name='Duración Total (s)')),
+                ('ultimo_resultado', models.TextField(blank=True, default='', verbose_name='Último Resultado')),
+                ('ultimo_error', models.TextField(blank=True, default='', verbose_name='Último Error')),
+                ('ejecuciones', models.PositiveIntegerField(default=0, verbose_name='Ejecuciones')),
+                ('fallos', models.PositiveIntegerField(default=0, verbose_name='Fallos')),
+            ],
+            options={
+                'verbose_name': 'Tarea Programada',
+                'verbose_name_plural': 'Tareas Programadas',
+                'ordering': ['nombre'],
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.30 on 2026-10-17 01:37
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('core', '0023_tarea_programada'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DestinatarioNotificacion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('leida', models.BooleanField(default=False, verbose_name='Leída')),
+                ('fecha_creacion', models.DateTimeField(verbose_name='Fecha de Creación')),
+                ('fecha_lectura', models.DateTimeField(blank=True, null=True, verbose_name='Fecha de Lectura')),
+                ('notificacion', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='destinatarios', to='core.notificacion', verbose_name='Notificación')),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='notificaciones_recibidas', to=settings.AUTH_USER_MODEL, verbose_name='Usuario')),
+            ],
+            options={
+                'verbose_name': 'Destinatario de Notificación',
+                'verbose_name_plural': 'Destinatarios de Notificaciones',
+                'indexes': [models.Index(fields=['usuario', 'leida', '-fecha_creacion'], name='destinatario_bandeja_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='destinatarionotificacion',
+            constraint=models.UniqueConstraint(fields=('notificacion', 'usuario'), name='destinatario_notificacion_uniq'),
+        ),
+    ]
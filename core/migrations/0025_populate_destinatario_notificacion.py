@@ -0,0 +1,53 @@
+"""
+Data migration: Pasar el estado de lectura de las notificaciones a
+DestinatarioNotificacion. Las individuales conservan su estado; las generales
+se reparten entre los usuarios activos con el estado que tenían (era uno solo,
+compartido por todos).
+"""
+from django.db import migrations
+
+
+def populate_destinatarios(apps, schema_editor):
+    """Crear las filas de destinatarios de las notificaciones existentes"""
+    Notificacion = apps.get_model('core', 'Notificacion')
+    DestinatarioNotificacion = apps.get_model('core', 'DestinatarioNotificacion')
+    User = apps.get_model('auth', 'User')
+    activos = list(User.objects.filter(is_active=True).values_list('pk', flat=True))
+
+    lote = []
+    filas = Notificacion.objects.order_by().values_list(
+        'pk', 'usuario_id', 'leida', 'fecha_creacion', 'fecha_lectura'
+    )
+    for pk, usuario_id, leida, fecha_creacion, fecha_lectura in filas.iterator(chunk_size=1000):
+        for usuario in ([usuario_id] if usuario_id else activos):
+            lote.append(DestinatarioNotificacion(
+                notificacion_id=pk,
+                usuario_id=usuario,
+                leida=leida,
+                fecha_creacion=fecha_creacion,
+                fecha_lectura=fecha_lectura,
+            ))
+        if len(lote) >= 1000:
+            DestinatarioNotificacion.objects.bulk_create(lote)
+            lote = []
+    DestinatarioNotificacion.objects.bulk_create(lote)
+
+
+def reverse_populate(apps, schema_editor):
+    """Reversa: una notificación queda leída si la leyeron todos sus destinatarios"""
+    Notificacion = apps.get_model('core', 'Notificacion')
+    DestinatarioNotificacion = apps.get_model('core', 'DestinatarioNotificacion')
+    sin_leer = DestinatarioNotificacion.objects.filter(leida=False).values('notificacion_id')
+    Notificacion.objects.exclude(pk__in=sin_leer).update(leida=True)
+    DestinatarioNotificacion.objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0024_destinatario_notificacion'),
+    ]
+
+    operations = [
+        migrations.RunPython(populate_destinatarios, reverse_populate),
+    ]
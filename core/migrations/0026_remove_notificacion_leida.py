@@ -0,0 +1,21 @@
+# Generated by Django 4.2.30 on 2026-10-17 01:37
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0025_populate_destinatario_notificacion'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='notificacion',
+            name='fecha_lectura',
+        ),
+        migrations.RemoveField(
+            model_name='notificacion',
+            name='leida',
+        ),
+    ]
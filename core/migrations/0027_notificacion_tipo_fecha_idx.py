@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-17 01:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0026_remove_notificacion_leida'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='notificacion',
+            index=models.Index(fields=['tipo', 'fecha_creacion'], name='notificacion_tipo_fecha_idx'),
+        ),
+    ]
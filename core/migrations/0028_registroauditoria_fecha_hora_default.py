@@ -0,0 +1,19 @@
+# Generated by Django 4.2.30 on 2026-10-17 01:44
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0027_notificacion_tipo_fecha_idx'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='registroauditoria',
+            name='fecha_hora',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False, verbose_name='Fecha y Hora'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.30 on 2026-10-17 01:52
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('core', '0028_registroauditoria_fecha_hora_default'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrabajoExportacion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('PL', 'Planilla de Cobros'), ('CI', 'Cierre de Caja'), ('CL', 'Clientes'), ('PR', 'Préstamos')], max_length=2, verbose_name='Tipo')),
+                ('parametros', models.JSONField(blank=True, default=dict, verbose_name='Parámetros')),
+                ('clave', models.CharField(db_index=True, help_text='Hash de usuario, tipo y parámetros: mismos datos, mismo archivo', max_length=64, verbose_name='Clave')),
+                ('estado', models.CharField(choices=[('PE', 'Pendiente'), ('EP', 'En Proceso'), ('LI', 'Listo'), ('ER', 'Error')], default='PE', max_length=2, verbose_name='Estado')),
+                ('archivo', models.FileField(blank=True, upload_to='exportaciones/', verbose_name='Archivo')),
+                ('error', models.TextField(blank=True, default='', verbose_name='Error')),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True, verbose_name='Fecha de Creación')),
+                ('fecha_inicio', models.DateTimeField(blank=True, null=True, verbose_name='Inicio')),
+                ('fecha_fin', models.DateTimeField(blank=True, null=True, verbose_name='Fin')),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='exportaciones', to=settings.AUTH_USER_MODEL, verbose_name='Usuario')),
+            ],
+            options={
+                'verbose_name': 'Exportación',
+                'verbose_name_plural': 'Exportaciones',
+                'ordering': ['-fecha_creacion'],
+                'indexes': [models.Index(fields=['estado', 'fecha_creacion'], name='exportacion_estado_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 4.2.30 on 2026-10-17 02:00
+
+from decimal import Decimal
+from django.conf import settings
+import django.core.serializers.json
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('core', '0029_trabajoexportacion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CierreDiario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField(verbose_name='Fecha')),
+                ('cantidad_pagos', models.IntegerField(default=0, verbose_name='Cantidad de Pagos')),
+                ('total_cobrado', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14, verbose_name='Total Cobrado')),
+                ('total_efectivo', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14, verbose_name='Total Efectivo')),
+                ('total_transferencia', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14, verbose_name='Total Transferencia')),
+                ('filas', models.JSONField(default=list, encoder=django.core.serializers.json.DjangoJSONEncoder, help_text='[apellido, valores, resaltado] de cada pago, en el orden del cierre', verbose_name='Filas')),
+                ('fecha_cierre', models.DateTimeField(auto_now_add=True, verbose_name='Fecha de Cierre')),
+                ('cobrador', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='cierres_diarios', to=settings.AUTH_USER_MODEL, verbose_name='Cobrador')),
+            ],
+            options={
+                'verbose_name': 'Cierre Diario',
+                'verbose_name_plural': 'Cierres Diarios',
+                'ordering': ['-fecha'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='cierrediario',
+            constraint=models.UniqueConstraint(fields=('cobrador', 'fecha'), name='cierre_diario_cobrador_fecha_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='cierrediario',
+            constraint=models.UniqueConstraint(condition=models.Q(('cobrador__isnull', True)), fields=('fecha',), name='cierre_diario_sin_cobrador_uniq'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.30 on 2026-10-17 02:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0030_cierrediario'),
+    ]
+
+    operations = [
+        migrations.DeleteModel(
+            name='SecuenciaCambios',
+        ),
+        migrations.AlterModelOptions(
+            name='cambioprestamo',
+            options={'ordering': ['id'], 'verbose_name': 'Cambio de Préstamo', 'verbose_name_plural': 'Cambios de Préstamos'},
+        ),
+        migrations.RemoveIndex(
+            model_name='cambioprestamo',
+            name='cambio_cobrador_seq_idx',
+        ),
+        migrations.RemoveField(
+            model_name='cambioprestamo',
+            name='secuencia',
+        ),
+        migrations.AddIndex(
+            model_name='cambioprestamo',
+            index=models.Index(fields=['cobrador_id', 'id'], name='cambio_cobrador_id_idx'),
+        ),
+    ]
@@ -1,14 +1,22 @@
 """
 Modelos del Sistema de Gestión de Préstamos
 """
-from django.db import models
+from django.conf import settings
+from django.db import models, transaction, IntegrityError
+from django.db.models import Exists, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.core.serializers.json import DjangoJSONEncoder
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.utils import timezone
 from django.contrib.auth.models import User
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 from datetime import timedelta
 from decimal import Decimal
+import hashlib
+import json
+
+from .cronograma import planificar_cuotas, calcular_fecha_fin
 
 
 def fecha_local_hoy():
@@ -89,6 +97,27 @@ def guardar_perfil_usuario(sender, instance, **kwargs):
         instance.perfil.save()
 
 
+@receiver(post_delete, sender='core.Prestamo')
+def registrar_prestamo_borrado(sender, instance, **kwargs):
+    """La app del cobrador tiene que quitar las cuotas de un préstamo borrado"""
+    CambioPrestamo.registrar(instance.pk, instance.cobrador_id)
+
+
+@receiver(post_save, sender='core.Notificacion')
+def repartir_notificacion_nueva(sender, instance, created, **kwargs):
+    """Cada notificación nueva llega a su usuario o, si es general, a todos los activos"""
+    if created:
+        DestinatarioNotificacion.repartir(Notificacion.objects.filter(pk=instance.pk))
+
+
+@receiver(post_save, sender='core.Notificacion')
+@receiver(post_delete, sender='core.Notificacion')
+def avisar_notificacion_modificada(sender, instance, **kwargs):
+    """Los streams de notificaciones abiertos vuelven a leer el contador"""
+    from .notificaciones import avisar_cambio_notificaciones
+    avisar_cambio_notificaciones()
+
+
 class RutaCobro(models.Model):
     """Modelo para categorizar rutas de cobro en la planilla"""
     nombre = models.CharField(max_length=100, verbose_name='Nombre de la Ruta')
@@ -401,9 +430,23 @@ class Cliente(models.Model):
         """Retorna el préstamo activo del cliente"""
         return self.prestamos.filter(estado='AC').first()
     
+    def _credito(self):
+        """
+        Información de crédito del cliente. Si fue precalculada en lote por
+        credito.EvaluadorCredito se usa esa; si no, se evalúa solo este cliente.
+        """
+        info = getattr(self, '_info_credito', None)
+        if info is None:
+            from .credito import EvaluadorCredito
+            info = EvaluadorCredito().evaluar(self)
+        return info
+    
     @property
     def credito_usado(self):
         """Retorna el monto total de crédito actualmente en uso"""
+        info = getattr(self, '_info_credito', None)
+        if info is not None:
+            return info['deuda_actual']
         prestamo = self.prestamo_activo
         if prestamo:
             return prestamo.monto_pendiente
@@ -437,19 +480,12 @@ class Cliente(models.Model):
     @property
     def limite_por_categoria(self):
         """Límite máximo según su categoría"""
-        config = self.config_credito
-        if config and config.limite_maximo > 0:
-            return config.limite_maximo
-        return None
+        return self._credito()['limite_categoria']
     
     @property
     def limite_sobre_deuda(self):
         """Cuánto más puede pedir basado en su deuda actual"""
-        config = self.config_credito
-        if config and config.porcentaje_sobre_deuda > 0:
-            deuda = self.credito_usado
-            return deuda * (config.porcentaje_sobre_deuda / 100)
-        return None
+        return self._credito()['limite_sobre_deuda']
     
     @property
     def limite_por_tipo_negocio(self):
@@ -461,71 +497,24 @@ class Cliente(models.Model):
     @property
     def maximo_prestable(self):
         """El máximo que se le puede prestar considerando todas las reglas"""
-        limites = []
-        deuda_actual = self.credito_usado
-        
-        # 1. Límite individual del cliente
-        if self.limite_credito > 0:
-            limites.append(self.limite_credito - deuda_actual)
-        
-        # 2. Límite por categoría
-        limite_cat = self.limite_por_categoria
-        if limite_cat:
-            limites.append(limite_cat - deuda_actual)
-        
-        # 3. Límite por tipo de negocio
-        limite_neg = self.limite_por_tipo_negocio
-        if limite_neg:
-            limites.append(limite_neg - deuda_actual)
-        
-        # 4. Límite basado en % sobre deuda
-        limite_deuda = self.limite_sobre_deuda
-        if limite_deuda and deuda_actual > 0:
-            limites.append(limite_deuda)
-        
-        if limites:
-            return max(Decimal('0.00'), min(limites))
-        return None  # Sin límite definido
+        return self._credito()['maximo_prestable']
     
     @property
     def puede_renovar(self):
         """Verifica si el cliente puede renovar su préstamo"""
-        config = self.config_credito
-        prestamo = self.prestamo_activo
-        
-        if not prestamo:
-            return True  # Sin préstamo activo, puede crear nuevo
-        
-        if config:
-            # Verificar si puede renovar con deuda
-            if not config.puede_renovar_con_deuda and self.credito_usado > 0:
-                return False
-            # Verificar días mínimos
-            if config.dias_minimos_para_renovar > 0:
-                dias_pagando = (fecha_local_hoy() - prestamo.fecha_inicio).days
-                if dias_pagando < config.dias_minimos_para_renovar:
-                    return False
-        
-        return True
+        return self._credito()['puede_renovar']
     
     @property
     def dias_para_poder_renovar(self):
         """Días que faltan para poder renovar"""
-        config = self.config_credito
-        prestamo = self.prestamo_activo
-        
-        if not prestamo or not config:
-            return 0
-        
-        if config.dias_minimos_para_renovar > 0:
-            dias_pagando = (fecha_local_hoy() - prestamo.fecha_inicio).days
-            dias_faltantes = config.dias_minimos_para_renovar - dias_pagando
-            return max(0, dias_faltantes)
-        return 0
+        return self._credito()['dias_para_renovar']
     
     @property
     def fecha_fin_prestamo_activo(self):
         """Fecha de finalización del préstamo activo"""
+        info = getattr(self, '_info_credito', None)
+        if info is not None:
+            return info['fecha_fin_actual']
         prestamo = self.prestamo_activo
         if prestamo:
             return prestamo.fecha_finalizacion
@@ -534,17 +523,7 @@ class Cliente(models.Model):
     @property
     def info_limite_credito(self):
         """Información completa de límites para mostrar"""
-        return {
-            'limite_individual': self.limite_credito if self.limite_credito > 0 else None,
-            'limite_categoria': self.limite_por_categoria,
-            'limite_tipo_negocio': self.limite_por_tipo_negocio,
-            'limite_sobre_deuda': self.limite_sobre_deuda,
-            'maximo_prestable': self.maximo_prestable,
-            'deuda_actual': self.credito_usado,
-            'puede_renovar': self.puede_renovar,
-            'dias_para_renovar': self.dias_para_poder_renovar,
-            'fecha_fin_actual': self.fecha_fin_prestamo_activo,
-        }
+        return dict(self._credito())
     
     def actualizar_categoria(self):
         """Actualiza la categoría del cliente basado en su historial de pagos"""
@@ -572,6 +551,50 @@ class Cliente(models.Model):
             self.save()
 
 
+class PrestamoQuerySet(models.QuerySet):
+    """QuerySet de préstamos con anotaciones de saldos calculadas en SQL"""
+    
+    # Anotaciones que agrega with_balances() (las propiedades del modelo las usan si existen)
+    ANOTACIONES_SALDO = (
+        'monto_pagado_anotado', 'cuotas_pagadas_anotadas', 'proximo_vencimiento_anotado',
+        'proxima_cuota_id', 'proxima_cuota_numero', 'proxima_cuota_vencimiento',
+        'proxima_cuota_monto', 'proxima_cuota_pagado',
+    )
+    
+    def with_balances(self):
+        """
+        Anota monto pagado, cuotas pagadas y la próxima cuota pendiente de cada
+        préstamo con subconsultas, en una sola sentencia SQL (sin N+1 por fila).
+        """
+        def cuotas(**filtros):
+            return Cuota.objects.filter(prestamo=OuterRef('pk'), **filtros).order_by()
+        
+        def agregado(qs, expresion):
+            return Subquery(qs.values('prestamo').annotate(valor=expresion).values('valor'))
+        
+        proxima = cuotas(estado='PE').order_by('numero_cuota')
+        decimal = models.DecimalField(max_digits=12, decimal_places=2)
+        
+        return self.annotate(
+            monto_pagado_anotado=Coalesce(
+                agregado(cuotas(estado__in=['PA', 'PC']), models.Sum('monto_pagado')),
+                Value(Decimal('0.00')),
+                output_field=decimal
+            ),
+            cuotas_pagadas_anotadas=Coalesce(
+                agregado(cuotas(estado='PA'), models.Count('id')),
+                Value(0),
+                output_field=models.IntegerField()
+            ),
+            proximo_vencimiento_anotado=agregado(cuotas(estado='PE'), models.Min('fecha_vencimiento')),
+            proxima_cuota_id=Subquery(proxima.values('pk')[:1]),
+            proxima_cuota_numero=Subquery(proxima.values('numero_cuota')[:1]),
+            proxima_cuota_vencimiento=Subquery(proxima.values('fecha_vencimiento')[:1]),
+            proxima_cuota_monto=Subquery(proxima.values('monto_cuota')[:1], output_field=decimal),
+            proxima_cuota_pagado=Subquery(proxima.values('monto_pagado')[:1], output_field=decimal),
+        )
+
+
 class Prestamo(models.Model):
     """Modelo para gestionar préstamos"""
     
@@ -664,10 +687,46 @@ class Prestamo(models.Model):
     fecha_creacion = models.DateTimeField(auto_now_add=True, verbose_name='Fecha de Creación')
     notas = models.TextField(blank=True, null=True, verbose_name='Notas')
     
+    # Saldos desnormalizados (se mantienen en cada pago/anulación/renovación)
+    total_pagado = models.DecimalField(
+        max_digits=12,
+        decimal_places=2,
+        default=Decimal('0.00'),
+        editable=False,
+        verbose_name='Total Pagado'
+    )
+    saldo_pendiente = models.DecimalField(
+        max_digits=12,
+        decimal_places=2,
+        default=Decimal('0.00'),
+        editable=False,
+        verbose_name='Saldo Pendiente'
+    )
+    cantidad_cuotas_pagadas = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Cuotas Pagadas'
+    )
+    fecha_proximo_vencimiento = models.DateField(
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name='Próximo Vencimiento'
+    )
+    
+    CAMPOS_SALDO = ['total_pagado', 'saldo_pendiente', 'cantidad_cuotas_pagadas', 'fecha_proximo_vencimiento']
+    
+    objects = PrestamoQuerySet.as_manager()
+    
     class Meta:
         verbose_name = 'Préstamo'
         verbose_name_plural = 'Préstamos'
         ordering = ['-fecha_creacion']
+        indexes = [
+            models.Index(fields=['estado', 'saldo_pendiente']),
+            models.Index(fields=['estado', 'fecha_proximo_vencimiento']),
+            models.Index(fields=['cobrador', 'estado'], name='prestamo_cobrador_estado_idx'),
+        ]
     
     def __str__(self):
         return f"Préstamo #{self.pk} - {self.cliente}"
@@ -682,108 +741,77 @@ class Prestamo(models.Model):
             self.fecha_finalizacion = self.calcular_fecha_finalizacion()
         
         is_new = self.pk is None
-        super().save(*args, **kwargs)
-        
-        # Generar cuotas automáticamente solo si es nuevo
+        plan = None
         if is_new:
-            self.generar_cuotas()
+            plan = self.planificar_cuotas()
+            self.fecha_proximo_vencimiento = min(c.fecha_vencimiento for c in plan) if plan else None
+        
+        with transaction.atomic():
+            if not self._state.adding:
+                # Los saldos los escribe actualizar_saldos con la fila bloqueada: se
+                # releen bajo el mismo bloqueo para no pisar con los valores en
+                # memoria un pago confirmado después de cargar esta instancia
+                saldos = Prestamo.objects.select_for_update().filter(pk=self.pk).values(
+                    *self.CAMPOS_SALDO
+                ).first()
+                for campo, valor in (saldos or {}).items():
+                    setattr(self, campo, valor)
+            self.saldo_pendiente = self.monto_total_a_pagar - self.total_pagado
+            super().save(*args, **kwargs)
+            
+            # Generar cuotas automáticamente solo si es nuevo
+            if is_new:
+                self.generar_cuotas(plan)
+            
+            CambioPrestamo.registrar(self.pk, self.cobrador_id, getattr(self, '_cobrador_cargado', self.cobrador_id))
+            self._cobrador_cargado = self.cobrador_id
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instancia = super().from_db(db, field_names, values)
+        # Cobrador con el que se cargó, para avisar también al anterior si se reasigna
+        instancia._cobrador_cargado = instancia.__dict__.get('cobrador_id')
+        return instancia
     
     def calcular_fecha_finalizacion(self):
         """Calcula la fecha de finalización del préstamo"""
-        fecha = self.fecha_inicio
-        
-        # Para diarios, la primera cuota es el mismo día de inicio
-        if self.frecuencia == self.Frecuencia.DIARIO:
-            # Asegurar que fecha_inicio no sea domingo
-            if fecha.weekday() == 6:
-                fecha += timedelta(days=1)
-            dias_agregados = 1  # La primera cuota es hoy
-            while dias_agregados < self.cuotas_pactadas:
-                fecha += timedelta(days=1)
-                if fecha.weekday() == 6:  # Saltar domingos
-                    continue
-                dias_agregados += 1
-        else:
-            dias_agregados = 0
-            while dias_agregados < self.cuotas_pactadas:
-                if self.frecuencia == self.Frecuencia.SEMANAL:
-                    fecha += timedelta(weeks=1)
-                elif self.frecuencia == self.Frecuencia.QUINCENAL:
-                    fecha += timedelta(days=15)
-                elif self.frecuencia == self.Frecuencia.MENSUAL:
-                    fecha += timedelta(days=30)
-                dias_agregados += 1
-        
-        return fecha
-    
-    def generar_cuotas(self):
-        """Genera todas las cuotas del préstamo automáticamente"""
-        monto_cuota = self.monto_total_a_pagar / self.cuotas_pactadas
-        fecha_vencimiento = self.fecha_inicio
-        
-        if self.fecha_finalizacion_manual and self.fecha_finalizacion:
-            # Distribuir cuotas uniformemente entre fecha_inicio y fecha_finalizacion
-            self._generar_cuotas_con_fecha_fin(monto_cuota)
-        else:
-            # Distribución normal por frecuencia
-            for numero in range(1, self.cuotas_pactadas + 1):
-                if numero == 1 and self.frecuencia == self.Frecuencia.DIARIO:
-                    # Primera cuota diaria: mismo día de inicio
-                    # Asegurar que no caiga domingo
-                    while fecha_vencimiento.weekday() == 6:
-                        fecha_vencimiento += timedelta(days=1)
-                else:
-                    # Calcular fecha de vencimiento según frecuencia
-                    if self.frecuencia == self.Frecuencia.DIARIO:
-                        fecha_vencimiento += timedelta(days=1)
-                        # Saltar domingos
-                        while fecha_vencimiento.weekday() == 6:
-                            fecha_vencimiento += timedelta(days=1)
-                    elif self.frecuencia == self.Frecuencia.SEMANAL:
-                        fecha_vencimiento += timedelta(weeks=1)
-                    elif self.frecuencia == self.Frecuencia.QUINCENAL:
-                        fecha_vencimiento += timedelta(days=15)
-                    elif self.frecuencia == self.Frecuencia.MENSUAL:
-                        fecha_vencimiento += timedelta(days=30)
-                
-                Cuota.objects.create(
-                    prestamo=self,
-                    numero_cuota=numero,
-                    monto_cuota=round(monto_cuota, 2),
-                    fecha_vencimiento=fecha_vencimiento
-                )
+        return calcular_fecha_fin(self.fecha_inicio, self.cuotas_pactadas, self.frecuencia)
     
-    def _generar_cuotas_con_fecha_fin(self, monto_cuota):
-        """Genera cuotas distribuyéndolas uniformemente hasta la fecha de finalización"""
-        total_dias = (self.fecha_finalizacion - self.fecha_inicio).days
-        if total_dias <= 0:
-            total_dias = 1
+    def planificar_cuotas(self):
+        """Cronograma de cuotas (en memoria) según frecuencia o fecha manual"""
+        # Si la fecha fue fijada manualmente, distribuir cuotas hasta esa fecha
+        fecha_fin = None
+        if self.fecha_finalizacion_manual and self.fecha_finalizacion:
+            fecha_fin = self.fecha_finalizacion
         
-        for numero in range(1, self.cuotas_pactadas + 1):
-            # Distribuir proporcionalmente
-            dias_offset = int(round(total_dias * numero / self.cuotas_pactadas))
-            fecha_vencimiento = self.fecha_inicio + timedelta(days=dias_offset)
-            
-            # Si es frecuencia diaria, saltar domingos
-            if self.frecuencia == self.Frecuencia.DIARIO:
-                while fecha_vencimiento.weekday() == 6:
-                    fecha_vencimiento += timedelta(days=1)
-            
-            Cuota.objects.create(
+        return planificar_cuotas(
+            self.monto_total_a_pagar,
+            self.cuotas_pactadas,
+            self.frecuencia,
+            self.fecha_inicio,
+            fecha_fin=fecha_fin
+        )
+    
+    def generar_cuotas(self, plan=None):
+        """Genera todas las cuotas del préstamo automáticamente"""
+        if plan is None:
+            plan = self.planificar_cuotas()
+        Cuota.objects.bulk_create([
+            Cuota(
                 prestamo=self,
-                numero_cuota=numero,
-                monto_cuota=round(monto_cuota, 2),
-                fecha_vencimiento=fecha_vencimiento
+                numero_cuota=cuota.numero,
+                monto_cuota=cuota.monto,
+                fecha_vencimiento=cuota.fecha_vencimiento
             )
+            for cuota in plan
+        ])
     
     @property
     def monto_pagado(self):
         """Suma de todos los pagos realizados"""
-        return self.cuotas.filter(
-            estado__in=['PA', 'PC']
-        ).aggregate(
-            total=models.Sum('monto_pagado')
-        )['total'] or Decimal('0.00')
+        if hasattr(self, 'monto_pagado_anotado'):
+            return self.monto_pagado_anotado
+        return self.total_pagado
     
     @property
     def monto_pendiente(self):
@@ -793,7 +821,9 @@ class Prestamo(models.Model):
     @property
     def cuotas_pagadas(self):
         """Número de cuotas completamente pagadas"""
-        return self.cuotas.filter(estado='PA').count()
+        if hasattr(self, 'cuotas_pagadas_anotadas'):
+            return self.cuotas_pagadas_anotadas
+        return self.cantidad_cuotas_pagadas
     
     @property
     def progreso_porcentaje(self):
@@ -805,14 +835,63 @@ class Prestamo(models.Model):
     @property
     def proxima_cuota(self):
         """Retorna la próxima cuota pendiente"""
+        if hasattr(self, 'proxima_cuota_id'):
+            # Viene anotada por with_balances(): armar la cuota sin consultar
+            if self.proxima_cuota_id is None:
+                return None
+            return Cuota(
+                pk=self.proxima_cuota_id,
+                prestamo=self,
+                numero_cuota=self.proxima_cuota_numero,
+                fecha_vencimiento=self.proxima_cuota_vencimiento,
+                monto_cuota=self.proxima_cuota_monto,
+                monto_pagado=self.proxima_cuota_pagado,
+                estado=Cuota.Estado.PENDIENTE,
+            )
         return self.cuotas.filter(estado='PE').order_by('numero_cuota').first()
     
+    def actualizar_saldos(self):
+        """
+        Recalcula los saldos desnormalizados desde las cuotas y los guarda.
+        Bloquea la fila del préstamo para que dos pagos simultáneos no se pisen.
+        """
+        with transaction.atomic():
+            Prestamo.objects.select_for_update().only('pk').get(pk=self.pk)
+            datos = self.cuotas.aggregate(
+                total=models.Sum('monto_pagado', filter=models.Q(estado__in=['PA', 'PC'])),
+                pagadas=models.Count('id', filter=models.Q(estado='PA')),
+                proximo=models.Min('fecha_vencimiento', filter=models.Q(estado='PE')),
+            )
+            self.total_pagado = datos['total'] or Decimal('0.00')
+            self.saldo_pendiente = self.monto_total_a_pagar - self.total_pagado
+            self.cantidad_cuotas_pagadas = datos['pagadas']
+            self.fecha_proximo_vencimiento = datos['proximo']
+            Prestamo.objects.filter(pk=self.pk).update(
+                **{campo: getattr(self, campo) for campo in self.CAMPOS_SALDO}
+            )
+            # Las anotaciones de with_balances() quedan desactualizadas
+            for anotacion in PrestamoQuerySet.ANOTACIONES_SALDO:
+                self.__dict__.pop(anotacion, None)
+            # Todos los caminos que tocan cuotas terminan acá: avisar a la app
+            CambioPrestamo.registrar(self.pk, self.cobrador_id)
+    
+    @transaction.atomic
     def liquidar_prestamo(self):
         """Liquida el préstamo marcando todas las cuotas como pagadas"""
-        self.cuotas.filter(estado='PE').update(
+        pendientes = self.cuotas.filter(estado='PE')
+        liquidadas = pendientes.aggregate(
+            monto=models.Sum('monto_pagado'),
+            cantidad=models.Count('id')
+        )
+        pendientes.update(
             estado='PA',
             fecha_pago_real=fecha_local_hoy()
         )
+        ResumenCobroDiario.acumular(
+            self.cobrador_id, fecha_local_hoy(),
+            liquidadas['monto'] or Decimal('0.00'), liquidadas['cantidad']
+        )
+        self.actualizar_saldos()
         self.estado = self.Estado.FINALIZADO
         self.save()
         self.cliente.actualizar_categoria()
@@ -822,6 +901,7 @@ class Prestamo(models.Model):
         return self.monto_pendiente
     
     @classmethod
+    @transaction.atomic
     def renovar_prestamo(cls, prestamo_anterior, nuevo_monto, nueva_tasa, nuevas_cuotas, nueva_frecuencia, cobrador=None, fecha_finalizacion=None):
         """
         Renueva un préstamo existente.
@@ -834,10 +914,14 @@ class Prestamo(models.Model):
         # Actualizamos cada cuota individualmente para evitar problemas con F()
         cuotas_pendientes = prestamo_anterior.cuotas.filter(estado__in=['PE', 'PC'])
         for cuota in cuotas_pendientes:
+            aporte_anterior = cuota.aporte_cobro_diario()
             cuota.estado = 'PA'
             cuota.fecha_pago_real = fecha_local_hoy()
             cuota.monto_pagado = cuota.monto_cuota
             cuota.save()
+            ResumenCobroDiario.aplicar_cambio(aporte_anterior, cuota.aporte_cobro_diario())
+        
+        prestamo_anterior.actualizar_saldos()
         
         # Marcar préstamo anterior como renovado
         prestamo_anterior.estado = cls.Estado.RENOVADO
@@ -960,11 +1044,34 @@ class Cuota(models.Model):
         verbose_name='Cobrado por'
     )
     
+    # Campos que modifican registrar_pago y cancelar_pago
+    CAMPOS_PAGO = [
+        'monto_pagado', 'estado', 'fecha_pago_real', 'metodo_pago', 'monto_efectivo',
+        'monto_transferencia', 'referencia_transferencia', 'interes_mora_cobrado', 'cobrado_por'
+    ]
+    
     class Meta:
         verbose_name = 'Cuota'
         verbose_name_plural = 'Cuotas'
         ordering = ['prestamo', 'numero_cuota']
         unique_together = ['prestamo', 'numero_cuota']
+        indexes = [
+            # Cuotas pendientes por vencimiento (cobros del día, vencidas, próximas, planilla)
+            models.Index(
+                fields=['fecha_vencimiento', 'prestamo'],
+                condition=models.Q(estado__in=['PE', 'PC']),
+                name='cuota_pendiente_venc_idx'
+            ),
+            # Cobros realizados por fecha (dashboard, cierre de caja, stats de cobro)
+            models.Index(
+                fields=['fecha_pago_real', 'estado'],
+                condition=models.Q(fecha_pago_real__isnull=False),
+                name='cuota_pago_fecha_idx'
+            ),
+            models.Index(fields=['estado', 'fecha_vencimiento'], name='cuota_estado_venc_idx'),
+            # Saldos y próxima cuota de un préstamo
+            models.Index(fields=['prestamo', 'estado', 'numero_cuota'], name='cuota_prestamo_estado_idx'),
+        ]
     
     def __str__(self):
         return f"Cuota {self.numero_cuota}/{self.prestamo.cuotas_pactadas} - {self.prestamo.cliente}"
@@ -1005,6 +1112,29 @@ class Cuota(models.Model):
         """Monto total a pagar incluyendo interés por mora"""
         return self.monto_restante + self.interes_mora_pendiente
     
+    def aporte_cobro_diario(self):
+        """
+        Cómo suma esta cuota a los cobros del día: (cobrador_id, fecha, monto)
+        si está pagada o con pago parcial, o None.
+        """
+        if self.estado in ('PA', 'PC') and self.fecha_pago_real:
+            return (self.prestamo.cobrador_id, self.fecha_pago_real, self.monto_pagado)
+        return None
+    
+    def bloquear_para_pago(self):
+        """
+        Bloquea el préstamo y la cuota (siempre en ese orden, igual que
+        actualizar_saldos) y recarga los montos de la cuota, para que dos pagos
+        simultáneos sobre el mismo préstamo se apliquen uno detrás del otro
+        sobre datos actuales. Debe llamarse dentro de una transacción.
+        El préstamo ya cargado en la cuota se conserva (actualizar_saldos lo
+        deja al día).
+        """
+        Prestamo.objects.select_for_update().only('pk').get(pk=self.prestamo_id)
+        Cuota.objects.select_for_update().only('pk').get(pk=self.pk)
+        self.refresh_from_db(fields=['monto_cuota', *self.CAMPOS_PAGO])
+    
+    @transaction.atomic
     def registrar_pago(self, monto=None, accion_restante='ignorar', fecha_especial=None,
                        metodo_pago='EF', monto_efectivo=None, monto_transferencia=None,
                        referencia_transferencia=None, interes_mora=None, cobrador=None):
@@ -1021,15 +1151,23 @@ class Cuota(models.Model):
         - 'EF': Efectivo
         - 'TR': Transferencia
         - 'MX': Mixto
+        
+        Todo se hace en una transacción con el préstamo y la cuota bloqueados
+        (ver bloquear_para_pago); el historial se inserta al final en un solo
+        bulk_create.
         """
         from core.models import HistorialModificacionPago
         
+        self.bloquear_para_pago()
+        
         if monto is None:
             monto = self.monto_restante
         
         monto = Decimal(str(monto))
         monto_cuota_original = self.monto_cuota
         monto_restante_anterior = self.monto_restante
+        aporte_anterior = self.aporte_cobro_diario()
+        historial = []
         
         self.monto_pagado += monto
         self.fecha_pago_real = fecha_local_hoy()
@@ -1062,8 +1200,6 @@ class Cuota(models.Model):
         else:
             self.estado = self.Estado.PARCIAL
         
-        self.save()
-        
         # Calcular lo que quedó sin pagar de esta cuota
         restante = monto_restante_anterior - monto
         
@@ -1076,7 +1212,7 @@ class Cuota(models.Model):
         es_parcial = monto < monto_restante_anterior
         tipo_pago = 'PP' if es_parcial else 'PA'
         
-        HistorialModificacionPago.objects.create(
+        historial.append(HistorialModificacionPago(
             cuota=self,
             usuario=cobrador,
             tipo_modificacion=tipo_pago,
@@ -1087,11 +1223,11 @@ class Cuota(models.Model):
             interes_mora=mora_pendiente,
             metodo_pago=metodo_pago,
             notas=f'Acción restante: {accion_restante}' if es_parcial else ''
-        )
+        ))
         
         if monto_a_transferir > 0 and accion_restante == 'proxima':
             # Sumar a la próxima cuota pendiente o parcial
-            proxima = self.prestamo.cuotas.filter(
+            proxima = self.prestamo.cuotas.select_for_update().filter(
                 estado__in=['PE', 'PC'],
                 numero_cuota__gt=self.numero_cuota
             ).order_by('numero_cuota').first()
@@ -1099,10 +1235,10 @@ class Cuota(models.Model):
             if proxima:
                 monto_proxima_anterior = proxima.monto_cuota
                 proxima.monto_cuota += monto_a_transferir
-                proxima.save()
+                proxima.save(update_fields=['monto_cuota'])
                 
                 # --- HISTORIAL: Registrar que la próxima cuota recibió monto ---
-                HistorialModificacionPago.objects.create(
+                historial.append(HistorialModificacionPago(
                     cuota=proxima,
                     cuota_relacionada=self,
                     usuario=cobrador,
@@ -1114,10 +1250,10 @@ class Cuota(models.Model):
                     interes_mora=mora_pendiente,
                     metodo_pago='',
                     notas=f'Recibió ${monto_a_transferir:,.0f} de cuota #{self.numero_cuota} (restante: ${restante:,.0f}, mora: ${mora_pendiente:,.0f})'
-                )
+                ))
                 
                 # --- HISTORIAL: Registrar que esta cuota transfirió monto ---
-                HistorialModificacionPago.objects.create(
+                historial.append(HistorialModificacionPago(
                     cuota=self,
                     cuota_relacionada=proxima,
                     usuario=cobrador,
@@ -1129,12 +1265,11 @@ class Cuota(models.Model):
                     interes_mora=mora_pendiente,
                     metodo_pago='',
                     notas=f'Transferido ${monto_a_transferir:,.0f} a cuota #{proxima.numero_cuota}'
-                )
+                ))
                 
                 # Marcar esta cuota como pagada ya que se transfirió el restante
                 if restante > 0:
                     self.estado = self.Estado.PAGADO
-                    self.save()
         
         elif monto_a_transferir > 0 and accion_restante == 'especial' and fecha_especial:
             # Crear cuota especial
@@ -1154,7 +1289,7 @@ class Cuota(models.Model):
             self.prestamo.save(update_fields=['cuotas_pactadas'])
             
             # --- HISTORIAL: Registrar cuota especial creada ---
-            HistorialModificacionPago.objects.create(
+            historial.append(HistorialModificacionPago(
                 cuota=self,
                 cuota_relacionada=cuota_especial,
                 usuario=cobrador,
@@ -1166,10 +1301,10 @@ class Cuota(models.Model):
                 interes_mora=mora_pendiente,
                 metodo_pago='',
                 notas=f'Cuota especial #{cuota_especial.numero_cuota} creada por ${monto_a_transferir:,.0f}'
-            )
+            ))
             
             # --- HISTORIAL: Registrar en la cuota especial ---
-            HistorialModificacionPago.objects.create(
+            historial.append(HistorialModificacionPago(
                 cuota=cuota_especial,
                 cuota_relacionada=self,
                 usuario=cobrador,
@@ -1181,21 +1316,29 @@ class Cuota(models.Model):
                 interes_mora=mora_pendiente,
                 metodo_pago='',
                 notas=f'Cuota especial. Recibió ${monto_a_transferir:,.0f} de cuota #{self.numero_cuota}'
-            )
+            ))
             
             # Marcar esta cuota como pagada
             self.estado = self.Estado.PAGADO
-            self.save()
         
-        # Verificar si el préstamo está completamente pagado
+        self.save(update_fields=self.CAMPOS_PAGO)
+        HistorialModificacionPago.objects.bulk_create(historial)
+        ResumenCobroDiario.aplicar_cambio(aporte_anterior, self.aporte_cobro_diario())
+        if aporte_anterior and aporte_anterior[1] != self.fecha_pago_real:
+            # Completar un pago parcial de otro día lo pasa a hoy: ese día cambió
+            CierreDiario.invalidar(aporte_anterior[1])
+        
+        # Actualizar saldos del préstamo y verificar si está completamente pagado
         prestamo = self.prestamo
+        prestamo.actualizar_saldos()
         if not prestamo.cuotas.filter(estado__in=['PE', 'PC']).exists():
             prestamo.estado = Prestamo.Estado.FINALIZADO
-            prestamo.save()
+            prestamo.save(update_fields=['estado'])
             prestamo.cliente.actualizar_categoria()
         
         return self
     
+    @transaction.atomic
     def cancelar_pago(self, usuario=None):
         """
         Cancela/revierte el pago de esta cuota.
@@ -1203,11 +1346,14 @@ class Cuota(models.Model):
         """
         from core.models import HistorialModificacionPago
         
+        self.bloquear_para_pago()
+        
         if self.estado not in ['PA', 'PC']:
             raise ValueError('Solo se pueden anular pagos de cuotas pagadas o con pago parcial.')
         
         monto_pagado_anterior = self.monto_pagado
         estado_anterior = self.estado
+        aporte_anterior = self.aporte_cobro_diario()
         
         # Registrar en historial antes de revertir
         HistorialModificacionPago.objects.create(
@@ -1233,10 +1379,14 @@ class Cuota(models.Model):
         self.referencia_transferencia = None
         self.interes_mora_cobrado = Decimal('0.00')
         self.cobrado_por = None
-        self.save()
+        self.save(update_fields=self.CAMPOS_PAGO)
+        ResumenCobroDiario.aplicar_cambio(aporte_anterior, None)
+        if aporte_anterior:
+            CierreDiario.invalidar(aporte_anterior[1])
         
-        # Si el préstamo estaba finalizado, reactivarlo
+        # Actualizar saldos; si el préstamo estaba finalizado, reactivarlo
         prestamo = self.prestamo
+        prestamo.actualizar_saldos()
         if prestamo.estado == Prestamo.Estado.FINALIZADO:
             prestamo.estado = Prestamo.Estado.ACTIVO
             prestamo.save(update_fields=['estado'])
@@ -1244,6 +1394,565 @@ class Cuota(models.Model):
         return self
 
 
+# ==================== RESUMEN DIARIO DE COBROS ====================
+
+class ResumenCobroDiario(models.Model):
+    """
+    Totales cobrados por cobrador y por día, acumulados en cada pago/anulación.
+    Equivale a sumar monto_pagado de las cuotas PA/PC con fecha_pago_real = fecha
+    de los préstamos del cobrador; se reconstruye con reconcile_daily_totals.
+    """
+    cobrador = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='resumenes_cobro',
+        verbose_name='Cobrador'
+    )
+    fecha = models.DateField(verbose_name='Fecha')
+    total_cobrado = models.DecimalField(
+        max_digits=14,
+        decimal_places=2,
+        default=Decimal('0.00'),
+        verbose_name='Total Cobrado'
+    )
+    cantidad_cobros = models.IntegerField(default=0, verbose_name='Cantidad de Cobros')
+    
+    class Meta:
+        verbose_name = 'Resumen de Cobro Diario'
+        verbose_name_plural = 'Resúmenes de Cobro Diario'
+        ordering = ['-fecha']
+        constraints = [
+            models.UniqueConstraint(fields=['cobrador', 'fecha'], name='resumen_cobro_cobrador_fecha_uniq'),
+            models.UniqueConstraint(
+                fields=['fecha'],
+                condition=models.Q(cobrador__isnull=True),
+                name='resumen_cobro_sin_cobrador_uniq'
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.fecha} - {self.cobrador or 'Sin cobrador'}: ${self.total_cobrado:,.0f}"
+    
+    @classmethod
+    def acumular(cls, cobrador_id, fecha, monto, cantidad):
+        """Suma monto y cantidad al total del día con F() (crea la fila si no existe)"""
+        if not monto and not cantidad:
+            return
+        filtro = cls.objects.filter(cobrador_id=cobrador_id, fecha=fecha)
+        cambios = {
+            'total_cobrado': F('total_cobrado') + monto,
+            'cantidad_cobros': F('cantidad_cobros') + cantidad,
+        }
+        if filtro.update(**cambios):
+            return
+        try:
+            with transaction.atomic():
+                cls.objects.create(
+                    cobrador_id=cobrador_id, fecha=fecha,
+                    total_cobrado=monto, cantidad_cobros=cantidad
+                )
+        except IntegrityError:
+            # Otro pago creó la fila al mismo tiempo
+            filtro.update(**cambios)
+    
+    @classmethod
+    def aplicar_cambio(cls, aporte_anterior, aporte_nuevo):
+        """Aplica la diferencia entre dos Cuota.aporte_cobro_diario()"""
+        if aporte_anterior == aporte_nuevo:
+            return
+        if aporte_anterior and aporte_nuevo and aporte_anterior[:2] == aporte_nuevo[:2]:
+            cls.acumular(*aporte_nuevo[:2], aporte_nuevo[2] - aporte_anterior[2], 0)
+            return
+        if aporte_anterior:
+            cls.acumular(*aporte_anterior[:2], -aporte_anterior[2], -1)
+        if aporte_nuevo:
+            cls.acumular(*aporte_nuevo[:2], aporte_nuevo[2], 1)
+    
+    @classmethod
+    def calcular_desde_cuotas(cls, desde=None, hasta=None):
+        """Totales recalculados desde las cuotas: {(cobrador_id, fecha): (total, cantidad)}"""
+        cuotas = Cuota.objects.filter(estado__in=['PA', 'PC'], fecha_pago_real__isnull=False)
+        if desde:
+            cuotas = cuotas.filter(fecha_pago_real__gte=desde)
+        if hasta:
+            cuotas = cuotas.filter(fecha_pago_real__lte=hasta)
+        filas = cuotas.order_by().values('prestamo__cobrador', 'fecha_pago_real').annotate(
+            total=models.Sum('monto_pagado'),
+            cantidad=models.Count('id')
+        )
+        return {
+            (fila['prestamo__cobrador'], fila['fecha_pago_real']): (fila['total'] or Decimal('0.00'), fila['cantidad'])
+            for fila in filas
+        }
+    
+    @classmethod
+    def totales_del_dia(cls, fecha, cobrador=None):
+        """Total cobrado y cantidad de cobros del día (de un cobrador o de todos)"""
+        filas = cls.objects.filter(fecha=fecha)
+        if cobrador is not None:
+            filas = filas.filter(cobrador=cobrador)
+        totales = filas.aggregate(
+            total=models.Sum('total_cobrado'),
+            cantidad=models.Sum('cantidad_cobros')
+        )
+        return {
+            'total_cobrado_hoy': totales['total'] or Decimal('0.00'),
+            'cantidad_cobros_hoy': totales['cantidad'] or 0,
+        }
+
+
+# ==================== CIERRES DE CAJA ====================
+
+class CierreDiario(models.Model):
+    """
+    Cierre de caja de un día terminado, por cobrador: totales por método de
+    pago y las filas del cierre tal como se exportan (ver
+    core/exportacion.py). Los días pasados se leen de acá en vez de
+    recalcularse; cancelar_pago de un cobro de un día cerrado (o completar
+    hoy un pago parcial de ese día) borra los cierres de ese día y se vuelven
+    a armar en la próxima lectura (o en la tarea 'cierre_diario').
+    
+    Todo día cerrado tiene el cierre sin cobrador (en cero si no hubo cobros
+    de préstamos sin cobrador): marca el día como cerrado aunque no haya
+    tenido cobros, para que leerlo no vuelva a armarlo cada vez.
+    """
+    fecha = models.DateField(verbose_name='Fecha')
+    cobrador = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='cierres_diarios',
+        verbose_name='Cobrador'
+    )
+    cantidad_pagos = models.IntegerField(default=0, verbose_name='Cantidad de Pagos')
+    total_cobrado = models.DecimalField(
+        max_digits=14, decimal_places=2, default=Decimal('0.00'), verbose_name='Total Cobrado'
+    )
+    total_efectivo = models.DecimalField(
+        max_digits=14, decimal_places=2, default=Decimal('0.00'), verbose_name='Total Efectivo'
+    )
+    total_transferencia = models.DecimalField(
+        max_digits=14, decimal_places=2, default=Decimal('0.00'), verbose_name='Total Transferencia'
+    )
+    filas = models.JSONField(
+        default=list,
+        encoder=DjangoJSONEncoder,
+        verbose_name='Filas',
+        help_text='[apellido, valores, resaltado] de cada pago, en el orden del cierre'
+    )
+    fecha_cierre = models.DateTimeField(auto_now_add=True, verbose_name='Fecha de Cierre')
+    
+    class Meta:
+        verbose_name = 'Cierre Diario'
+        verbose_name_plural = 'Cierres Diarios'
+        ordering = ['-fecha']
+        constraints = [
+            models.UniqueConstraint(fields=['cobrador', 'fecha'], name='cierre_diario_cobrador_fecha_uniq'),
+            models.UniqueConstraint(
+                fields=['fecha'],
+                condition=models.Q(cobrador__isnull=True),
+                name='cierre_diario_sin_cobrador_uniq'
+            ),
+        ]
+    
+    def __str__(self):
+        return f"Cierre {self.fecha} - {self.cobrador or 'Sin cobrador'}: ${self.total_cobrado:,.0f}"
+    
+    @classmethod
+    def cerrar(cls, fecha):
+        """
+        Arma (o rearma) los cierres de todos los cobradores del día: los
+        totales en una consulta agrupada y las filas recorriendo los pagos
+        una vez. Devuelve los cierres armados.
+        
+        Si otro proceso cierra el mismo día a la vez (dos primeras lecturas,
+        o una lectura y la tarea), sus filas ya insertadas se respetan en vez
+        de chocar con las restricciones únicas: los dos calculan lo mismo.
+        """
+        from .exportacion import filas_cierre
+        
+        pagos = Cuota.objects.filter(fecha_pago_real=fecha, estado__in=['PA', 'PC'])
+        totales = pagos.order_by().values('prestamo__cobrador').annotate(
+            cantidad=models.Count('id'),
+            cobrado=models.Sum('monto_pagado'),
+            efectivo=models.Sum('monto_efectivo'),
+            transferencia=models.Sum('monto_transferencia'),
+        )
+        cierres = {
+            fila['prestamo__cobrador']: cls(
+                fecha=fecha,
+                cobrador_id=fila['prestamo__cobrador'],
+                cantidad_pagos=fila['cantidad'],
+                total_cobrado=fila['cobrado'] or Decimal('0.00'),
+                total_efectivo=fila['efectivo'] or Decimal('0.00'),
+                total_transferencia=fila['transferencia'] or Decimal('0.00'),
+                filas=[],
+            )
+            for fila in totales
+        }
+        for pago, valores, resaltado in filas_cierre(pagos):
+            cierre = cierres.get(pago.prestamo.cobrador_id)
+            if cierre is not None:
+                cierre.filas.append([pago.prestamo.cliente.apellido, valores, resaltado])
+        cierres.setdefault(None, cls(fecha=fecha, cobrador=None, filas=[]))
+        
+        with transaction.atomic():
+            cls.objects.filter(fecha=fecha).delete()
+            return cls.objects.bulk_create(cierres.values(), ignore_conflicts=True)
+    
+    @classmethod
+    def obtener(cls, fecha, cobrador=None):
+        """
+        Cierres de un día ya terminado (de un cobrador, o de todos con
+        cobrador=None), armándolos si faltan. None si el día sigue abierto.
+        """
+        if fecha >= fecha_local_hoy():
+            return None
+        cierres = cls.objects.filter(fecha=fecha)
+        if cobrador is not None:
+            # El cierre sin cobrador viene solo para saber si el día está cerrado
+            cierres = cierres.filter(models.Q(cobrador=cobrador) | models.Q(cobrador__isnull=True))
+        guardados = list(cierres)
+        if not guardados:
+            cls.cerrar(fecha)
+            guardados = list(cierres.all())
+        if cobrador is not None:
+            guardados = [cierre for cierre in guardados if cierre.cobrador_id is not None]
+        return guardados
+    
+    @classmethod
+    def cerrar_pendientes(cls, dias=7):
+        """Cierra los días de la última semana (o de `dias`) con cobros y sin cierre"""
+        hoy = fecha_local_hoy()
+        con_cobros = set(Cuota.objects.filter(
+            fecha_pago_real__gte=hoy - timedelta(days=dias),
+            fecha_pago_real__lt=hoy,
+            estado__in=['PA', 'PC'],
+        ).order_by().values_list('fecha_pago_real', flat=True).distinct())
+        cerrados = set(cls.objects.filter(fecha__in=con_cobros).values_list('fecha', flat=True))
+        pendientes = sorted(con_cobros - cerrados)
+        for fecha in pendientes:
+            cls.cerrar(fecha)
+        return pendientes
+    
+    @classmethod
+    def invalidar(cls, fecha):
+        """El día cambió (p. ej. se anuló un cobro): se rearma en la próxima lectura"""
+        if fecha < fecha_local_hoy():
+            cls.objects.filter(fecha=fecha).delete()
+
+
+# ==================== IDEMPOTENCIA DE COBROS ====================
+
+class ClaveIdempotencia(models.Model):
+    """
+    Respuesta guardada de una operación de cobro identificada por una clave
+    generada en el dispositivo. Si la misma clave vuelve a llegar (reintento,
+    cola offline) se devuelve la respuesta guardada sin aplicar el pago otra vez.
+    Las claves vencen a las IDEMPOTENCIA_TTL_HORAS (ver purge_idempotency_keys).
+    """
+    TTL_HORAS_DEFAULT = 24
+    
+    usuario = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='claves_idempotencia',
+        verbose_name='Usuario'
+    )
+    clave = models.CharField(max_length=64, verbose_name='Clave')
+    operacion = models.CharField(max_length=30, verbose_name='Operación')
+    respuesta = models.JSONField(null=True, blank=True, verbose_name='Respuesta')
+    codigo_estado = models.PositiveSmallIntegerField(default=200, verbose_name='Código de Estado')
+    fecha_creacion = models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Fecha')
+    
+    class Meta:
+        verbose_name = 'Clave de Idempotencia'
+        verbose_name_plural = 'Claves de Idempotencia'
+        ordering = ['-fecha_creacion']
+        constraints = [
+            models.UniqueConstraint(fields=['usuario', 'clave'], name='idempotencia_usuario_clave_uniq'),
+        ]
+    
+    def __str__(self):
+        return f"{self.usuario} - {self.operacion} - {self.clave}"
+    
+    @classmethod
+    def reservar(cls, usuario, clave, operacion):
+        """
+        Crea la fila de la clave y devuelve (registro, creada). Si la clave ya
+        existía devuelve la fila guardada con creada=False.
+        Debe usarse dentro de la transacción de la operación: si esta falla la
+        clave se libera, y otra request con la misma clave espera en el índice
+        único hasta que la primera termine.
+        """
+        try:
+            with transaction.atomic():
+                return cls.objects.create(usuario=usuario, clave=clave, operacion=operacion), True
+        except IntegrityError:
+            registro = cls.objects.get(usuario=usuario, clave=clave)
+            if registro.fecha_creacion >= cls.limite_vigencia():
+                return registro, False
+            # Clave vencida: se toma como una operación nueva
+            registro.delete()
+            return cls.objects.create(usuario=usuario, clave=clave, operacion=operacion), True
+    
+    @classmethod
+    def limite_vigencia(cls):
+        """Las claves creadas antes de este momento están vencidas"""
+        horas = getattr(settings, 'IDEMPOTENCIA_TTL_HORAS', cls.TTL_HORAS_DEFAULT)
+        return timezone.now() - timedelta(hours=horas)
+    
+    @classmethod
+    def purgar_vencidas(cls, lote=1000):
+        """Borra las claves vencidas en lotes de `lote` filas; devuelve cuántas borró"""
+        limite = cls.limite_vigencia()
+        borradas = 0
+        while True:
+            ids = list(
+                cls.objects.filter(fecha_creacion__lt=limite).values_list('pk', flat=True)[:lote]
+            )
+            if not ids:
+                return borradas
+            borradas += cls.objects.filter(pk__in=ids).delete()[0]
+    
+    def guardar_respuesta(self, respuesta, codigo_estado=200):
+        """Guarda la respuesta que se devolverá a los reintentos con esta clave"""
+        self.respuesta = respuesta
+        self.codigo_estado = codigo_estado
+        self.save(update_fields=['respuesta', 'codigo_estado'])
+
+
+# ==================== REGISTRO DE CAMBIOS (SINCRONIZACIÓN) ====================
+
+class CambioPrestamo(models.Model):
+    """
+    Registro de los préstamos cuyas cuotas cambiaron (alta, pagos, anulaciones,
+    cambios de estado o de cobrador, baja). El id autoincremental es el cursor:
+    la app pide las cuotas del día "desde" el último id que vio y recibe solo
+    las de los préstamos que cambiaron (ver core/cambios.py).
+    Los ids no son ForeignKey para conservar el registro de préstamos borrados.
+    """
+    prestamo_id = models.PositiveIntegerField(verbose_name='Préstamo')
+    cobrador_id = models.PositiveIntegerField(null=True, blank=True, verbose_name='Cobrador')
+    fecha = models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Fecha')
+    
+    class Meta:
+        verbose_name = 'Cambio de Préstamo'
+        verbose_name_plural = 'Cambios de Préstamos'
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['cobrador_id', 'id'], name='cambio_cobrador_id_idx'),
+        ]
+    
+    def __str__(self):
+        return f"#{self.pk} préstamo {self.prestamo_id}"
+    
+    @classmethod
+    def registrar(cls, prestamo_id, *cobradores_ids):
+        """
+        Registra un cambio del préstamo para cada cobrador indicado (el actual y,
+        si cambió, el anterior, para que su app lo quite).
+        
+        Los cambios se juntan por conexión y se insertan al confirmarse la
+        transacción, una fila por préstamo y cobrador aunque la operación pase
+        varias veces por acá (pago + préstamo finalizado, liquidación,
+        renovación). Es un INSERT sin bloqueos fuera de la transacción de la
+        operación. Si un savepoint se revierte, su callback se descarta pero lo
+        que dejó pendiente sale con otro: a lo sumo se avisa un cambio de más.
+        """
+        conexion = transaction.get_connection()
+        pendientes = getattr(conexion, 'cambios_prestamo_pendientes', None)
+        if pendientes is None:
+            pendientes = conexion.cambios_prestamo_pendientes = {}
+        for cobrador_id in cobradores_ids:
+            pendientes[(prestamo_id, cobrador_id)] = None
+        transaction.on_commit(lambda: cls._insertar_pendientes(conexion), robust=True)
+    
+    @classmethod
+    def _insertar_pendientes(cls, conexion):
+        pendientes, conexion.cambios_prestamo_pendientes = getattr(conexion, 'cambios_prestamo_pendientes', None), {}
+        if pendientes:
+            cls.objects.bulk_create([
+                cls(prestamo_id=prestamo_id, cobrador_id=cobrador_id)
+                for prestamo_id, cobrador_id in pendientes
+            ])
+
+
+# ==================== TAREAS PROGRAMADAS ====================
+
+class TareaProgramada(models.Model):
+    """
+    Estado de una tarea del programador (ver core/tareas.py y run_scheduler):
+    cuándo corre la próxima vez, quién la tiene tomada y cómo terminó la última.
+    """
+    nombre = models.CharField(max_length=50, unique=True, verbose_name='Nombre')
+    proxima_ejecucion = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name='Próxima Ejecución',
+        help_text='Vacío: se ejecuta en la próxima vuelta del programador'
+    )
+    bloqueada_hasta = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name='Bloqueada Hasta',
+        help_text='Mientras no pase esta hora, ningún otro proceso la ejecuta'
+    )
+    bloqueada_por = models.CharField(max_length=100, blank=True, default='', verbose_name='Bloqueada Por')
+    ultima_ejecucion = models.DateTimeField(null=True, blank=True, verbose_name='Última Ejecución')
+    ultima_duracion = models.FloatField(null=True, blank=True, verbose_name='Última Duración (s)')
+    duracion_total = models.FloatField(default=0, verbose_name='Duración Total (s)')
+    ultimo_resultado = models.TextField(blank=True, default='', verbose_name='Último Resultado')
+    ultimo_error = models.TextField(blank=True, default='', verbose_name='Último Error')
+    ejecuciones = models.PositiveIntegerField(default=0, verbose_name='Ejecuciones')
+    fallos = models.PositiveIntegerField(default=0, verbose_name='Fallos')
+    
+    class Meta:
+        verbose_name = 'Tarea Programada'
+        verbose_name_plural = 'Tareas Programadas'
+        ordering = ['nombre']
+    
+    def __str__(self):
+        return self.nombre
+    
+    @property
+    def duracion_promedio(self):
+        return self.duracion_total / self.ejecuciones if self.ejecuciones else None
+    
+    @classmethod
+    def tomar(cls, nombre, trabajador, bloqueo, forzar=False):
+        """
+        Toma la tarea si está vencida (o forzar=True) y nadie la tiene tomada.
+        Es un UPDATE condicional: de varios procesos que lo intentan a la vez,
+        solo uno lo logra. El bloqueo vence solo, por si el proceso muere.
+        """
+        ahora = timezone.now()
+        tareas = cls.objects.filter(nombre=nombre).filter(
+            models.Q(bloqueada_hasta__isnull=True) | models.Q(bloqueada_hasta__lt=ahora)
+        )
+        if not forzar:
+            tareas = tareas.filter(
+                models.Q(proxima_ejecucion__isnull=True) | models.Q(proxima_ejecucion__lte=ahora)
+            )
+        return tareas.update(bloqueada_hasta=ahora + bloqueo, bloqueada_por=trabajador) == 1
+    
+    def liberar(self, inicio, duracion, proxima, resultado='', error=''):
+        """Registra el resultado de la ejecución y suelta el bloqueo"""
+        TareaProgramada.objects.filter(pk=self.pk).update(
+            proxima_ejecucion=proxima,
+            bloqueada_hasta=None,
+            bloqueada_por='',
+            ultima_ejecucion=inicio,
+            ultima_duracion=duracion,
+            duracion_total=F('duracion_total') + duracion,
+            ultimo_resultado=resultado,
+            ultimo_error=error,
+            ejecuciones=F('ejecuciones') + 1,
+            fallos=F('fallos') + (1 if error else 0)
+        )
+    
+    @classmethod
+    def solicitar(cls, nombre):
+        """Pide que la tarea corra en la próxima vuelta del programador"""
+        tarea, _ = cls.objects.get_or_create(nombre=nombre)
+        cls.objects.filter(pk=tarea.pk).update(proxima_ejecucion=None)
+
+
+# ==================== EXPORTACIONES EN SEGUNDO PLANO ====================
+
+class TrabajoExportacion(models.Model):
+    """
+    Exportación a Excel pedida desde la web y generada por el programador
+    (tarea 'exportaciones', ver core/exportacion.py). El archivo queda en
+    MEDIA_ROOT/exportaciones/ y se avisa al usuario con una notificación.
+    """
+    
+    class Tipo(models.TextChoices):
+        PLANILLA = 'PL', 'Planilla de Cobros'
+        CIERRE = 'CI', 'Cierre de Caja'
+        CLIENTES = 'CL', 'Clientes'
+        PRESTAMOS = 'PR', 'Préstamos'
+    
+    class Estado(models.TextChoices):
+        PENDIENTE = 'PE', 'Pendiente'
+        PROCESANDO = 'EP', 'En Proceso'
+        LISTO = 'LI', 'Listo'
+        ERROR = 'ER', 'Error'
+    
+    usuario = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='exportaciones',
+        verbose_name='Usuario'
+    )
+    tipo = models.CharField(max_length=2, choices=Tipo.choices, verbose_name='Tipo')
+    parametros = models.JSONField(default=dict, blank=True, verbose_name='Parámetros')
+    clave = models.CharField(
+        max_length=64,
+        db_index=True,
+        verbose_name='Clave',
+        help_text='Hash de usuario, tipo y parámetros: mismos datos, mismo archivo'
+    )
+    estado = models.CharField(
+        max_length=2,
+        choices=Estado.choices,
+        default=Estado.PENDIENTE,
+        verbose_name='Estado'
+    )
+    archivo = models.FileField(upload_to='exportaciones/', blank=True, verbose_name='Archivo')
+    error = models.TextField(blank=True, default='', verbose_name='Error')
+    fecha_creacion = models.DateTimeField(auto_now_add=True, verbose_name='Fecha de Creación')
+    fecha_inicio = models.DateTimeField(null=True, blank=True, verbose_name='Inicio')
+    fecha_fin = models.DateTimeField(null=True, blank=True, verbose_name='Fin')
+    
+    class Meta:
+        verbose_name = 'Exportación'
+        verbose_name_plural = 'Exportaciones'
+        ordering = ['-fecha_creacion']
+        indexes = [
+            models.Index(fields=['estado', 'fecha_creacion'], name='exportacion_estado_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.get_tipo_display()} de {self.usuario} ({self.get_estado_display()})"
+    
+    @staticmethod
+    def calcular_clave(usuario, tipo, parametros):
+        datos = json.dumps([usuario.pk, tipo, parametros], sort_keys=True, default=str)
+        return hashlib.sha256(datos.encode('utf-8')).hexdigest()
+    
+    @classmethod
+    def solicitar(cls, usuario, tipo, parametros, ventana):
+        """
+        Encola la exportación, o devuelve la misma que se pidió hace menos de
+        `ventana` (timedelta) si todavía no falló. Devuelve (trabajo, reutilizado).
+        """
+        clave = cls.calcular_clave(usuario, tipo, parametros)
+        previo = cls.objects.filter(
+            clave=clave,
+            estado__in=[cls.Estado.PENDIENTE, cls.Estado.PROCESANDO, cls.Estado.LISTO],
+            fecha_creacion__gte=timezone.now() - ventana
+        ).first()
+        if previo is not None:
+            return previo, True
+        trabajo = cls.objects.create(usuario=usuario, tipo=tipo, parametros=parametros, clave=clave)
+        TareaProgramada.solicitar('exportaciones')
+        return trabajo, False
+    
+    def tomar(self):
+        """Pasa a En Proceso si sigue pendiente (UPDATE condicional, como TareaProgramada.tomar)"""
+        ahora = timezone.now()
+        tomado = TrabajoExportacion.objects.filter(pk=self.pk, estado=self.Estado.PENDIENTE).update(
+            estado=self.Estado.PROCESANDO, fecha_inicio=ahora
+        ) == 1
+        if tomado:
+            self.estado, self.fecha_inicio = self.Estado.PROCESANDO, ahora
+        return tomado
+
+
 # ==================== HISTORIAL DE MODIFICACIONES DE PAGO ====================
 
 class HistorialModificacionPago(models.Model):
@@ -1443,7 +2152,8 @@ class RegistroAuditoria(models.Model):
         verbose_name='Dirección IP'
     )
     fecha_hora = models.DateTimeField(
-        auto_now_add=True,
+        default=timezone.now,
+        editable=False,
         verbose_name='Fecha y Hora'
     )
     
@@ -1465,8 +2175,15 @@ class RegistroAuditoria(models.Model):
     @classmethod
     def registrar(cls, usuario, tipo_accion, tipo_modelo, descripcion, 
                   modelo_id=None, datos_anteriores=None, datos_nuevos=None, ip_address=None):
-        """Método de conveniencia para crear registros de auditoría"""
-        return cls.objects.create(
+        """
+        Método de conveniencia para crear registros de auditoría. El registro
+        se escribe después, en lote, si la transacción en curso se confirma
+        (ver core/auditoria.py): la hora es la del evento, pero el pk no
+        existe hasta que se vacía el buffer.
+        """
+        from .auditoria import agregar
+
+        return agregar(cls(
             usuario=usuario,
             tipo_accion=tipo_accion,
             tipo_modelo=tipo_modelo,
@@ -1474,8 +2191,9 @@ class RegistroAuditoria(models.Model):
             descripcion=descripcion,
             datos_anteriores=datos_anteriores,
             datos_nuevos=datos_nuevos,
-            ip_address=ip_address
-        )
+            ip_address=ip_address,
+            fecha_hora=timezone.now()
+        ))
 
 
 # ==================== SISTEMA DE NOTIFICACIONES ====================
@@ -1534,34 +2252,56 @@ class Notificacion(models.Model):
         verbose_name='Enlace',
         help_text='URL para redireccionar al hacer clic'
     )
-    leida = models.BooleanField(
-        default=False,
-        verbose_name='Leída'
-    )
     fecha_creacion = models.DateTimeField(
         auto_now_add=True,
         verbose_name='Fecha de Creación'
     )
-    fecha_lectura = models.DateTimeField(
+    cuota = models.ForeignKey(
+        'Cuota',
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='notificaciones',
+        verbose_name='Cuota',
+        help_text='Cuota que originó la notificación automática'
+    )
+    fecha_referencia = models.DateField(
         null=True,
         blank=True,
-        verbose_name='Fecha de Lectura'
+        verbose_name='Fecha de Referencia',
+        help_text='Día de generación: hay una sola notificación por cuota, tipo y día'
     )
     
+    # Notificaciones por INSERT al generar las de cuotas vencidas / por vencer
+    LOTE_GENERACION = 1000
+    
     class Meta:
         verbose_name = 'Notificación'
         verbose_name_plural = 'Notificaciones'
         ordering = ['-fecha_creacion']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['cuota', 'tipo', 'fecha_referencia'],
+                name='notificacion_cuota_tipo_fecha_uniq'
+            ),
+        ]
+        indexes = [
+            # Retención por tipo (core/retencion.py)
+            models.Index(fields=['tipo', 'fecha_creacion'], name='notificacion_tipo_fecha_idx'),
+        ]
     
     def __str__(self):
         return f"{self.titulo} - {self.get_tipo_display()}"
     
-    def marcar_como_leida(self):
-        """Marca la notificación como leída"""
-        if not self.leida:
-            self.leida = True
-            self.fecha_lectura = timezone.now()
-            self.save()
+    def marcar_como_leida(self, usuario):
+        """Marca la notificación como leída para un usuario; devuelve si estaba sin leer"""
+        marcadas = self.destinatarios.filter(usuario=usuario, leida=False).update(
+            leida=True, fecha_lectura=timezone.now()
+        )
+        if marcadas:
+            from .notificaciones import avisar_cambio_notificaciones
+            avisar_cambio_notificaciones()
+        return bool(marcadas)
     
     @classmethod
     def crear_notificacion(cls, tipo, titulo, mensaje, usuario=None, prioridad='ME', enlace=None):
@@ -1575,38 +2315,78 @@ class Notificacion(models.Model):
             enlace=enlace
         )
     
+    @classmethod
+    def _notificar_cuotas(cls, tipo, cuotas, armar, hoy):
+        """
+        Crea una notificación de `tipo` por cada cuota que todavía no la tenga
+        hoy. Las que ya existen se descartan en la misma consulta (NOT EXISTS)
+        y el resto se inserta por lotes; si otro proceso generó la misma
+        notificación en el medio, la restricción única la descarta.
+        
+        Cada notificación es para el cobrador del préstamo; solo las de
+        préstamos sin cobrador son generales (una fila de destinatario por
+        cada usuario activo).
+        """
+        ya_notificadas = cls.objects.filter(
+            cuota=OuterRef('pk'),
+            tipo=tipo,
+            fecha_referencia=hoy
+        )
+        filas = cuotas.filter(~Exists(ya_notificadas)).values(
+            'pk', 'numero_cuota', 'monto_cuota', 'monto_pagado', 'fecha_vencimiento',
+            'prestamo_id', 'prestamo__cuotas_pactadas', 'prestamo__cobrador_id',
+            'prestamo__cliente__nombre', 'prestamo__cliente__apellido'
+        )
+        
+        creadas = 0
+        lote = []
+        for fila in filas.iterator(chunk_size=cls.LOTE_GENERACION):
+            lote.append(cls(
+                tipo=tipo, cuota_id=fila['pk'], usuario_id=fila['prestamo__cobrador_id'],
+                fecha_referencia=hoy, **armar(fila)
+            ))
+            if len(lote) >= cls.LOTE_GENERACION:
+                creadas += len(cls.objects.bulk_create(lote, ignore_conflicts=True))
+                lote = []
+        if lote:
+            creadas += len(cls.objects.bulk_create(lote, ignore_conflicts=True))
+        
+        # bulk_create con ignore_conflicts no devuelve los ids: se reparten
+        # las del día que todavía no tienen destinatarios
+        DestinatarioNotificacion.repartir(cls.objects.filter(tipo=tipo, fecha_referencia=hoy))
+        
+        if creadas:
+            # bulk_create no dispara post_save: avisar a los streams abiertos
+            from .notificaciones import avisar_cambio_notificaciones
+            avisar_cambio_notificaciones()
+        return creadas
+    
     @classmethod
     def notificar_cuotas_vencidas(cls):
-        """Crea notificaciones para cuotas vencidas"""
+        """Crea notificaciones para cuotas vencidas (una por cuota y por día)"""
         hoy = fecha_local_hoy()
         cuotas_vencidas = Cuota.objects.filter(
             fecha_vencimiento__lt=hoy,
             estado__in=['PE', 'PC'],
             prestamo__estado='AC'
-        ).select_related('prestamo', 'prestamo__cliente')
-        
-        for cuota in cuotas_vencidas:
-            # Verificar si ya existe notificación para esta cuota
-            existe = cls.objects.filter(
-                tipo='CV',
-                titulo__contains=f'#{cuota.pk}',
-                fecha_creacion__date=hoy,
-                leida=False
-            ).exists()
-            
-            if not existe:
-                dias = (hoy - cuota.fecha_vencimiento).days
-                cls.crear_notificacion(
-                    tipo='CV',
-                    titulo=f'Cuota #{cuota.pk} vencida - {cuota.prestamo.cliente.nombre_completo}',
-                    mensaje=f'La cuota {cuota.numero_cuota}/{cuota.prestamo.cuotas_pactadas} de {cuota.prestamo.cliente.nombre_completo} tiene {dias} días vencida. Monto pendiente: ${cuota.monto_restante}',
-                    prioridad='AL' if dias > 7 else 'ME',
-                    enlace=f'/prestamos/{cuota.prestamo.pk}/'
-                )
+        )
+        
+        def armar(fila):
+            cliente = f"{fila['prestamo__cliente__nombre']} {fila['prestamo__cliente__apellido']}"
+            dias = (hoy - fila['fecha_vencimiento']).days
+            restante = fila['monto_cuota'] - fila['monto_pagado']
+            return {
+                'titulo': f"Cuota #{fila['pk']} vencida - {cliente}",
+                'mensaje': f"La cuota {fila['numero_cuota']}/{fila['prestamo__cuotas_pactadas']} de {cliente} tiene {dias} días vencida. Monto pendiente: ${restante}",
+                'prioridad': 'AL' if dias > 7 else 'ME',
+                'enlace': f"/prestamos/{fila['prestamo_id']}/",
+            }
+        
+        return cls._notificar_cuotas('CV', cuotas_vencidas, armar, hoy)
     
     @classmethod
     def notificar_cuotas_por_vencer(cls, dias_anticipacion=1):
-        """Crea notificaciones para cuotas que vencen pronto"""
+        """Crea notificaciones para cuotas que vencen pronto (una por cuota y por día)"""
         hoy = fecha_local_hoy()
         fecha_limite = hoy + timedelta(days=dias_anticipacion)
         
@@ -1614,23 +2394,97 @@ class Notificacion(models.Model):
             fecha_vencimiento=fecha_limite,
             estado='PE',
             prestamo__estado='AC'
-        ).select_related('prestamo', 'prestamo__cliente')
-        
-        for cuota in cuotas:
-            existe = cls.objects.filter(
-                tipo='CP',
-                titulo__contains=f'#{cuota.pk}',
-                fecha_creacion__date=hoy
-            ).exists()
-            
-            if not existe:
-                cls.crear_notificacion(
-                    tipo='CP',
-                    titulo=f'Cuota por vencer - {cuota.prestamo.cliente.nombre_completo}',
-                    mensaje=f'La cuota {cuota.numero_cuota}/{cuota.prestamo.cuotas_pactadas} vence mañana. Monto: ${cuota.monto_cuota}',
-                    prioridad='BA',
-                    enlace=f'/cobros/'
-                )
+        )
+        
+        def armar(fila):
+            cliente = f"{fila['prestamo__cliente__nombre']} {fila['prestamo__cliente__apellido']}"
+            return {
+                'titulo': f'Cuota por vencer - {cliente}',
+                'mensaje': f"La cuota {fila['numero_cuota']}/{fila['prestamo__cuotas_pactadas']} vence mañana. Monto: ${fila['monto_cuota']}",
+                'prioridad': 'BA',
+                'enlace': '/cobros/',
+            }
+        
+        return cls._notificar_cuotas('CP', cuotas, armar, hoy)
+
+
+class DestinatarioNotificacion(models.Model):
+    """
+    Estado de lectura de una notificación para cada usuario. Las notificaciones
+    generales (usuario vacío) tienen una fila por cada usuario activo al
+    crearse; las individuales, una sola. La bandeja, el contador y "marcar
+    todas como leídas" consultan solo esta tabla por el índice
+    (usuario, leida, fecha_creacion).
+    """
+    notificacion = models.ForeignKey(
+        Notificacion,
+        on_delete=models.CASCADE,
+        related_name='destinatarios',
+        verbose_name='Notificación'
+    )
+    usuario = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='notificaciones_recibidas',
+        verbose_name='Usuario'
+    )
+    leida = models.BooleanField(default=False, verbose_name='Leída')
+    # Copia de la fecha de la notificación, para ordenar la bandeja sin join
+    fecha_creacion = models.DateTimeField(verbose_name='Fecha de Creación')
+    fecha_lectura = models.DateTimeField(null=True, blank=True, verbose_name='Fecha de Lectura')
+    
+    # Filas por INSERT al repartir notificaciones
+    LOTE_REPARTO = 1000
+    
+    class Meta:
+        verbose_name = 'Destinatario de Notificación'
+        verbose_name_plural = 'Destinatarios de Notificaciones'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['notificacion', 'usuario'],
+                name='destinatario_notificacion_uniq'
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=['usuario', 'leida', '-fecha_creacion'],
+                name='destinatario_bandeja_idx'
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.usuario} - {self.notificacion_id}"
+    
+    @classmethod
+    def repartir(cls, notificaciones):
+        """
+        Crea las filas de destinatarios de las notificaciones del queryset que
+        todavía no tienen ninguna. Devuelve cuántas filas creó.
+        """
+        pendientes = notificaciones.filter(
+            ~Exists(cls.objects.filter(notificacion=OuterRef('pk')))
+        ).order_by().values_list('pk', 'usuario_id', 'fecha_creacion')
+        
+        activos = None
+        creadas = 0
+        lote = []
+        for notificacion_id, usuario_id, fecha in pendientes.iterator(chunk_size=cls.LOTE_REPARTO):
+            if usuario_id:
+                usuarios = [usuario_id]
+            else:
+                if activos is None:
+                    activos = list(User.objects.filter(is_active=True).values_list('pk', flat=True))
+                usuarios = activos
+            lote.extend(
+                cls(notificacion_id=notificacion_id, usuario_id=usuario, fecha_creacion=fecha)
+                for usuario in usuarios
+            )
+            if len(lote) >= cls.LOTE_REPARTO:
+                creadas += len(cls.objects.bulk_create(lote, ignore_conflicts=True))
+                lote = []
+        if lote:
+            creadas += len(cls.objects.bulk_create(lote, ignore_conflicts=True))
+        return creadas
 
 
 # ==================== CONFIGURACIÓN DE RESPALDOS ====================
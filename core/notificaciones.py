@@ -0,0 +1,170 @@
+"""
+Notificaciones en tiempo real.
+
+El contador de la barra superior se actualiza por Server-Sent Events
+(/api/notificaciones/stream/, servido por prestamos_config/asgi.py): cada
+conexión revisa cada pocos segundos una versión guardada en caché, que se
+incrementa al confirmarse cualquier cambio en las notificaciones, y solo
+consulta la base cuando la versión cambió (o cada NOTIFICACIONES_SSE_REVISION
+segundos, por si el cambio se hizo en otro proceso con una caché local).
+
+Las consultas del stream corren de a una en el pool de hilos compartido y
+cierran su conexión al terminar (ver consultar): entre revisión y revisión una
+pestaña abierta no ocupa un hilo ni una conexión a la base.
+
+Si el navegador no soporta EventSource o el servidor corre por WSGI, la
+página vuelve a consultar /api/notificaciones/, que responde con ETag: si el
+contador no cambió, la respuesta es un 304 sin cuerpo.
+"""
+import asyncio
+import json
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Count, Max
+
+from .models import DestinatarioNotificacion
+
+
+CLAVE_VERSION = 'notificaciones:version'
+NOTIFICACIONES_RECIENTES = 5
+NOTIFICACIONES_SSE_INTERVALO_DEFAULT = 5
+NOTIFICACIONES_SSE_REVISION_DEFAULT = 60
+NOTIFICACIONES_SSE_LATIDO_DEFAULT = 25
+NOTIFICACIONES_SSE_DURACION_DEFAULT = 300
+# Milisegundos que espera EventSource antes de reconectarse
+NOTIFICACIONES_SSE_RECONEXION = 5000
+
+
+def no_leidas(usuario):
+    """Filas de destinatario sin leer del usuario (índice usuario, leida, fecha)"""
+    return DestinatarioNotificacion.objects.filter(usuario=usuario, leida=False)
+
+
+def estado_notificaciones(usuario):
+    """Cantidad de no leídas y id de la última, en una consulta"""
+    return no_leidas(usuario).aggregate(
+        no_leidas=Count('id'),
+        ultima=Max('notificacion_id')
+    )
+
+
+def marca_notificaciones(estado):
+    """Identifica el estado del contador: sirve de ETag y de id de evento SSE"""
+    return f'{estado["no_leidas"]}-{estado["ultima"] or 0}'
+
+
+def resumen_notificaciones(usuario, estado=None):
+    """Contador y últimas notificaciones no leídas (respuesta de la API y del stream)"""
+    estado = estado or estado_notificaciones(usuario)
+    recientes = [
+        destinatario.notificacion
+        for destinatario in no_leidas(usuario).select_related('notificacion')
+        .order_by('-fecha_creacion')[:NOTIFICACIONES_RECIENTES]
+    ] if estado['no_leidas'] else []
+    return {
+        'no_leidas': estado['no_leidas'],
+        'count': len(recientes),
+        'notificaciones': [
+            {
+                'id': n.pk,
+                'titulo': n.titulo,
+                'mensaje': n.mensaje[:100],
+                'tipo': n.tipo,
+                'prioridad': n.prioridad,
+                'fecha': n.fecha_creacion.strftime('%d/%m %H:%M'),
+                'enlace': n.enlace
+            }
+            for n in recientes
+        ]
+    }
+
+
+def version_notificaciones():
+    return cache.get(CLAVE_VERSION, 0)
+
+
+def avisar_cambio_notificaciones():
+    """Incrementa la versión al confirmarse la transacción en curso"""
+    def incrementar():
+        try:
+            cache.incr(CLAVE_VERSION)
+        except ValueError:
+            cache.set(CLAVE_VERSION, 1, None)
+    transaction.on_commit(incrementar)
+
+
+def _consultar_y_cerrar(funcion, *args):
+    try:
+        return funcion(*args)
+    finally:
+        # Fuera de un atomic (los tests lo abren) la conexión se cierra ya:
+        # el request del stream dura minutos y request_finished llega al final
+        if not connection.in_atomic_block:
+            connection.close()
+
+
+def consultar(funcion):
+    """
+    Versión async de funcion para las vistas que mantienen la conexión
+    abierta: corre en un hilo cualquiera del pool (no en el hilo propio del
+    request, que quedaría tomado hasta que termine el stream) y cierra la
+    conexión a la base al volver.
+    """
+    async def envuelta(*args):
+        return await sync_to_async(_consultar_y_cerrar, thread_sensitive=False)(funcion, *args)
+    return envuelta
+
+
+def evento_sse(evento, datos, id_evento=None):
+    lineas = []
+    if id_evento:
+        lineas.append(f'id: {id_evento}')
+    lineas.append(f'event: {evento}')
+    lineas.append(f'data: {json.dumps(datos)}')
+    return '\n'.join(lineas) + '\n\n'
+
+
+async def flujo_notificaciones(usuario, ultimo_evento=None):
+    """
+    Eventos SSE para un usuario. Envía 'notificaciones' al conectarse (salvo
+    que Last-Event-ID ya corresponda al estado actual) y cada vez que cambia;
+    entre medio, un comentario cada NOTIFICACIONES_SSE_LATIDO segundos para
+    que los proxies no corten la conexión. A los NOTIFICACIONES_SSE_DURACION
+    segundos se cierra y el navegador se reconecta solo.
+    """
+    intervalo = getattr(settings, 'NOTIFICACIONES_SSE_INTERVALO', NOTIFICACIONES_SSE_INTERVALO_DEFAULT)
+    revision = getattr(settings, 'NOTIFICACIONES_SSE_REVISION', NOTIFICACIONES_SSE_REVISION_DEFAULT)
+    latido = getattr(settings, 'NOTIFICACIONES_SSE_LATIDO', NOTIFICACIONES_SSE_LATIDO_DEFAULT)
+    duracion = getattr(settings, 'NOTIFICACIONES_SSE_DURACION', NOTIFICACIONES_SSE_DURACION_DEFAULT)
+
+    leer_version = consultar(version_notificaciones)
+    leer_estado = consultar(estado_notificaciones)
+    leer_resumen = consultar(resumen_notificaciones)
+
+    yield f'retry: {NOTIFICACIONES_SSE_RECONEXION}\n\n'
+
+    inicio = ultimo_envio = ultima_revision = time.monotonic()
+    version = None
+    enviado = ultimo_evento
+    while True:
+        actual = await leer_version()
+        ahora = time.monotonic()
+        if actual != version or ahora - ultima_revision >= revision:
+            version, ultima_revision = actual, ahora
+            estado = await leer_estado(usuario)
+            marca = marca_notificaciones(estado)
+            if marca != enviado:
+                datos = await leer_resumen(usuario, estado)
+                yield evento_sse('notificaciones', datos, marca)
+                enviado = marca
+                ultimo_envio = ahora
+        if ahora - ultimo_envio >= latido:
+            yield ': latido\n\n'
+            ultimo_envio = ahora
+        if ahora - inicio >= duracion:
+            return
+        await asyncio.sleep(intervalo)
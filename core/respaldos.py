@@ -0,0 +1,88 @@
+"""
+Respaldos de la base de datos.
+
+Los crea la tarea 'respaldo' del programador (core/tareas.py) cada
+ConfiguracionRespaldo.frecuencia_horas, o cuando un desarrollador lo pide
+desde la pantalla de respaldos. Se guardan en BASE_DIR/backups y se
+conservan los últimos `mantener_ultimos`.
+"""
+import json
+import os
+import shutil
+from datetime import datetime
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core import serializers
+from django.utils import timezone
+
+from .models import (
+    Cliente, Prestamo, Cuota, TipoNegocio, RutaCobro, ConfiguracionCredito, ConfiguracionPlanilla,
+    PerfilUsuario, RegistroAuditoria, ConfiguracionRespaldo
+)
+
+
+def directorio_respaldos():
+    return os.path.join(settings.BASE_DIR, 'backups')
+
+
+def crear_respaldo():
+    """Crea un respaldo, borra los que sobran y devuelve el nombre del archivo"""
+    backup_dir = directorio_respaldos()
+    os.makedirs(backup_dir, exist_ok=True)
+
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    db_engine = settings.DATABASES['default']['ENGINE']
+
+    # Verificar si es PostgreSQL o SQLite
+    if 'postgresql' in db_engine:
+        # PostgreSQL: exportar datos a JSON
+        backup_name = f'backup_{timestamp}.json'
+        backup_path = os.path.join(backup_dir, backup_name)
+
+        all_data = {}
+        models_to_export = [
+            ('users', User),
+            ('perfiles', PerfilUsuario),
+            ('tipos_negocio', TipoNegocio),
+            ('rutas_cobro', RutaCobro),
+            ('config_credito', ConfiguracionCredito),
+            ('config_planilla', ConfiguracionPlanilla),
+            ('clientes', Cliente),
+            ('prestamos', Prestamo),
+            ('cuotas', Cuota),
+        ]
+
+        for name, model in models_to_export:
+            all_data[name] = json.loads(serializers.serialize('json', model.objects.all()))
+
+        with open(backup_path, 'w', encoding='utf-8') as f:
+            json.dump(all_data, f, ensure_ascii=False, indent=2, default=str)
+    else:
+        # SQLite: copiar archivo
+        backup_name = f'backup_{timestamp}.sqlite3'
+        backup_path = os.path.join(backup_dir, backup_name)
+        shutil.copy2(settings.DATABASES['default']['NAME'], backup_path)
+
+    RegistroAuditoria.registrar(
+        usuario=None,
+        tipo_accion='RS',
+        tipo_modelo='SI',
+        descripcion=f'Respaldo creado: {backup_name}'
+    )
+
+    # Limpiar respaldos antiguos
+    config = ConfiguracionRespaldo.objects.first()
+    if config:
+        config.ultimo_respaldo = timezone.now()
+        config.save(update_fields=['ultimo_respaldo'])
+
+        # Mantener solo los últimos N respaldos
+        backups = sorted(
+            [f for f in os.listdir(backup_dir) if f.startswith('backup_')],
+            reverse=True
+        )
+        for old_backup in backups[config.mantener_ultimos:]:
+            os.remove(os.path.join(backup_dir, old_backup))
+
+    return backup_name
@@ -0,0 +1,142 @@
+"""
+Retención de notificaciones y archivo de auditoría.
+
+- Notificaciones: se borran las más viejas que los días configurados para su
+  tipo (NOTIFICACIONES_RETENCION_DIAS, con RETENCION_NOTIFICACIONES como
+  base). Las de cuotas vencidas se generan todos los días, así que duran poco.
+- Auditoría: los registros más viejos que AUDITORIA_RETENCION_DIAS se pasan a
+  archivos JSON Lines comprimidos, uno por mes (auditoria_AAAA-MM.jsonl.gz en
+  AUDITORIA_ARCHIVO_DIR), y después se borran de la tabla.
+
+Todo se hace en lotes chicos con una transacción corta por lote, así que
+nunca se bloquean las tablas mientras se usan. Si el proceso se corta entre
+escribir un lote en el archivo y borrarlo, la próxima vez ese lote se vuelve
+a archivar: los registros conservan su id para descartar repetidos.
+"""
+import gzip
+import json
+import os
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import DestinatarioNotificacion, Notificacion, RegistroAuditoria
+
+
+# Días que se conserva cada tipo de notificación
+RETENCION_NOTIFICACIONES = {
+    Notificacion.TipoNotificacion.CUOTA_VENCIDA: 7,
+    Notificacion.TipoNotificacion.CUOTA_POR_VENCER: 3,
+}
+RETENCION_NOTIFICACIONES_OTRAS = 90
+AUDITORIA_RETENCION_DIAS_DEFAULT = 365
+LOTE_DEFAULT = 1000
+
+CAMPOS_AUDITORIA = (
+    'id', 'usuario_id', 'usuario__username', 'tipo_accion', 'tipo_modelo', 'modelo_id',
+    'descripcion', 'datos_anteriores', 'datos_nuevos', 'ip_address', 'fecha_hora'
+)
+
+
+def dias_retencion_notificaciones():
+    """Días de retención por tipo de notificación (todos los tipos)"""
+    configurados = getattr(settings, 'NOTIFICACIONES_RETENCION_DIAS', {})
+    return {
+        tipo: configurados.get(tipo, RETENCION_NOTIFICACIONES.get(tipo, RETENCION_NOTIFICACIONES_OTRAS))
+        for tipo in Notificacion.TipoNotificacion.values
+    }
+
+
+def directorio_archivo_auditoria():
+    return getattr(
+        settings, 'AUDITORIA_ARCHIVO_DIR', os.path.join(settings.BASE_DIR, 'archivo', 'auditoria')
+    )
+
+
+def notificaciones_vencidas(ahora=None):
+    """Cantidad de notificaciones fuera de retención, por tipo"""
+    ahora = ahora or timezone.now()
+    return {
+        tipo: Notificacion.objects.filter(
+            tipo=tipo, fecha_creacion__lt=ahora - timedelta(days=dias)
+        ).count()
+        for tipo, dias in dias_retencion_notificaciones().items()
+    }
+
+
+def purgar_notificaciones(lote=LOTE_DEFAULT, pausa=0, ahora=None):
+    """Borra las notificaciones fuera de retención en lotes; devuelve cuántas por tipo"""
+    ahora = ahora or timezone.now()
+    borradas = {}
+    for tipo, dias in dias_retencion_notificaciones().items():
+        viejas = Notificacion.objects.filter(tipo=tipo, fecha_creacion__lt=ahora - timedelta(days=dias))
+        borradas[tipo] = 0
+        while True:
+            ids = list(viejas.order_by().values_list('pk', flat=True)[:lote])
+            if not ids:
+                break
+            with transaction.atomic():
+                # Los destinatarios primero, con un DELETE directo (no tienen dependientes)
+                DestinatarioNotificacion.objects.filter(notificacion_id__in=ids).delete()
+                Notificacion.objects.filter(pk__in=ids).delete()
+            borradas[tipo] += len(ids)
+            if pausa:
+                time.sleep(pausa)
+    return borradas
+
+
+def limite_auditoria(ahora=None):
+    dias = getattr(settings, 'AUDITORIA_RETENCION_DIAS', AUDITORIA_RETENCION_DIAS_DEFAULT)
+    return (ahora or timezone.now()) - timedelta(days=dias)
+
+
+def auditoria_vencida(ahora=None):
+    return RegistroAuditoria.objects.filter(fecha_hora__lt=limite_auditoria(ahora)).count()
+
+
+def _escribir_archivo(directorio, mes, filas):
+    """Agrega filas al archivo del mes (cada lote es un miembro gzip nuevo) y lo baja a disco"""
+    ruta = os.path.join(directorio, f'auditoria_{mes}.jsonl.gz')
+    with open(ruta, 'ab') as archivo:
+        with gzip.GzipFile(fileobj=archivo, mode='ab') as comprimido:
+            for fila in filas:
+                comprimido.write(json.dumps(fila, ensure_ascii=False, default=str).encode('utf-8'))
+                comprimido.write(b'\n')
+        archivo.flush()
+        os.fsync(archivo.fileno())
+    return ruta
+
+
+def archivar_auditoria(lote=LOTE_DEFAULT, pausa=0, ahora=None, directorio=None):
+    """
+    Archiva y borra los registros de auditoría fuera de retención, del más
+    viejo al más nuevo. Devuelve {mes: cantidad} de lo archivado.
+    """
+    directorio = directorio or directorio_archivo_auditoria()
+    viejos = RegistroAuditoria.objects.filter(fecha_hora__lt=limite_auditoria(ahora))
+
+    archivados = {}
+    while True:
+        filas = list(viejos.order_by('fecha_hora', 'pk').values(*CAMPOS_AUDITORIA)[:lote])
+        if not filas:
+            return archivados
+        os.makedirs(directorio, exist_ok=True)
+        por_mes = {}
+        for fila in filas:
+            mes = timezone.localtime(fila['fecha_hora']).strftime('%Y-%m')
+            por_mes.setdefault(mes, []).append(fila)
+        for mes, filas_mes in por_mes.items():
+            _escribir_archivo(directorio, mes, filas_mes)
+            archivados[mes] = archivados.get(mes, 0) + len(filas_mes)
+        RegistroAuditoria.objects.filter(pk__in=[fila['id'] for fila in filas]).delete()
+        if pausa:
+            time.sleep(pausa)
+
+
+def leer_archivo_auditoria(ruta):
+    """Registros de un archivo mensual de auditoría"""
+    with gzip.open(ruta, 'rt', encoding='utf-8') as archivo:
+        return [json.loads(linea) for linea in archivo if linea.strip()]
@@ -0,0 +1,161 @@
+"""
+Tareas programadas.
+
+El comando run_scheduler las ejecuta fuera de los requests web: en cada
+vuelta toma las tareas vencidas con un UPDATE condicional sobre
+TareaProgramada (bloqueo en la base, con vencimiento), así que se pueden
+correr varios procesos sin que una tarea se ejecute dos veces. Al terminar
+se guardan la duración y el resultado, y la próxima ejecución se programa
+con un desfase al azar (TAREAS_JITTER) para que las tareas no coincidan
+siempre en el mismo minuto.
+
+Los intervalos se pueden cambiar con TAREAS_INTERVALOS (segundos por
+tarea); el de 'respaldo' sale de ConfiguracionRespaldo.frecuencia_horas.
+"""
+import logging
+import os
+import random
+import socket
+import time
+import traceback
+from datetime import timedelta
+from io import StringIO
+
+from django.conf import settings
+from django.core.management import call_command
+from django.utils import timezone
+
+from .auditoria import vaciar as vaciar_auditoria
+from .exportacion import procesar_exportaciones
+from .models import CierreDiario, ConfiguracionRespaldo, Notificacion, TareaProgramada
+
+
+logger = logging.getLogger(__name__)
+
+HORA = 3600
+TAREAS_JITTER_DEFAULT = 0.1
+TAREAS_BLOQUEO_DEFAULT = 2 * HORA
+CIERRE_DIARIO_DIAS_DEFAULT = 7
+
+
+def notificar_por_vencer():
+    return f'{Notificacion.notificar_cuotas_por_vencer()} notificaciones de cuotas por vencer'
+
+
+def notificar_mora():
+    return f'{Notificacion.notificar_cuotas_vencidas()} notificaciones de cuotas vencidas'
+
+
+def cierre_diario():
+    dias = getattr(settings, 'CIERRE_DIARIO_DIAS', CIERRE_DIARIO_DIAS_DEFAULT)
+    return f'{len(CierreDiario.cerrar_pendientes(dias))} días cerrados'
+
+
+def respaldo_automatico():
+    from .respaldos import crear_respaldo
+
+    config = ConfiguracionRespaldo.objects.first()
+    if not config or not config.activo:
+        return 'Respaldos automáticos desactivados'
+    return f'Respaldo creado: {crear_respaldo()}'
+
+
+def comando(nombre, *args):
+    def ejecutar():
+        salida = StringIO()
+        call_command(nombre, *args, stdout=salida)
+        return salida.getvalue().strip()
+    return ejecutar
+
+
+def intervalo_respaldo():
+    config = ConfiguracionRespaldo.objects.first()
+    if not config or not config.activo:
+        # Desactivados: se vuelve a revisar la configuración en una hora
+        return HORA
+    return max(config.frecuencia_horas, 1) * HORA
+
+
+# nombre: (función, intervalo en segundos o función que lo calcula)
+TAREAS = {
+    'notificaciones': (notificar_por_vencer, HORA),
+    'mora': (notificar_mora, HORA),
+    'respaldo': (respaldo_automatico, intervalo_respaldo),
+    # Cierra el día anterior (y los que hayan quedado sin cierre)
+    'cierre_diario': (cierre_diario, HORA),
+    'claves_idempotencia': (comando('purge_idempotency_keys'), 6 * HORA),
+    'registro_cambios': (comando('prune_change_log'), 24 * HORA),
+    'retencion': (comando('apply_retention'), 24 * HORA),
+    # También se pide al encolar cada exportación (TareaProgramada.solicitar)
+    'exportaciones': (procesar_exportaciones, 60),
+}
+
+
+def nombre_trabajador():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def intervalo_tarea(nombre):
+    _, intervalo = TAREAS[nombre]
+    intervalo = getattr(settings, 'TAREAS_INTERVALOS', {}).get(nombre, intervalo)
+    return intervalo() if callable(intervalo) else intervalo
+
+
+def proxima_ejecucion(nombre, desde):
+    intervalo = intervalo_tarea(nombre)
+    jitter = getattr(settings, 'TAREAS_JITTER', TAREAS_JITTER_DEFAULT)
+    return desde + timedelta(seconds=intervalo + random.uniform(0, intervalo * jitter))
+
+
+def registrar_tareas():
+    """Crea las filas de las tareas nuevas. El respaldo arranca desde el último hecho"""
+    existentes = set(TareaProgramada.objects.values_list('nombre', flat=True))
+    for nombre in TAREAS:
+        if nombre in existentes:
+            continue
+        proxima = None
+        if nombre == 'respaldo':
+            config = ConfiguracionRespaldo.objects.first()
+            if config and config.ultimo_respaldo:
+                proxima = proxima_ejecucion(nombre, config.ultimo_respaldo)
+        TareaProgramada.objects.get_or_create(nombre=nombre, defaults={'proxima_ejecucion': proxima})
+
+
+def ejecutar_tarea(nombre, trabajador=None, forzar=False):
+    """
+    Ejecuta la tarea si este proceso logra tomarla. Devuelve la TareaProgramada
+    actualizada, o None si no estaba vencida o la tenía otro proceso.
+    """
+    bloqueo = timedelta(seconds=getattr(settings, 'TAREAS_BLOQUEO', TAREAS_BLOQUEO_DEFAULT))
+    if not TareaProgramada.tomar(nombre, trabajador or nombre_trabajador(), bloqueo, forzar=forzar):
+        return None
+
+    tarea = TareaProgramada.objects.get(nombre=nombre)
+    funcion, _ = TAREAS[nombre]
+    inicio = timezone.now()
+    reloj = time.monotonic()
+    resultado, error = '', ''
+    try:
+        resultado = funcion() or ''
+    except Exception:
+        error = traceback.format_exc()
+        logger.exception('Falló la tarea programada %s', nombre)
+    duracion = time.monotonic() - reloj
+    # Fuera de los requests nadie más vacía la auditoría de la tarea
+    vaciar_auditoria()
+
+    tarea.liberar(inicio, duracion, proxima_ejecucion(nombre, timezone.now()), resultado, error)
+    tarea.refresh_from_db()
+    return tarea
+
+
+def ejecutar_pendientes(trabajador=None):
+    """Ejecuta todas las tareas vencidas; devuelve las que corrió este proceso"""
+    registrar_tareas()
+    trabajador = trabajador or nombre_trabajador()
+    ejecutadas = []
+    for nombre in TAREAS:
+        tarea = ejecutar_tarea(nombre, trabajador)
+        if tarea is not None:
+            ejecutadas.append(tarea)
+    return ejecutadas
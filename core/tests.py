@@ -4,15 +4,17 @@ Ejecutar: python manage.py test core -v 2
 """
 from decimal import Decimal
 from datetime import date, timedelta
-from django.test import TestCase, Client as TestClient
+from django.test import TestCase, TransactionTestCase, Client as TestClient
 from django.urls import reverse
 from django.contrib.auth.models import User
 from django.utils import timezone
 
 from .models import (
     Cliente, Prestamo, Cuota, RutaCobro, TipoNegocio,
-    PerfilUsuario, RegistroAuditoria, Notificacion, ConfiguracionRespaldo
+    PerfilUsuario, RegistroAuditoria, Notificacion, DestinatarioNotificacion, ConfiguracionRespaldo
 )
+from .calendario import CalendarioCobro
+from .cronograma import planificar_cuotas, calcular_fecha_fin
 from .templatetags.currency_filters import formato_ars, dinero, dinero_completo, formato_miles
 
 
@@ -218,6 +220,115 @@ class CuotaModelTest(TestCase):
         self.assertEqual(self.cuota.dias_vencida, 3)
 
 
+# ============== TESTS DE CRONOGRAMA ==============
+
+class CronogramaCuotasTest(TestCase):
+    """Tests para el planificador de cuotas"""
+    
+    def setUp(self):
+        self.cliente = Cliente.objects.create(
+            nombre='Crono',
+            apellido='Grama',
+            telefono='1212121212',
+            direccion='Dir Cronograma'
+        )
+    
+    def test_diario_salta_domingos(self):
+        """Las cuotas diarias nunca vencen domingo"""
+        # 2025-01-05 es domingo: la primera cuota pasa al lunes
+        plan = planificar_cuotas(Decimal('1200'), 12, 'DI', date(2025, 1, 5))
+        self.assertEqual(plan[0].fecha_vencimiento, date(2025, 1, 6))
+        self.assertEqual(len(plan), 12)
+        for cuota in plan:
+            self.assertNotEqual(cuota.fecha_vencimiento.weekday(), 6)
+    
+    def test_fecha_fin_coincide_con_ultima_cuota(self):
+        """La fecha de finalización es el vencimiento de la última cuota"""
+        for frecuencia in ['DI', 'SE', 'QU', 'ME']:
+            plan = planificar_cuotas(Decimal('1000'), 25, frecuencia, date(2025, 3, 1))
+            self.assertEqual(
+                calcular_fecha_fin(date(2025, 3, 1), 25, frecuencia),
+                plan[-1].fecha_vencimiento
+            )
+    
+    def test_prestamo_diario_largo(self):
+        """Un préstamo diario de 120 cuotas genera todas sus cuotas"""
+        prestamo = Prestamo.objects.create(
+            cliente=self.cliente,
+            monto_solicitado=Decimal('120000'),
+            tasa_interes_porcentaje=Decimal('0'),
+            cuotas_pactadas=120,
+            frecuencia='DI',
+            fecha_inicio=date(2025, 1, 6)
+        )
+        cuotas = list(prestamo.cuotas.order_by('numero_cuota'))
+        self.assertEqual(len(cuotas), 120)
+        self.assertEqual(cuotas[0].monto_cuota, Decimal('1000'))
+        self.assertEqual(cuotas[-1].fecha_vencimiento, prestamo.fecha_finalizacion)
+    
+    def test_fecha_finalizacion_manual(self):
+        """Con fecha manual, la última cuota vence en esa fecha"""
+        prestamo = Prestamo.objects.create(
+            cliente=self.cliente,
+            monto_solicitado=Decimal('10000'),
+            tasa_interes_porcentaje=Decimal('10'),
+            cuotas_pactadas=4,
+            frecuencia='SE',
+            fecha_inicio=date(2025, 1, 1),
+            fecha_finalizacion=date(2025, 2, 1),
+            fecha_finalizacion_manual=True
+        )
+        ultima = prestamo.cuotas.order_by('numero_cuota').last()
+        self.assertEqual(ultima.fecha_vencimiento, date(2025, 2, 1))
+
+
+class CalendarioCobroTest(TestCase):
+    """Tests para el cálculo de días hábiles"""
+    
+    def _enesimo_dia_por_dia(self, calendario, fecha, n):
+        """Referencia: avanzar de a un día"""
+        fecha = calendario.siguiente_habil(fecha)
+        contados = 1
+        while contados < n:
+            fecha += timedelta(days=1)
+            if calendario.es_habil(fecha):
+                contados += 1
+        return fecha
+    
+    def test_enesimo_habil_coincide_con_recorrido(self):
+        """El cálculo aritmético coincide con recorrer día por día"""
+        calendarios = [
+            CalendarioCobro(),
+            CalendarioCobro(dias_no_habiles=[5, 6]),
+            CalendarioCobro(feriados=['2025-01-01', '2025-03-03', '2025-03-04', '2025-05-25']),
+            CalendarioCobro(dias_no_habiles=[6], feriados=[date(2025, 1, 6) + timedelta(days=i) for i in range(0, 60, 3)]),
+        ]
+        inicio = date(2024, 12, 28)
+        for calendario in calendarios:
+            for offset in range(0, 10):
+                for n in [1, 2, 5, 6, 7, 13, 30, 100]:
+                    fecha = inicio + timedelta(days=offset)
+                    self.assertEqual(
+                        calendario.enesimo_habil(fecha, n),
+                        self._enesimo_dia_por_dia(calendario, fecha, n)
+                    )
+    
+    def test_feriado_configurado_corre_fecha_fin(self):
+        """Un feriado dentro del plazo agrega un día al préstamo diario"""
+        sin_feriado = calcular_fecha_fin(date(2025, 1, 6), 6, 'DI')
+        self.assertEqual(sin_feriado, date(2025, 1, 11))
+        with self.settings(COBRO_FERIADOS=['2025-01-08']):
+            self.assertEqual(calcular_fecha_fin(date(2025, 1, 6), 6, 'DI'), date(2025, 1, 13))
+            plan = planificar_cuotas(Decimal('600'), 6, 'DI', date(2025, 1, 6))
+            self.assertNotIn(date(2025, 1, 8), [c.fecha_vencimiento for c in plan])
+        self.assertEqual(calcular_fecha_fin(date(2025, 1, 6), 6, 'DI'), sin_feriado)
+    
+    def test_sin_dias_habiles(self):
+        """Un calendario sin días hábiles es inválido"""
+        with self.assertRaises(ValueError):
+            CalendarioCobro(dias_no_habiles=range(7))
+
+
 # ============== TESTS DE VISTAS ==============
 
 class ViewsAuthenticationTest(TestCase):
@@ -421,6 +532,570 @@ class APIViewsTest(TestCase):
         self.assertEqual(self.cliente.categoria, 'EX')
 
 
+class CreditoClienteAPITest(TestCase):
+    """Tests del endpoint de crédito de un cliente"""
+    
+    def setUp(self):
+        self.client = TestClient()
+        self.user = User.objects.create_user(username='credito', password='testpass123')
+        self.client.login(username='credito', password='testpass123')
+        self.cliente = Cliente.objects.create(
+            nombre='Crédito',
+            apellido='API',
+            telefono='2323232323',
+            direccion='Dirección Crédito API',
+            limite_credito=Decimal('50000'),
+            usuario=self.user
+        )
+        self.prestamo = Prestamo.objects.create(
+            cliente=self.cliente,
+            monto_solicitado=Decimal('10000'),
+            tasa_interes_porcentaje=Decimal('20'),
+            cuotas_pactadas=4,
+            frecuencia='SE',
+            fecha_inicio=date.today()
+        )
+        self.url = reverse('core:credito_cliente', args=[self.cliente.pk])
+    
+    def test_datos_de_credito(self):
+        """Test devuelve límites y deuda del cliente"""
+        data = self.client.get(self.url).json()
+        self.assertTrue(data['success'])
+        self.assertEqual(data['cliente']['deuda_total'], 12000)
+        self.assertEqual(data['cliente']['maximo_prestable'], 38000)
+        self.assertEqual(data['cliente']['fecha_fin'], self.prestamo.fecha_finalizacion.strftime('%d/%m/%Y'))
+    
+    def test_pago_se_refleja_enseguida(self):
+        """Test después de un pago la deuda del cliente ya está actualizada"""
+        self.client.get(self.url)
+        cuota = self.prestamo.cuotas.get(numero_cuota=1)
+        cuota.registrar_pago(cuota.monto_cuota)
+        data = self.client.get(self.url).json()
+        self.assertEqual(data['cliente']['deuda_total'], 9000)
+    
+    def test_cliente_de_otro_cobrador(self):
+        """Test no se puede consultar un cliente ajeno"""
+        otro = Cliente.objects.create(
+            nombre='Ajeno', apellido='Cliente', telefono='1', direccion='Dir'
+        )
+        response = self.client.get(reverse('core:credito_cliente', args=[otro.pk]))
+        self.assertEqual(response.status_code, 404)
+
+
+class CobroLoteAPITest(TestCase):
+    """Tests de la API de cobro en lote"""
+    
+    def setUp(self):
+        self.client = TestClient()
+        self.user = User.objects.create_user(username='lote', password='testpass123')
+        self.client.login(username='lote', password='testpass123')
+        cliente = Cliente.objects.create(
+            nombre='Lote', apellido='Test', telefono='1', direccion='Dir', usuario=self.user
+        )
+        self.prestamo = Prestamo.objects.create(
+            cliente=cliente,
+            monto_solicitado=Decimal('10000'),
+            tasa_interes_porcentaje=Decimal('20'),
+            cuotas_pactadas=4,
+            frecuencia='SE',
+            fecha_inicio=date.today(),
+            cobrador=self.user
+        )
+        self.cuotas = list(self.prestamo.cuotas.order_by('numero_cuota'))
+        self.url = reverse('core:cobrar_cuotas_lote')
+    
+    def enviar(self, pagos):
+        import json
+        return self.client.post(self.url, content_type='application/json', data=json.dumps({'pagos': pagos}))
+    
+    def test_varios_pagos_un_request(self):
+        """Test aplica todos los pagos y devuelve un resultado por pago"""
+        response = self.enviar([
+            {'cuota_id': self.cuotas[0].pk},
+            {'cuota_id': self.cuotas[1].pk, 'monto': 1000, 'metodo_pago': 'TR'},
+            {'cuota_id': self.cuotas[2].pk, 'monto': 2000, 'accion_restante': 'proxima'},
+        ])
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertTrue(data['success'])
+        self.assertEqual([r['cuota']['estado'] for r in data['resultados']], ['PA', 'PC', 'PA'])
+        self.assertEqual(data['estadisticas'], {'total_cobrado_hoy': 6000, 'cantidad_cobros_hoy': 3})
+        self.assertEqual(Cuota.objects.get(pk=self.cuotas[3].pk).monto_cuota, Decimal('4000.00'))
+        self.assertEqual(Prestamo.objects.get(pk=self.prestamo.pk).total_pagado, Decimal('6000.00'))
+    
+    def test_error_en_un_pago_no_revierte_los_demas(self):
+        """Test un pago inválido se informa sin afectar al resto del lote"""
+        ajeno = Prestamo.objects.create(
+            cliente=self.prestamo.cliente,
+            monto_solicitado=Decimal('1000'),
+            tasa_interes_porcentaje=Decimal('0'),
+            cuotas_pactadas=1,
+            frecuencia='SE',
+            fecha_inicio=date.today()
+        ).cuotas.get()
+        self.cuotas[0].registrar_pago()
+        data = self.enviar([
+            {'cuota_id': self.cuotas[0].pk},
+            {'cuota_id': ajeno.pk},
+            {'cuota_id': 'x'},
+            {'cuota_id': self.cuotas[1].pk, 'monto': 'abc'},
+            {'cuota_id': self.cuotas[2].pk},
+        ]).json()
+        self.assertFalse(data['success'])
+        self.assertEqual([r['success'] for r in data['resultados']], [False, False, False, False, True])
+        self.assertEqual(Cuota.objects.get(pk=self.cuotas[1].pk).estado, 'PE')
+        self.assertEqual(Cuota.objects.get(pk=ajeno.pk).estado, 'PE')
+        self.assertEqual(data['estadisticas']['cantidad_cobros_hoy'], 2)
+    
+    def test_lote_invalido(self):
+        """Test rechaza lotes vacíos, mal formados o demasiado grandes"""
+        self.assertEqual(self.enviar([]).status_code, 400)
+        self.assertEqual(self.client.post(self.url, content_type='application/json', data='[1]').status_code, 400)
+        with self.settings(COBRO_LOTE_MAXIMO=2):
+            self.assertEqual(self.enviar([{'cuota_id': c.pk} for c in self.cuotas]).status_code, 400)
+        self.assertEqual(self.client.get(self.url).status_code, 405)
+    
+    def test_consultas_no_crecen_por_cuota_buscada(self):
+        """Test las cuotas del lote se buscan en una sola consulta"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        with CaptureQueriesContext(connection) as consultas:
+            self.enviar([{'cuota_id': 999999 + i} for i in range(10)])
+        cuota_selects = [q for q in consultas.captured_queries if 'FROM "core_cuota"' in q['sql']]
+        self.assertEqual(len(cuota_selects), 1)
+
+
+class SincronizarCobrosAPITest(TestCase):
+    """Tests de la sincronización de cobros encolados sin conexión"""
+    
+    def setUp(self):
+        self.client = TestClient()
+        self.user = User.objects.create_user(username='offline', password='testpass123')
+        self.client.login(username='offline', password='testpass123')
+        cliente = Cliente.objects.create(
+            nombre='Offline', apellido='Test', telefono='1', direccion='Dir', usuario=self.user
+        )
+        self.prestamo = Prestamo.objects.create(
+            cliente=cliente,
+            monto_solicitado=Decimal('10000'),
+            tasa_interes_porcentaje=Decimal('20'),
+            cuotas_pactadas=4,
+            frecuencia='SE',
+            fecha_inicio=date.today(),
+            cobrador=self.user
+        )
+        self.cuotas = list(self.prestamo.cuotas.order_by('numero_cuota'))
+        self.url = reverse('core:sincronizar_cobros')
+    
+    def sincronizar(self, pagos):
+        import json
+        return self.client.post(self.url, content_type='application/json', data=json.dumps({'pagos': pagos}))
+    
+    def test_misma_clave_se_aplica_una_vez(self):
+        """Test reenviar la cola no duplica pagos parciales"""
+        pagos = [
+            {'clave': 'a-1', 'cuota_id': self.cuotas[0].pk, 'monto': 1000, 'monto_restante_visto': 3000},
+            {'clave': 'a-2', 'cuota_id': self.cuotas[1].pk, 'monto_restante_visto': 3000},
+        ]
+        data = self.sincronizar(pagos).json()
+        self.assertEqual([r['estado'] for r in data['resultados']], ['aplicado', 'aplicado'])
+        
+        data = self.sincronizar(pagos).json()
+        self.assertTrue(all(r['duplicado'] for r in data['resultados']))
+        self.assertEqual(data['resultados'][0]['cuota']['monto_pagado'], 1000)
+        self.assertEqual(Cuota.objects.get(pk=self.cuotas[0].pk).monto_pagado, Decimal('1000.00'))
+        self.assertEqual(data['estadisticas'], {'total_cobrado_hoy': 4000, 'cantidad_cobros_hoy': 2})
+    
+    def test_conflictos(self):
+        """Test no aplica cobros sobre cuotas que cambiaron desde que se encolaron"""
+        self.cuotas[0].registrar_pago(Decimal('500'))
+        self.cuotas[1].registrar_pago()
+        data = self.sincronizar([
+            {'clave': 'c-1', 'cuota_id': self.cuotas[0].pk, 'monto_restante_visto': 3000},
+            {'clave': 'c-2', 'cuota_id': self.cuotas[1].pk},
+            {'clave': 'c-3', 'cuota_id': 999999},
+            {'clave': 'c-4', 'cuota_id': self.cuotas[2].pk, 'monto_restante_visto': 3000},
+        ]).json()
+        self.assertEqual(
+            [r['estado'] for r in data['resultados']],
+            ['conflicto', 'conflicto', 'conflicto', 'aplicado']
+        )
+        self.assertEqual(data['resultados'][0]['cuota']['monto_restante'], 2500)
+        self.assertEqual(Cuota.objects.get(pk=self.cuotas[0].pk).monto_pagado, Decimal('500.00'))
+    
+    def test_error_libera_la_clave(self):
+        """Test un pago con error no guarda la clave y se puede reintentar"""
+        from .models import ClaveIdempotencia
+        data = self.sincronizar([{'clave': 'e-1', 'cuota_id': self.cuotas[0].pk, 'monto': 'abc'}]).json()
+        self.assertEqual(data['resultados'][0]['estado'], 'error')
+        self.assertFalse(ClaveIdempotencia.objects.filter(clave='e-1').exists())
+        data = self.sincronizar([{'clave': 'e-1', 'cuota_id': self.cuotas[0].pk}]).json()
+        self.assertEqual(data['resultados'][0]['estado'], 'aplicado')
+    
+    def test_claves_por_usuario(self):
+        """Test la misma clave de otro usuario no devuelve su respuesta"""
+        from .models import ClaveIdempotencia
+        otro = User.objects.create_user(username='otro_offline', password='x')
+        ClaveIdempotencia.objects.create(usuario=otro, clave='k-1', operacion='sincronizar', respuesta={})
+        data = self.sincronizar([{'clave': 'k-1', 'cuota_id': self.cuotas[0].pk}]).json()
+        self.assertEqual(data['resultados'][0]['estado'], 'aplicado')
+    
+    def test_clave_de_otra_operacion(self):
+        """Test una clave usada en otra cuota o en cobrar_cuota es un conflicto, no un duplicado"""
+        from .models import ClaveIdempotencia
+        self.sincronizar([{'clave': 'o-1', 'cuota_id': self.cuotas[0].pk}])
+        ClaveIdempotencia.objects.create(
+            usuario=self.user, clave='o-2', operacion=f'cobrar:{self.cuotas[2].pk}', respuesta={'success': True}
+        )
+        data = self.sincronizar([
+            {'clave': 'o-1', 'cuota_id': self.cuotas[1].pk},
+            {'clave': 'o-2', 'cuota_id': self.cuotas[2].pk},
+        ]).json()
+        for resultado, cuota in zip(data['resultados'], self.cuotas[1:3]):
+            self.assertEqual(resultado['estado'], 'conflicto')
+            self.assertEqual(resultado['cuota_id'], cuota.pk)
+            self.assertNotIn('duplicado', resultado)
+        self.assertEqual(Cuota.objects.get(pk=self.cuotas[1].pk).estado, 'PE')
+    
+    def test_service_worker(self):
+        """Test el service worker se sirve desde la raíz como JavaScript"""
+        response = self.client.get('/sw.js')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/javascript')
+        self.assertContains(response, 'cola_cobros.js')
+
+
+class IdempotenciaCobroTest(TestCase):
+    """Tests del header Idempotency-Key en cobrar y anular"""
+    
+    def setUp(self):
+        self.client = TestClient()
+        self.user = User.objects.create_user(username='idem', password='testpass123')
+        self.client.login(username='idem', password='testpass123')
+        cliente = Cliente.objects.create(
+            nombre='Idem', apellido='Test', telefono='1', direccion='Dir', usuario=self.user
+        )
+        self.prestamo = Prestamo.objects.create(
+            cliente=cliente,
+            monto_solicitado=Decimal('10000'),
+            tasa_interes_porcentaje=Decimal('20'),
+            cuotas_pactadas=4,
+            frecuencia='SE',
+            fecha_inicio=date.today(),
+            cobrador=self.user
+        )
+        self.cuota = self.prestamo.cuotas.get(numero_cuota=1)
+    
+    def cobrar(self, clave, cuota=None, monto=1000):
+        import json
+        return self.client.post(
+            reverse('core:cobrar_cuota', args=[(cuota or self.cuota).pk]),
+            content_type='application/json',
+            data=json.dumps({'monto': monto}),
+            HTTP_IDEMPOTENCY_KEY=clave
+        )
+    
+    def test_reintento_no_duplica_pago_parcial(self):
+        """Test el reintento devuelve la respuesta guardada sin volver a cobrar"""
+        primera = self.cobrar('k-1')
+        segunda = self.cobrar('k-1')
+        self.assertEqual(primera.status_code, 200)
+        self.assertEqual(segunda.json(), primera.json())
+        self.assertEqual(segunda['Idempotent-Replayed'], 'true')
+        self.cuota.refresh_from_db()
+        self.assertEqual(self.cuota.monto_pagado, Decimal('1000.00'))
+        
+        # Sin clave cada request es un pago nuevo
+        self.client.post(
+            reverse('core:cobrar_cuota', args=[self.cuota.pk]),
+            content_type='application/json', data='{"monto": 500}'
+        )
+        self.cuota.refresh_from_db()
+        self.assertEqual(self.cuota.monto_pagado, Decimal('1500.00'))
+    
+    def test_anular_con_clave(self):
+        """Test anular dos veces con la misma clave anula una sola vez"""
+        self.cobrar('k-2')
+        url = reverse('core:anular_pago_cuota', args=[self.cuota.pk])
+        primera = self.client.post(url, HTTP_IDEMPOTENCY_KEY='k-3')
+        segunda = self.client.post(url, HTTP_IDEMPOTENCY_KEY='k-3')
+        self.assertEqual(primera.status_code, 200)
+        self.assertEqual(segunda.json(), primera.json())
+        from .models import HistorialModificacionPago
+        self.assertEqual(HistorialModificacionPago.objects.filter(cuota=self.cuota, tipo_modificacion='AN').count(), 1)
+    
+    def test_clave_en_otra_cuota(self):
+        """Test reusar la clave en otra cuota se rechaza"""
+        self.cobrar('k-4')
+        otra = self.prestamo.cuotas.get(numero_cuota=2)
+        response = self.cobrar('k-4', cuota=otra)
+        self.assertEqual(response.status_code, 422)
+        otra.refresh_from_db()
+        self.assertEqual(otra.estado, 'PE')
+    
+    def test_error_no_se_guarda(self):
+        """Test una respuesta con error deja la clave libre"""
+        from .models import ClaveIdempotencia
+        response = self.cobrar('k-5', monto='abc')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(ClaveIdempotencia.objects.filter(clave='k-5').exists())
+        self.assertEqual(self.cobrar('k-5').status_code, 200)
+    
+    def test_clave_vencida(self):
+        """Test una clave vencida se toma como operación nueva y el comando la borra"""
+        from django.core.management import call_command
+        from io import StringIO
+        from .models import ClaveIdempotencia
+        self.cobrar('k-6')
+        ClaveIdempotencia.objects.filter(clave='k-6').update(fecha_creacion=timezone.now() - timedelta(hours=25))
+        self.assertNotIn('Idempotent-Replayed', self.cobrar('k-6'))
+        self.cuota.refresh_from_db()
+        self.assertEqual(self.cuota.monto_pagado, Decimal('2000.00'))
+        
+        ClaveIdempotencia.objects.update(fecha_creacion=timezone.now() - timedelta(hours=25))
+        call_command('purge_idempotency_keys', '--lote', '1', stdout=StringIO())
+        self.assertFalse(ClaveIdempotencia.objects.exists())
+
+
+class CuotasHoyDeltaTest(TestCase):
+    """Tests de la sincronización incremental de cuotas del día"""
+    
+    def setUp(self):
+        self.client = TestClient()
+        self.user = User.objects.create_user(username='delta', password='testpass123')
+        self.client.login(username='delta', password='testpass123')
+        self.cliente = Cliente.objects.create(
+            nombre='Delta', apellido='Test', telefono='1', direccion='Dir', usuario=self.user
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            self.prestamos = [self.crear_prestamo() for _ in range(3)]
+        self.url = reverse('core:cuotas_hoy')
+    
+    def crear_prestamo(self, cobrador=None):
+        # Semanal con inicio hace 7 días: la primera cuota vence hoy
+        return Prestamo.objects.create(
+            cliente=self.cliente,
+            monto_solicitado=Decimal('1000'),
+            tasa_interes_porcentaje=Decimal('0'),
+            cuotas_pactadas=2,
+            frecuencia='SE',
+            fecha_inicio=date.today() - timedelta(days=7),
+            cobrador=cobrador or self.user
+        )
+    
+    def pedir(self, token=None):
+        # Sin margen: todos los cambios confirmados entran en el token
+        with self.settings(CAMBIOS_MARGEN_SEGUNDOS=0):
+            return self.client.get(self.url, {'desde': token} if token else {}).json()
+    
+    def test_completo_y_sin_cambios(self):
+        """Test sin token devuelve todo; con el token recibido no devuelve nada"""
+        data = self.pedir()
+        self.assertTrue(data['completo'])
+        self.assertEqual(len(data['cuotas']), 3)
+        data = self.pedir(data['token'])
+        self.assertFalse(data['completo'])
+        self.assertEqual(data['prestamos'], [])
+        self.assertEqual(data['cuotas'], [])
+    
+    def test_solo_prestamos_cambiados(self):
+        """Test devuelve solo los préstamos con pagos, altas o cambios de cobrador"""
+        token = self.pedir()['token']
+        
+        pagada = self.prestamos[0].cuotas.get(numero_cuota=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            pagada.registrar_pago(Decimal('200'))
+            nuevo = self.crear_prestamo()
+            otro = User.objects.create_user(username='otro_delta', password='x')
+            reasignado = Prestamo.objects.get(pk=self.prestamos[1].pk)
+            reasignado.cobrador = otro
+            reasignado.save()
+        
+        data = self.pedir(token)
+        self.assertFalse(data['completo'])
+        self.assertEqual(sorted(data['prestamos']), sorted([self.prestamos[0].pk, nuevo.pk, reasignado.pk]))
+        self.assertEqual(
+            sorted(c['prestamo__id'] for c in data['cuotas']),
+            sorted([self.prestamos[0].pk, nuevo.pk])
+        )
+        parcial = next(c for c in data['cuotas'] if c['id'] == pagada.pk)
+        self.assertEqual(Decimal(str(parcial['monto_pagado'])), Decimal('200'))
+        
+        # El pago completo y el borrado quitan las cuotas
+        token = data['token']
+        nuevo_id = nuevo.pk
+        with self.captureOnCommitCallbacks(execute=True):
+            pagada.registrar_pago()
+            nuevo.delete()
+        data = self.pedir(token)
+        self.assertEqual(sorted(data['prestamos']), sorted([self.prestamos[0].pk, nuevo_id]))
+        self.assertEqual(data['cuotas'], [])
+    
+    def test_cambios_recientes_se_reenvian(self):
+        """Test los cambios dentro del margen vuelven a llegar hasta que quedan atrás"""
+        from .models import CambioPrestamo
+        token = self.pedir()['token']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.prestamos[0].cuotas.get(numero_cuota=1).registrar_pago(Decimal('100'))
+        
+        for _ in range(2):
+            data = self.client.get(self.url, {'desde': token}).json()
+            self.assertEqual(data['prestamos'], [self.prestamos[0].pk])
+            token = data['token']
+        CambioPrestamo.objects.update(fecha=timezone.now() - timedelta(minutes=10))
+        token = self.client.get(self.url, {'desde': token}).json()['token']
+        self.assertEqual(self.client.get(self.url, {'desde': token}).json()['prestamos'], [])
+    
+    def test_un_cambio_por_operacion(self):
+        """Test una operación registra una fila por préstamo aunque toque el préstamo varias veces"""
+        from .models import CambioPrestamo
+        prestamo = self.prestamos[0]
+        CambioPrestamo.objects.all().delete()
+        with self.captureOnCommitCallbacks(execute=True):
+            # Paga la primera cuota y la última: el préstamo queda finalizado
+            for cuota in prestamo.cuotas.order_by('numero_cuota'):
+                cuota.registrar_pago()
+        self.assertEqual(list(CambioPrestamo.objects.values_list('prestamo_id', flat=True)), [prestamo.pk])
+        
+        CambioPrestamo.objects.all().delete()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.prestamos[1].liquidar_prestamo()
+        self.assertEqual(CambioPrestamo.objects.count(), 1)
+    
+    def test_token_invalido_o_viejo(self):
+        """Test tokens de otro día, ilegibles o anteriores al registro devuelven todo"""
+        from django.core.management import call_command
+        from io import StringIO
+        from .models import CambioPrestamo
+        
+        token = self.pedir()['token']
+        ayer = (date.today() - timedelta(days=1)).strftime('%Y%m%d')
+        self.assertTrue(self.pedir(f'{ayer}-1')['completo'])
+        self.assertTrue(self.pedir('basura')['completo'])
+        self.assertTrue(self.pedir(token.split('-')[0] + '-999999')['completo'])
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            self.crear_prestamo()
+        CambioPrestamo.objects.update(fecha=timezone.now() - timedelta(days=5))
+        call_command('prune_change_log', stdout=StringIO())
+        self.assertFalse(CambioPrestamo.objects.exists())
+        self.assertTrue(self.pedir('{}-0'.format(token.split('-')[0]))['completo'])
+
+
+class NotificacionesTiempoRealTest(TestCase):
+    """Tests del stream SSE de notificaciones y de la API con ETag"""
+    
+    def setUp(self):
+        self.client = TestClient()
+        self.user = User.objects.create_user(username='avisos', password='testpass123')
+        self.client.login(username='avisos', password='testpass123')
+        self.url = reverse('core:api_notificaciones')
+        Notificacion.crear_notificacion('IN', 'Para el cobrador', 'Mensaje', usuario=self.user)
+        Notificacion.crear_notificacion('AS', 'Para todos', 'Mensaje')
+    
+    def test_etag_responde_304_sin_cambios(self):
+        """Test con If-None-Match igual responde 304 hasta que cambia el contador"""
+        response = self.client.get(self.url)
+        self.assertEqual(response.json()['no_leidas'], 2)
+        etag = response['ETag']
+        
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        
+        Notificacion.crear_notificacion('IN', 'Otra', 'Mensaje', usuario=self.user)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['no_leidas'], 3)
+        self.assertNotEqual(response['ETag'], etag)
+    
+    def test_stream_fuera_de_asgi(self):
+        """Test por WSGI el stream responde 204 (la página consulta la API) y exige login"""
+        url = reverse('core:stream_notificaciones')
+        self.assertEqual(self.client.get(url).status_code, 204)
+        self.assertEqual(TestClient().get(url).status_code, 401)
+    
+    def test_bandeja_por_usuario(self):
+        """Test la bandeja y "marcar todas" solo tocan las filas del usuario"""
+        otro = User.objects.create_user(username='otro_avisos', password='x')
+        Notificacion.crear_notificacion('IN', 'Para otro', 'Mensaje', usuario=otro)
+        
+        response = self.client.get(reverse('core:notificacion_list'))
+        self.assertEqual(response.context['no_leidas_count'], 2)
+        self.assertEqual(
+            sorted(d.notificacion.titulo for d in response.context['notificaciones']),
+            ['Para el cobrador', 'Para todos']
+        )
+        
+        with self.assertNumQueries(3):
+            # sesión, usuario y un único UPDATE
+            self.client.get(reverse('core:notificaciones_todas_leidas'))
+        self.assertEqual(self.client.get(self.url).json()['no_leidas'], 0)
+        # La general es anterior a "otro": solo le llegó la suya, que sigue sin leer
+        self.assertEqual(DestinatarioNotificacion.objects.filter(usuario=otro, leida=False).count(), 1)
+        
+        # No se puede marcar una notificación que no es del usuario
+        ajena = Notificacion.objects.get(titulo='Para otro')
+        response = self.client.get(reverse('core:notificacion_leida', args=[ajena.pk]))
+        self.assertEqual(response.status_code, 404)
+
+
+class NotificacionesStreamTest(TransactionTestCase):
+    """
+    Tests del stream SSE por ASGI. Sus consultas corren en el pool de hilos,
+    que no ve los datos de una transacción de TestCase sin confirmar.
+    """
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='avisos', password='testpass123')
+        Notificacion.crear_notificacion('IN', 'Para el cobrador', 'Mensaje', usuario=self.user)
+        Notificacion.crear_notificacion('AS', 'Para todos', 'Mensaje')
+    
+    async def test_stream_envia_contador(self):
+        """Test el stream por ASGI envía el contador y no lo repite si Last-Event-ID está al día"""
+        from django.test import AsyncClient
+        from asgiref.sync import sync_to_async
+        
+        client = AsyncClient()
+        await sync_to_async(client.force_login)(self.user)
+        url = reverse('core:stream_notificaciones')
+        
+        response = await client.get(url)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        contenido = response.streaming_content
+        self.assertTrue((await anext(contenido)).startswith(b'retry:'))
+        evento = (await anext(contenido)).decode()
+        await contenido.aclose()
+        self.assertIn('event: notificaciones', evento)
+        self.assertIn('"no_leidas": 2', evento)
+        
+        id_evento = evento.split('\n')[0].split(': ')[1]
+        with self.settings(NOTIFICACIONES_SSE_DURACION=0):
+            response = await client.get(url, headers={'Last-Event-ID': id_evento})
+            partes = [parte async for parte in response.streaming_content]
+        self.assertEqual(partes, [b'retry: 5000\n\n'])
+
+    
+    def test_consultas_cierran_la_conexion(self):
+        """Test cada consulta del stream cierra su conexión al terminar"""
+        from unittest import mock
+        from asgiref.sync import async_to_sync
+        from django.db import connections
+        from .notificaciones import consultar, estado_notificaciones
+        
+        def estado_y_conexion(usuario):
+            return estado_notificaciones(usuario), connections['default']
+        
+        cerradas = []
+        with mock.patch.object(type(connections['default']), 'close', autospec=True,
+                               side_effect=cerradas.append):
+            estado, conexion = async_to_sync(consultar(estado_y_conexion))(self.user)
+        self.assertEqual(estado['no_leidas'], 2)
+        # Corrió en otro hilo (otra conexión) y la cerró al volver
+        self.assertIsNot(conexion, connections['default'])
+        self.assertEqual(cerradas, [conexion])
+
+
 class ClienteFormTest(TestCase):
     """Tests para formulario de cliente"""
     
@@ -536,6 +1211,287 @@ class ExportViewsTest(TestCase):
             f'?fecha={date.today().strftime("%Y-%m-%d")}'
         )
         self.assertEqual(response.status_code, 200)
+    
+    def libro(self, response):
+        import io
+        import openpyxl
+        self.assertTrue(response.streaming)
+        return openpyxl.load_workbook(io.BytesIO(b''.join(response.streaming_content)))
+    
+    def crear_prestamo(self):
+        self.cliente.usuario = self.user
+        self.cliente.save()
+        return Prestamo.objects.create(
+            cliente=self.cliente, monto_solicitado=Decimal('10000'), tasa_interes_porcentaje=Decimal('20'),
+            cuotas_pactadas=4, frecuencia='SE', fecha_inicio=date.today(), cobrador=self.user
+        )
+    
+    def test_exportar_prestamos_contenido(self):
+        """Test el Excel de préstamos trae encabezado y una fila por préstamo"""
+        prestamo = self.crear_prestamo()
+        prestamo.cuotas.get(numero_cuota=1).registrar_pago(cobrador=self.user)
+        hoja = self.libro(self.client.get(reverse('core:exportar_prestamos_excel')))['Préstamos']
+        filas = list(hoja.iter_rows(values_only=True))
+        self.assertEqual(filas[0][:4], ('#', 'Cliente', 'Dirección', 'Monto'))
+        self.assertEqual(len(filas), 2)
+        self.assertEqual(filas[1][1], 'Export Test')
+        self.assertEqual(filas[1][3:8], (10000, 12000, 3000, 9000, '1/4'))
+        self.assertEqual(hoja['D2'].number_format, '#,##0')
+    
+    def test_exportar_prestamos_consultas_constantes(self):
+        """Test el Excel de préstamos hace las mismas consultas con 1 o con muchos préstamos"""
+        import io
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from .exportacion import escribir_xlsx, planilla_prestamos
+        
+        def consultas():
+            with CaptureQueriesContext(connection) as capturadas:
+                escribir_xlsx(planilla_prestamos(self.user), io.BytesIO())
+            return len(capturadas)
+        
+        prestamo = self.crear_prestamo()
+        prestamo.cuotas.get(numero_cuota=1).registrar_pago(cobrador=self.user)
+        con_uno = consultas()
+        for _ in range(10):
+            self.crear_prestamo().cuotas.get(numero_cuota=2).registrar_pago(Decimal('500'), cobrador=self.user)
+        self.assertEqual(consultas(), con_uno)
+        self.assertLessEqual(con_uno, 2)
+    
+    async def test_exportar_excel_por_asgi(self):
+        """Test por ASGI el Excel se envía desde un iterador async (Django no lo junta en memoria)"""
+        import io
+        import openpyxl
+        from asgiref.sync import sync_to_async
+        from django.test import AsyncClient
+        
+        await sync_to_async(self.crear_prestamo)()
+        client = AsyncClient()
+        await sync_to_async(client.force_login)(self.user)
+        response = await client.get(reverse('core:exportar_prestamos_excel'))
+        self.assertTrue(response.is_async)
+        contenido = b''.join([parte async for parte in response.streaming_content])
+        self.assertEqual(int(response['Content-Length']), len(contenido))
+        hoja = openpyxl.load_workbook(io.BytesIO(contenido))['Préstamos']
+        self.assertEqual(hoja['B2'].value, 'Export Test')
+    
+    def test_exportar_csv_y_jsonl(self):
+        """Test CSV y JSON Lines salen fila por fila, con formato ARS opcional"""
+        import csv
+        import json
+        self.crear_prestamo().cuotas.get(numero_cuota=1).registrar_pago(cobrador=self.user)
+        url = reverse('core:exportar_prestamos_excel')
+        
+        response = self.client.get(url + '?format=csv')
+        self.assertTrue(response.streaming)
+        self.assertTrue(response['Content-Type'].startswith('text/csv'))
+        self.assertTrue(response['Content-Disposition'].endswith('.csv'))
+        filas = list(csv.reader(b''.join(response.streaming_content).decode('utf-8').splitlines()))
+        self.assertEqual(filas[0][:4], ['#', 'Cliente', 'Dirección', 'Monto'])
+        self.assertEqual(filas[1][3], '10000.00')
+        
+        response = self.client.get(url + '?format=csv&ars=1')
+        filas = list(csv.reader(b''.join(response.streaming_content).decode('utf-8').splitlines()))
+        self.assertEqual(filas[1][3:7], ['10.000', '12.000', '3.000', '9.000'])
+        
+        response = self.client.get(url + '?format=jsonl')
+        lineas = b''.join(response.streaming_content).decode('utf-8').splitlines()
+        self.assertEqual(len(lineas), 1)
+        fila = json.loads(lineas[0])
+        self.assertEqual((fila['Cliente'], fila['Pagado'], fila['Cuotas']), ('Export Test', 3000, '1/4'))
+    
+    async def test_exportar_csv_por_asgi(self):
+        """Test por ASGI el CSV sale de un iterador async que lee la consulta en lotes"""
+        import csv
+        from asgiref.sync import sync_to_async
+        from django.test import AsyncClient
+        
+        @sync_to_async
+        def crear():
+            for _ in range(3):
+                self.crear_prestamo()
+        
+        await crear()
+        client = AsyncClient()
+        await sync_to_async(client.force_login)(self.user)
+        response = await client.get(reverse('core:exportar_prestamos_excel') + '?format=csv')
+        self.assertTrue(response.is_async)
+        partes = [parte async for parte in response.streaming_content]
+        filas = list(csv.reader(b''.join(partes).decode('utf-8').splitlines()))
+        self.assertEqual(len(filas), 4)
+        self.assertEqual(filas[1][1], 'Export Test')
+    
+    async def test_partes_async_cierra_el_generador(self):
+        """Test partes_async pide las partes en lotes y cierra el generador si se corta antes"""
+        from .exportacion import partes_async
+        
+        pedidas = []
+        cerrado = []
+        
+        def partes():
+            try:
+                for numero in range(10):
+                    pedidas.append(numero)
+                    yield numero
+            finally:
+                cerrado.append(True)
+        
+        iterador = partes_async(partes(), tamaño=3)
+        self.assertEqual(await anext(iterador), 0)
+        self.assertEqual(pedidas, [0, 1, 2])
+        await iterador.aclose()
+        self.assertEqual(cerrado, [True])
+    
+    def test_cierre_caja_view_con_formato(self):
+        """Test la vista de cierre de caja devuelve el archivo si se pide un formato"""
+        import csv
+        self.crear_prestamo().cuotas.get(numero_cuota=1).registrar_pago(cobrador=self.user)
+        response = self.client.get(reverse('core:cierre_caja') + '?format=csv')
+        filas = list(csv.reader(b''.join(response.streaming_content).decode('utf-8').splitlines()))
+        self.assertEqual(len(filas), 2)
+        self.assertEqual(filas[1][7], '3000.00')
+        self.assertEqual(self.client.get(reverse('core:cierre_caja')).status_code, 200)
+    
+    def test_formato_no_disponible(self):
+        """Test un formato desconocido (o sin pyarrow) vuelve con un mensaje"""
+        from unittest import mock
+        response = self.client.get(reverse('core:exportar_clientes_excel') + '?format=pdf')
+        self.assertRedirects(response, reverse('core:cliente_list'), fetch_redirect_response=False)
+        with mock.patch('core.views.pyarrow_disponible', return_value=False):
+            response = self.client.get(reverse('core:exportar_clientes_excel') + '?format=parquet')
+        self.assertRedirects(response, reverse('core:cliente_list'), fetch_redirect_response=False)
+    
+    def test_exportar_parquet(self):
+        """Test Parquet con montos numéricos y texto en el resto"""
+        import io
+        from .exportacion import pyarrow_disponible
+        if not pyarrow_disponible():
+            self.skipTest('pyarrow no está instalado')
+        import pyarrow.parquet as pq
+        self.crear_prestamo()
+        response = self.client.get(reverse('core:exportar_prestamos_excel') + '?format=parquet')
+        tabla = pq.read_table(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(tabla.num_rows, 1)
+        self.assertEqual(tabla.column('Monto').to_pylist(), [10000.0])
+        self.assertEqual(tabla.column('Cuotas').to_pylist(), ['0/4'])
+    
+    def test_exportar_cierre_estilos_compartidos(self):
+        """Test el cierre resalta los pagos parciales con pocos estilos con nombre"""
+        prestamo = self.crear_prestamo()
+        prestamo.cuotas.get(numero_cuota=1).registrar_pago(Decimal('1000'), accion_restante='proxima', cobrador=self.user)
+        prestamo.cuotas.get(numero_cuota=3).registrar_pago(cobrador=self.user)
+        libro = self.libro(self.client.get(
+            reverse('core:exportar_cierre_excel') + f'?fecha={date.today().strftime("%Y-%m-%d")}'
+        ))
+        hoja = libro.active
+        self.assertTrue(hoja['A1'].value.startswith('CIERRE DE CAJA'))
+        self.assertIn('A1:S1', [str(rango) for rango in hoja.merged_cells.ranges])
+        self.assertEqual(hoja['A5'].value, '#')
+        parcial, completo = (6, 7) if hoja['F6'].value == '1/4' else (7, 6)
+        self.assertEqual(hoja[f'Q{parcial}'].value, 'SÍ')
+        self.assertEqual(hoja[f'A{parcial}'].fill.start_color.rgb, '00FFF3CD')
+        self.assertIn('Pago parcial', hoja[f'S{parcial}'].value)
+        self.assertEqual(hoja[f'Q{completo}'].value, '-')
+        self.assertEqual(hoja['A8'].value, 'TOTAL COBRADO:')
+        self.assertEqual(hoja['H8'].value, 4000)
+        self.assertLess(len(libro.named_styles), 20)
+
+
+class ExportacionSegundoPlanoTest(TestCase):
+    """Tests de las exportaciones generadas por el programador"""
+    
+    def setUp(self):
+        import tempfile
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        ajustes = self.settings(MEDIA_ROOT=directorio.name, EXPORTACIONES_FILAS_DIRECTAS=0)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        
+        self.user = User.objects.create_user(username='exporta', password='x')
+        self.client = TestClient()
+        self.client.login(username='exporta', password='x')
+        Cliente.objects.create(
+            nombre='Fondo', apellido='Test', telefono='1', direccion='Dir', usuario=self.user
+        )
+    
+    def test_encola_genera_y_descarga(self):
+        """Test la exportación grande se encola, se genera y se descarga"""
+        import io
+        import openpyxl
+        from .exportacion import procesar_exportaciones
+        from .models import TareaProgramada, TrabajoExportacion
+        
+        response = self.client.get(reverse('core:exportar_clientes_excel'))
+        self.assertRedirects(response, reverse('core:cliente_list'), fetch_redirect_response=False)
+        trabajo = TrabajoExportacion.objects.get()
+        self.assertEqual((trabajo.tipo, trabajo.estado), ('CL', 'PE'))
+        self.assertIsNone(TareaProgramada.objects.get(nombre='exportaciones').proxima_ejecucion)
+        
+        # Mismo pedido mientras se genera: no se encola otra vez
+        self.client.get(reverse('core:exportar_clientes_excel'))
+        self.assertEqual(TrabajoExportacion.objects.count(), 1)
+        
+        self.assertEqual(
+            procesar_exportaciones(), '1 exportaciones generadas, 0 con error, 0 vencidas borradas'
+        )
+        trabajo.refresh_from_db()
+        self.assertEqual(trabajo.estado, 'LI')
+        enlace = reverse('core:descargar_exportacion', args=[trabajo.pk])
+        notificacion = Notificacion.objects.get(usuario=self.user)
+        self.assertEqual(notificacion.enlace, enlace)
+        self.assertEqual(
+            self.client.get(reverse('core:estado_exportacion', args=[trabajo.pk])).json()['url'], enlace
+        )
+        
+        # Ya generada: el mismo pedido va directo al archivo
+        response = self.client.get(reverse('core:exportar_clientes_excel'))
+        self.assertRedirects(response, enlace, fetch_redirect_response=False)
+        response = self.client.get(enlace)
+        hoja = openpyxl.load_workbook(io.BytesIO(b''.join(response.streaming_content))).active
+        self.assertEqual(hoja['B2'].value, 'Fondo')
+        
+        otro = TestClient()
+        User.objects.create_user(username='ajeno', password='x')
+        otro.login(username='ajeno', password='x')
+        self.assertEqual(otro.get(enlace).status_code, 404)
+    
+    def test_parametros_distintos_no_reutilizan(self):
+        """Test otro estado de préstamos es otra exportación"""
+        from .models import TrabajoExportacion
+        self.client.get(reverse('core:exportar_prestamos_excel') + '?estado=AC')
+        self.client.get(reverse('core:exportar_prestamos_excel') + '?estado=FI')
+        self.client.get(reverse('core:exportar_prestamos_excel') + '?estado=AC')
+        self.assertEqual(
+            sorted(TrabajoExportacion.objects.values_list('parametros__estado', flat=True)), ['AC', 'FI']
+        )
+    
+    def test_error_y_vencimiento(self):
+        """Test un error queda registrado y avisado; los vencidos se borran con su archivo"""
+        import os
+        from unittest import mock
+        from .exportacion import procesar_exportaciones
+        from .models import TrabajoExportacion
+        
+        self.client.get(reverse('core:exportar_clientes_excel'))
+        with mock.patch('core.exportacion.escribir_xlsx', side_effect=OSError('disco lleno')):
+            procesar_exportaciones()
+        trabajo = TrabajoExportacion.objects.get()
+        self.assertEqual(trabajo.estado, 'ER')
+        self.assertIn('disco lleno', trabajo.error)
+        self.assertEqual(Notificacion.objects.get(usuario=self.user).prioridad, 'AL')
+        
+        # El error no se reutiliza: el próximo pedido genera otro
+        self.client.get(reverse('core:exportar_clientes_excel'))
+        procesar_exportaciones()
+        generado = TrabajoExportacion.objects.get(estado='LI')
+        ruta = generado.archivo.path
+        self.assertTrue(os.path.exists(ruta))
+        
+        resultado = procesar_exportaciones(ahora=timezone.now() + timedelta(days=2))
+        self.assertTrue(resultado.endswith('2 vencidas borradas'))
+        self.assertFalse(TrabajoExportacion.objects.exists())
+        self.assertFalse(os.path.exists(ruta))
 
 
 # ============== TESTS DE MODELOS ADICIONALES ==============
@@ -582,7 +1538,7 @@ class NotificacionModelTest(TestCase):
             tipo='CV',
             prioridad='AL'
         )
-        self.assertFalse(notif.leida)
+        self.assertFalse(notif.destinatarios.get(usuario=self.user).leida)
         self.assertEqual(notif.prioridad, 'AL')
     
     def test_marcar_leida(self):
@@ -593,10 +1549,101 @@ class NotificacionModelTest(TestCase):
             mensaje='Mensaje',
             tipo='IN'
         )
-        notif.leida = True
-        notif.save()
-        self.assertTrue(notif.leida)
+        self.assertTrue(notif.marcar_como_leida(self.user))
+        self.assertFalse(notif.marcar_como_leida(self.user))
+        destinatario = notif.destinatarios.get(usuario=self.user)
+        self.assertTrue(destinatario.leida)
+        self.assertIsNotNone(destinatario.fecha_lectura)
+    
+    def test_general_leida_por_usuario(self):
+        """Test una notificación general se lee por separado para cada usuario activo"""
+        otro = User.objects.create_user(username='otro_notif', password='x')
+        User.objects.create_user(username='inactivo_notif', password='x', is_active=False)
+        notif = Notificacion.crear_notificacion('AS', 'Para todos', 'Mensaje')
+        
+        self.assertEqual(
+            sorted(notif.destinatarios.values_list('usuario__username', flat=True)),
+            ['otro_notif', 'testuser']
+        )
+        notif.marcar_como_leida(self.user)
+        self.assertTrue(notif.destinatarios.get(usuario=self.user).leida)
+        self.assertFalse(notif.destinatarios.get(usuario=otro).leida)
+    
+    def crear_prestamos_vencidos(self, cantidad):
+        cliente = Cliente.objects.create(
+            nombre='Moroso', apellido='Test', telefono='1', direccion='Dir', usuario=self.user
+        )
+        for _ in range(cantidad):
+            Prestamo.objects.create(
+                cliente=cliente,
+                monto_solicitado=Decimal('1000'),
+                tasa_interes_porcentaje=Decimal('0'),
+                cuotas_pactadas=4,
+                frecuencia='SE',
+                fecha_inicio=date.today() - timedelta(days=60),
+                cobrador=self.user
+            )
+    
+    def test_generar_cuotas_vencidas_sin_duplicar(self):
+        """Test genera una notificación por cuota vencida y no la repite en el día"""
+        self.crear_prestamos_vencidos(2)
+        
+        self.assertEqual(Notificacion.notificar_cuotas_vencidas(), 8)
+        self.assertEqual(Notificacion.notificar_cuotas_vencidas(), 0)
+        
+        notificaciones = Notificacion.objects.filter(tipo='CV')
+        self.assertEqual(notificaciones.count(), 8)
+        self.assertEqual(notificaciones.values('cuota').distinct().count(), 8)
+        notif = notificaciones.filter(cuota__numero_cuota=1).first()
+        self.assertIn(f'#{notif.cuota_id}', notif.titulo)
+        self.assertEqual(notif.prioridad, 'AL')
+        self.assertEqual(notif.enlace, f'/prestamos/{notif.cuota.prestamo_id}/')
+        
+        # Leída o no, al día siguiente se vuelve a avisar
+        notificaciones.update(fecha_referencia=date.today() - timedelta(days=1))
+        self.assertEqual(Notificacion.notificar_cuotas_vencidas(), 8)
+    
+    def test_generar_consultas_constantes(self):
+        """Test la cantidad de consultas no depende de la cantidad de cuotas vencidas"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        
+        self.crear_prestamos_vencidos(1)
+        with CaptureQueriesContext(connection) as pocas:
+            Notificacion.notificar_cuotas_vencidas()
+        Notificacion.objects.all().delete()
+        
+        self.crear_prestamos_vencidos(10)
+        with CaptureQueriesContext(connection) as muchas:
+            self.assertEqual(Notificacion.notificar_cuotas_vencidas(), 44)
+        self.assertEqual(len(muchas), len(pocas))
+        self.assertEqual(
+            DestinatarioNotificacion.objects.filter(notificacion__tipo='CV', usuario=self.user).count(), 44
+        )
 
+    
+    def test_cuotas_vencidas_para_su_cobrador(self):
+        """Test la notificación de una cuota va a su cobrador; sin cobrador, a todos"""
+        otro = User.objects.create_user(username='otro_cobrador', password='x')
+        self.crear_prestamos_vencidos(1)
+        sin_cobrador = Prestamo.objects.create(
+            cliente=Cliente.objects.get(nombre='Moroso'),
+            monto_solicitado=Decimal('1000'),
+            tasa_interes_porcentaje=Decimal('0'),
+            cuotas_pactadas=4,
+            frecuencia='SE',
+            fecha_inicio=date.today() - timedelta(days=60),
+        )
+        
+        self.assertEqual(Notificacion.notificar_cuotas_vencidas(), 8)
+        self.assertEqual(Notificacion.objects.filter(tipo='CV', usuario=self.user).count(), 4)
+        self.assertEqual(
+            set(DestinatarioNotificacion.objects.filter(usuario=otro).values_list(
+                'notificacion__cuota__prestamo', flat=True
+            )),
+            {sin_cobrador.pk}
+        )
+        self.assertEqual(DestinatarioNotificacion.objects.filter(usuario=self.user).count(), 8)
 
 class AuditoriaModelTest(TestCase):
     """Tests para RegistroAuditoria"""
@@ -620,6 +1667,174 @@ class AuditoriaModelTest(TestCase):
         self.assertIsNotNone(registro.fecha_hora)
 
 
+class AuditoriaDiferidaTest(TransactionTestCase):
+    """
+    Tests del buffer de auditoría (core/auditoria.py). Los registros entran al
+    buffer al confirmarse la transacción, que en TestCase nunca se confirma.
+    """
+    
+    def setUp(self):
+        from . import auditoria
+        import tempfile
+        self.auditoria = auditoria
+        auditoria.vaciar()
+        # Lo que quede pendiente se escribe antes de vaciar las tablas
+        self.addCleanup(auditoria.vaciar)
+        self.directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directorio.cleanup)
+        self.spool = f'{self.directorio.name}/pendiente.jsonl'
+        self.user = User.objects.create_user(username='auditor', password='x')
+    
+    def test_registrar_escribe_en_lote(self):
+        """Test registrar no escribe hasta vaciar y el lote va en una consulta"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        registros = [
+            RegistroAuditoria.registrar(self.user, 'CO', 'CU', f'Cobro {n}', modelo_id=n)
+            for n in range(5)
+        ]
+        self.assertEqual(RegistroAuditoria.objects.count(), 0)
+        self.assertEqual(self.auditoria.pendientes(), 5)
+        with CaptureQueriesContext(connection) as consultas:
+            self.assertEqual(self.auditoria.vaciar(), 5)
+        # Fuera de TestCase bulk_create va entre BEGIN y COMMIT
+        self.assertEqual([c['sql'].split()[0] for c in consultas], ['BEGIN', 'INSERT', 'COMMIT'])
+        self.assertEqual(RegistroAuditoria.objects.count(), 5)
+        # Conserva la hora del evento, no la de la escritura
+        self.assertEqual(
+            RegistroAuditoria.objects.get(modelo_id=0).fecha_hora, registros[0].fecha_hora
+        )
+    
+    def test_vacia_al_llenar_el_lote(self):
+        """Test al llegar a AUDITORIA_LOTE se escribe sin esperar"""
+        with self.settings(AUDITORIA_LOTE=3):
+            for n in range(4):
+                RegistroAuditoria.registrar(self.user, 'OT', 'SI', f'Evento {n}')
+        self.assertEqual(RegistroAuditoria.objects.count(), 3)
+        self.assertEqual(self.auditoria.pendientes(), 1)
+    
+    def test_sin_diferir(self):
+        """Test con AUDITORIA_DIFERIDA = False se escribe en el momento"""
+        with self.settings(AUDITORIA_DIFERIDA=False):
+            registro = RegistroAuditoria.registrar(self.user, 'OT', 'SI', 'Directo')
+        self.assertIsNotNone(registro.pk)
+        self.assertEqual(self.auditoria.pendientes(), 0)
+    
+    def test_operacion_revertida_no_queda_auditada(self):
+        """Test lo registrado en un atomic que se revierte no llega al buffer"""
+        from django.db import transaction
+        
+        with self.assertRaises(ValueError):
+            with transaction.atomic():
+                RegistroAuditoria.registrar(self.user, 'CO', 'CU', 'Revertido')
+                raise ValueError('falla el cobro')
+        with transaction.atomic():
+            RegistroAuditoria.registrar(self.user, 'CO', 'CU', 'Confirmado')
+            self.assertEqual(self.auditoria.pendientes(), 0)
+        self.assertEqual(self.auditoria.pendientes(), 1)
+        self.assertEqual(self.auditoria.vaciar(), 1)
+        self.assertEqual(RegistroAuditoria.objects.get().descripcion, 'Confirmado')
+    
+    def test_buffer_por_hilo(self):
+        """Test cada hilo (cada request) vacía solo sus registros"""
+        import threading
+        
+        RegistroAuditoria.registrar(self.user, 'OT', 'SI', 'De este hilo')
+        escritos = []
+        otro = threading.Thread(target=lambda: escritos.append(self.auditoria.vaciar()))
+        otro.start()
+        otro.join()
+        self.assertEqual(escritos, [0])
+        self.assertEqual(self.auditoria.pendientes(), 1)
+    
+    def test_spool_si_falla_la_base(self):
+        """Test si falla la escritura queda en el spool y se reintenta después"""
+        import os
+        from unittest import mock
+        from django.db import DatabaseError
+        
+        with self.settings(AUDITORIA_SPOOL=self.spool):
+            RegistroAuditoria.registrar(self.user, 'CO', 'CU', 'Cobro', modelo_id=7, datos_nuevos='{"monto": 1500}')
+            with mock.patch.object(RegistroAuditoria.objects, 'bulk_create', side_effect=DatabaseError('caída')):
+                self.assertEqual(self.auditoria.vaciar(), 0)
+            self.assertTrue(os.path.exists(self.spool))
+            self.assertEqual(RegistroAuditoria.objects.count(), 0)
+            
+            RegistroAuditoria.registrar(self.user, 'OT', 'SI', 'Después')
+            self.assertEqual(self.auditoria.vaciar(), 2)
+            self.assertFalse(os.listdir(self.directorio.name))
+        
+        recuperado = RegistroAuditoria.objects.get(modelo_id=7)
+        self.assertEqual(recuperado.usuario, self.user)
+        self.assertEqual(recuperado.datos_nuevos, '{"monto": 1500}')
+    
+    def test_spool_se_conserva_si_falla_el_reintento(self):
+        """Test si el reintento también falla, lo recuperado del spool sigue ahí"""
+        from unittest import mock
+        from django.db import DatabaseError
+        
+        with self.settings(AUDITORIA_SPOOL=self.spool):
+            falla = mock.patch.object(RegistroAuditoria.objects, 'bulk_create', side_effect=DatabaseError('caída'))
+            RegistroAuditoria.registrar(self.user, 'OT', 'SI', 'Primero')
+            with falla:
+                self.assertEqual(self.auditoria.vaciar(), 0)
+            RegistroAuditoria.registrar(self.user, 'OT', 'SI', 'Segundo')
+            with falla:
+                self.assertEqual(self.auditoria.vaciar(), 0)
+            with open(self.spool, encoding='utf-8') as archivo:
+                self.assertEqual(len(archivo.readlines()), 2)
+            
+            self.assertEqual(self.auditoria.vaciar(), 2)
+        self.assertEqual(
+            sorted(RegistroAuditoria.objects.values_list('descripcion', flat=True)), ['Primero', 'Segundo']
+        )
+    
+    def test_spool_tomado_por_otro_proceso(self):
+        """Test si otro proceso está vaciando el spool, se escribe solo el buffer"""
+        if self.auditoria.fcntl is None:
+            self.skipTest('Sin fcntl no se bloquea el spool')
+        
+        with self.settings(AUDITORIA_SPOOL=self.spool):
+            self.auditoria._escribir_spool([
+                RegistroAuditoria(usuario=self.user, tipo_accion='OT', tipo_modelo='SI',
+                                  descripcion='En el spool', fecha_hora=timezone.now())
+            ])
+            RegistroAuditoria.registrar(self.user, 'OT', 'SI', 'En el buffer')
+            otro = self.auditoria._abrir_spool()
+            try:
+                self.assertEqual(self.auditoria.vaciar(), 1)
+            finally:
+                otro.close()
+            self.assertEqual(RegistroAuditoria.objects.get().descripcion, 'En el buffer')
+            self.assertEqual(self.auditoria.vaciar(), 1)
+        self.assertTrue(RegistroAuditoria.objects.filter(descripcion='En el spool').exists())
+    
+    def test_cobro_auditado_al_terminar_request(self):
+        """Test cobrar_cuota deja su registro escrito al terminar el request"""
+        import json
+        cliente = Cliente.objects.create(
+            nombre='Audit', apellido='Test', telefono='1', direccion='Dir', usuario=self.user
+        )
+        prestamo = Prestamo.objects.create(
+            cliente=cliente, monto_solicitado=Decimal('10000'), tasa_interes_porcentaje=Decimal('20'),
+            cuotas_pactadas=4, frecuencia='SE', fecha_inicio=date.today(), cobrador=self.user
+        )
+        cuota = prestamo.cuotas.get(numero_cuota=1)
+        client = TestClient()
+        client.login(username='auditor', password='x')
+        response = client.post(
+            reverse('core:cobrar_cuota', args=[cuota.pk]),
+            content_type='application/json',
+            data=json.dumps({'monto': 1000})
+        )
+        self.assertTrue(response.json()['success'])
+        self.assertEqual(self.auditoria.pendientes(), 0)
+        registro = RegistroAuditoria.objects.get(tipo_accion='CO')
+        self.assertEqual((registro.tipo_modelo, registro.modelo_id), ('CU', cuota.pk))
+        self.assertEqual(registro.usuario, self.user)
+        self.assertEqual(json.loads(registro.datos_nuevos)['monto_pagado'], 1000)
+
+
 # ============== TESTS DE LÓGICA DE NEGOCIO ==============
 
 class PrestamoRenovacionTest(TestCase):
@@ -658,6 +1873,642 @@ class PrestamoRenovacionTest(TestCase):
         self.assertLess(progreso, 100)
 
 
+class SaldosPrestamoTest(TestCase):
+    """Tests de los saldos desnormalizados del préstamo"""
+    
+    def setUp(self):
+        self.cliente = Cliente.objects.create(
+            nombre='Saldo',
+            apellido='Test',
+            telefono='7070707070',
+            direccion='Dir Saldos Test'
+        )
+        self.prestamo = Prestamo.objects.create(
+            cliente=self.cliente,
+            monto_solicitado=Decimal('10000'),
+            tasa_interes_porcentaje=Decimal('20'),
+            cuotas_pactadas=4,
+            frecuencia='SE',
+            fecha_inicio=date.today()
+        )
+    
+    def test_saldos_iniciales(self):
+        """Test préstamo nuevo: todo pendiente, próximo vencimiento = primera cuota"""
+        self.prestamo.refresh_from_db()
+        self.assertEqual(self.prestamo.total_pagado, Decimal('0'))
+        self.assertEqual(self.prestamo.saldo_pendiente, Decimal('12000'))
+        self.assertEqual(self.prestamo.cantidad_cuotas_pagadas, 0)
+        self.assertEqual(
+            self.prestamo.fecha_proximo_vencimiento,
+            self.prestamo.cuotas.get(numero_cuota=1).fecha_vencimiento
+        )
+    
+    def test_saldos_despues_de_pago_y_anulacion(self):
+        """Test registrar_pago y cancelar_pago mantienen los saldos"""
+        cuota = self.prestamo.cuotas.get(numero_cuota=1)
+        cuota.registrar_pago(cuota.monto_cuota)
+        self.prestamo.refresh_from_db()
+        self.assertEqual(self.prestamo.total_pagado, Decimal('3000'))
+        self.assertEqual(self.prestamo.saldo_pendiente, Decimal('9000'))
+        self.assertEqual(self.prestamo.cuotas_pagadas, 1)
+        self.assertEqual(
+            self.prestamo.fecha_proximo_vencimiento,
+            self.prestamo.cuotas.get(numero_cuota=2).fecha_vencimiento
+        )
+        
+        cuota.cancelar_pago()
+        self.prestamo.refresh_from_db()
+        self.assertEqual(self.prestamo.total_pagado, Decimal('0'))
+        self.assertEqual(self.prestamo.cuotas_pagadas, 0)
+        self.assertEqual(self.prestamo.fecha_proximo_vencimiento, cuota.fecha_vencimiento)
+    
+    def test_guardar_instancia_vieja_no_pisa_saldos(self):
+        """Test guardar un préstamo cargado antes de un pago no revierte sus saldos"""
+        vieja = Prestamo.objects.get(pk=self.prestamo.pk)
+        self.prestamo.cuotas.get(numero_cuota=1).registrar_pago()
+        vieja.notas = 'Editado'
+        vieja.save()
+        self.prestamo.refresh_from_db()
+        self.assertEqual(self.prestamo.notas, 'Editado')
+        self.assertEqual(self.prestamo.total_pagado, Decimal('3000'))
+        self.assertEqual(self.prestamo.saldo_pendiente, Decimal('9000'))
+        self.assertEqual(self.prestamo.cantidad_cuotas_pagadas, 1)
+        self.assertEqual(vieja.saldo_pendiente, Decimal('9000'))
+    
+    def test_saldos_liquidacion_y_renovacion(self):
+        """Test liquidar y renovar dejan al préstamo sin cuotas pendientes"""
+        cuota = self.prestamo.cuotas.get(numero_cuota=1)
+        cuota.registrar_pago(Decimal('1000'), accion_restante='ignorar')
+        Prestamo.renovar_prestamo(self.prestamo, Decimal('5000'), Decimal('20'), 4, 'SE')
+        self.prestamo.refresh_from_db()
+        self.assertEqual(self.prestamo.estado, 'RE')
+        self.assertEqual(self.prestamo.cantidad_cuotas_pagadas, 4)
+        self.assertIsNone(self.prestamo.fecha_proximo_vencimiento)
+        
+        nuevo = Prestamo.objects.get(prestamo_anterior=self.prestamo)
+        nuevo.liquidar_prestamo()
+        nuevo.refresh_from_db()
+        self.assertEqual(nuevo.estado, 'FI')
+        self.assertEqual(nuevo.cantidad_cuotas_pagadas, 4)
+        self.assertIsNone(nuevo.fecha_proximo_vencimiento)
+    
+    def test_comando_recompute_balances(self):
+        """Test el comando detecta y corrige saldos desactualizados"""
+        from django.core.management import call_command
+        from django.core.management.base import CommandError
+        from io import StringIO
+        
+        Cuota.objects.filter(prestamo=self.prestamo, numero_cuota=1).update(
+            estado='PA', monto_pagado=Decimal('3000')
+        )
+        with self.assertRaises(CommandError):
+            call_command('recompute_balances', '--verificar', stdout=StringIO())
+        
+        call_command('recompute_balances', stdout=StringIO())
+        self.prestamo.refresh_from_db()
+        self.assertEqual(self.prestamo.total_pagado, Decimal('3000'))
+        self.assertEqual(self.prestamo.saldo_pendiente, Decimal('9000'))
+        self.assertEqual(self.prestamo.cantidad_cuotas_pagadas, 1)
+        call_command('recompute_balances', '--verificar', stdout=StringIO())
+
+
+class PrestamoWithBalancesTest(TestCase):
+    """Tests del queryset Prestamo.objects.with_balances()"""
+    
+    def setUp(self):
+        self.cliente = Cliente.objects.create(
+            nombre='Anotado',
+            apellido='Test',
+            telefono='7171717171',
+            direccion='Dir Anotado Test'
+        )
+        for _ in range(3):
+            prestamo = Prestamo.objects.create(
+                cliente=self.cliente,
+                monto_solicitado=Decimal('10000'),
+                tasa_interes_porcentaje=Decimal('20'),
+                cuotas_pactadas=4,
+                frecuencia='SE',
+                fecha_inicio=date.today()
+            )
+            cuota = prestamo.cuotas.get(numero_cuota=1)
+            cuota.registrar_pago(cuota.monto_cuota)
+    
+    def test_anotaciones_coinciden_con_cuotas(self):
+        """Test las anotaciones calculan lo mismo que las cuotas"""
+        for prestamo in Prestamo.objects.with_balances():
+            self.assertEqual(prestamo.monto_pagado, Decimal('3000'))
+            self.assertEqual(prestamo.monto_pendiente, Decimal('9000'))
+            self.assertEqual(prestamo.cuotas_pagadas, 1)
+            esperada = prestamo.cuotas.get(numero_cuota=2)
+            self.assertEqual(prestamo.proxima_cuota.pk, esperada.pk)
+            self.assertEqual(prestamo.proxima_cuota.fecha_vencimiento, esperada.fecha_vencimiento)
+            self.assertEqual(prestamo.proxima_cuota.monto_cuota, esperada.monto_cuota)
+    
+    def test_listado_en_una_consulta(self):
+        """Test recorrer el listado no genera consultas por fila"""
+        with self.assertNumQueries(1):
+            for prestamo in Prestamo.objects.with_balances().select_related('cliente'):
+                prestamo.monto_pagado, prestamo.cuotas_pagadas, prestamo.progreso_porcentaje
+                prestamo.proxima_cuota.monto_restante
+                prestamo.cliente.nombre_completo
+
+
+class EvaluadorCreditoTest(TestCase):
+    """Tests del evaluador de crédito en lote"""
+    
+    def setUp(self):
+        from .models import ConfiguracionCredito
+        ConfiguracionCredito.objects.create(
+            categoria='NU', limite_maximo=Decimal('50000'),
+            porcentaje_sobre_deuda=Decimal('50'), dias_minimos_para_renovar=10
+        )
+        negocio = TipoNegocio.objects.create(nombre='Kiosco', limite_credito_sugerido=Decimal('40000'))
+        for i in range(5):
+            cliente = Cliente.objects.create(
+                nombre=f'Credito{i}',
+                apellido='Test',
+                telefono='7272727272',
+                direccion='Dir Crédito Test',
+                tipo_negocio=negocio if i % 2 else None,
+                limite_credito=Decimal('30000') if i == 0 else Decimal('0')
+            )
+            if i < 3:
+                Prestamo.objects.create(
+                    cliente=cliente,
+                    monto_solicitado=Decimal('10000'),
+                    tasa_interes_porcentaje=Decimal('20'),
+                    cuotas_pactadas=4,
+                    frecuencia='SE',
+                    fecha_inicio=date.today() - timedelta(days=3)
+                )
+    
+    def test_lote_coincide_con_cliente_individual(self):
+        """Test el cálculo en lote da lo mismo que el cálculo por cliente"""
+        from .credito import evaluar_clientes
+        resultado = evaluar_clientes(Cliente.objects.all())
+        self.assertEqual(len(resultado), 5)
+        for cliente in Cliente.objects.all():
+            self.assertEqual(resultado[cliente.pk], cliente.info_limite_credito)
+        primero = Cliente.objects.get(nombre='Credito0')
+        self.assertEqual(resultado[primero.pk]['maximo_prestable'], Decimal('6000'))
+        self.assertFalse(resultado[primero.pk]['puede_renovar'])
+        self.assertEqual(resultado[primero.pk]['dias_para_renovar'], 7)
+    
+    def test_cantidad_fija_de_consultas(self):
+        """Test clientes + préstamos activos + configuraciones = 3 consultas"""
+        from .credito import EvaluadorCredito
+        evaluador = EvaluadorCredito()
+        clientes = list(Cliente.objects.select_related('tipo_negocio'))
+        with self.assertNumQueries(3):
+            evaluador.evaluar_clientes(Cliente.objects.all())
+        with self.assertNumQueries(1):
+            evaluador.evaluar_clientes(clientes)
+            for cliente in clientes:
+                cliente.maximo_prestable, cliente.puede_renovar, cliente.deuda_total
+
+
+class ExplainQueriesTest(TestCase):
+    """Tests del comando explain_queries"""
+    
+    def test_detecta_recorridos_secuenciales(self):
+        """Test el análisis de planes marca solo tablas críticas sin índice"""
+        from .management.commands.explain_queries import tablas_recorridas
+        plan = '2 0 0 SCAN core_cuota\n5 0 0 SEARCH core_prestamo USING INDEX x (id=?)\n7 0 0 SCAN core_rutacobro'
+        self.assertEqual(tablas_recorridas(plan), ['core_cuota'])
+        self.assertEqual(tablas_recorridas('3 0 0 SCAN core_cuota USING INDEX cuota_estado_venc_idx'), [])
+    
+    def test_comando_explain(self):
+        """Test el comando recorre todas las consultas de las vistas"""
+        from django.core.management import call_command
+        from io import StringIO
+        
+        cobrador = User.objects.create_user(username='explain', password='x')
+        cliente = Cliente.objects.create(
+            nombre='Explain', apellido='Test', telefono='1', direccion='Dir', usuario=cobrador
+        )
+        Prestamo.objects.create(
+            cliente=cliente,
+            monto_solicitado=Decimal('10000'),
+            tasa_interes_porcentaje=Decimal('10'),
+            cuotas_pactadas=4,
+            frecuencia='SE',
+            fecha_inicio=date.today(),
+            cobrador=cobrador
+        )
+        salida = StringIO()
+        call_command('explain_queries', stdout=salida)
+        self.assertIn('cierre de caja: pagos del día', salida.getvalue())
+
+
+class ResumenDashboardTest(TestCase):
+    """Tests de las cifras del dashboard"""
+    
+    def setUp(self):
+        self.cobrador = User.objects.create_user(username='dashboard', password='x')
+        self.cliente = Cliente.objects.create(
+            nombre='Dashboard', apellido='Test', telefono='1', direccion='Dir', usuario=self.cobrador
+        )
+        self.prestamo = Prestamo.objects.create(
+            cliente=self.cliente,
+            monto_solicitado=Decimal('10000'),
+            tasa_interes_porcentaje=Decimal('20'),
+            cuotas_pactadas=4,
+            frecuencia='SE',
+            fecha_inicio=date.today() - timedelta(days=14),
+            cobrador=self.cobrador
+        )
+    
+    def test_cifras_en_una_consulta(self):
+        """Test las cifras de cuotas salen de una consulta (+2 COUNT)"""
+        from .estadisticas import calcular_resumen_dashboard
+        with self.assertNumQueries(3):
+            resumen = calcular_resumen_dashboard(self.cobrador)
+        self.assertEqual(resumen['cuotas_vencidas'], 1)
+        self.assertEqual(resumen['cuotas_pendientes_hoy'], 1)
+        self.assertEqual(resumen['total_por_cobrar'], Decimal('3000'))
+        self.assertEqual(resumen['total_cartera'], Decimal('12000'))
+        self.assertEqual(resumen['prestamos_activos'], 1)
+        self.assertEqual(resumen['clientes_activos'], 1)
+    
+    def test_pago_se_refleja(self):
+        """Test las cifras incluyen el pago de hoy y no cuentan cobros de otros días"""
+        from .estadisticas import calcular_resumen_dashboard
+        cuota = self.prestamo.cuotas.get(numero_cuota=1)
+        cuota.registrar_pago(cuota.monto_cuota, cobrador=self.cobrador)
+        anterior = self.prestamo.cuotas.get(numero_cuota=2)
+        anterior.registrar_pago(anterior.monto_cuota, cobrador=self.cobrador)
+        Cuota.objects.filter(pk=anterior.pk).update(fecha_pago_real=date.today() - timedelta(days=1))
+        
+        resumen = calcular_resumen_dashboard(self.cobrador)
+        self.assertEqual(resumen['cantidad_cobros_hoy'], 1)
+        self.assertEqual(resumen['total_cobrado_hoy'], Decimal('3000'))
+        self.assertEqual(resumen['cuotas_vencidas'], 0)
+        self.assertEqual(resumen['total_cartera'], Decimal('6000'))
+        self.assertEqual(calcular_resumen_dashboard()['cantidad_cobros_hoy'], 1)
+
+
+class ResumenCobroDiarioTest(TestCase):
+    """Tests de los totales de cobro por cobrador y día"""
+    
+    def setUp(self):
+        self.cobrador = User.objects.create_user(username='totales', password='x')
+        cliente = Cliente.objects.create(
+            nombre='Totales', apellido='Test', telefono='1', direccion='Dir', usuario=self.cobrador
+        )
+        self.prestamo = Prestamo.objects.create(
+            cliente=cliente,
+            monto_solicitado=Decimal('10000'),
+            tasa_interes_porcentaje=Decimal('20'),
+            cuotas_pactadas=4,
+            frecuencia='SE',
+            fecha_inicio=date.today(),
+            cobrador=self.cobrador
+        )
+    
+    def totales(self):
+        from .models import ResumenCobroDiario
+        return ResumenCobroDiario.totales_del_dia(date.today(), self.cobrador)
+    
+    def esperados(self):
+        from .models import ResumenCobroDiario
+        datos = ResumenCobroDiario.calcular_desde_cuotas(desde=date.today())
+        total, cantidad = datos.get((self.cobrador.pk, date.today()), (Decimal('0'), 0))
+        return {'total_cobrado_hoy': total, 'cantidad_cobros_hoy': cantidad}
+    
+    def test_pagos_parciales_y_anulacion(self):
+        """Test los totales siguen a las cuotas en pagos, completados y anulaciones"""
+        cuota1 = self.prestamo.cuotas.get(numero_cuota=1)
+        cuota2 = self.prestamo.cuotas.get(numero_cuota=2)
+        cuota1.registrar_pago(Decimal('1000'), cobrador=self.cobrador)
+        self.assertEqual(self.totales(), {'total_cobrado_hoy': Decimal('1000'), 'cantidad_cobros_hoy': 1})
+        cuota1.registrar_pago(Decimal('2000'), cobrador=self.cobrador)
+        cuota2.registrar_pago(cobrador=self.cobrador)
+        self.assertEqual(self.totales(), {'total_cobrado_hoy': Decimal('6000'), 'cantidad_cobros_hoy': 2})
+        cuota1.cancelar_pago()
+        self.assertEqual(self.totales(), {'total_cobrado_hoy': Decimal('3000'), 'cantidad_cobros_hoy': 1})
+        self.assertEqual(self.totales(), self.esperados())
+    
+    def test_liquidacion_y_renovacion(self):
+        """Test liquidar y renovar también actualizan los totales"""
+        cuota = self.prestamo.cuotas.get(numero_cuota=1)
+        cuota.registrar_pago(Decimal('500'), accion_restante='ignorar', cobrador=self.cobrador)
+        Prestamo.renovar_prestamo(self.prestamo, Decimal('5000'), Decimal('10'), 2, 'SE')
+        self.assertEqual(self.totales(), self.esperados())
+        nuevo = Prestamo.objects.get(prestamo_anterior=self.prestamo)
+        nuevo.liquidar_prestamo()
+        self.assertEqual(self.totales(), self.esperados())
+    
+    def test_comando_reconcile(self):
+        """Test el comando corrige totales desviados"""
+        from django.core.management import call_command
+        from django.core.management.base import CommandError
+        from io import StringIO
+        from .models import ResumenCobroDiario
+        
+        cuota = self.prestamo.cuotas.get(numero_cuota=1)
+        cuota.registrar_pago(cobrador=self.cobrador)
+        ResumenCobroDiario.objects.update(total_cobrado=Decimal('1'))
+        with self.assertRaises(CommandError):
+            call_command('reconcile_daily_totals', '--verificar', stdout=StringIO())
+        call_command('reconcile_daily_totals', stdout=StringIO())
+        self.assertEqual(self.totales(), {'total_cobrado_hoy': Decimal('3000'), 'cantidad_cobros_hoy': 1})
+    
+    def test_endpoint_lee_totales(self):
+        """Test cobrar_cuota devuelve los totales acumulados"""
+        import json
+        client = TestClient()
+        client.login(username='totales', password='x')
+        cuota = self.prestamo.cuotas.get(numero_cuota=1)
+        response = client.post(
+            reverse('core:cobrar_cuota', args=[cuota.pk]),
+            content_type='application/json',
+            data=json.dumps({'monto': 1500})
+        )
+        self.assertEqual(response.json()['estadisticas'], {'total_cobrado_hoy': 1500, 'cantidad_cobros_hoy': 1})
+
+
+class CierreDiarioTest(TestCase):
+    """Tests de los cierres de caja guardados por día y cobrador"""
+    
+    def setUp(self):
+        from .models import fecha_local_hoy
+        self.hoy = fecha_local_hoy()
+        self.ayer = self.hoy - timedelta(days=1)
+        self.cobrador = User.objects.create_user(username='cierres', password='x')
+        cliente = Cliente.objects.create(
+            nombre='Cierre', apellido='Test', telefono='1', direccion='Dir', usuario=self.cobrador
+        )
+        self.prestamo = Prestamo.objects.create(
+            cliente=cliente,
+            monto_solicitado=Decimal('10000'),
+            tasa_interes_porcentaje=Decimal('20'),
+            cuotas_pactadas=4,
+            frecuencia='SE',
+            fecha_inicio=self.hoy,
+            cobrador=self.cobrador
+        )
+        # Dos cobros de ayer (efectivo y transferencia) y uno de hoy
+        self.cuota1 = self.prestamo.cuotas.get(numero_cuota=1)
+        self.cuota1.registrar_pago(cobrador=self.cobrador)
+        self.cuota2 = self.prestamo.cuotas.get(numero_cuota=2)
+        self.cuota2.registrar_pago(Decimal('1000'), metodo_pago='TR', cobrador=self.cobrador)
+        Cuota.objects.filter(pk__in=[self.cuota1.pk, self.cuota2.pk]).update(fecha_pago_real=self.ayer)
+        self.prestamo.cuotas.get(numero_cuota=3).registrar_pago(cobrador=self.cobrador)
+    
+    def test_cierre_de_dia_terminado(self):
+        """Test el día terminado se cierra con totales por método; el día en curso no"""
+        from .models import CierreDiario
+        
+        self.assertIsNone(CierreDiario.obtener(self.hoy, self.cobrador))
+        cierre, = CierreDiario.obtener(self.ayer, self.cobrador)
+        self.assertEqual(cierre.cantidad_pagos, 2)
+        self.assertEqual(cierre.total_cobrado, Decimal('4000.00'))
+        self.assertEqual(cierre.total_efectivo, Decimal('3000.00'))
+        self.assertEqual(cierre.total_transferencia, Decimal('1000.00'))
+        self.assertEqual(len(cierre.filas), 2)
+        
+        self.client.login(username='cierres', password='x')
+        response = self.client.get(reverse('core:cierre_caja') + f'?fecha={self.ayer:%Y-%m-%d}')
+        self.assertEqual(response.context['total_cobrado'], Decimal('4000.00'))
+        self.assertEqual(response.context['cantidad_pagos'], 2)
+    
+    def test_vista_de_dia_cerrado_usa_el_cierre(self):
+        """Test la página de un día cerrado muestra las filas del cierre, no los pagos de ahora"""
+        from .exportacion import planilla_cierre
+        from .models import CierreDiario
+        
+        CierreDiario.cerrar(self.ayer)
+        # Los datos en vivo cambian sin invalidar el día: la página sigue al cierre
+        Cuota.objects.filter(pk=self.cuota2.pk).update(fecha_pago_real=self.hoy)
+        
+        self.client.login(username='cierres', password='x')
+        response = self.client.get(reverse('core:cierre_caja') + f'?fecha={self.ayer:%Y-%m-%d}')
+        pagos = response.context['pagos']
+        self.assertTrue(response.context['cierre_guardado'])
+        self.assertEqual(response.context['cantidad_pagos'], len(pagos))
+        self.assertEqual(sum(pago['monto_pagado'] for pago in pagos), response.context['total_cobrado'])
+        self.assertEqual(len(pagos), planilla_cierre(self.cobrador, self.ayer).cantidad)
+        parcial, = [pago for pago in pagos if pago['parcial']]
+        self.assertEqual((parcial['monto_pagado'], parcial['metodo']), (Decimal('1000'), 'Transferencia'))
+        self.assertContains(response, f'Préstamo #{self.prestamo.pk}')
+    
+    def test_exportar_desde_cierre_guardado(self):
+        """Test la planilla de un día cerrado sale del cierre con los mismos valores"""
+        from .exportacion import filas_cierre, filas_datos, planilla_cierre
+        from .models import CierreDiario
+        
+        pagos = Cuota.objects.filter(fecha_pago_real=self.ayer, estado__in=['PA', 'PC'])
+        calculadas = [
+            [numero, *valores] for numero, (_, valores, _) in enumerate(filas_cierre(pagos), start=1)
+        ]
+        CierreDiario.cerrar(self.ayer)
+        with self.assertNumQueries(1):
+            planilla = planilla_cierre(None, self.ayer)
+            guardadas = [fila.valores for fila in planilla.filas]
+        self.assertEqual(guardadas, calculadas)
+        self.assertEqual(planilla.cantidad, 2)
+        self.assertEqual(len(list(filas_datos(planilla_cierre(None, self.ayer), False))), 2)
+    
+    def test_cancelar_pago_invalida_el_dia(self):
+        """Test anular un cobro de un día cerrado rearma ese cierre"""
+        from .models import CierreDiario
+        
+        CierreDiario.cerrar(self.ayer)
+        self.cuota2.refresh_from_db()
+        self.cuota2.cancelar_pago()
+        self.assertFalse(CierreDiario.objects.filter(fecha=self.ayer).exists())
+        cierre, = CierreDiario.obtener(self.ayer, self.cobrador)
+        self.assertEqual(cierre.cantidad_pagos, 1)
+        self.assertEqual(cierre.total_transferencia, Decimal('0.00'))
+    
+    def test_completar_pago_parcial_invalida_su_dia(self):
+        """Test completar hoy un pago parcial de un día cerrado rearma ese cierre"""
+        from .models import CierreDiario
+        
+        CierreDiario.cerrar(self.ayer)
+        self.cuota2.refresh_from_db()
+        self.assertEqual(self.cuota2.estado, 'PC')
+        self.cuota2.registrar_pago(cobrador=self.cobrador)
+        self.cuota2.refresh_from_db()
+        self.assertEqual((self.cuota2.estado, self.cuota2.fecha_pago_real), ('PA', self.hoy))
+        
+        self.assertFalse(CierreDiario.objects.filter(fecha=self.ayer).exists())
+        cierre, = CierreDiario.obtener(self.ayer, self.cobrador)
+        self.assertEqual(cierre.cantidad_pagos, 1)
+        self.assertEqual(cierre.total_transferencia, Decimal('0.00'))
+    
+    def test_tarea_cierre_diario(self):
+        """Test la tarea cierra solo los días pendientes"""
+        from .models import CierreDiario
+        from .tareas import cierre_diario
+        
+        self.assertEqual(cierre_diario(), '1 días cerrados')
+        self.assertEqual(cierre_diario(), '0 días cerrados')
+        self.assertEqual(list(CierreDiario.objects.values_list('fecha', flat=True).distinct()), [self.ayer])
+    
+    def test_dia_sin_cobros_queda_cerrado(self):
+        """Test un día sin cobros guarda el cierre vacío y no se vuelve a armar al leerlo"""
+        from .models import CierreDiario
+        
+        antes = self.ayer - timedelta(days=1)
+        self.assertEqual(CierreDiario.obtener(antes, self.cobrador), [])
+        vacio = CierreDiario.objects.get(fecha=antes)
+        self.assertIsNone(vacio.cobrador)
+        self.assertEqual((vacio.cantidad_pagos, vacio.total_cobrado, vacio.filas), (0, Decimal('0.00'), []))
+        
+        with self.assertNumQueries(1):
+            self.assertEqual(CierreDiario.obtener(antes, self.cobrador), [])
+        with self.assertNumQueries(1):
+            self.assertEqual(CierreDiario.obtener(antes), [vacio])
+    
+    def test_cierre_simultaneo(self):
+        """Test si otro proceso cerró el día mientras se armaba, no choca con sus filas"""
+        from unittest import mock
+        from django.db.models.query import QuerySet
+        from .models import CierreDiario
+        
+        CierreDiario.cerrar(self.ayer)
+        # El otro proceso insertó después de que este borrara
+        with mock.patch.object(QuerySet, 'delete', return_value=(0, {})):
+            CierreDiario.cerrar(self.ayer)
+        cierre, = CierreDiario.obtener(self.ayer, self.cobrador)
+        self.assertEqual(cierre.total_cobrado, Decimal('4000.00'))
+        self.assertEqual(CierreDiario.objects.filter(fecha=self.ayer).count(), 2)
+
+
+class TareasProgramadasTest(TestCase):
+    """Tests del programador de tareas (core/tareas.py)"""
+    
+    def test_ejecuta_vencidas_y_reprograma(self):
+        """Test cada tarea corre una vez, guarda la duración y se reprograma con desfase"""
+        from . import tareas
+        from .models import TareaProgramada
+        
+        ejecutadas = tareas.ejecutar_pendientes('test:1')
+        self.assertEqual(sorted(t.nombre for t in ejecutadas), sorted(tareas.TAREAS))
+        self.assertEqual(tareas.ejecutar_pendientes('test:1'), [])
+        
+        mora = TareaProgramada.objects.get(nombre='mora')
+        self.assertEqual(mora.ejecuciones, 1)
+        self.assertEqual(mora.ultimo_error, '')
+        self.assertIsNotNone(mora.ultima_duracion)
+        self.assertEqual(mora.bloqueada_por, '')
+        espera = (mora.proxima_ejecucion - mora.ultima_ejecucion).total_seconds()
+        self.assertGreaterEqual(espera, 3600)
+        self.assertLessEqual(espera, 3600 * 1.1 + 60)
+        respaldo = TareaProgramada.objects.get(nombre='respaldo')
+        self.assertEqual(respaldo.ultimo_resultado, 'Respaldos automáticos desactivados')
+    
+    def test_bloqueo_exclusivo(self):
+        """Test una tarea tomada no la toma otro proceso hasta que vence el bloqueo"""
+        from .models import TareaProgramada
+        
+        TareaProgramada.objects.create(nombre='prueba')
+        self.assertTrue(TareaProgramada.tomar('prueba', 'a', timedelta(minutes=5)))
+        self.assertFalse(TareaProgramada.tomar('prueba', 'b', timedelta(minutes=5)))
+        self.assertFalse(TareaProgramada.tomar('prueba', 'b', timedelta(minutes=5), forzar=True))
+        
+        TareaProgramada.objects.update(bloqueada_hasta=timezone.now() - timedelta(seconds=1))
+        self.assertTrue(TareaProgramada.tomar('prueba', 'b', timedelta(minutes=5)))
+        self.assertEqual(TareaProgramada.objects.get().bloqueada_por, 'b')
+    
+    def test_fallo_registrado(self):
+        """Test un error queda registrado, suelta el bloqueo y no frena las demás"""
+        from unittest import mock
+        from . import tareas
+        
+        def fallar():
+            raise RuntimeError('sin conexión')
+        
+        with mock.patch.dict(tareas.TAREAS, {'mora': (fallar, 3600)}):
+            with self.assertLogs('core.tareas', level='ERROR'):
+                ejecutadas = {t.nombre: t for t in tareas.ejecutar_pendientes()}
+        self.assertEqual(len(ejecutadas), len(tareas.TAREAS))
+        self.assertIn('RuntimeError: sin conexión', ejecutadas['mora'].ultimo_error)
+        self.assertEqual(ejecutadas['mora'].fallos, 1)
+        self.assertIsNone(ejecutadas['mora'].bloqueada_hasta)
+        self.assertEqual(ejecutadas['notificaciones'].fallos, 0)
+    
+    def test_respaldo_manual_se_programa(self):
+        """Test pedir un respaldo desde la web lo deja para el programador"""
+        from .models import TareaProgramada
+        
+        User.objects.create_superuser(username='dev', password='testpass123')
+        client = TestClient()
+        client.login(username='dev', password='testpass123')
+        TareaProgramada.objects.create(
+            nombre='respaldo', proxima_ejecucion=timezone.now() + timedelta(days=1)
+        )
+        
+        # Sin diferir: en TestCase la transacción no se confirma y el
+        # registro no llegaría al buffer
+        with self.settings(AUDITORIA_DIFERIDA=False):
+            response = client.get(reverse('core:crear_respaldo'))
+        self.assertRedirects(response, reverse('core:respaldo_list'))
+        self.assertIsNone(TareaProgramada.objects.get(nombre='respaldo').proxima_ejecucion)
+        self.assertTrue(RegistroAuditoria.objects.filter(descripcion='Respaldo manual solicitado').exists())
+
+
+class RetencionTest(TestCase):
+    """Tests de la retención de notificaciones y el archivo de auditoría"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='retencion', password='x')
+    
+    def envejecer(self, queryset, campo, dias):
+        queryset.update(**{campo: timezone.now() - timedelta(days=dias)})
+    
+    def test_notificaciones_por_tipo(self):
+        """Test cada tipo se borra según sus días, con sus destinatarios, en lotes"""
+        from .retencion import purgar_notificaciones
+        
+        for tipo in ('CP', 'CP', 'CP', 'CV', 'IN'):
+            Notificacion.crear_notificacion(tipo, 'Vieja', 'Mensaje')
+        Notificacion.crear_notificacion('CP', 'Nueva', 'Mensaje')
+        self.envejecer(Notificacion.objects.filter(titulo='Vieja'), 'fecha_creacion', 5)
+        
+        with self.settings(NOTIFICACIONES_RETENCION_DIAS={'IN': 4}):
+            borradas = purgar_notificaciones(lote=2)
+        self.assertEqual(borradas['CP'], 3)
+        self.assertEqual(borradas['CV'], 0)
+        self.assertEqual(borradas['IN'], 1)
+        self.assertEqual(
+            sorted(Notificacion.objects.values_list('tipo', 'titulo')),
+            [('CP', 'Nueva'), ('CV', 'Vieja')]
+        )
+        self.assertEqual(DestinatarioNotificacion.objects.count(), 2)
+    
+    def test_archivo_auditoria_mensual(self):
+        """Test la auditoría vieja pasa a archivos comprimidos por mes y se borra"""
+        import os
+        import tempfile
+        from datetime import datetime
+        from .retencion import archivar_auditoria, leer_archivo_auditoria
+        
+        for mes in (1, 1, 1, 2):
+            RegistroAuditoria.objects.create(
+                usuario=self.user, tipo_accion='CR', tipo_modelo='CL', descripcion=f'Viejo {mes}',
+                ip_address='10.0.0.1', fecha_hora=timezone.make_aware(datetime(2020, mes, 15, 12))
+            )
+        RegistroAuditoria.objects.create(usuario=self.user, tipo_accion='CR', tipo_modelo='CL', descripcion='Reciente')
+        
+        with tempfile.TemporaryDirectory() as directorio:
+            archivados = archivar_auditoria(lote=2, directorio=directorio)
+            self.assertEqual(archivados, {'2020-01': 3, '2020-02': 1})
+            self.assertEqual(
+                sorted(os.listdir(directorio)),
+                ['auditoria_2020-01.jsonl.gz', 'auditoria_2020-02.jsonl.gz']
+            )
+            enero = leer_archivo_auditoria(os.path.join(directorio, 'auditoria_2020-01.jsonl.gz'))
+            self.assertEqual(len(enero), 3)
+            self.assertEqual(enero[0]['usuario__username'], 'retencion')
+            self.assertEqual(enero[0]['ip_address'], '10.0.0.1')
+            self.assertEqual(archivar_auditoria(directorio=directorio), {})
+        
+        self.assertEqual(list(RegistroAuditoria.objects.values_list('descripcion', flat=True)), ['Reciente'])
+
+
 class CategoriaClienteTest(TestCase):
     """Tests para lógica de categorías de cliente"""
     
@@ -829,3 +2680,88 @@ class IntegridadDatosTest(TestCase):
         
         cuotas_count_after = Cuota.objects.filter(prestamo=prestamo).count()
         self.assertEqual(cuotas_count_after, 0)
+
+
+class PagosConcurrentesTest(TransactionTestCase):
+    """Pagos simultáneos sobre el mismo préstamo (desde varios dispositivos)"""
+    
+    HILOS_PARCIALES = 6
+    
+    def setUp(self):
+        self.cobrador = User.objects.create_user(username='concurrente', password='x')
+        cliente = Cliente.objects.create(
+            nombre='Concurrente', apellido='Test', telefono='1', direccion='Dir', usuario=self.cobrador
+        )
+        self.prestamo = Prestamo.objects.create(
+            cliente=cliente,
+            monto_solicitado=Decimal('10000'),
+            tasa_interes_porcentaje=Decimal('20'),
+            cuotas_pactadas=4,
+            frecuencia='SE',
+            fecha_inicio=date.today(),
+            cobrador=self.cobrador
+        )
+    
+    def pagar_en_paralelo(self, pagos):
+        """
+        Ejecuta cada (cuota, monto) en su propio hilo. Las cuotas se cargan
+        antes de arrancar, así todos los hilos parten de datos viejos.
+        """
+        import threading
+        import time
+        from django.db import OperationalError, connection
+        
+        barrera = threading.Barrier(len(pagos))
+        errores = []
+        
+        def pagar(cuota, monto):
+            try:
+                barrera.wait()
+                for _ in range(200):
+                    try:
+                        cuota.registrar_pago(monto, cobrador=self.cobrador)
+                        return
+                    except OperationalError:
+                        # SQLite no bloquea filas: reintentar si la tabla está bloqueada
+                        time.sleep(0.01)
+                errores.append('reintentos agotados')
+            except Exception as e:  # pragma: no cover - se reporta en el assert
+                errores.append(repr(e))
+            finally:
+                connection.close()
+        
+        hilos = [threading.Thread(target=pagar, args=pago) for pago in pagos]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        self.assertEqual(errores, [])
+    
+    def test_pagos_simultaneos_no_pierden_montos(self):
+        """Test ningún pago se pierde y los saldos cierran con las cuotas"""
+        from .models import HistorialModificacionPago, ResumenCobroDiario
+        
+        cuotas = list(self.prestamo.cuotas.order_by('numero_cuota'))
+        parcial = cuotas[0].monto_cuota / self.HILOS_PARCIALES
+        pagos = [(Cuota.objects.get(pk=cuotas[0].pk), parcial) for _ in range(self.HILOS_PARCIALES)]
+        pagos += [(cuota, None) for cuota in cuotas[1:]]
+        self.pagar_en_paralelo(pagos)
+        
+        primera = Cuota.objects.get(pk=cuotas[0].pk)
+        self.assertEqual(primera.monto_pagado, primera.monto_cuota)
+        self.assertEqual(primera.estado, 'PA')
+        self.assertFalse(self.prestamo.cuotas.exclude(estado='PA').exists())
+        self.assertEqual(
+            HistorialModificacionPago.objects.filter(cuota__prestamo=self.prestamo).count(),
+            len(pagos)
+        )
+        
+        prestamo = Prestamo.objects.get(pk=self.prestamo.pk)
+        self.assertEqual(prestamo.estado, 'FI')
+        self.assertEqual(prestamo.total_pagado, prestamo.monto_total_a_pagar)
+        self.assertEqual(prestamo.saldo_pendiente, Decimal('0.00'))
+        self.assertEqual(prestamo.cantidad_cuotas_pagadas, 4)
+        self.assertEqual(
+            ResumenCobroDiario.totales_del_dia(date.today(), self.cobrador),
+            {'total_cobrado_hoy': prestamo.monto_total_a_pagar, 'cantidad_cobros_hoy': 4}
+        )
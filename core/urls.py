@@ -30,10 +30,13 @@ urlpatterns = [
     
     # Cobros (AJAX)
     path('api/cobrar/<int:pk>/', views.cobrar_cuota, name='cobrar_cuota'),
+    path('api/cobrar-lote/', views.cobrar_cuotas_lote, name='cobrar_cuotas_lote'),
+    path('api/cobros/sincronizar/', views.sincronizar_cobros, name='sincronizar_cobros'),
     path('api/anular-pago/<int:pk>/', views.anular_pago_cuota, name='anular_pago_cuota'),
     path('api/cuotas-hoy/', views.obtener_cuotas_hoy, name='cuotas_hoy'),
     path('api/cliente/<int:pk>/categoria/', views.cambiar_categoria_cliente, name='cambiar_categoria'),
     path('api/buscar-clientes/', views.buscar_clientes, name='buscar_clientes'),
+    path('api/cliente/<int:pk>/credito/', views.credito_cliente, name='credito_cliente'),
     
     # Reportes
     path('cierre-caja/', views.CierreCajaView.as_view(), name='cierre_caja'),
@@ -51,12 +54,15 @@ urlpatterns = [
     path('exportar/cierre/', views.exportar_cierre_excel, name='exportar_cierre_excel'),
     path('exportar/clientes/', views.exportar_clientes_excel, name='exportar_clientes_excel'),
     path('exportar/prestamos/', views.exportar_prestamos_excel, name='exportar_prestamos_excel'),
+    path('exportaciones/<int:pk>/descargar/', views.descargar_exportacion, name='descargar_exportacion'),
+    path('api/exportaciones/<int:pk>/', views.estado_exportacion, name='estado_exportacion'),
     
     # Notificaciones
     path('notificaciones/', views.NotificacionListView.as_view(), name='notificacion_list'),
     path('notificaciones/<int:pk>/leida/', views.marcar_notificacion_leida, name='notificacion_leida'),
     path('notificaciones/todas-leidas/', views.marcar_todas_leidas, name='notificaciones_todas_leidas'),
     path('api/notificaciones/', views.obtener_notificaciones, name='api_notificaciones'),
+    path('api/notificaciones/stream/', views.stream_notificaciones, name='stream_notificaciones'),
     path('api/generar-notificaciones/', views.generar_notificaciones, name='generar_notificaciones'),
     
     # Auditoría
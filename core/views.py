@@ -2,20 +2,37 @@
 Vistas del Sistema de Gestión de Préstamos
 """
 from django.shortcuts import render, redirect, get_object_or_404
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
 from django.views.generic import ListView, CreateView, UpdateView, DetailView, TemplateView
-from django.urls import reverse_lazy
+from django.urls import reverse, reverse_lazy
 from django.utils import timezone
-from django.db.models import Sum, Count, Q
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Sum, Count, Q, F
 from django.contrib import messages
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import logout
+from django.utils.cache import get_conditional_response
+from django.views.decorators.cache import cache_control
+from asgiref.sync import sync_to_async
 from decimal import Decimal
 import json
 
-from .models import Cliente, Prestamo, Cuota, ConfiguracionMora, HistorialModificacionPago
+from .models import (
+    Cliente, Prestamo, Cuota, ConfiguracionMora, HistorialModificacionPago, ResumenCobroDiario,
+    ClaveIdempotencia, CierreDiario
+)
 from .forms import ClienteForm, PrestamoForm, RenovacionPrestamoForm
+from .cambios import cuotas_hoy_desde, token_actual
+from .credito import EvaluadorCredito, datos_credito_cliente
+from .estadisticas import calcular_resumen_dashboard
+from .idempotencia import idempotente
+from .notificaciones import (
+    avisar_cambio_notificaciones, consultar, estado_notificaciones, flujo_notificaciones,
+    marca_notificaciones, no_leidas, resumen_notificaciones
+)
 
 
 def fecha_local_hoy():
@@ -50,73 +67,10 @@ class DashboardView(LoginRequiredMixin, TemplateView):
         context = super().get_context_data(**kwargs)
         hoy = fecha_local_hoy()
         
-        # Filtro base por usuario (admin ve todo)
-        cliente_filter = {}
-        if not es_usuario_admin(self.request.user):
-            cliente_filter['prestamo__cobrador'] = self.request.user
-        
-        # Estadísticas del día (incluye pagos completos y parciales)
-        cobros_realizados_hoy = Cuota.objects.filter(
-            fecha_pago_real=hoy,
-            estado__in=['PA', 'PC'],
-            **cliente_filter
-        ).aggregate(
-            total=Sum('monto_pagado'),
-            cantidad=Count('id')
-        )
-        
-        # Cuotas pendientes hoy
-        cuotas_pendientes_hoy = Cuota.objects.filter(
-            fecha_vencimiento=hoy,
-            estado__in=['PE', 'PC'],
-            prestamo__estado='AC',
-            **cliente_filter
-        ).count()
-        
-        # Cuotas vencidas total
-        cuotas_vencidas = Cuota.objects.filter(
-            fecha_vencimiento__lt=hoy,
-            estado__in=['PE', 'PC'],
-            prestamo__estado='AC',
-            **cliente_filter
-        ).count()
-        
-        # Total por cobrar hoy
-        total_por_cobrar = Cuota.objects.filter(
-            fecha_vencimiento=hoy,
-            estado__in=['PE', 'PC'],
-            prestamo__estado='AC',
-            **cliente_filter
-        ).aggregate(total=Sum('monto_cuota'))['total'] or Decimal('0.00')
-        
-        # Estadísticas generales (filtradas por usuario)
-        if not es_usuario_admin(self.request.user):
-            prestamos_activos = Prestamo.objects.filter(estado='AC', cobrador=self.request.user).count()
-            clientes_activos = Cliente.objects.filter(estado='AC', usuario=self.request.user).count()
-            total_cartera = Cuota.objects.filter(
-                estado__in=['PE', 'PC'],
-                prestamo__estado='AC',
-                prestamo__cobrador=self.request.user
-            ).aggregate(total=Sum('monto_cuota'))['total'] or Decimal('0.00')
-        else:
-            prestamos_activos = Prestamo.objects.filter(estado='AC').count()
-            clientes_activos = Cliente.objects.filter(estado='AC').count()
-            total_cartera = Cuota.objects.filter(
-                estado__in=['PE', 'PC'],
-                prestamo__estado='AC'
-            ).aggregate(total=Sum('monto_cuota'))['total'] or Decimal('0.00')
-        
-        context.update({
-            'total_cobrado_hoy': cobros_realizados_hoy['total'] or Decimal('0.00'),
-            'cantidad_cobros_hoy': cobros_realizados_hoy['cantidad'] or 0,
-            'cuotas_pendientes_hoy': cuotas_pendientes_hoy,
-            'cuotas_vencidas': cuotas_vencidas,
-            'total_por_cobrar': total_por_cobrar,
-            'prestamos_activos': prestamos_activos,
-            'clientes_activos': clientes_activos,
-            'total_cartera': total_cartera,
-            'fecha_hoy': hoy,
-        })
+        # Todas las cifras de cuotas salen de una consulta agregada
+        cobrador = None if es_usuario_admin(self.request.user) else self.request.user
+        context.update(calcular_resumen_dashboard(cobrador, hoy))
+        context['fecha_hoy'] = hoy
         return context
 
 
@@ -129,6 +83,8 @@ class CobrosView(LoginRequiredMixin, TemplateView):
         from datetime import timedelta
         from .models import RutaCobro, ConfiguracionMora
         hoy = fecha_local_hoy()
+        # Token para pedir después solo los cambios (se lee antes que las cuotas)
+        context['token_cuotas'] = token_actual(hoy)
         
         # Base queryset - filtrar por usuario si no es admin
         base_filter = {}
@@ -334,10 +290,11 @@ class ClienteDetailView(LoginRequiredMixin, DetailView):
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['prestamos'] = self.object.prestamos.select_related('cobrador').all()
+        EvaluadorCredito().evaluar_clientes([self.object])
+        context['prestamos'] = self.object.prestamos.select_related('cobrador').with_balances()
         context['prestamos_activos'] = self.object.prestamos.filter(
             estado='AC'
-        ).select_related('cobrador')
+        ).select_related('cobrador').with_balances()
         return context
 
 
@@ -361,7 +318,7 @@ class PrestamoListView(LoginRequiredMixin, ListView):
         if estado:
             queryset = queryset.filter(estado=estado)
         
-        return queryset.select_related('cliente', 'cliente__usuario', 'cobrador')
+        return queryset.select_related('cliente', 'cliente__usuario', 'cobrador').with_balances()
 
 
 class PrestamoCreateView(LoginRequiredMixin, CreateView):
@@ -395,19 +352,6 @@ class PrestamoCreateView(LoginRequiredMixin, CreateView):
             ).order_by('apellido', 'nombre')
         return form
     
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        # Pasar datos de clientes para mostrar límite de crédito
-        if not es_usuario_admin(self.request.user):
-            context['clientes'] = Cliente.objects.filter(
-                estado='AC', usuario=self.request.user
-            ).order_by('apellido', 'nombre')
-        else:
-            context['clientes'] = Cliente.objects.filter(
-                estado='AC'
-            ).order_by('apellido', 'nombre')
-        return context
-    
     def form_valid(self, form):
         # Asignar el cobrador actual al préstamo
         form.instance.cobrador = self.request.user
@@ -517,7 +461,22 @@ class RenovarPrestamoView(LoginRequiredMixin, TemplateView):
 
 # ============== VISTAS DE COBROS (AJAX) ==============
 
+# Pagos por request en cobrar_cuotas_lote (settings.COBRO_LOTE_MAXIMO)
+COBRO_LOTE_MAXIMO_DEFAULT = 200
+
+
+def totales_cobro_del_dia(usuario):
+    """Total cobrado hoy (sin decimales) y cantidad de cobros del usuario (admin: todos)"""
+    cobrador = None if es_usuario_admin(usuario) else usuario
+    totales = ResumenCobroDiario.totales_del_dia(fecha_local_hoy(), cobrador)
+    return {
+        'total_cobrado_hoy': int(totales['total_cobrado_hoy']),
+        'cantidad_cobros_hoy': totales['cantidad_cobros_hoy'],
+    }
+
+
 @login_required
+@idempotente('anular')
 def anular_pago_cuota(request, pk):
     """Anular/revertir un pago de cuota via AJAX"""
     if request.method == 'POST':
@@ -535,23 +494,17 @@ def anular_pago_cuota(request, pk):
                 }, status=400)
             
             cuota.cancelar_pago(usuario=request.user)
+            RegistroAuditoria.registrar(
+                usuario=request.user,
+                tipo_accion=RegistroAuditoria.TipoAccion.CAMBIO_ESTADO,
+                tipo_modelo=RegistroAuditoria.TipoModelo.CUOTA,
+                modelo_id=cuota.pk,
+                descripcion=f'Pago anulado de cuota #{cuota.pk}',
+                ip_address=get_client_ip(request)
+            )
             
-            # Recalcular estadísticas
-            hoy = fecha_local_hoy()
-            stats_filter = {
-                'fecha_pago_real': hoy,
-                'estado__in': ['PA', 'PC'],
-            }
-            if not es_usuario_admin(request.user):
-                stats_filter['prestamo__cobrador'] = request.user
-            
-            total_cobrado_hoy = Cuota.objects.filter(
-                **stats_filter
-            ).aggregate(total=Sum('monto_pagado'))['total'] or Decimal('0.00')
-            
-            cantidad_cobros_hoy = Cuota.objects.filter(
-                **stats_filter
-            ).count()
+            # Estadísticas del día (totales acumulados, sin recorrer cuotas)
+            estadisticas = totales_cobro_del_dia(request.user)
             
             return JsonResponse({
                 'success': True,
@@ -568,10 +521,7 @@ def anular_pago_cuota(request, pk):
                     'progreso': cuota.prestamo.progreso_porcentaje,
                     'estado': cuota.prestamo.estado,
                 },
-                'estadisticas': {
-                    'total_cobrado_hoy': int(total_cobrado_hoy),
-                    'cantidad_cobros_hoy': cantidad_cobros_hoy,
-                }
+                'estadisticas': estadisticas
             })
         except Exception as e:
             return JsonResponse({
@@ -582,7 +532,113 @@ def anular_pago_cuota(request, pk):
     return JsonResponse({'success': False, 'message': 'Método no permitido'}, status=405)
 
 
+def datos_pago(data, cuota):
+    """
+    Argumentos de Cuota.registrar_pago a partir del JSON de un pago.
+    Si los datos no se pueden interpretar se cobra el total en efectivo.
+    """
+    try:
+        accion_restante = data.get('accion_restante', 'ignorar')  # 'ignorar', 'proxima', 'especial'
+        fecha_especial_str = data.get('fecha_especial', None)
+        
+        # Convertir fecha especial si existe
+        fecha_especial = None
+        if fecha_especial_str and accion_restante == 'especial':
+            from datetime import datetime
+            fecha_especial = datetime.strptime(fecha_especial_str, '%Y-%m-%d').date()
+        
+        return {
+            'monto': Decimal(str(data.get('monto', cuota.monto_restante))),
+            'accion_restante': accion_restante,
+            'fecha_especial': fecha_especial,
+            # Método de pago
+            'metodo_pago': data.get('metodo_pago', 'EF'),  # 'EF', 'TR', 'MX'
+            'monto_efectivo': data.get('monto_efectivo'),
+            'monto_transferencia': data.get('monto_transferencia'),
+            'referencia_transferencia': data.get('referencia_transferencia'),
+            # Interés por mora
+            'interes_mora': data.get('interes_mora', 0),
+        }
+    except ValueError:
+        return {
+            'monto': None,
+            'accion_restante': 'ignorar',
+            'fecha_especial': None,
+            'metodo_pago': 'EF',
+            'monto_efectivo': None,
+            'monto_transferencia': None,
+            'referencia_transferencia': None,
+            'interes_mora': 0,
+        }
+
+
+def aplicar_pago(cuota, data, usuario):
+    """
+    Registra un pago (JSON de cobrar_cuota) en la cuota y devuelve el mensaje
+    y el estado resultante de la cuota y su préstamo.
+    """
+    pago = datos_pago(data, cuota)
+    monto = pago['monto']
+    accion_restante = pago['accion_restante']
+    metodo_pago = pago['metodo_pago']
+    
+    # Calcular restante antes del pago
+    monto_restante_antes = float(cuota.monto_restante)
+    monto_que_quedara = max(0, monto_restante_antes - float(monto or cuota.monto_restante))
+    
+    cuota.registrar_pago(cobrador=usuario, **pago)
+    
+    # Mensaje según la acción
+    if accion_restante == 'proxima' and monto_que_quedara > 0:
+        mensaje = f'Pago registrado. ${monto_que_quedara:.2f} sumado a la próxima cuota.'
+    elif accion_restante == 'especial' and monto_que_quedara > 0:
+        mensaje = f'Pago registrado. Cuota especial creada por ${monto_que_quedara:.2f}.'
+    else:
+        mensaje = 'Pago registrado exitosamente'
+    
+    # Agregar info de método de pago al mensaje
+    if metodo_pago == 'TR':
+        mensaje += ' (Transferencia)'
+    elif metodo_pago == 'MX':
+        mensaje += ' (Mixto)'
+    
+    return {
+        'message': mensaje,
+        'cuota': {
+            'id': cuota.pk,
+            'estado': cuota.estado,
+            'estado_display': cuota.get_estado_display(),
+            'monto_pagado': float(cuota.monto_pagado),
+            'monto_restante': float(cuota.monto_restante),
+            'metodo_pago': cuota.metodo_pago,
+            'interes_mora_cobrado': float(cuota.interes_mora_cobrado),
+        },
+        'prestamo': {
+            'progreso': cuota.prestamo.progreso_porcentaje,
+            'estado': cuota.prestamo.estado,
+        },
+    }
+
+
+def auditar_cobro(request, resultado):
+    """
+    Auditoría de un pago ya confirmado. Se escribe en lote al terminar el
+    request (ver core/auditoria.py), así que no agrega una escritura por cobro.
+    """
+    cuota = resultado['cuota']
+    RegistroAuditoria.registrar(
+        usuario=request.user,
+        tipo_accion=RegistroAuditoria.TipoAccion.COBRO,
+        tipo_modelo=RegistroAuditoria.TipoModelo.CUOTA,
+        modelo_id=cuota['id'],
+        descripcion=f"Cobro de cuota #{cuota['id']}: {resultado['message']}",
+        datos_nuevos=json.dumps(cuota),
+        ip_address=get_client_ip(request)
+    )
+
+
 @login_required
+@idempotente('cobrar')
 def cobrar_cuota(request, pk):
     """Registrar pago de cuota via AJAX"""
     if request.method == 'POST':
@@ -593,102 +649,19 @@ def cobrar_cuota(request, pk):
             # Obtener datos del body
             try:
                 data = json.loads(request.body)
-                monto = Decimal(str(data.get('monto', cuota.monto_restante)))
-                accion_restante = data.get('accion_restante', 'ignorar')  # 'ignorar', 'proxima', 'especial'
-                fecha_especial_str = data.get('fecha_especial', None)
-                
-                # Nuevos campos de método de pago
-                metodo_pago = data.get('metodo_pago', 'EF')  # 'EF', 'TR', 'MX'
-                monto_efectivo = data.get('monto_efectivo')
-                monto_transferencia = data.get('monto_transferencia')
-                referencia_transferencia = data.get('referencia_transferencia')
-                
-                # Interés por mora
-                interes_mora = data.get('interes_mora', 0)
-                
-                # Convertir fecha especial si existe
-                fecha_especial = None
-                if fecha_especial_str and accion_restante == 'especial':
-                    from datetime import datetime
-                    fecha_especial = datetime.strptime(fecha_especial_str, '%Y-%m-%d').date()
-                    
-            except (json.JSONDecodeError, ValueError):
-                monto = None
-                accion_restante = 'ignorar'
-                fecha_especial = None
-                metodo_pago = 'EF'
-                monto_efectivo = None
-                monto_transferencia = None
-                referencia_transferencia = None
-                interes_mora = 0
-            
-            # Calcular restante antes del pago
-            monto_restante_antes = float(cuota.monto_restante)
-            monto_que_quedara = max(0, monto_restante_antes - float(monto or cuota.monto_restante))
-            
-            cuota.registrar_pago(
-                monto=monto, 
-                accion_restante=accion_restante, 
-                fecha_especial=fecha_especial,
-                metodo_pago=metodo_pago,
-                monto_efectivo=monto_efectivo,
-                monto_transferencia=monto_transferencia,
-                referencia_transferencia=referencia_transferencia,
-                interes_mora=interes_mora,
-                cobrador=request.user
-            )
+            except json.JSONDecodeError:
+                data = {}
             
-            # Mensaje según la acción
-            if accion_restante == 'proxima' and monto_que_quedara > 0:
-                mensaje = f'Pago registrado. ${monto_que_quedara:.2f} sumado a la próxima cuota.'
-            elif accion_restante == 'especial' and monto_que_quedara > 0:
-                mensaje = f'Pago registrado. Cuota especial creada por ${monto_que_quedara:.2f}.'
-            else:
-                mensaje = 'Pago registrado exitosamente'
+            resultado = aplicar_pago(cuota, data, request.user)
+            auditar_cobro(request, resultado)
             
-            # Agregar info de método de pago al mensaje
-            if metodo_pago == 'TR':
-                mensaje += ' (Transferencia)'
-            elif metodo_pago == 'MX':
-                mensaje += ' (Mixto)'
-            
-            # Calcular total cobrado hoy (incluye pagos parciales)
-            hoy = fecha_local_hoy()
-            stats_filter = {
-                'fecha_pago_real': hoy,
-                'estado__in': ['PA', 'PC'],
-            }
-            if not es_usuario_admin(request.user):
-                stats_filter['prestamo__cobrador'] = request.user
-            
-            total_cobrado_hoy = Cuota.objects.filter(
-                **stats_filter
-            ).aggregate(total=Sum('monto_pagado'))['total'] or Decimal('0.00')
-            
-            cantidad_cobros_hoy = Cuota.objects.filter(
-                **stats_filter
-            ).count()
+            # Total cobrado hoy (incluye pagos parciales), leído de los totales acumulados
+            estadisticas = totales_cobro_del_dia(request.user)
             
             return JsonResponse({
                 'success': True,
-                'message': mensaje,
-                'cuota': {
-                    'id': cuota.pk,
-                    'estado': cuota.estado,
-                    'estado_display': cuota.get_estado_display(),
-                    'monto_pagado': float(cuota.monto_pagado),
-                    'monto_restante': float(cuota.monto_restante),
-                    'metodo_pago': cuota.metodo_pago,
-                    'interes_mora_cobrado': float(cuota.interes_mora_cobrado),
-                },
-                'prestamo': {
-                    'progreso': cuota.prestamo.progreso_porcentaje,
-                    'estado': cuota.prestamo.estado,
-                },
-                'estadisticas': {
-                    'total_cobrado_hoy': int(total_cobrado_hoy),  # Sin decimales
-                    'cantidad_cobros_hoy': cantidad_cobros_hoy,
-                }
+                **resultado,
+                'estadisticas': estadisticas
             })
         except Exception as e:
             return JsonResponse({
@@ -700,32 +673,192 @@ def cobrar_cuota(request, pk):
 
 
 @login_required
-def obtener_cuotas_hoy(request):
-    """Obtener cuotas del día via AJAX (para actualización en tiempo real)"""
-    hoy = fecha_local_hoy()
+def cobrar_cuotas_lote(request):
+    """
+    Registrar varios pagos en un solo request (por ejemplo, toda la ruta).
+    Body: {"pagos": [{"cuota_id": 1, "monto": 1000, "metodo_pago": "EF",
+    "accion_restante": "ignorar"}, ...]} con los mismos campos que cobrar_cuota.
+    
+    Los pagos se aplican en orden dentro de una transacción. Cada uno tiene su
+    propio savepoint: si falla se revierte solo ese pago y se informa en su
+    resultado. Las estadísticas del día se devuelven una sola vez al final.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'message': 'Método no permitido'}, status=405)
     
-    cuotas_qs = Cuota.objects.filter(
-        fecha_vencimiento=hoy,
-        estado__in=['PE', 'PC'],
-        prestamo__estado='AC'
-    )
-    # Filtrar por usuario (admin ve todo)
-    if not es_usuario_admin(request.user):
-        cuotas_qs = cuotas_qs.filter(prestamo__cobrador=request.user)
-    
-    cuotas = cuotas_qs.select_related('prestamo', 'prestamo__cliente', 'prestamo__cliente__usuario', 'prestamo__cobrador').values(
-        'id', 'numero_cuota', 'monto_cuota', 'estado',
-        'prestamo__id', 'prestamo__cuotas_pactadas',
-        'prestamo__cliente__nombre', 'prestamo__cliente__apellido',
-        'prestamo__cobrador__username', 'prestamo__cobrador__first_name',
-        'prestamo__cobrador__last_name'
-    )
+    try:
+        pagos = json.loads(request.body).get('pagos')
+    except (json.JSONDecodeError, AttributeError):
+        pagos = None
+    if not isinstance(pagos, list) or not pagos:
+        return JsonResponse({'success': False, 'message': 'Debe enviar una lista de pagos.'}, status=400)
+    
+    maximo = getattr(settings, 'COBRO_LOTE_MAXIMO', COBRO_LOTE_MAXIMO_DEFAULT)
+    if len(pagos) > maximo:
+        return JsonResponse({
+            'success': False,
+            'message': f'Se pueden enviar hasta {maximo} pagos por lote.'
+        }, status=400)
+    
+    def cuota_id_de(pago):
+        try:
+            return int(pago.get('cuota_id'))
+        except (AttributeError, TypeError, ValueError):
+            return None
     
+    # Todas las cuotas del lote en una consulta (solo las del cobrador)
+    cuotas = Cuota.objects.filter(
+        pk__in=[cuota_id for cuota_id in map(cuota_id_de, pagos) if cuota_id is not None],
+        prestamo__cobrador=request.user
+    ).select_related('prestamo')
+    cuotas = {cuota.pk: cuota for cuota in cuotas}
+    
+    resultados = []
+    with transaction.atomic():
+        for pago in pagos:
+            cuota_id = cuota_id_de(pago)
+            cuota = cuotas.get(cuota_id)
+            if cuota is None:
+                resultados.append({'cuota_id': cuota_id, 'success': False, 'message': 'Cuota no encontrada.'})
+                continue
+            try:
+                with transaction.atomic():
+                    if cuota.estado == 'PA':
+                        raise ValueError('La cuota ya está pagada.')
+                    resultado = aplicar_pago(cuota, pago, request.user)
+                resultados.append({'cuota_id': cuota_id, 'success': True, **resultado})
+            except Exception as e:
+                resultados.append({'cuota_id': cuota_id, 'success': False, 'message': str(e)})
+    
+    registrados = sum(1 for resultado in resultados if resultado['success'])
+    for resultado in resultados:
+        if resultado['success']:
+            auditar_cobro(request, resultado)
     return JsonResponse({
-        'cuotas': list(cuotas)
+        'success': registrados == len(resultados),
+        'message': f'{registrados} de {len(resultados)} pagos registrados.',
+        'resultados': resultados,
+        'estadisticas': totales_cobro_del_dia(request.user)
     })
 
 
+def conflicto_sincronizacion(cuota, pago):
+    """
+    Motivo por el que un cobro encolado sin conexión ya no se puede aplicar
+    tal como se registró en el dispositivo, o None si no hay conflicto.
+    """
+    if cuota.prestamo.estado != 'AC':
+        return 'El préstamo ya no está activo.'
+    if cuota.estado == 'PA':
+        return 'La cuota ya fue cobrada.'
+    visto = pago.get('monto_restante_visto')
+    if visto is not None and Decimal(str(visto)) != cuota.monto_restante:
+        return f'La cuota cambió: el restante actual es ${cuota.monto_restante:,.0f}.'
+    return None
+
+
+@login_required
+def sincronizar_cobros(request):
+    """
+    Recibe los cobros que la app guardó sin conexión (cola en IndexedDB).
+    Body: {"pagos": [{"clave": "<uuid>", "cuota_id": 1, "monto_restante_visto": 3000,
+    ...mismos campos que cobrar_cuota}]}, en el orden en que se registraron.
+    
+    Cada clave se aplica una sola vez; si vuelve a llegar para la misma cuota
+    se devuelve el resultado guardado con 'duplicado': true. El estado de cada
+    resultado es:
+    - 'aplicado': el pago se registró con Cuota.registrar_pago
+    - 'conflicto': no se aplicó porque la cuota cambió desde que se encoló
+      (ya cobrada, otro restante, préstamo no activo o cuota ajena) o porque
+      la clave ya se usó en otra operación
+    - 'error': falló al aplicarse; no se guarda y se puede reintentar con la misma clave
+    """
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'message': 'Método no permitido'}, status=405)
+    
+    try:
+        pagos = json.loads(request.body).get('pagos')
+    except (json.JSONDecodeError, AttributeError):
+        pagos = None
+    if not isinstance(pagos, list) or not all(isinstance(pago, dict) for pago in pagos):
+        return JsonResponse({'success': False, 'message': 'Debe enviar una lista de pagos.'}, status=400)
+    
+    maximo = getattr(settings, 'COBRO_LOTE_MAXIMO', COBRO_LOTE_MAXIMO_DEFAULT)
+    if len(pagos) > maximo:
+        return JsonResponse({
+            'success': False,
+            'message': f'Se pueden enviar hasta {maximo} pagos por lote.'
+        }, status=400)
+    
+    cuotas = Cuota.objects.filter(
+        pk__in=[pago.get('cuota_id') for pago in pagos if str(pago.get('cuota_id', '')).isdigit()],
+        prestamo__cobrador=request.user
+    ).select_related('prestamo')
+    cuotas = {cuota.pk: cuota for cuota in cuotas}
+    
+    resultados = []
+    for pago in pagos:
+        clave = str(pago.get('clave') or '')
+        cuota_id = pago.get('cuota_id')
+        if not clave or len(clave) > 64:
+            resultados.append({'clave': clave, 'cuota_id': cuota_id, 'estado': 'error',
+                               'message': 'Clave de pago inválida.'})
+            continue
+        try:
+            with transaction.atomic():
+                # La operación incluye la cuota, como en @idempotente: una clave usada
+                # en otra cuota (o en cobrar_cuota) no devuelve una respuesta ajena
+                operacion = f'sincronizar:{cuota_id}'
+                registro, creada = ClaveIdempotencia.reservar(request.user, clave, operacion)
+                if not creada:
+                    if registro.operacion != operacion:
+                        resultados.append({'clave': clave, 'cuota_id': cuota_id, 'estado': 'conflicto',
+                                           'message': 'La clave de pago ya se usó en otra operación.'})
+                    else:
+                        resultados.append({**registro.respuesta, 'duplicado': True})
+                    continue
+                
+                cuota = cuotas.get(int(cuota_id)) if str(cuota_id).isdigit() else None
+                if cuota is not None:
+                    cuota.bloquear_para_pago()
+                motivo = 'Cuota no encontrada.' if cuota is None else conflicto_sincronizacion(cuota, pago)
+                if motivo:
+                    resultado = {'clave': clave, 'cuota_id': cuota_id, 'estado': 'conflicto', 'message': motivo}
+                    if cuota is not None:
+                        resultado['cuota'] = {
+                            'id': cuota.pk,
+                            'estado': cuota.estado,
+                            'monto_restante': float(cuota.monto_restante),
+                        }
+                else:
+                    resultado = {'clave': clave, 'cuota_id': cuota_id, 'estado': 'aplicado',
+                                 **aplicar_pago(cuota, pago, request.user)}
+                registro.guardar_respuesta(resultado)
+            resultados.append(resultado)
+            if resultado['estado'] == 'aplicado':
+                auditar_cobro(request, resultado)
+        except Exception as e:
+            resultados.append({'clave': clave, 'cuota_id': cuota_id, 'estado': 'error', 'message': str(e)})
+    
+    return JsonResponse({
+        'success': True,
+        'resultados': resultados,
+        'estadisticas': totales_cobro_del_dia(request.user)
+    })
+
+
+@login_required
+def obtener_cuotas_hoy(request):
+    """
+    Obtener cuotas del día via AJAX (para actualización en tiempo real).
+    Con ?desde=<token> devuelve solo las cuotas de los préstamos que cambiaron
+    desde ese token (ver core/cambios.py); la respuesta trae el token siguiente.
+    """
+    # Filtrar por usuario (admin ve todo)
+    cobrador = None if es_usuario_admin(request.user) else request.user
+    return JsonResponse(cuotas_hoy_desde(request.GET.get('desde'), cobrador))
+
+
 @login_required
 def cambiar_categoria_cliente(request, pk):
     """Cambiar categoría del cliente via AJAX"""
@@ -799,12 +932,28 @@ def buscar_clientes(request):
     return JsonResponse({'results': results})
 
 
+@login_required
+def credito_cliente(request, pk):
+    """Límites de crédito de un cliente para el formulario de préstamo (AJAX)"""
+    queryset = Cliente.objects.select_related('tipo_negocio')
+    if not es_usuario_admin(request.user):
+        queryset = queryset.filter(usuario=request.user)
+    cliente = get_object_or_404(queryset, pk=pk)
+    return JsonResponse({'success': True, 'cliente': datos_credito_cliente(cliente)})
+
+
 # ============== VISTAS DE REPORTES ==============
 
 class CierreCajaView(LoginRequiredMixin, TemplateView):
     """Vista de cierre de caja del día"""
     template_name = 'core/cierre_caja.html'
     
+    def get(self, request, *args, **kwargs):
+        # Con ?format=csv|jsonl|parquet|xlsx devuelve el cierre como archivo
+        if request.GET.get('format'):
+            return exportar_cierre_excel(request)
+        return super().get(request, *args, **kwargs)
+    
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         
@@ -816,28 +965,36 @@ class CierreCajaView(LoginRequiredMixin, TemplateView):
         else:
             fecha = fecha_local_hoy()
         
+        # Filtrar por usuario (admin ve todo)
+        cobrador = None if es_usuario_admin(self.request.user) else self.request.user
+        context['fecha'] = fecha
+        
+        # Día terminado: totales y pagos salen del cierre guardado, las
+        # mismas filas que la exportación
+        cierres = CierreDiario.obtener(fecha, cobrador)
+        if cierres is not None:
+            context.update({
+                'cierre_guardado': True,
+                'pagos': [pago_guardado(valores, resaltado) for valores, resaltado in filas_guardadas(cierres)],
+                'total_cobrado': sum((cierre.total_cobrado for cierre in cierres), Decimal('0.00')),
+                'cantidad_pagos': sum(cierre.cantidad_pagos for cierre in cierres),
+            })
+            return context
+        
         # Pagos del día (incluye pagos completos y parciales)
         pagos_del_dia = Cuota.objects.filter(
             fecha_pago_real=fecha,
             estado__in=['PA', 'PC']
         )
-        # Filtrar por usuario (admin ve todo)
-        if not es_usuario_admin(self.request.user):
-            pagos_del_dia = pagos_del_dia.filter(prestamo__cobrador=self.request.user)
+        if cobrador is not None:
+            pagos_del_dia = pagos_del_dia.filter(prestamo__cobrador=cobrador)
         pagos_del_dia = pagos_del_dia.select_related('prestamo', 'prestamo__cliente', 'cobrado_por').order_by(
             'prestamo__cliente__apellido'
         )
-        
-        # Total cobrado
-        total_cobrado = pagos_del_dia.aggregate(
-            total=Sum('monto_pagado')
-        )['total'] or Decimal('0.00')
-        
+        totales = pagos_del_dia.aggregate(total=Sum('monto_pagado'), cantidad=Count('id'))
         context.update({
-            'fecha': fecha,
-            'pagos': pagos_del_dia,
-            'total_cobrado': total_cobrado,
-            'cantidad_pagos': pagos_del_dia.count(),
+            'total_cobrado': totales['total'] or Decimal('0.00'),
+            'cantidad_pagos': totales['cantidad'],
         })
         
         # Anotar historial de modificaciones en cada pago
@@ -859,6 +1016,24 @@ class CierreCajaView(LoginRequiredMixin, TemplateView):
         return context
 
 
+def pago_guardado(valores, resaltado):
+    """Un pago de un cierre guardado (columnas de exportacion.filas_cierre) para la plantilla"""
+    (prestamo, cliente, _, _, cuota, _, cobrado, metodo, _, _, estado, _, _,
+     fecha_fin, cobrador, _, _, observaciones) = valores
+    return {
+        'prestamo': prestamo,
+        'cliente': cliente,
+        'cuota': cuota,
+        'monto_pagado': cobrado,
+        'metodo': metodo,
+        'parcial': estado == Cuota.Estado.PARCIAL.label,
+        'cobrador': cobrador if cobrador != '-' else '',
+        'fecha_fin': fecha_fin if fecha_fin != '-' else '',
+        'modificada': bool(resaltado),
+        'observaciones': observaciones if observaciones != '-' else '',
+    }
+
+
 class PlanillaImpresionView(LoginRequiredMixin, TemplateView):
     """Vista optimizada para impresión con cuotas pendientes del día"""
     template_name = 'core/planilla_impresion.html'
@@ -1092,7 +1267,9 @@ class ReporteGeneralView(LoginRequiredMixin, TemplateView):
         context['prestamos_activos'] = prestamos_qs.count()
         
         # Capital en la calle (monto pendiente de todos los préstamos activos)
-        capital_calle = sum(p.monto_pendiente for p in prestamos_qs)
+        capital_calle = prestamos_qs.with_balances().aggregate(
+            total=Sum(F('monto_total_a_pagar') - F('monto_pagado_anotado'))
+        )['total'] or Decimal('0.00')
         context['capital_en_calle'] = capital_calle
         
         # Cuotas vencidas
@@ -1296,615 +1473,206 @@ def toggle_usuario_activo(request, pk):
 # ==================== EXPORTACIÓN EXCEL ====================
 
 from django.http import HttpResponse
-from .models import RegistroAuditoria, Notificacion, ConfiguracionRespaldo
+from .models import (
+    RegistroAuditoria, Notificacion, DestinatarioNotificacion, ConfiguracionRespaldo, TareaProgramada
+)
+from .models import TrabajoExportacion
+from .exportacion import (
+    exportar_en_segundo_plano, filas_guardadas, openpyxl_disponible, planilla_cierre, planilla_clientes,
+    planilla_cobros, planilla_prestamos, pyarrow_disponible, respuesta_archivo, respuesta_datos,
+    respuesta_xlsx, solicitar_exportacion, FORMATOS, TIPO_XLSX
+)
 import io
 import os
 from datetime import datetime
 
 
-@login_required
-def exportar_planilla_excel(request):
-    """Exportar planilla de cobros a Excel"""
-    try:
-        import openpyxl
-        from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
-        from openpyxl.utils import get_column_letter
-    except ImportError:
-        messages.error(request, 'La exportación a Excel no está disponible. Instale openpyxl.')
-        return redirect('core:planilla_impresion')
-    
-    # Obtener fecha del filtro
+def fecha_de_request(request):
+    """Fecha del parámetro ?fecha=AAAA-MM-DD, o la de hoy"""
     fecha_str = request.GET.get('fecha')
     if fecha_str:
-        fecha = datetime.strptime(fecha_str, '%Y-%m-%d').date()
-    else:
-        fecha = fecha_local_hoy()
-    
-    # Obtener ruta de filtro
-    ruta_id = request.GET.get('ruta')
-    incluir_vencidas = request.GET.get('incluir_vencidas', '1').lower() in ('true', '1', 'si')
-    
-    # Obtener cuotas pendientes
-    cuotas = Cuota.objects.filter(
-        prestamo__estado='AC',
-        estado__in=['PE', 'PC']
+        return datetime.strptime(fecha_str, '%Y-%m-%d').date()
+    return fecha_local_hoy()
+
+
+def formato_exportacion(request):
+    """
+    Formato pedido con ?format=xlsx|csv|jsonl|parquet (xlsx por defecto) y el
+    mensaje de error si no se puede exportar en ese formato.
+    """
+    formato = (request.GET.get('format') or 'xlsx').lower()
+    if formato not in FORMATOS:
+        return formato, f'Formato de exportación desconocido: {formato}. Use {", ".join(FORMATOS)}.'
+    if formato == 'xlsx' and not openpyxl_disponible():
+        return formato, 'La exportación a Excel no está disponible. Instale openpyxl.'
+    if formato == 'parquet' and not pyarrow_disponible():
+        return formato, 'La exportación a Parquet no está disponible. Instale pyarrow.'
+    return formato, None
+
+
+def responder_exportacion(request, planilla, formato, tipo, parametros, volver):
+    """
+    CSV, JSON Lines y Parquet van siempre en la respuesta (con ?ars=1 los
+    montos de CSV y JSON Lines salen en formato ARS). El Excel va en la
+    respuesta si es chico; si no (o con ?segundo_plano=1) se encola y se
+    vuelve a `volver` avisando que llega una notificación.
+    """
+    asincrono = isinstance(request, ASGIRequest)
+    if formato != 'xlsx':
+        formateado = request.GET.get('ars', '').lower() in ('true', '1', 'si')
+        return respuesta_datos(planilla, formato, formateado, asincrono)
+    
+    pedido = request.GET.get('segundo_plano', '').lower() in ('true', '1', 'si')
+    if not exportar_en_segundo_plano(planilla, pedido):
+        return respuesta_xlsx(planilla, asincrono)
+    
+    trabajo, reutilizado = solicitar_exportacion(
+        request.user, tipo, parametros, todos=es_usuario_admin(request.user)
     )
-    if not es_usuario_admin(request.user):
-        cuotas = cuotas.filter(prestamo__cobrador=request.user)
-    cuotas = cuotas.select_related('prestamo', 'prestamo__cliente', 'prestamo__cliente__ruta')
-    
-    if incluir_vencidas:
-        cuotas = cuotas.filter(fecha_vencimiento__lte=fecha)
+    if trabajo.estado == TrabajoExportacion.Estado.LISTO:
+        return redirect('core:descargar_exportacion', pk=trabajo.pk)
+    if reutilizado:
+        messages.info(request, 'Esa exportación ya se está generando. Le avisaremos con una notificación.')
     else:
-        cuotas = cuotas.filter(fecha_vencimiento=fecha)
-    
-    if ruta_id:
-        cuotas = cuotas.filter(prestamo__cliente__ruta_id=ruta_id)
-    
-    cuotas = cuotas.order_by('prestamo__cliente__ruta__orden', 'prestamo__cliente__apellido')
-    
-    # Crear workbook
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = f"Planilla {fecha.strftime('%d-%m-%Y')}"
-    
-    # Pre-cargar historial de modificaciones (cuotas que recibieron monto)
-    cuota_ids = list(cuotas.values_list('id', flat=True))
-    cuotas_con_monto_recibido = {}
-    if cuota_ids:
-        historiales_recibidos = HistorialModificacionPago.objects.filter(
-            cuota_id__in=cuota_ids,
-            tipo_modificacion='MR'
-        ).select_related('cuota_relacionada')
-        for h in historiales_recibidos:
-            cuotas_con_monto_recibido[h.cuota_id] = h
-    
-    # Estilos
-    header_font = Font(bold=True, color='FFFFFF')
-    header_fill = PatternFill(start_color='333333', end_color='333333', fill_type='solid')
-    header_alignment = Alignment(horizontal='center', vertical='center', wrap_text=True)
-    border = Border(
-        left=Side(style='thin'),
-        right=Side(style='thin'),
-        top=Side(style='thin'),
-        bottom=Side(style='thin')
+        messages.info(
+            request,
+            f'La exportación tiene {planilla.cantidad} filas y se generará en segundo plano. '
+            'Le avisaremos con una notificación cuando esté lista para descargar.'
+        )
+    return redirect(volver)
+
+
+@login_required
+def exportar_planilla_excel(request):
+    """Exportar planilla de cobros a Excel (o CSV, JSON Lines o Parquet con ?format=)"""
+    formato, error = formato_exportacion(request)
+    if error:
+        messages.error(request, error)
+        return redirect('core:planilla_impresion')
+    
+    fecha = fecha_de_request(request)
+    parametros = {
+        'fecha': fecha.isoformat(),
+        'ruta': request.GET.get('ruta') or None,
+        'incluir_vencidas': request.GET.get('incluir_vencidas', '1').lower() in ('true', '1', 'si'),
+    }
+    planilla = planilla_cobros(
+        None if es_usuario_admin(request.user) else request.user,
+        fecha,
+        ruta_id=parametros['ruta'],
+        incluir_vencidas=parametros['incluir_vencidas'],
     )
-    recibida_fill = PatternFill(start_color='D1ECF1', end_color='D1ECF1', fill_type='solid')  # Celeste claro
-    
-    # Título
-    ws.merge_cells('A1:M1')
-    ws['A1'] = f'PLANILLA DE COBROS - {fecha.strftime("%d/%m/%Y")}'
-    ws['A1'].font = Font(bold=True, size=14)
-    ws['A1'].alignment = Alignment(horizontal='center')
-    
-    # Info
-    ws.merge_cells('A2:M2')
-    ws['A2'] = f'Total cobros: {cuotas.count()} | Generado: {datetime.now().strftime("%d/%m/%Y %H:%M")}'
-    ws['A2'].alignment = Alignment(horizontal='center')
-    
-    # Leyenda
-    ws.merge_cells('A3:M3')
-    ws['A3'] = '■ Celeste = Cuota modificada (recibió monto de otra cuota por pago parcial)'
-    ws['A3'].font = Font(italic=True, size=9)
-    ws['A3'].alignment = Alignment(horizontal='center')
-    
-    # Headers
-    headers = ['#', 'Préstamo', 'Cliente', 'Teléfono', 'Ruta', 'Cuota', 'Monto', 'Monto Original', 'Venc.', 'Fecha Fin', 'Cobrado', 'Modificada', 'Observaciones']
-    for col, header in enumerate(headers, 1):
-        cell = ws.cell(row=5, column=col, value=header)
-        cell.font = header_font
-        cell.fill = header_fill
-        cell.alignment = header_alignment
-        cell.border = border
-    
-    # Anchos de columna
-    ws.column_dimensions['A'].width = 5
-    ws.column_dimensions['B'].width = 12
-    ws.column_dimensions['C'].width = 25
-    ws.column_dimensions['D'].width = 15
-    ws.column_dimensions['E'].width = 15
-    ws.column_dimensions['F'].width = 10
-    ws.column_dimensions['G'].width = 15
-    ws.column_dimensions['H'].width = 16
-    ws.column_dimensions['I'].width = 12
-    ws.column_dimensions['J'].width = 14
-    ws.column_dimensions['K'].width = 15
-    ws.column_dimensions['L'].width = 14
-    ws.column_dimensions['M'].width = 40
-    
-    # Datos
-    total = Decimal('0.00')
-    for i, cuota in enumerate(cuotas, 1):
-        row = i + 5
-        ws.cell(row=row, column=1, value=i).border = border
-        ws.cell(row=row, column=2, value=f'#{cuota.prestamo.pk}').border = border
-        ws.cell(row=row, column=3, value=cuota.prestamo.cliente.nombre_completo).border = border
-        ws.cell(row=row, column=4, value=cuota.prestamo.cliente.telefono).border = border
-        ws.cell(row=row, column=5, value=cuota.prestamo.cliente.ruta.nombre if cuota.prestamo.cliente.ruta else 'Sin Ruta').border = border
-        ws.cell(row=row, column=6, value=f'{cuota.numero_cuota}/{cuota.prestamo.cuotas_pactadas}').border = border
-        
-        monto_cell = ws.cell(row=row, column=7, value=float(cuota.monto_cuota))
-        monto_cell.number_format = '#,##0'
-        monto_cell.border = border
-        
-        # Columna Monto Original y Observaciones
-        recibido = cuotas_con_monto_recibido.get(cuota.id)
-        fue_modificada = recibido is not None
-        
-        if recibido:
-            orig_cell = ws.cell(row=row, column=8, value=float(recibido.monto_cuota_anterior))
-            orig_cell.number_format = '#,##0'
-        else:
-            orig_cell = ws.cell(row=row, column=8, value='-')
-        orig_cell.border = border
-        
-        ws.cell(row=row, column=9, value=cuota.fecha_vencimiento.strftime('%d/%m')).border = border
-        ws.cell(row=row, column=10, value=cuota.prestamo.fecha_finalizacion.strftime('%d/%m/%Y') if cuota.prestamo.fecha_finalizacion else '-').border = border
-        ws.cell(row=row, column=11, value='').border = border
-        
-        mod_cell = ws.cell(row=row, column=12, value='SÍ' if fue_modificada else '-')
-        mod_cell.border = border
-        mod_cell.alignment = Alignment(horizontal='center')
-        if fue_modificada:
-            mod_cell.font = Font(bold=True, color='856404')
-        
-        obs_text = ''
-        if recibido:
-            origen = f' de cuota #{recibido.cuota_relacionada.numero_cuota}' if recibido.cuota_relacionada else ''
-            obs_text = f'Recibió ${recibido.monto_restante_transferido:,.0f}{origen}'
-            if recibido.interes_mora > 0:
-                obs_text += f' (mora: ${recibido.interes_mora:,.0f})'
-        
-        obs_cell = ws.cell(row=row, column=13, value=obs_text if obs_text else '-')
-        obs_cell.border = border
-        obs_cell.alignment = Alignment(wrap_text=True)
-        
-        # Aplicar color de fondo si fue modificada
-        if fue_modificada:
-            for col_idx in range(1, 14):
-                ws.cell(row=row, column=col_idx).fill = recibida_fill
-        
-        total += cuota.monto_cuota
-    
-    # Fila de total
-    total_row = cuotas.count() + 6
-    ws.merge_cells(f'A{total_row}:G{total_row}')
-    ws.cell(row=total_row, column=1, value='TOTAL ESPERADO:').font = Font(bold=True)
-    total_cell = ws.cell(row=total_row, column=8, value=float(total))
-    total_cell.font = Font(bold=True)
-    total_cell.number_format = '#,##0'
     
     # Registrar auditoría
     RegistroAuditoria.registrar(
         usuario=request.user,
         tipo_accion='OT',
         tipo_modelo='SI',
-        descripcion=f'Exportación de planilla a Excel - Fecha: {fecha}',
+        descripcion=f'Exportación de planilla a {FORMATOS[formato][0]} - Fecha: {fecha}',
         ip_address=get_client_ip(request)
     )
     
-    # Crear respuesta
-    response = HttpResponse(
-        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    return responder_exportacion(
+        request, planilla, formato, TrabajoExportacion.Tipo.PLANILLA, parametros, 'core:planilla_impresion'
     )
-    response['Content-Disposition'] = f'attachment; filename=planilla_cobros_{fecha.strftime("%Y%m%d")}.xlsx'
-    
-    wb.save(response)
-    return response
 
 
 @login_required
 def exportar_cierre_excel(request):
-    """Exportar cierre de caja a Excel con cobros realizados"""
-    try:
-        import openpyxl
-        from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
-        from openpyxl.utils import get_column_letter
-    except ImportError:
-        messages.error(request, 'La exportación a Excel no está disponible. Instale openpyxl.')
+    """Exportar cierre de caja a Excel con cobros realizados (o CSV, JSON Lines o Parquet con ?format=)"""
+    formato, error = formato_exportacion(request)
+    if error:
+        messages.error(request, error)
         return redirect('core:cierre_caja')
     
-    # Obtener fecha
-    fecha_str = request.GET.get('fecha')
-    if fecha_str:
-        fecha = datetime.strptime(fecha_str, '%Y-%m-%d').date()
-    else:
-        fecha = fecha_local_hoy()
-    
-    # Obtener cobros del día (completos y parciales)
-    pagos = Cuota.objects.filter(
-        fecha_pago_real=fecha,
-        estado__in=['PA', 'PC']
-    )
-    if not es_usuario_admin(request.user):
-        pagos = pagos.filter(prestamo__cobrador=request.user)
-    pagos = pagos.select_related('prestamo', 'prestamo__cliente', 'prestamo__cliente__ruta', 'cobrado_por').order_by(
-        'prestamo__cliente__apellido'
-    )
-    
-    # Pre-cargar historial de modificaciones para las cuotas del día
-    cuota_ids = list(pagos.values_list('id', flat=True))
-    historial_por_cuota = {}
-    if cuota_ids:
-        historiales = HistorialModificacionPago.objects.filter(
-            cuota_id__in=cuota_ids
-        ).select_related('cuota_relacionada').order_by('fecha_modificacion')
-        for h in historiales:
-            if h.cuota_id not in historial_por_cuota:
-                historial_por_cuota[h.cuota_id] = []
-            historial_por_cuota[h.cuota_id].append(h)
-    
-    # También buscar cuotas que recibieron monto (fueron modificadas por un pago parcial previo)
-    cuotas_con_monto_recibido = {}
-    historiales_recibidos = HistorialModificacionPago.objects.filter(
-        cuota_id__in=cuota_ids,
-        tipo_modificacion='MR'
-    ).select_related('cuota_relacionada')
-    for h in historiales_recibidos:
-        cuotas_con_monto_recibido[h.cuota_id] = h
-    
-    # Crear workbook
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = f"Cierre {fecha.strftime('%d-%m-%Y')}"
-    
-    # Estilos
-    header_font = Font(bold=True, color='FFFFFF')
-    header_fill = PatternFill(start_color='198754', end_color='198754', fill_type='solid')
-    header_alignment = Alignment(horizontal='center', vertical='center', wrap_text=True)
-    border = Border(
-        left=Side(style='thin'), right=Side(style='thin'),
-        top=Side(style='thin'), bottom=Side(style='thin')
-    )
-    modificada_fill = PatternFill(start_color='FFF3CD', end_color='FFF3CD', fill_type='solid')  # Amarillo claro
-    recibida_fill = PatternFill(start_color='D1ECF1', end_color='D1ECF1', fill_type='solid')  # Celeste claro
-    
-    # Título
-    ws.merge_cells('A1:S1')
-    ws['A1'] = f'CIERRE DE CAJA - {fecha.strftime("%d/%m/%Y")}'
-    ws['A1'].font = Font(bold=True, size=14)
-    ws['A1'].alignment = Alignment(horizontal='center')
-    
-    total_cobrado = pagos.aggregate(total=Sum('monto_pagado'))['total'] or Decimal('0.00')
-    total_efectivo = pagos.aggregate(total=Sum('monto_efectivo'))['total'] or Decimal('0.00')
-    total_transferencia = pagos.aggregate(total=Sum('monto_transferencia'))['total'] or Decimal('0.00')
-    ws.merge_cells('A2:S2')
-    ws['A2'] = f'Total cobrado: ${total_cobrado:,.0f} (Efectivo: ${total_efectivo:,.0f} | Transferencia: ${total_transferencia:,.0f}) | Pagos: {pagos.count()} | Generado: {datetime.now().strftime("%d/%m/%Y %H:%M")}'
-    ws['A2'].alignment = Alignment(horizontal='center')
-    
-    # Leyenda de colores
-    ws.merge_cells('A3:S3')
-    ws['A3'] = '■ Amarillo = Pago parcial (se transfirió monto a otra cuota)  |  ■ Celeste = Cuota que recibió monto de otra cuota'
-    ws['A3'].font = Font(italic=True, size=9)
-    ws['A3'].alignment = Alignment(horizontal='center')
-    
-    # Headers - ahora con columnas de modificaciones
-    headers = ['#', 'Préstamo', 'Cliente', 'Dirección', 'Teléfono', 'Cuota', 'Monto Cuota', 'Cobrado', 
-               'Método Pago', 'Efectivo', 'Transferencia', 'Estado', 'Fecha Inicio', 
-               '% Interés', 'Fecha Fin Préstamo', 'Cobrador',
-               'Modificada', 'Monto Original', 'Observaciones']
-    for col, header in enumerate(headers, 1):
-        cell = ws.cell(row=5, column=col, value=header)
-        cell.font = header_font
-        cell.fill = header_fill
-        cell.alignment = header_alignment
-        cell.border = border
-    
-    # Anchos
-    ws.column_dimensions['A'].width = 5
-    ws.column_dimensions['B'].width = 12
-    ws.column_dimensions['C'].width = 25
-    ws.column_dimensions['D'].width = 30
-    ws.column_dimensions['E'].width = 15
-    ws.column_dimensions['F'].width = 10
-    ws.column_dimensions['G'].width = 15
-    ws.column_dimensions['H'].width = 15
-    ws.column_dimensions['I'].width = 16
-    ws.column_dimensions['J'].width = 15
-    ws.column_dimensions['K'].width = 15
-    ws.column_dimensions['L'].width = 12
-    ws.column_dimensions['M'].width = 16
-    ws.column_dimensions['N'].width = 12
-    ws.column_dimensions['O'].width = 16
-    ws.column_dimensions['P'].width = 20
-    ws.column_dimensions['Q'].width = 14
-    ws.column_dimensions['R'].width = 16
-    ws.column_dimensions['S'].width = 45
-    
-    # Datos
-    total = Decimal('0.00')
-    for i, pago in enumerate(pagos, 1):
-        row = i + 5
-        ws.cell(row=row, column=1, value=i).border = border
-        ws.cell(row=row, column=2, value=f'#{pago.prestamo.pk}').border = border
-        ws.cell(row=row, column=3, value=pago.prestamo.cliente.nombre_completo).border = border
-        ws.cell(row=row, column=4, value=pago.prestamo.cliente.direccion or '-').border = border
-        ws.cell(row=row, column=5, value=pago.prestamo.cliente.telefono).border = border
-        ws.cell(row=row, column=6, value=f'{pago.numero_cuota}/{pago.prestamo.cuotas_pactadas}').border = border
-        
-        monto_cell = ws.cell(row=row, column=7, value=float(pago.monto_cuota))
-        monto_cell.number_format = '#,##0'
-        monto_cell.border = border
-        
-        cobrado_cell = ws.cell(row=row, column=8, value=float(pago.monto_pagado))
-        cobrado_cell.number_format = '#,##0'
-        cobrado_cell.border = border
-        cobrado_cell.font = Font(bold=True, color='198754')
-        
-        ws.cell(row=row, column=9, value=pago.get_metodo_pago_display()).border = border
-        
-        ef_cell = ws.cell(row=row, column=10, value=float(pago.monto_efectivo or 0))
-        ef_cell.number_format = '#,##0'
-        ef_cell.border = border
-        
-        tr_cell = ws.cell(row=row, column=11, value=float(pago.monto_transferencia or 0))
-        tr_cell.number_format = '#,##0'
-        tr_cell.border = border
-        
-        ws.cell(row=row, column=12, value=pago.get_estado_display()).border = border
-        ws.cell(row=row, column=13, value=pago.prestamo.fecha_inicio.strftime('%d/%m/%Y')).border = border
-        ws.cell(row=row, column=14, value=f'{pago.prestamo.tasa_interes_porcentaje}%').border = border
-        ws.cell(row=row, column=15, value=pago.prestamo.fecha_finalizacion.strftime('%d/%m/%Y') if pago.prestamo.fecha_finalizacion else '-').border = border
-        ws.cell(row=row, column=16, value=pago.cobrado_por.get_full_name() or pago.cobrado_por.username if pago.cobrado_por else '-').border = border
-        
-        # --- Columnas de Modificaciones ---
-        historial = historial_por_cuota.get(pago.id, [])
-        recibido = cuotas_con_monto_recibido.get(pago.id)
-        
-        fue_modificada = False
-        monto_original = ''
-        observaciones_parts = []
-        row_fill = None
-        
-        for h in historial:
-            if h.tipo_modificacion == 'PP':
-                fue_modificada = True
-                row_fill = modificada_fill
-                if h.monto_restante_transferido > 0:
-                    observaciones_parts.append(
-                        f'Pago parcial: cobrado ${h.monto_pagado:,.0f} de ${h.monto_cuota_anterior:,.0f}. '
-                        f'Restante ${h.monto_restante_transferido:,.0f} transferido'
-                    )
-                else:
-                    observaciones_parts.append(
-                        f'Pago parcial: cobrado ${h.monto_pagado:,.0f} de ${h.monto_cuota_anterior:,.0f}'
-                    )
-            elif h.tipo_modificacion == 'TR':
-                destino = f' a cuota #{h.cuota_relacionada.numero_cuota}' if h.cuota_relacionada else ''
-                observaciones_parts.append(
-                    f'Transferido ${h.monto_restante_transferido:,.0f}{destino}'
-                )
-                if h.interes_mora > 0:
-                    observaciones_parts.append(f'(incluye mora: ${h.interes_mora:,.0f})')
-            elif h.tipo_modificacion == 'CE':
-                destino = f' (cuota #{h.cuota_relacionada.numero_cuota})' if h.cuota_relacionada else ''
-                observaciones_parts.append(
-                    f'Cuota especial creada por ${h.monto_restante_transferido:,.0f}{destino}'
-                )
-        
-        if recibido:
-            fue_modificada = True
-            if not row_fill:
-                row_fill = recibida_fill
-            monto_original = float(recibido.monto_cuota_anterior)
-            origen = f' de cuota #{recibido.cuota_relacionada.numero_cuota}' if recibido.cuota_relacionada else ''
-            observaciones_parts.insert(0,
-                f'Recibió ${recibido.monto_restante_transferido:,.0f}{origen}'
-            )
-            if recibido.interes_mora > 0:
-                observaciones_parts.insert(1, f'(incluye mora: ${recibido.interes_mora:,.0f})')
-        
-        mod_cell = ws.cell(row=row, column=17, value='SÍ' if fue_modificada else '-')
-        mod_cell.border = border
-        mod_cell.alignment = Alignment(horizontal='center')
-        if fue_modificada:
-            mod_cell.font = Font(bold=True, color='856404')
-        
-        orig_cell = ws.cell(row=row, column=18, value=monto_original if monto_original else '-')
-        if isinstance(monto_original, float):
-            orig_cell.number_format = '#,##0'
-        orig_cell.border = border
-        
-        obs_cell = ws.cell(row=row, column=19, value=' | '.join(observaciones_parts) if observaciones_parts else '-')
-        obs_cell.border = border
-        obs_cell.alignment = Alignment(wrap_text=True)
-        
-        # Aplicar color de fondo a toda la fila si fue modificada
-        if row_fill:
-            for col_idx in range(1, 20):
-                ws.cell(row=row, column=col_idx).fill = row_fill
-        
-        total += pago.monto_pagado
-    
-    # Fila total
-    total_row = pagos.count() + 6
-    ws.merge_cells(f'A{total_row}:G{total_row}')
-    total_label = ws.cell(row=total_row, column=1, value='TOTAL COBRADO:')
-    total_label.font = Font(bold=True, size=12)
-    total_cell = ws.cell(row=total_row, column=8, value=float(total))
-    total_cell.font = Font(bold=True, size=12, color='198754')
-    total_cell.number_format = '#,##0'
-    
-    # Totales efectivo y transferencia
-    ef_total_cell = ws.cell(row=total_row, column=10, value=float(total_efectivo))
-    ef_total_cell.font = Font(bold=True, size=11)
-    ef_total_cell.number_format = '#,##0'
-    tr_total_cell = ws.cell(row=total_row, column=11, value=float(total_transferencia))
-    tr_total_cell.font = Font(bold=True, size=11)
-    tr_total_cell.number_format = '#,##0'
+    fecha = fecha_de_request(request)
+    planilla = planilla_cierre(None if es_usuario_admin(request.user) else request.user, fecha)
     
     # Registrar auditoría
     RegistroAuditoria.registrar(
         usuario=request.user,
         tipo_accion='OT',
         tipo_modelo='SI',
-        descripcion=f'Exportación de cierre de caja a Excel - Fecha: {fecha}',
+        descripcion=f'Exportación de cierre de caja a {FORMATOS[formato][0]} - Fecha: {fecha}',
         ip_address=get_client_ip(request)
     )
     
-    response = HttpResponse(
-        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    return responder_exportacion(
+        request, planilla, formato, TrabajoExportacion.Tipo.CIERRE, {'fecha': fecha.isoformat()},
+        'core:cierre_caja'
     )
-    response['Content-Disposition'] = f'attachment; filename=cierre_caja_{fecha.strftime("%Y%m%d")}.xlsx'
-    wb.save(response)
-    return response
 
 
 @login_required
 def exportar_clientes_excel(request):
-    """Exportar lista de clientes a Excel"""
-    try:
-        import openpyxl
-        from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
-    except ImportError:
-        messages.error(request, 'La exportación a Excel no está disponible. Instale openpyxl.')
+    """Exportar lista de clientes a Excel (o CSV, JSON Lines o Parquet con ?format=)"""
+    formato, error = formato_exportacion(request)
+    if error:
+        messages.error(request, error)
         return redirect('core:cliente_list')
     
-    clientes = Cliente.objects.filter(estado='AC')
-    if not es_usuario_admin(request.user):
-        clientes = clientes.filter(usuario=request.user)
-    clientes = clientes.select_related('ruta', 'tipo_negocio')
-    
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = "Clientes"
-    
-    # Estilos
-    header_font = Font(bold=True, color='FFFFFF')
-    header_fill = PatternFill(start_color='198754', end_color='198754', fill_type='solid')
-    border = Border(
-        left=Side(style='thin'),
-        right=Side(style='thin'),
-        top=Side(style='thin'),
-        bottom=Side(style='thin')
-    )
-    
-    # Headers
-    headers = ['#', 'Nombre', 'Apellido', 'Teléfono', 'Dirección', 'Categoría', 'Ruta', 'Tipo Negocio', 'Límite Crédito']
-    for col, header in enumerate(headers, 1):
-        cell = ws.cell(row=1, column=col, value=header)
-        cell.font = header_font
-        cell.fill = header_fill
-        cell.border = border
-    
-    # Datos
-    for i, cliente in enumerate(clientes, 1):
-        row = i + 1
-        ws.cell(row=row, column=1, value=i).border = border
-        ws.cell(row=row, column=2, value=cliente.nombre).border = border
-        ws.cell(row=row, column=3, value=cliente.apellido).border = border
-        ws.cell(row=row, column=4, value=cliente.telefono).border = border
-        ws.cell(row=row, column=5, value=cliente.direccion[:50]).border = border
-        ws.cell(row=row, column=6, value=cliente.get_categoria_display()).border = border
-        ws.cell(row=row, column=7, value=cliente.ruta.nombre if cliente.ruta else '-').border = border
-        ws.cell(row=row, column=8, value=cliente.tipo_negocio.nombre if cliente.tipo_negocio else '-').border = border
-        limite_cell = ws.cell(row=row, column=9, value=float(cliente.limite_credito))
-        limite_cell.number_format = '#,##0'
-        limite_cell.border = border
-    
-    # Ajustar anchos
-    for col in range(1, 10):
-        ws.column_dimensions[openpyxl.utils.get_column_letter(col)].width = 15
-    ws.column_dimensions['B'].width = 20
-    ws.column_dimensions['C'].width = 20
-    ws.column_dimensions['E'].width = 30
-    
-    response = HttpResponse(
-        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    planilla = planilla_clientes(None if es_usuario_admin(request.user) else request.user)
+    return responder_exportacion(
+        request, planilla, formato, TrabajoExportacion.Tipo.CLIENTES, {}, 'core:cliente_list'
     )
-    response['Content-Disposition'] = f'attachment; filename=clientes_{datetime.now().strftime("%Y%m%d")}.xlsx'
-    
-    wb.save(response)
-    return response
 
 
 @login_required
 def exportar_prestamos_excel(request):
-    """Exportar préstamos a Excel"""
-    try:
-        import openpyxl
-        from openpyxl.styles import Font, PatternFill, Border, Side
-    except ImportError:
-        messages.error(request, 'La exportación a Excel no está disponible. Instale openpyxl.')
+    """Exportar préstamos a Excel (o CSV, JSON Lines o Parquet con ?format=)"""
+    formato, error = formato_exportacion(request)
+    if error:
+        messages.error(request, error)
         return redirect('core:prestamo_list')
     
     estado = request.GET.get('estado', '')
-    prestamos = Prestamo.objects.select_related('cliente')
-    if not es_usuario_admin(request.user):
-        prestamos = prestamos.filter(cliente__usuario=request.user)
-    if estado:
-        prestamos = prestamos.filter(estado=estado)
-    
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = "Préstamos"
-    
-    header_font = Font(bold=True, color='FFFFFF')
-    header_fill = PatternFill(start_color='0d6efd', end_color='0d6efd', fill_type='solid')
-    border = Border(
-        left=Side(style='thin'),
-        right=Side(style='thin'),
-        top=Side(style='thin'),
-        bottom=Side(style='thin')
+    planilla = planilla_prestamos(None if es_usuario_admin(request.user) else request.user, estado)
+    return responder_exportacion(
+        request, planilla, formato, TrabajoExportacion.Tipo.PRESTAMOS, {'estado': estado}, 'core:prestamo_list'
     )
-    
-    headers = ['#', 'Cliente', 'Dirección', 'Monto', 'Total', 'Pagado', 'Pendiente', 'Cuotas', 'Frecuencia', 'Estado', 'Fecha Inicio', 'Fecha Finalización']
-    for col, header in enumerate(headers, 1):
-        cell = ws.cell(row=1, column=col, value=header)
-        cell.font = header_font
-        cell.fill = header_fill
-        cell.border = border
-    
-    for i, p in enumerate(prestamos, 1):
-        row = i + 1
-        ws.cell(row=row, column=1, value=i).border = border
-        ws.cell(row=row, column=2, value=p.cliente.nombre_completo).border = border
-        ws.cell(row=row, column=3, value=p.cliente.direccion or '-').border = border
-        monto_cell = ws.cell(row=row, column=4, value=float(p.monto_solicitado))
-        monto_cell.number_format = '#,##0'
-        monto_cell.border = border
-        total_cell = ws.cell(row=row, column=5, value=float(p.monto_total_a_pagar))
-        total_cell.number_format = '#,##0'
-        total_cell.border = border
-        pagado_cell = ws.cell(row=row, column=6, value=float(p.monto_pagado))
-        pagado_cell.number_format = '#,##0'
-        pagado_cell.border = border
-        pend_cell = ws.cell(row=row, column=7, value=float(p.monto_pendiente))
-        pend_cell.number_format = '#,##0'
-        pend_cell.border = border
-        ws.cell(row=row, column=8, value=f'{p.cuotas_pagadas}/{p.cuotas_pactadas}').border = border
-        ws.cell(row=row, column=9, value=p.get_frecuencia_display()).border = border
-        ws.cell(row=row, column=10, value=p.get_estado_display()).border = border
-        ws.cell(row=row, column=11, value=p.fecha_inicio.strftime('%d/%m/%Y')).border = border
-        ws.cell(row=row, column=12, value=p.fecha_finalizacion.strftime('%d/%m/%Y') if p.fecha_finalizacion else '-').border = border
-    
-    for col in range(1, 13):
-        ws.column_dimensions[openpyxl.utils.get_column_letter(col)].width = 15
-    ws.column_dimensions['B'].width = 25
-    ws.column_dimensions['C'].width = 30
-    
-    response = HttpResponse(
-        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+
+@login_required
+def descargar_exportacion(request, pk):
+    """Descargar el archivo de una exportación generada en segundo plano"""
+    trabajo = get_object_or_404(TrabajoExportacion, pk=pk, usuario=request.user)
+    if trabajo.estado != TrabajoExportacion.Estado.LISTO or not trabajo.archivo:
+        messages.error(request, 'La exportación todavía no está lista o ya no está disponible.')
+        return redirect('core:notificacion_list')
+    return respuesta_archivo(
+        trabajo.archivo.open('rb'),
+        os.path.basename(trabajo.archivo.name),
+        TIPO_XLSX,
+        asincrono=isinstance(request, ASGIRequest)
     )
-    response['Content-Disposition'] = f'attachment; filename=prestamos_{datetime.now().strftime("%Y%m%d")}.xlsx'
-    
-    wb.save(response)
-    return response
+
+
+@login_required
+def estado_exportacion(request, pk):
+    """Estado de una exportación en segundo plano (para consultar hasta que esté lista)"""
+    trabajo = get_object_or_404(TrabajoExportacion, pk=pk, usuario=request.user)
+    listo = trabajo.estado == TrabajoExportacion.Estado.LISTO
+    return JsonResponse({
+        'id': trabajo.pk,
+        'estado': trabajo.estado,
+        'estado_display': trabajo.get_estado_display(),
+        'url': reverse('core:descargar_exportacion', args=[trabajo.pk]) if listo else None,
+    })
 
 
 # ==================== NOTIFICACIONES ====================
 
 class NotificacionListView(LoginRequiredMixin, ListView):
-    """Vista de notificaciones del usuario"""
-    model = Notificacion
+    """Vista de notificaciones del usuario (filas de DestinatarioNotificacion)"""
+    model = DestinatarioNotificacion
     template_name = 'core/notificacion_list.html'
     context_object_name = 'notificaciones'
     paginate_by = 20
     
     def get_queryset(self):
-        qs = Notificacion.objects.filter(
-            Q(usuario=self.request.user) | Q(usuario__isnull=True)
-        )
+        qs = DestinatarioNotificacion.objects.filter(
+            usuario=self.request.user
+        ).select_related('notificacion')
         
         # Filtros
         solo_no_leidas = self.request.GET.get('no_leidas', '')
@@ -1913,25 +1681,22 @@ class NotificacionListView(LoginRequiredMixin, ListView):
         if solo_no_leidas:
             qs = qs.filter(leida=False)
         if tipo:
-            qs = qs.filter(tipo=tipo)
+            qs = qs.filter(notificacion__tipo=tipo)
         
         return qs.order_by('-fecha_creacion')
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['tipos_notificacion'] = Notificacion.TipoNotificacion.choices
-        context['no_leidas_count'] = Notificacion.objects.filter(
-            Q(usuario=self.request.user) | Q(usuario__isnull=True),
-            leida=False
-        ).count()
+        context['no_leidas_count'] = no_leidas(self.request.user).count()
         return context
 
 
 @login_required
 def marcar_notificacion_leida(request, pk):
     """Marcar notificación como leída via AJAX"""
-    notificacion = get_object_or_404(Notificacion, pk=pk)
-    notificacion.marcar_como_leida()
+    notificacion = get_object_or_404(Notificacion, pk=pk, destinatarios__usuario=request.user)
+    notificacion.marcar_como_leida(request.user)
     
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
         return JsonResponse({'success': True})
@@ -1941,40 +1706,55 @@ def marcar_notificacion_leida(request, pk):
 
 @login_required
 def marcar_todas_leidas(request):
-    """Marcar todas las notificaciones como leídas"""
-    Notificacion.objects.filter(
-        Q(usuario=request.user) | Q(usuario__isnull=True),
-        leida=False
-    ).update(leida=True, fecha_lectura=timezone.now())
+    """Marcar todas las notificaciones como leídas (un UPDATE sobre las del usuario)"""
+    if no_leidas(request.user).update(leida=True, fecha_lectura=timezone.now()):
+        avisar_cambio_notificaciones()
     
     messages.success(request, 'Todas las notificaciones marcadas como leídas.')
     return redirect('core:notificacion_list')
 
 
 @login_required
+@cache_control(private=True, no_cache=True)
 def obtener_notificaciones(request):
-    """API para obtener notificaciones no leídas (para actualización en tiempo real)"""
-    notificaciones = Notificacion.objects.filter(
-        Q(usuario=request.user) | Q(usuario__isnull=True),
-        leida=False
-    ).order_by('-fecha_creacion')[:5]
-    
-    data = {
-        'count': notificaciones.count(),
-        'notificaciones': [
-            {
-                'id': n.pk,
-                'titulo': n.titulo,
-                'mensaje': n.mensaje[:100],
-                'tipo': n.tipo,
-                'prioridad': n.prioridad,
-                'fecha': n.fecha_creacion.strftime('%d/%m %H:%M'),
-                'enlace': n.enlace
-            }
-            for n in notificaciones
-        ]
-    }
-    return JsonResponse(data)
+    """
+    API para obtener notificaciones no leídas (respaldo del stream SSE).
+    Responde con ETag: si el contador no cambió, devuelve 304 sin cuerpo.
+    """
+    estado = estado_notificaciones(request.user)
+    etag = f'"{marca_notificaciones(estado)}"'
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = JsonResponse(resumen_notificaciones(request.user, estado))
+    response['ETag'] = etag
+    return response
+
+
+def _usuario_autenticado(request):
+    return request.user if request.user.is_authenticated else None
+
+
+async def stream_notificaciones(request):
+    """
+    Server-Sent Events con el contador y las últimas notificaciones no leídas.
+    Solo se sirve por ASGI; por WSGI responde 204 para que la página use la API
+    con ETag en su lugar (EventSource no se reconecta ante un 204).
+    """
+    if not isinstance(request, ASGIRequest):
+        usuario = await sync_to_async(_usuario_autenticado)(request)
+        return HttpResponse(status=401 if usuario is None else 204)
+    usuario = await consultar(_usuario_autenticado)(request)
+    if usuario is None:
+        return HttpResponse(status=401)
+
+    response = StreamingHttpResponse(
+        flujo_notificaciones(usuario, request.headers.get('Last-Event-ID')),
+        content_type='text/event-stream'
+    )
+    response['Cache-Control'] = 'no-cache'
+    # Que nginx no acumule los eventos antes de enviarlos
+    response['X-Accel-Buffering'] = 'no'
+    return response
 
 
 # ==================== AUDITORÍA ====================
@@ -2031,92 +1811,25 @@ class AuditoriaListView(LoginRequiredMixin, ListView):
 
 @login_required
 def crear_respaldo(request):
-    """Crear respaldo manual de la base de datos"""
+    """
+    Pedir un respaldo manual. Lo crea el programador de tareas (run_scheduler)
+    en su próxima vuelta, fuera del request.
+    """
     if not es_superadmin(request.user):
         messages.error(request, 'Solo los desarrolladores pueden crear respaldos.')
         return redirect('core:dashboard')
     
-    import shutil
-    import json
-    from django.conf import settings
-    from django.core import serializers
-    
-    try:
-        # Crear directorio de respaldos si no existe
-        backup_dir = os.path.join(settings.BASE_DIR, 'backups')
-        os.makedirs(backup_dir, exist_ok=True)
-        
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        db_engine = settings.DATABASES['default']['ENGINE']
-        
-        # Verificar si es PostgreSQL o SQLite
-        if 'postgresql' in db_engine:
-            # PostgreSQL: exportar datos a JSON
-            backup_name = f'backup_{timestamp}.json'
-            backup_path = os.path.join(backup_dir, backup_name)
-            
-            # Exportar todos los modelos a JSON
-            from core.models import (
-                Cliente, Prestamo, Cuota, TipoNegocio, RutaCobro,
-                ConfiguracionCredito, ConfiguracionPlanilla, PerfilUsuario,
-                RegistroAuditoria, Notificacion
-            )
-            from django.contrib.auth.models import User
-            
-            all_data = {}
-            models_to_export = [
-                ('users', User),
-                ('perfiles', PerfilUsuario),
-                ('tipos_negocio', TipoNegocio),
-                ('rutas_cobro', RutaCobro),
-                ('config_credito', ConfiguracionCredito),
-                ('config_planilla', ConfiguracionPlanilla),
-                ('clientes', Cliente),
-                ('prestamos', Prestamo),
-                ('cuotas', Cuota),
-            ]
-            
-            for name, model in models_to_export:
-                all_data[name] = json.loads(serializers.serialize('json', model.objects.all()))
-            
-            with open(backup_path, 'w', encoding='utf-8') as f:
-                json.dump(all_data, f, ensure_ascii=False, indent=2, default=str)
-                
-        else:
-            # SQLite: copiar archivo
-            backup_name = f'backup_{timestamp}.sqlite3'
-            backup_path = os.path.join(backup_dir, backup_name)
-            db_path = settings.DATABASES['default']['NAME']
-            shutil.copy2(db_path, backup_path)
-        
-        # Registrar auditoría
-        RegistroAuditoria.registrar(
-            usuario=request.user,
-            tipo_accion='RS',
-            tipo_modelo='SI',
-            descripcion=f'Respaldo manual creado: {backup_name}',
-            ip_address=get_client_ip(request)
-        )
-        
-        # Limpiar respaldos antiguos
-        config = ConfiguracionRespaldo.objects.first()
-        if config:
-            config.ultimo_respaldo = timezone.now()
-            config.save()
-            
-            # Mantener solo los últimos N respaldos
-            backups = sorted(
-                [f for f in os.listdir(backup_dir) if f.startswith('backup_')],
-                reverse=True
-            )
-            for old_backup in backups[config.mantener_ultimos:]:
-                os.remove(os.path.join(backup_dir, old_backup))
-        
-        messages.success(request, f'Respaldo creado exitosamente: {backup_name}')
-    except Exception as e:
-        messages.error(request, f'Error al crear respaldo: {str(e)}')
+    TareaProgramada.solicitar('respaldo')
+    RegistroAuditoria.registrar(
+        usuario=request.user,
+        tipo_accion='RS',
+        tipo_modelo='SI',
+        descripcion='Respaldo manual solicitado',
+        ip_address=get_client_ip(request)
+    )
     
-    return redirect('core:reporte_general')
+    messages.success(request, 'Respaldo solicitado. Estará en la lista en menos de un minuto.')
+    return redirect('core:respaldo_list')
 
 
 @login_required
@@ -2194,7 +1907,12 @@ def generar_notificaciones(request):
     if not es_usuario_admin(request.user):
         return JsonResponse({'success': False, 'message': 'Sin permisos'}, status=403)
     
-    Notificacion.notificar_cuotas_vencidas()
-    Notificacion.notificar_cuotas_por_vencer()
+    vencidas = Notificacion.notificar_cuotas_vencidas()
+    por_vencer = Notificacion.notificar_cuotas_por_vencer()
     
-    return JsonResponse({'success': True, 'message': 'Notificaciones generadas'})
+    return JsonResponse({
+        'success': True,
+        'message': f'Notificaciones generadas: {vencidas + por_vencer}',
+        'vencidas': vencidas,
+        'por_vencer': por_vencer
+    })
@@ -3,6 +3,13 @@ ASGI config for prestamos_config project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Se sirve con gunicorn y workers de uvicorn (ver Procfile): el stream de
+notificaciones (/api/notificaciones/stream/) es una vista async que mantiene
+la conexión abierta sin ocupar un hilo ni una conexión a la base por usuario
+(las consultas usan el pool de hilos y cierran la conexión, y CONN_MAX_AGE es
+0). Por WSGI ese endpoint responde 204 y la página vuelve a consultar la API
+cada 60 segundos. El programador de tareas corre aparte, en el proceso worker.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
 """
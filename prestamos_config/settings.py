@@ -96,8 +96,11 @@ WSGI_APPLICATION = 'prestamos_config.wsgi.application'
 DATABASE_URL = os.environ.get('DATABASE_URL') or os.environ.get('DATABASE_PUBLIC_URL')
 
 if DATABASE_URL:
+    # Sin conexiones persistentes: por ASGI cada request corre en un hilo
+    # propio, así que una conexión reutilizable queda abierta por cada hilo
+    # (y por cada stream de notificaciones) en lugar de compartirse.
     DATABASES = {
-        'default': dj_database_url.parse(DATABASE_URL, conn_max_age=600)
+        'default': dj_database_url.parse(DATABASE_URL, conn_max_age=0)
     }
 else:
     DATABASES = {
@@ -167,6 +170,64 @@ USE_THOUSAND_SEPARATOR = True
 THOUSAND_SEPARATOR = '.'
 DECIMAL_SEPARATOR = ','
 
+# Calendario de cobro (ver core/calendario.py)
+# Días de la semana sin cobro (0=lunes ... 6=domingo) y feriados en formato ISO
+COBRO_DIAS_NO_HABILES = [6]
+COBRO_FERIADOS = []
+
+# Máximo de pagos por request en la API de cobro en lote
+COBRO_LOTE_MAXIMO = 200
+
+# Horas que se guarda la respuesta de un cobro por su Idempotency-Key
+IDEMPOTENCIA_TTL_HORAS = 24
+
+# Sincronización incremental de cuotas (ver core/cambios.py): los cambios de
+# los últimos segundos se vuelven a enviar por si hay otros sin confirmar
+CAMBIOS_MARGEN_SEGUNDOS = 120
+
+# Stream de notificaciones (SSE, requiere servir por ASGI - ver core/notificaciones.py)
+# Segundos entre revisiones de la versión en caché, entre lecturas forzadas de la
+# base y entre latidos; y duración máxima de cada conexión antes de reconectarse
+NOTIFICACIONES_SSE_INTERVALO = 5
+NOTIFICACIONES_SSE_REVISION = 60
+NOTIFICACIONES_SSE_LATIDO = 25
+NOTIFICACIONES_SSE_DURACION = 300
+
+# Programador de tareas (run_scheduler, ver core/tareas.py)
+# Desfase al azar sobre cada intervalo (fracción) y segundos que dura el
+# bloqueo de una tarea tomada si el proceso que la ejecuta muere
+TAREAS_JITTER = 0.1
+TAREAS_BLOQUEO = 2 * 3600
+# Intervalos en segundos que reemplazan los de core/tareas.py, p. ej. {'mora': 1800}
+TAREAS_INTERVALOS = {}
+
+# Retención (apply_retention, ver core/retencion.py)
+# Días por tipo de notificación que reemplazan los de core/retencion.py, p. ej. {'CV': 14}
+NOTIFICACIONES_RETENCION_DIAS = {}
+# La auditoría más vieja se pasa a archivos mensuales comprimidos
+AUDITORIA_RETENCION_DIAS = 365
+AUDITORIA_ARCHIVO_DIR = BASE_DIR / 'archivo' / 'auditoria'
+
+# Auditoría diferida (ver core/auditoria.py): los registros se escriben en lote
+# al terminar el request o al juntar AUDITORIA_LOTE; si la base falla quedan
+# en AUDITORIA_SPOOL hasta la próxima escritura. Si el proceso muere antes de
+# terminar el request se pierden los registros de ese request; con False no.
+AUDITORIA_DIFERIDA = True
+AUDITORIA_LOTE = 200
+AUDITORIA_SPOOL = BASE_DIR / 'archivo' / 'auditoria_pendiente.jsonl'
+
+# Exportaciones a Excel (ver core/exportacion.py): desde esta cantidad de filas se
+# generan en segundo plano (tarea 'exportaciones') y se avisa con una notificación.
+# Pedir lo mismo dentro de la ventana reutiliza el archivo; los archivos se borran
+# después de las horas de retención
+EXPORTACIONES_FILAS_DIRECTAS = 5000
+EXPORTACIONES_REUTILIZAR_MINUTOS = 10
+EXPORTACIONES_RETENCION_HORAS = 24
+
+# Cierres de caja guardados (CierreDiario): la tarea 'cierre_diario' cierra
+# los días de este período que tuvieron cobros y todavía no tienen cierre
+CIERRE_DIARIO_DIAS = 7
+
 # Autenticación
 LOGIN_URL = 'login'
 LOGIN_REDIRECT_URL = 'core:dashboard'
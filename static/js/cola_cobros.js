@@ -0,0 +1,160 @@
+/**
+ * Cola de cobros offline (IndexedDB)
+ * La usan la página (main.js) y el service worker (sw.js).
+ *
+ * Cada cobro se guarda primero en el dispositivo con una clave única y después
+ * se envía a /api/cobros/sincronizar/, que aplica cada clave una sola vez.
+ * Los cobros aplicados o en conflicto salen de la cola; los que no llegaron
+ * al servidor (sin conexión o con error) quedan para el próximo intento.
+ */
+const ColaCobros = (() => {
+    const DB_NOMBRE = 'prestamos-cobros';
+    const DB_VERSION = 1;
+    const STORE_PAGOS = 'pagos';
+    const STORE_META = 'meta';
+    const URL_SINCRONIZAR = '/api/cobros/sincronizar/';
+    const PAGOS_POR_LOTE = 100;
+
+    let sincronizando = null;
+
+    function disponible() {
+        return typeof indexedDB !== 'undefined';
+    }
+
+    function abrir() {
+        return new Promise((resolve, reject) => {
+            const request = indexedDB.open(DB_NOMBRE, DB_VERSION);
+            request.onupgradeneeded = () => {
+                const db = request.result;
+                if (!db.objectStoreNames.contains(STORE_PAGOS)) {
+                    db.createObjectStore(STORE_PAGOS, { keyPath: 'clave' });
+                }
+                if (!db.objectStoreNames.contains(STORE_META)) {
+                    db.createObjectStore(STORE_META);
+                }
+            };
+            request.onsuccess = () => resolve(request.result);
+            request.onerror = () => reject(request.error);
+        });
+    }
+
+    /**
+     * Ejecuta fn(store) en una transacción y devuelve el resultado del request
+     * que retorne fn (si retorna uno) cuando la transacción termina.
+     */
+    async function operar(nombreStore, modo, fn) {
+        const db = await abrir();
+        return new Promise((resolve, reject) => {
+            const tx = db.transaction(nombreStore, modo);
+            const request = fn(tx.objectStore(nombreStore));
+            tx.oncomplete = () => {
+                db.close();
+                resolve(request ? request.result : undefined);
+            };
+            tx.onerror = () => {
+                db.close();
+                reject(tx.error);
+            };
+        });
+    }
+
+    function nuevaClave() {
+        if (self.crypto && self.crypto.randomUUID) {
+            return self.crypto.randomUUID();
+        }
+        return `${Date.now()}-${Math.random().toString(16).slice(2)}-${Math.random().toString(16).slice(2)}`;
+    }
+
+    /**
+     * Guarda un cobro en la cola. pago: { cuota_id, monto, metodo_pago, ... }
+     */
+    async function encolar(pago) {
+        const item = { ...pago, clave: nuevaClave(), creado: Date.now() };
+        await operar(STORE_PAGOS, 'readwrite', store => { store.put(item); });
+        return item;
+    }
+
+    async function pendientes() {
+        const items = await operar(STORE_PAGOS, 'readonly', store => store.getAll());
+        return (items || []).sort((a, b) => a.creado - b.creado);
+    }
+
+    function quitar(claves) {
+        return operar(STORE_PAGOS, 'readwrite', store => {
+            claves.forEach(clave => store.delete(clave));
+        });
+    }
+
+    /**
+     * El service worker no puede leer cookies: la página deja guardado el token CSRF
+     */
+    function guardarToken(token) {
+        return operar(STORE_META, 'readwrite', store => { store.put(token, 'csrf'); });
+    }
+
+    function leerToken() {
+        return operar(STORE_META, 'readonly', store => store.get('csrf'));
+    }
+
+    async function enviarPendientes() {
+        const pagos = await pendientes();
+        const resumen = { resultados: [], estadisticas: null, restantes: pagos.length, sinConexion: false };
+        if (!pagos.length) return resumen;
+
+        const token = await leerToken();
+        for (let i = 0; i < pagos.length; i += PAGOS_POR_LOTE) {
+            const lote = pagos.slice(i, i + PAGOS_POR_LOTE);
+            let data;
+            try {
+                const response = await fetch(URL_SINCRONIZAR, {
+                    method: 'POST',
+                    credentials: 'same-origin',
+                    headers: {
+                        'Content-Type': 'application/json',
+                        'X-CSRFToken': token || ''
+                    },
+                    body: JSON.stringify({ pagos: lote })
+                });
+                if (!response.ok) {
+                    resumen.sinConexion = true;
+                    break;
+                }
+                data = await response.json();
+            } catch (error) {
+                // Sin conexión: todo queda en la cola
+                resumen.sinConexion = true;
+                break;
+            }
+
+            const resueltas = data.resultados
+                .filter(resultado => resultado.estado !== 'error')
+                .map(resultado => resultado.clave);
+            await quitar(resueltas);
+            resumen.resultados.push(...data.resultados);
+            resumen.estadisticas = data.estadisticas;
+            resumen.restantes -= resueltas.length;
+        }
+        return resumen;
+    }
+
+    /**
+     * Envía todos los cobros pendientes (una sola sincronización a la vez).
+     * Devuelve { resultados, estadisticas, restantes, sinConexion }.
+     */
+    function sincronizar() {
+        if (!sincronizando) {
+            sincronizando = enviarPendientes().finally(() => {
+                sincronizando = null;
+            });
+        }
+        return sincronizando;
+    }
+
+    return {
+        disponible,
+        encolar,
+        pendientes,
+        guardarToken,
+        sincronizar
+    };
+})();
@@ -27,6 +27,7 @@ document.addEventListener('DOMContentLoaded', function() {
     }
     
     // Inicializar funciones
+    initColaCobros();
     initCobros();
     initCalculadoraPrestamo();
     initBusqueda();
@@ -174,6 +175,125 @@ function showSuccessModal() {
     setTimeout(() => modal.classList.remove('show'), 1200);
 }
 
+/**
+ * Cola de cobros offline: registra el service worker, reenvía lo pendiente
+ * al cargar y al recuperar la conexión, y oculta las cuotas ya cobradas
+ * que todavía no llegaron al servidor.
+ */
+function initColaCobros() {
+    if ('serviceWorker' in navigator) {
+        navigator.serviceWorker.register('/sw.js').catch(err => console.log('Service worker no registrado:', err));
+        navigator.serviceWorker.addEventListener('message', event => {
+            if (event.data && event.data.tipo === 'cobros-sincronizados') {
+                procesarSincronizacion(event.data.resumen);
+            }
+        });
+    }
+    
+    if (typeof ColaCobros === 'undefined' || !ColaCobros.disponible()) return;
+    
+    if (CONFIG.CSRF_TOKEN) {
+        ColaCobros.guardarToken(CONFIG.CSRF_TOKEN);
+    }
+    ColaCobros.pendientes().then(pagos => {
+        pagos.filter(pago => pago.completo).forEach(pago => {
+            const card = document.querySelector(`.payment-card button[data-cuota-id="${pago.cuota_id}"]`)?.closest('.payment-card');
+            if (card) card.remove();
+        });
+    });
+    sincronizarCobros();
+    window.addEventListener('online', sincronizarCobros);
+}
+
+/**
+ * POST JSON con Idempotency-Key: si la red falla se reintenta con la misma
+ * clave, y el servidor devuelve la respuesta original sin repetir la operación.
+ */
+async function postConReintentos(url, datos = {}, intentos = 3) {
+    const clave = (window.crypto && crypto.randomUUID)
+        ? crypto.randomUUID()
+        : `${Date.now()}-${Math.random().toString(16).slice(2)}`;
+    for (let intento = 1; ; intento++) {
+        try {
+            const response = await fetch(url, {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                    'X-CSRFToken': CONFIG.CSRF_TOKEN,
+                    'Idempotency-Key': clave
+                },
+                body: JSON.stringify(datos)
+            });
+            return await response.json();
+        } catch (error) {
+            if (intento >= intentos) throw error;
+            await new Promise(resolve => setTimeout(resolve, 500 * intento));
+        }
+    }
+}
+
+/**
+ * Registrar un cobro. Se guarda primero en la cola local (IndexedDB) y se
+ * envía en segundo plano, así el cobrador no espera a la red.
+ * Sin IndexedDB se envía directo a /api/cobrar/.
+ *   datos: mismos campos que /api/cobrar/<pk>/
+ *   montoRestanteVisto: restante que mostraba la pantalla (para detectar conflictos)
+ */
+async function registrarCobro(cuotaId, datos = {}, montoRestanteVisto = null) {
+    if (typeof ColaCobros === 'undefined' || !ColaCobros.disponible()) {
+        return postConReintentos(`/api/cobrar/${cuotaId}/`, datos);
+    }
+    
+    const pago = {
+        ...datos,
+        cuota_id: parseInt(cuotaId),
+        // Cobro del total: la cuota se oculta aunque todavía no se haya enviado
+        completo: datos.monto === undefined
+    };
+    if (montoRestanteVisto !== null && !isNaN(montoRestanteVisto)) {
+        pago.monto_restante_visto = montoRestanteVisto;
+    }
+    await ColaCobros.encolar(pago);
+    
+    // Enviar ya si hay conexión; si no, el service worker reintenta
+    sincronizarCobros();
+    if ('serviceWorker' in navigator && 'SyncManager' in window) {
+        navigator.serviceWorker.ready
+            .then(registration => registration.sync.register('sincronizar-cobros'))
+            .catch(() => {});
+    }
+    return { success: true, encolado: true, message: 'Cobro registrado' };
+}
+
+/**
+ * Enviar los cobros pendientes de la cola
+ */
+async function sincronizarCobros() {
+    if (typeof ColaCobros === 'undefined' || !ColaCobros.disponible()) return null;
+    const resumen = await ColaCobros.sincronizar();
+    procesarSincronizacion(resumen);
+    return resumen;
+}
+
+/**
+ * Mostrar el resultado de una sincronización (estadísticas y conflictos)
+ */
+function procesarSincronizacion(resumen) {
+    if (!resumen) return;
+    if (resumen.estadisticas) {
+        updateStatsFromServer(resumen.estadisticas);
+    }
+    resumen.resultados
+        .filter(resultado => resultado.estado !== 'aplicado' && !resultado.duplicado)
+        .forEach(resultado => showToast(`Cuota #${resultado.cuota_id}: ${resultado.message}`, 'error'));
+    
+    const badge = document.getElementById('cobros-pendientes');
+    if (badge) {
+        badge.textContent = resumen.restantes;
+        badge.style.display = resumen.restantes > 0 ? '' : 'none';
+    }
+}
+
 /**
  * Manejar cobro de cuota
  */
@@ -201,15 +321,7 @@ async function handleCobro(event) {
     btn.innerHTML = '<span class="spinner-border spinner-border-sm"></span>';
     
     try {
-        const response = await fetch(`/api/cobrar/${cuotaId}/`, {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json',
-                'X-CSRFToken': CONFIG.CSRF_TOKEN
-            }
-        });
-        
-        const data = await response.json();
+        const data = await registrarCobro(cuotaId, {}, montoNum);
         
         if (data.success) {
             // Mostrar animación de éxito
@@ -289,20 +401,14 @@ async function registrarPagoParcial(cuotaId, monto, accionRestante = 'ignorar',
             body.fecha_especial = fechaEspecial;
         }
         
-        const response = await fetch(`/api/cobrar/${cuotaId}/`, {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json',
-                'X-CSRFToken': CONFIG.CSRF_TOKEN
-            },
-            body: JSON.stringify(body)
-        });
-        
-        const data = await response.json();
+        const data = await registrarCobro(cuotaId, body);
         
         if (data.success) {
             showSuccessModal();
-            setTimeout(() => location.reload(), 1300);
+            // Recargar cuando el pago ya llegó al servidor (o quedó en la cola)
+            const sincronizado = data.encolado ? sincronizarCobros() : Promise.resolve();
+            Promise.all([sincronizado, new Promise(resolve => setTimeout(resolve, 1300))])
+                .then(() => location.reload());
         } else {
             throw new Error(data.message);
         }
@@ -0,0 +1,94 @@
+{% load static %}/**
+ * Service worker - Sistema de Gestión de Préstamos
+ * - Archivos estáticos: primero caché
+ * - Página de cobros: primero red, con la última copia si no hay conexión
+ * - Cobros sin conexión: se sincronizan desde la cola de IndexedDB (cola_cobros.js)
+ */
+importScripts('{% static "js/cola_cobros.js" %}');
+
+const CACHE = 'prestamos-v1';
+const PRECARGA = [
+    '{% static "css/main.css" %}',
+    '{% static "js/main.js" %}',
+    '{% static "js/cola_cobros.js" %}',
+    '{% static "manifest.json" %}',
+    '{% static "icons/icon-192x192.png" %}'
+];
+// Páginas de la ruta de cobro que se guardan para usar sin conexión
+// (/api/cuotas-hoy/ responde cambios desde un token: no se cachea)
+const RUTAS_COBRO = ['{% url "core:cobros" %}'];
+const PREFIJO_ESTATICOS = '{% get_static_prefix %}';
+
+self.addEventListener('install', event => {
+    event.waitUntil(
+        caches.open(CACHE)
+            .then(cache => cache.addAll(PRECARGA))
+            .then(() => self.skipWaiting())
+    );
+});
+
+self.addEventListener('activate', event => {
+    event.waitUntil(
+        caches.keys()
+            .then(nombres => Promise.all(
+                nombres.filter(nombre => nombre !== CACHE).map(nombre => caches.delete(nombre))
+            ))
+            .then(() => self.clients.claim())
+    );
+});
+
+async function primeroCache(request) {
+    const guardada = await caches.match(request);
+    if (guardada) return guardada;
+    const response = await fetch(request);
+    if (response.ok) {
+        const cache = await caches.open(CACHE);
+        cache.put(request, response.clone());
+    }
+    return response;
+}
+
+async function primeroRed(request) {
+    try {
+        const response = await fetch(request);
+        if (response.ok && !response.redirected) {
+            const cache = await caches.open(CACHE);
+            cache.put(request, response.clone());
+        }
+        return response;
+    } catch (error) {
+        const guardada = await caches.match(request, { ignoreSearch: true });
+        if (guardada) return guardada;
+        throw error;
+    }
+}
+
+self.addEventListener('fetch', event => {
+    const request = event.request;
+    if (request.method !== 'GET') return;
+
+    const url = new URL(request.url);
+    if (url.origin !== self.location.origin) return;
+
+    if (url.pathname.startsWith(PREFIJO_ESTATICOS)) {
+        event.respondWith(primeroCache(request));
+    } else if (RUTAS_COBRO.includes(url.pathname)) {
+        event.respondWith(primeroRed(request));
+    }
+});
+
+async function sincronizarYAvisar() {
+    const resumen = await ColaCobros.sincronizar();
+    const clientes = await self.clients.matchAll({ type: 'window' });
+    clientes.forEach(cliente => cliente.postMessage({ tipo: 'cobros-sincronizados', resumen }));
+    if (resumen.sinConexion) {
+        // El navegador vuelve a intentar la sincronización más tarde
+        throw new Error('Cobros pendientes sin enviar');
+    }
+}
+
+self.addEventListener('sync', event => {
+    if (event.tag === 'sincronizar-cobros') {
+        event.waitUntil(sincronizarYAvisar());
+    }
+});